@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+analysis_client.py — Thin CLI for analysis_server.py.
+
+Standard library only and no project imports. It speaks HTTP/1.0 over a
+raw socket rather than importing http.client (which alone costs ~30 ms via
+the email package), so a query is dominated by interpreter startup and
+the answer comes from the server's in-memory corpus.
+
+Usage:
+    python analysis_client.py configs
+    python analysis_client.py passk --config 14B
+    python analysis_client.py crashes --config 4B --type context_window
+    python analysis_client.py failures --config 14B_ACT_airline --task-id 12
+    python analysis_client.py classifications --json
+    python analysis_client.py --socket /tmp/tau-analysis.sock health
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+from urllib.parse import urlencode
+
+DEFAULT_PORT = 8765
+
+
+def request(args, endpoint, params):
+    query = urlencode({k: v for k, v in params.items() if v is not None})
+    path = endpoint + (f"?{query}" if query else "")
+    try:
+        if args.socket:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(60)
+            sock.connect(args.socket)
+        else:
+            sock = socket.create_connection((args.host, args.port), timeout=60)
+        with sock:
+            sock.sendall(f"GET {path} HTTP/1.0\r\nHost: localhost\r\n\r\n".encode())
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+    except OSError as e:
+        where = f"unix:{args.socket}" if args.socket else f"{args.host}:{args.port}"
+        print(f"ERROR: analysis server not reachable at {where} ({e}). "
+              f"Start it with: python analysis_server.py", file=sys.stderr)
+        sys.exit(1)
+
+    head, _, payload = b"".join(chunks).partition(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    body = json.loads(payload)
+    if status != 200:
+        print(f"ERROR: {body.get('error', status)}", file=sys.stderr)
+        sys.exit(1)
+    return body
+
+
+def table(rows, columns=None):
+    if not rows:
+        print("(no rows)")
+        return
+    columns = columns or list(rows[0])
+    print("| " + " | ".join(columns) + " |")
+    print("|" + "|".join("-" * (len(c) + 2) for c in columns) + "|")
+    for r in rows:
+        print("| " + " | ".join("-" if r.get(c) is None else str(r.get(c)) for c in columns) + " |")
+
+
+def render(command, body):
+    if command == "crashes":
+        print(f"**{body['total']} crashes** — " +
+              (", ".join(f"{t}: {n}" for t, n in sorted(body["by_type"].items())) or "none"))
+        print()
+        table(body["crashes"])
+    elif command == "classifications":
+        for config, summary in body.items():
+            print(f"## {config}")
+            print()
+            table([{"category": cat, **v} for cat, v in summary.items()])
+            print()
+    elif isinstance(body, dict):
+        for k, v in body.items():
+            print(f"{k}: {v}")
+    else:
+        table(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query a running analysis_server.py.")
+    parser.add_argument("--host", default="127.0.0.1", help="Server host (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Server port (default: {DEFAULT_PORT})")
+    parser.add_argument("--socket", default=os.environ.get("TAU_ANALYSIS_SOCKET"),
+                        help="Unix socket of the server (default: $TAU_ANALYSIS_SOCKET)")
+    parser.add_argument("--json", action="store_true", help="Print the raw JSON response")
+    parser.add_argument(
+        "command",
+        choices=["health", "configs", "crashes", "passk", "failures", "classifications", "reload"],
+    )
+    parser.add_argument("--config", default=None, help="Config substring filter (e.g., 14B, ACT_airline)")
+    parser.add_argument("--type", default=None, help="crashes: only this crash type")
+    parser.add_argument("--max-k", type=int, default=5, help="passk: highest k (default: 5)")
+    parser.add_argument("--task-id", type=int, default=None, help="failures: only this task")
+    args = parser.parse_args()
+
+    params = {"config": args.config}
+    if args.command == "crashes":
+        params["type"] = args.type
+    elif args.command == "passk":
+        params["max_k"] = args.max_k
+    elif args.command == "failures":
+        params["task_id"] = args.task_id
+    body = request(args, f"/{args.command}", params)
+
+    if args.json:
+        print(json.dumps(body, indent=2))
+    else:
+        render(args.command, body)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+analysis_server.py — Long-lived local server holding the trajectory corpus.
+
+Every question asked of the data used to be a fresh Python process that
+re-discovers the files and re-parses multi-MB JSON (and, for the
+classification tooling, re-imports the LLM SDKs and matplotlib). This
+server loads the corpus and the classification results once, keeps a
+compact per-entry summary in memory, and answers over local HTTP — on
+127.0.0.1 or on a Unix socket. analysis_client.py is the thin CLI for it.
+
+How it works:
+─────────────
+1. LOAD: Every trajectory file (analyze_crashes.discover_files) is reduced
+   to one small record per entry: task_id, trial, reward, turns, and the
+   classify_crash result for crashed entries. Classification results
+   (results/{config}.json + their NDJSON logs) are loaded alongside.
+
+2. HOT RELOAD: A background thread checks file sizes/mtimes every
+   --reload-interval seconds and re-parses only what changed (new files
+   appear, deleted ones drop out). Each file's records are swapped in
+   under a lock, so requests never see a half-loaded file.
+
+3. API (GET, JSON responses):
+     /health                         loaded files, entries, last reload
+     /configs                        per-config breakdown
+     /crashes?config=&type=          crash counts + crash list
+     /passk?config=&max_k=           pass^k per config (tau-bench formula)
+     /failures?config=&task_id=      failed entries, with classification label
+     /classifications?config=        category summary per config
+     /reload                         force a reload now
+   `config` filters accept a substring ("14B", "ACT_airline").
+
+Usage:
+    python analysis_server.py                                  # 127.0.0.1:8765
+    python analysis_server.py --socket /tmp/tau-analysis.sock
+    python analysis_server.py --port 9000 --reload-interval 10
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from math import comb
+from pathlib import Path
+from socketserver import ThreadingMixIn, UnixStreamServer
+from urllib.parse import parse_qs, urlparse
+
+from analyze_crashes import classify_crash, discover_files
+from classify_errors import iter_classifications
+from plan_trials import is_success
+from traj_json import load
+
+DEFAULT_PORT = 8765
+
+
+def load_trajectory_file(filepath):
+    data = load(filepath)
+    records = []
+    for entry in data:
+        info = entry.get("info", {})
+        rec = {
+            "task_id": entry.get("task_id"),
+            "trial": entry.get("trial"),
+            "reward": entry.get("reward", 0.0),
+            "turns": len(entry.get("traj", [])),
+        }
+        if "error" in info:
+            crash = classify_crash(info["error"])
+            rec["crash_type"] = crash["crash_type"]
+            rec["crash"] = crash["error_short"]
+            rec["tokens_used"] = crash["tokens_used"]
+        records.append(rec)
+    return records
+
+
+def load_classification_file(path):
+    """{(task_id, trial): classification} plus the summary for one results file."""
+    with open(path) as f:
+        result = json.load(f)
+    if not isinstance(result, dict) or "config" not in result:
+        return None
+    labels = {}
+    for rec in iter_classifications(result, path.parent):
+        labels[(rec.get("task_id"), rec.get("trial", 0))] = rec.get("classification", {})
+    return {"config": result["config"], "summary": result.get("summary", {}), "labels": labels}
+
+
+class Corpus:
+    """In-memory, hot-reloadable view of trajectories + classifications."""
+
+    def __init__(self, traj_dir, results_dir, model_size=None, verbose=False):
+        self.traj_dir = traj_dir
+        self.results_dir = results_dir
+        self.model_size = model_size
+        self.verbose = verbose
+        self.lock = threading.Lock()          # guards the tables below
+        self.reload_lock = threading.Lock()   # one reload at a time (watcher vs /reload)
+        self.files = {}       # path -> {"config": ..., "stamp": ..., "records": [...]}
+        self.classified = {}  # path -> {"config", "summary", "labels", "stamp"}
+        self.last_reload = None
+        self.reload_seconds = None
+
+    @staticmethod
+    def _stamp(path):
+        st = path.stat()
+        return st.st_size, st.st_mtime_ns
+
+    def reload(self):
+        """Re-parse new/changed files, drop deleted ones. Returns #files changed."""
+        with self.reload_lock:
+            return self._reload()
+
+    def _reload(self):
+        start = time.perf_counter()
+        changed = 0
+
+        seen = set()
+        for filepath, config in discover_files(self.traj_dir, self.model_size):
+            seen.add(filepath)
+            stamp = self._stamp(filepath)
+            current = self.files.get(filepath)
+            if current and current["stamp"] == stamp:
+                continue
+            try:
+                records = load_trajectory_file(filepath)
+            except (json.JSONDecodeError, OSError):
+                continue  # mid-write; pick it up on the next pass
+            with self.lock:
+                self.files[filepath] = {"config": config, "stamp": stamp, "records": records}
+            changed += 1
+
+        seen_results = set()
+        if self.results_dir.exists():
+            # Logs are appended to while classification runs; track them with their summary
+            for path in sorted(self.results_dir.glob("*_*_*.json")):
+                seen_results.add(path)
+                log = path.with_suffix(".ndjson")
+                stamp = (self._stamp(path), self._stamp(log) if log.exists() else None)
+                current = self.classified.get(path)
+                if current and current["stamp"] == stamp:
+                    continue
+                try:
+                    loaded = load_classification_file(path)
+                except (json.JSONDecodeError, OSError):
+                    continue
+                if loaded:
+                    loaded["stamp"] = stamp
+                    with self.lock:
+                        self.classified[path] = loaded
+                    changed += 1
+
+        with self.lock:
+            for gone in [p for p in self.files if p not in seen]:
+                del self.files[gone]
+                changed += 1
+            for gone in [p for p in self.classified if p not in seen_results]:
+                del self.classified[gone]
+                changed += 1
+            self.last_reload = time.time()
+            self.reload_seconds = round(time.perf_counter() - start, 3)
+        return changed
+
+    def watch(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                changed = self.reload()
+                if changed:
+                    print(f"[{time.strftime('%H:%M:%S')}] reloaded {changed} file(s) "
+                          f"in {self.reload_seconds}s", flush=True)
+            except Exception as e:  # keep serving the last good snapshot
+                print(f"[{time.strftime('%H:%M:%S')}] reload failed: {e}", file=sys.stderr, flush=True)
+
+    # ── Queries ───────────────────────────────────────────────────────────
+    # Each takes a snapshot of the file table under the lock, then works lock-free.
+
+    def _by_config(self, config_filter=None):
+        with self.lock:
+            files = list(self.files.values())
+        grouped = {}
+        for f in files:
+            label = f["config"]["config_label"]
+            if config_filter and config_filter.lower() not in label.lower():
+                continue
+            grouped.setdefault(label, []).extend(f["records"])
+        return dict(sorted(grouped.items()))
+
+    def _labels(self):
+        """{config_label.lower(): {(task_id, trial): classification}}."""
+        with self.lock:
+            classified = list(self.classified.values())
+        return {c["config"].lower(): c["labels"] for c in classified}
+
+    def health(self):
+        with self.lock:
+            return {
+                "files": len(self.files),
+                "entries": sum(len(f["records"]) for f in self.files.values()),
+                "classification_files": len(self.classified),
+                "last_reload": self.last_reload,
+                "reload_seconds": self.reload_seconds,
+            }
+
+    def configs(self, config=None):
+        out = []
+        for label, recs in self._by_config(config).items():
+            crashes = sum(1 for r in recs if "crash_type" in r)
+            passes = sum(1 for r in recs if is_success(r["reward"]))
+            ok = [r["turns"] for r in recs if "crash_type" not in r]
+            out.append({
+                "config": label,
+                "entries": len(recs),
+                "tasks": len({r["task_id"] for r in recs}),
+                "passes": passes,
+                "failures": len(recs) - passes,
+                "crashes": crashes,
+                "pass_rate_pct": round(passes / len(recs) * 100, 1) if recs else 0.0,
+                "avg_turns": round(sum(ok) / len(ok), 1) if ok else 0.0,
+            })
+        return out
+
+    def crashes(self, config=None, crash_type=None):
+        by_type, listing = {}, []
+        for label, recs in self._by_config(config).items():
+            for r in recs:
+                if "crash_type" not in r or (crash_type and r["crash_type"] != crash_type):
+                    continue
+                by_type[r["crash_type"]] = by_type.get(r["crash_type"], 0) + 1
+                listing.append({"config": label, "task_id": r["task_id"], "trial": r["trial"],
+                                "crash_type": r["crash_type"], "error_short": r["crash"],
+                                "tokens_used": r["tokens_used"]})
+        return {"total": len(listing), "by_type": by_type, "crashes": listing}
+
+    def passk(self, config=None, max_k=5):
+        out = []
+        for label, recs in self._by_config(config).items():
+            per_task = {}
+            for r in recs:
+                per_task.setdefault(r["task_id"], []).append(is_success(r["reward"]))
+            n_trials = max((len(v) for v in per_task.values()), default=0)
+            row = {"config": label, "tasks": len(per_task), "trials": n_trials}
+            for k in range(1, max_k + 1):
+                if k > n_trials:
+                    row[f"pass^{k}"] = None
+                    continue
+                # tau-bench: mean over tasks of C(successes, k) / C(trials, k)
+                row[f"pass^{k}"] = round(
+                    sum(comb(sum(v), k) / comb(n_trials, k) for v in per_task.values())
+                    / len(per_task), 4)
+            out.append(row)
+        return out
+
+    def failures(self, config=None, task_id=None):
+        labels = self._labels()
+        out = []
+        for label, recs in self._by_config(config).items():
+            # classify_errors names configs "14b_ACT_airline"; labels are per task (one trial sampled)
+            by_task = {}
+            for (tid, _), cls in labels.get(label.lower(), {}).items():
+                by_task.setdefault(tid, cls)
+            for r in recs:
+                if is_success(r["reward"]) or (task_id is not None and r["task_id"] != task_id):
+                    continue
+                cls = by_task.get(r["task_id"], {})
+                out.append({"config": label, "task_id": r["task_id"], "trial": r["trial"],
+                            "turns": r["turns"], "crash_type": r.get("crash_type"),
+                            "label": cls.get("primary_category")})
+        return out
+
+    def classifications(self, config=None):
+        with self.lock:
+            classified = list(self.classified.values())
+        return {c["config"]: c["summary"] for c in sorted(classified, key=lambda c: c["config"])
+                if not config or config.lower() in c["config"].lower()}
+
+
+def make_handler(corpus):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            config = q.get("config")
+            try:
+                if url.path == "/health":
+                    body = corpus.health()
+                elif url.path == "/configs":
+                    body = corpus.configs(config)
+                elif url.path == "/crashes":
+                    body = corpus.crashes(config, q.get("type"))
+                elif url.path == "/passk":
+                    body = corpus.passk(config, int(q.get("max_k", 5)))
+                elif url.path == "/failures":
+                    task_id = int(q["task_id"]) if "task_id" in q else None
+                    body = corpus.failures(config, task_id)
+                elif url.path == "/classifications":
+                    body = corpus.classifications(config)
+                elif url.path == "/reload":
+                    body = {"changed": corpus.reload(), **corpus.health()}
+                else:
+                    return self._send(404, {"error": f"unknown endpoint {url.path}"})
+            except ValueError as e:
+                return self._send(400, {"error": str(e)})
+            self._send(200, body)
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def address_string(self):
+            # Unix-socket clients have no (host, port)
+            return self.client_address[0] if self.client_address else "unix"
+
+        def log_message(self, fmt, *args):
+            if corpus.verbose:
+                super().log_message(fmt, *args)
+
+    return Handler
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+def main():
+    script_dir = Path(__file__).resolve().parent
+    parser = argparse.ArgumentParser(
+        description="Serve crash, pass^k and failure queries from an in-memory corpus."
+    )
+    parser.add_argument(
+        "--trajectory-dir", type=str, default=None,
+        help="Path to trajectory directory. Default: auto-detect from script location.",
+    )
+    parser.add_argument(
+        "--results-dir", type=str, default=str(script_dir / "results"),
+        help="classify_errors.py results directory (default: results/)",
+    )
+    parser.add_argument(
+        "--model-size", type=str, default=None, choices=["4b", "8b", "14b", "32b"],
+        help="Only load one model size. Default: all sizes.",
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port (default: {DEFAULT_PORT})")
+    parser.add_argument("--socket", type=str, default=None, help="Serve on this Unix socket instead of TCP")
+    parser.add_argument(
+        "--reload-interval", type=float, default=5.0,
+        help="Seconds between checks for changed files (default: 5, 0 = never)",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    if args.trajectory_dir:
+        traj_dir = Path(args.trajectory_dir)
+    else:
+        traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories"
+        if not traj_dir.exists():
+            traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories "
+    if not traj_dir.exists():
+        print(f"ERROR: Trajectory directory not found: {traj_dir}")
+        sys.exit(1)
+
+    corpus = Corpus(traj_dir, Path(args.results_dir), args.model_size, args.verbose)
+    corpus.reload()
+    h = corpus.health()
+    print(f"Loaded {h['files']} trajectory file(s), {h['entries']} entries, "
+          f"{h['classification_files']} classification file(s) in {h['reload_seconds']}s")
+
+    if args.reload_interval > 0:
+        threading.Thread(target=corpus.watch, args=(args.reload_interval,), daemon=True).start()
+
+    handler = make_handler(corpus)
+    if args.socket:
+        sock = Path(args.socket)
+        if sock.exists():
+            sock.unlink()
+        server = ThreadingUnixHTTPServer(str(sock), handler)
+        print(f"Serving on unix:{sock}")
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), handler)
+        print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket:
+            Path(args.socket).unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
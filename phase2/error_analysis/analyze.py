@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+analyze.py — Fast-start entry point for the Phase 2 analysis scripts.
+
+One CLI with a subcommand per job. Nothing beyond `sys` is imported until
+the subcommand is known, and each subcommand imports only what it needs:
+
+How it works:
+─────────────
+1. DISPATCH: The first argument picks the subcommand; the rest are handed
+   to that subcommand's own argument parser. `analyze.py --help` is printed
+   from a constant, so it costs no more than starting the interpreter.
+
+2. scan / classify / rerun / plan: Delegate to analyze_crashes.main(),
+   classify_errors.main(), rerun_crashes.main() and plan_trials.main() with
+   the remaining arguments, so every flag of the original scripts keeps
+   working. Provider SDKs are only imported once classify actually creates
+   an API client.
+
+3. summarize / examples / plot: Rebuild combined_summary.json,
+   examples/representative_examples.json and the plots from the finished
+   {config}.json files in the results directory. No provider, API key or
+   trajectory files are needed; matplotlib is only imported by `plot`.
+
+The modules are imported (not run as __main__), so their bytecode is cached
+and a reporting command skips recompiling the 1,000+ line scripts.
+bench_startup.py measures every subcommand's startup and fails when one
+regresses or pulls in a heavy module it should not.
+
+Usage:
+    python analyze.py scan --model-size 14b            # crash scan (analyze_crashes.py)
+    python analyze.py classify --provider anthropic    # LLM classification (classify_errors.py)
+    python analyze.py classify --dry-run --model-size 8b
+    python analyze.py rerun manifest --model-size 14b   # crashed entries -> rerun_manifest.json
+    python analyze.py plan simulate --k 1               # adaptive vs fixed trials on history
+    python analyze.py summarize                        # results/*.json -> combined_summary.json
+    python analyze.py summarize --model-size 14b       # -> combined_summary_14B.json
+    python analyze.py examples --per-category 5
+    python analyze.py plot
+"""
+
+import sys
+
+USAGE = """\
+usage: analyze.py <command> [options]
+
+commands:
+  scan        Scan trajectory files for crashed runs (analyze_crashes.py)
+  classify    Classify failures with an LLM (classify_errors.py)
+  rerun       Re-run manifest / merge for crashed entries (rerun_crashes.py)
+  plan        Plan extra trials that tighten pass^k the most (plan_trials.py)
+  summarize   Rebuild combined_summary.json from existing results
+  examples    Rebuild representative_examples.json from existing results
+  plot        Regenerate plots from combined_summary.json
+
+Run `analyze.py <command> --help` for that command's options.
+"""
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# DELEGATING COMMANDS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def cmd_scan(argv):
+    import analyze_crashes
+    sys.argv[0] = "analyze.py scan"
+    analyze_crashes.main(argv)
+
+
+def cmd_classify(argv):
+    import classify_errors
+    sys.argv[0] = "analyze.py classify"
+    classify_errors.main(argv)
+
+
+def cmd_rerun(argv):
+    import rerun_crashes
+    sys.argv[0] = "analyze.py rerun"
+    rerun_crashes.main(argv)
+
+
+def cmd_plan(argv):
+    import plan_trials
+    sys.argv[0] = "analyze.py plan"
+    plan_trials.main(argv)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# REPORTING COMMANDS
+# Work from the results directory only — no provider, no trajectories.
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _reporting_parser(command, description):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog=f"analyze.py {command}", description=description)
+    parser.add_argument(
+        "--output-dir", default=None,
+        help="Results directory of classify (default: results/ next to this script)",
+    )
+    parser.add_argument(
+        "--model-size", default=None,
+        help="Only configs of this model size (e.g., 14b). Default: all",
+    )
+    parser.add_argument(
+        "--debug", action="store_true",
+        help="Enable [DEBUG] print statements for tracing",
+    )
+    return parser
+
+
+def _load(args):
+    """Import classify_errors and load the finished results. Exits if there are none."""
+    from pathlib import Path
+
+    import classify_errors as ce
+
+    ce.DEBUG = args.debug
+    output_dir = Path(args.output_dir) if args.output_dir else (
+        Path(__file__).resolve().parent / "results"
+    )
+    all_results = ce.load_results(output_dir, args.model_size)
+    if not all_results:
+        sys.exit(f"No classification results in {output_dir}. Run: python analyze.py classify")
+    return ce, output_dir, all_results
+
+
+def _summary_name(model_size):
+    return f"combined_summary_{model_size.upper()}.json" if model_size else "combined_summary.json"
+
+
+def cmd_summarize(argv):
+    parser = _reporting_parser("summarize", "Rebuild the combined summary from existing results.")
+    parser.add_argument(
+        "--output", default=None,
+        help="Summary path (default: <output-dir>/combined_summary[_SIZE].json)",
+    )
+    parser.add_argument(
+        "--quiet", action="store_true",
+        help="Don't print the summary table",
+    )
+    args = parser.parse_args(argv)
+
+    ce, output_dir, all_results = _load(args)
+    combined, path = ce.write_combined_summary(
+        all_results, output_dir, args.output or output_dir / _summary_name(args.model_size))
+    if not args.quiet:
+        ce.print_summary_table(combined)
+    print(f"\nCombined summary ({len(combined)} configs): {path}")
+
+
+def cmd_examples(argv):
+    parser = _reporting_parser("examples", "Rebuild representative examples from existing results.")
+    parser.add_argument(
+        "--per-category", type=int, default=5,
+        help="Examples per error category (default: 5)",
+    )
+    parser.add_argument(
+        "--output", default=None,
+        help="Examples path (default: <output-dir>/examples/representative_examples.json)",
+    )
+    args = parser.parse_args(argv)
+
+    ce, output_dir, all_results = _load(args)
+    examples, path = ce.write_examples(all_results, output_dir, args.per_category, args.output)
+    for cat, items in sorted(examples.items()):
+        print(f"  {cat:25s} {len(items)}")
+    print(f"\nRepresentative examples ({len(examples)} categories): {path}")
+
+
+def cmd_plot(argv):
+    parser = _reporting_parser("plot", "Regenerate plots from the combined summary.")
+    parser.add_argument(
+        "--summary", default=None,
+        help="Combined summary to plot (default: <output-dir>/combined_summary[_SIZE].json; "
+             "rebuilt from results if missing)",
+    )
+    parser.add_argument(
+        "--plot-dir", default=None,
+        help="Where to write the PNGs (default: <output-dir>/plots)",
+    )
+    args = parser.parse_args(argv)
+
+    import json
+    from pathlib import Path
+
+    import classify_errors as ce
+
+    ce.DEBUG = args.debug
+    output_dir = Path(args.output_dir) if args.output_dir else (
+        Path(__file__).resolve().parent / "results"
+    )
+    summary_path = Path(args.summary) if args.summary else output_dir / _summary_name(args.model_size)
+    if summary_path.exists():
+        with open(summary_path) as f:
+            combined = json.load(f)
+        if args.model_size:
+            prefix = f"{args.model_size.lower()}_"
+            combined = {k: v for k, v in combined.items() if k.startswith(prefix)}
+        print(f"Plotting {len(combined)} configs from {summary_path}")
+    else:
+        _, output_dir, all_results = _load(args)
+        combined = ce.aggregate_all(all_results, output_dir)
+        print(f"{summary_path.name} not found — aggregated {len(combined)} configs from results")
+
+    plot_dir = Path(args.plot_dir) if args.plot_dir else output_dir / "plots"
+    plot_dir.mkdir(parents=True, exist_ok=True)
+    ce.generate_plots(combined, plot_dir)
+
+
+COMMANDS = {
+    "scan": cmd_scan,
+    "classify": cmd_classify,
+    "rerun": cmd_rerun,
+    "plan": cmd_plan,
+    "summarize": cmd_summarize,
+    "examples": cmd_examples,
+    "plot": cmd_plot,
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(USAGE, end="")
+        return
+    command = COMMANDS.get(argv[0])
+    if command is None:
+        sys.exit(f"analyze.py: unknown command {argv[0]!r} "
+                 f"(choose from {', '.join(COMMANDS)})")
+    command(argv[1:])
+
+
+if __name__ == "__main__":
+    main()
@@ -32,19 +32,35 @@ How it works:
    - Top 10 longest conversations (potential near-limit)
    - Cross-model comparison (crash rates by model size)
 
+6. FOLLOW (--follow): Watches the trajectory directory while tau-bench is
+   still running (inotify via `inotify_simple` if installed, polling
+   otherwise). tau-bench rewrites each results file with one more entry per
+   finished task, so only the bytes after the last parsed entry are decoded
+   on each change. Crash counts and context-token stats are updated live,
+   and an alert fires (stderr + optional --alert-cmd) when a config's crash
+   rate or near-limit rate crosses its threshold, so a doomed run can be
+   killed early.
+
 Usage:
     python analyze_crashes.py                          # scan all model sizes
     python analyze_crashes.py --model-size 14b         # only 14B files
     python analyze_crashes.py --model-size 4b          # only 4B files
     python analyze_crashes.py --output results.md      # save to file
+    python analyze_crashes.py --follow --alert-crash-rate 20 --alert-near-limit-rate 30
+    python analyze_crashes.py --follow --alert-cmd 'notify-send "$TAU_ALERT"'
 """
 
 import argparse
 import json
+import os
 import re
 import sys
+import time
 from pathlib import Path
 
+from traj_json import TRAJ_SUFFIXES, TrajectoryFile, unique_runs
+from traj_model import CrashRecord
+
 
 def parse_config_from_path(filepath: Path) -> dict:
     """
@@ -148,37 +164,31 @@ def scan_file(filepath: Path, config: dict) -> dict:
       - filepath: path to the file
       - total_entries: total number of entries in the file
       - normal_entries: entries with info.task
-      - crashes: list of crash detail dicts
+      - crashes: list of CrashRecord
       - longest_trajs: top 10 longest conversations (turns, task_id, trial, reward)
     """
-    with open(filepath, "r") as f:
-        data = json.load(f)
-
     crashes = []
     traj_lengths = []
 
-    for entry in data:
-        info = entry.get("info", {})
-        task_id = entry.get("task_id", "?")
-        trial = entry.get("trial", "?")
-        reward = entry.get("reward", 0.0)
-        traj = entry.get("traj", [])
-
-        if "error" in info:
-            crash_info = classify_crash(info["error"])
-            crash_info["task_id"] = task_id
-            crash_info["trial"] = trial
-            crash_info["config_label"] = config["config_label"]
-            crashes.append(crash_info)
-        else:
-            traj_lengths.append(
-                {
-                    "task_id": task_id,
-                    "trial": trial,
-                    "turns": len(traj),
-                    "reward": reward,
-                }
-            )
+    # Lazy entries: only reward/ids, info.error and the traj length are read;
+    # the traj messages themselves are never decoded.
+    with TrajectoryFile(filepath) as data:
+        for entry in data:
+            task_id = entry.get("task_id", "?")
+            trial = entry.get("trial", "?")
+
+            if entry.has("info", "error"):
+                crashes.append(CrashRecord(config["config_label"], task_id, trial,
+                                           **classify_crash(entry.get_path("info", "error"))))
+            else:
+                traj_lengths.append(
+                    {
+                        "task_id": task_id,
+                        "trial": trial,
+                        "turns": entry.length("traj"),
+                        "reward": entry.get("reward", 0.0),
+                    }
+                )
 
     # Sort by turns descending, take top 10
     traj_lengths.sort(key=lambda x: x["turns"], reverse=True)
@@ -195,11 +205,12 @@ def scan_file(filepath: Path, config: dict) -> dict:
 
 def discover_files(base_dir: Path, model_filter: str = None) -> list:
     """
-    Find all trajectory JSON files. Returns list of (filepath, config) tuples.
+    Find all trajectory files (JSON or .tjz archives). Returns list of (filepath, config) tuples.
     """
     results = []
 
-    for json_path in sorted(base_dir.rglob("*.json")):
+    # A .tjz packed next to its .json is the same run: count it once
+    for json_path in unique_runs(sorted(p for p in base_dir.rglob("*") if p.suffix in TRAJ_SUFFIXES)):
         # Skip non-trajectory files (results, summaries, etc.)
         if "results" in str(json_path) or "summary" in str(json_path):
             continue
@@ -232,13 +243,13 @@ def print_summary(all_results: list, output_file=None):
     total_entries = sum(r["total_entries"] for r in all_results)
     total_crashes = sum(len(r["crashes"]) for r in all_results)
     ctx_crashes = sum(
-        1 for r in all_results for c in r["crashes"] if c["crash_type"] == "context_window"
+        1 for r in all_results for c in r["crashes"] if c.crash_type == "context_window"
     )
     timeout_crashes = sum(
-        1 for r in all_results for c in r["crashes"] if c["crash_type"] == "api_timeout"
+        1 for r in all_results for c in r["crashes"] if c.crash_type == "api_timeout"
     )
     other_crashes = sum(
-        1 for r in all_results for c in r["crashes"] if c["crash_type"] == "other"
+        1 for r in all_results for c in r["crashes"] if c.crash_type == "other"
     )
 
     p(f"**Total entries:** {total_entries} | "
@@ -253,9 +264,9 @@ def print_summary(all_results: list, output_file=None):
     p("|--------|-------|--------|---------|------------|---------|-------|")
 
     for r in all_results:
-        ctx = sum(1 for c in r["crashes"] if c["crash_type"] == "context_window")
-        tout = sum(1 for c in r["crashes"] if c["crash_type"] == "api_timeout")
-        oth = sum(1 for c in r["crashes"] if c["crash_type"] == "other")
+        ctx = sum(1 for c in r["crashes"] if c.crash_type == "context_window")
+        tout = sum(1 for c in r["crashes"] if c.crash_type == "api_timeout")
+        oth = sum(1 for c in r["crashes"] if c.crash_type == "other")
         crash_total = len(r["crashes"])
         label = r["config"]["config_label"]
         p(f"| {label} | {r['total_entries']} | {r['normal_entries']} | "
@@ -265,7 +276,7 @@ def print_summary(all_results: list, output_file=None):
 
     # ── Table 2: All context window crashes with token details ──
     ctx_entries = [
-        c for r in all_results for c in r["crashes"] if c["crash_type"] == "context_window"
+        c for r in all_results for c in r["crashes"] if c.crash_type == "context_window"
     ]
 
     if ctx_entries:
@@ -275,17 +286,17 @@ def print_summary(all_results: list, output_file=None):
         p("|--------|---------|-------|-------------|-------------|---------|")
 
         for c in ctx_entries:
-            over = (c["tokens_used"] - c["token_limit"]) if c["tokens_used"] and c["token_limit"] else "?"
-            p(f"| {c['config_label']} | {c['task_id']} | {c['trial']} | "
-              f"{c['tokens_used'] or '?':,} | {c['token_limit'] or '?':,} | "
+            over = c.over_by if c.tokens_used and c.token_limit else "?"
+            p(f"| {c.config_label} | {c.task_id} | {c.trial} | "
+              f"{c.tokens_used or '?':,} | {c.token_limit or '?':,} | "
               f"+{over:,} |" if isinstance(over, int) else
-              f"| {c['config_label']} | {c['task_id']} | {c['trial']} | "
-              f"{c['tokens_used'] or '?'} | {c['token_limit'] or '?'} | ? |")
+              f"| {c.config_label} | {c.task_id} | {c.trial} | "
+              f"{c.tokens_used or '?'} | {c.token_limit or '?'} | ? |")
         p()
 
     # ── Table 3: All other crashes ──
     other_entries = [
-        c for r in all_results for c in r["crashes"] if c["crash_type"] != "context_window"
+        c for r in all_results for c in r["crashes"] if c.crash_type != "context_window"
     ]
 
     if other_entries:
@@ -295,8 +306,8 @@ def print_summary(all_results: list, output_file=None):
         p("|--------|---------|-------|------|-------|")
 
         for c in other_entries:
-            p(f"| {c['config_label']} | {c['task_id']} | {c['trial']} | "
-              f"{c['crash_type']} | {c['error_short']} |")
+            p(f"| {c.config_label} | {c.task_id} | {c.trial} | "
+              f"{c.crash_type} | {c.error_short} |")
         p()
 
     # ── Table 4: Cross-model comparison ──
@@ -311,9 +322,9 @@ def print_summary(all_results: list, output_file=None):
             ms_results = [r for r in all_results if r["config"]["model_size"] == ms]
             ms_total = sum(r["total_entries"] for r in ms_results)
             ms_crashes = sum(len(r["crashes"]) for r in ms_results)
-            ms_ctx = sum(1 for r in ms_results for c in r["crashes"] if c["crash_type"] == "context_window")
-            ms_tout = sum(1 for r in ms_results for c in r["crashes"] if c["crash_type"] == "api_timeout")
-            ms_oth = sum(1 for r in ms_results for c in r["crashes"] if c["crash_type"] == "other")
+            ms_ctx = sum(1 for r in ms_results for c in r["crashes"] if c.crash_type == "context_window")
+            ms_tout = sum(1 for r in ms_results for c in r["crashes"] if c.crash_type == "api_timeout")
+            ms_oth = sum(1 for r in ms_results for c in r["crashes"] if c.crash_type == "other")
             rate = f"{ms_crashes/ms_total*100:.1f}%" if ms_total > 0 else "N/A"
             p(f"| {ms} | {ms_total} | {ms_crashes} | {rate} | {ms_ctx} | {ms_tout} | {ms_oth} |")
         p()
@@ -354,13 +365,13 @@ def save_json(all_results: list, json_path: str):
             "total_entries": sum(r["total_entries"] for r in all_results),
             "total_crashes": sum(len(r["crashes"]) for r in all_results),
             "context_window": sum(
-                1 for r in all_results for c in r["crashes"] if c["crash_type"] == "context_window"
+                1 for r in all_results for c in r["crashes"] if c.crash_type == "context_window"
             ),
             "api_timeout": sum(
-                1 for r in all_results for c in r["crashes"] if c["crash_type"] == "api_timeout"
+                1 for r in all_results for c in r["crashes"] if c.crash_type == "api_timeout"
             ),
             "other": sum(
-                1 for r in all_results for c in r["crashes"] if c["crash_type"] == "other"
+                1 for r in all_results for c in r["crashes"] if c.crash_type == "other"
             ),
         },
         "per_file": [],
@@ -376,9 +387,9 @@ def save_json(all_results: list, json_path: str):
 
     # Per-file summaries
     for r in all_results:
-        ctx = sum(1 for c in r["crashes"] if c["crash_type"] == "context_window")
-        tout = sum(1 for c in r["crashes"] if c["crash_type"] == "api_timeout")
-        oth = sum(1 for c in r["crashes"] if c["crash_type"] == "other")
+        ctx = sum(1 for c in r["crashes"] if c.crash_type == "context_window")
+        tout = sum(1 for c in r["crashes"] if c.crash_type == "api_timeout")
+        oth = sum(1 for c in r["crashes"] if c.crash_type == "other")
         output["per_file"].append({
             "config": r["config"]["config_label"],
             "model_size": r["config"]["model_size"],
@@ -396,16 +407,16 @@ def save_json(all_results: list, json_path: str):
     for r in all_results:
         for c in r["crashes"]:
             entry = {
-                "config": c["config_label"],
-                "task_id": c["task_id"],
-                "trial": c["trial"],
-                "crash_type": c["crash_type"],
-                "error_short": c["error_short"],
+                "config": c.config_label,
+                "task_id": c.task_id,
+                "trial": c.trial,
+                "crash_type": c.crash_type,
+                "error_short": c.error_short,
             }
-            if c["tokens_used"] is not None:
-                entry["tokens_used"] = c["tokens_used"]
-                entry["token_limit"] = c["token_limit"]
-                entry["over_by"] = c["tokens_used"] - c["token_limit"]
+            if c.tokens_used is not None:
+                entry["tokens_used"] = c.tokens_used
+                entry["token_limit"] = c.token_limit
+                entry["over_by"] = c.over_by
             output["crashes"].append(entry)
 
     # Cross-model comparison
@@ -419,13 +430,13 @@ def save_json(all_results: list, json_path: str):
             "total_crashes": ms_crashes,
             "crash_rate_pct": round(ms_crashes / ms_total * 100, 2) if ms_total > 0 else 0.0,
             "context_window": sum(
-                1 for r in ms_results for c in r["crashes"] if c["crash_type"] == "context_window"
+                1 for r in ms_results for c in r["crashes"] if c.crash_type == "context_window"
             ),
             "api_timeout": sum(
-                1 for r in ms_results for c in r["crashes"] if c["crash_type"] == "api_timeout"
+                1 for r in ms_results for c in r["crashes"] if c.crash_type == "api_timeout"
             ),
             "other": sum(
-                1 for r in ms_results for c in r["crashes"] if c["crash_type"] == "other"
+                1 for r in ms_results for c in r["crashes"] if c.crash_type == "other"
             ),
         }
 
@@ -447,7 +458,215 @@ def save_json(all_results: list, json_path: str):
         json.dump(output, f, indent=2)
 
 
-def main():
+# ═══════════════════════════════════════════════════════════════════════════════
+# LIVE TAIL (--follow)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TrajectoryTail:
+    """
+    Incrementally parse a JSON array file that is rewritten as it grows.
+
+    tau-bench re-dumps the whole results list after every finished task, so
+    the bytes of entries already written don't change. We remember the byte
+    offset after the last complete entry plus the bytes just before it; on
+    the next change only the tail is decoded. If those bytes differ, the
+    file was replaced (new run) and parsing restarts from the top.
+    """
+
+    FINGERPRINT = 64
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.offset = 0
+        self.fingerprint = b""
+        self.mtime = None
+        self.shrunk = None
+        self.decoder = json.JSONDecoder()
+
+    def poll(self):
+        """Return (new_entries, restarted)."""
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return [], False
+        if st.st_mtime_ns == self.mtime:
+            return [], False
+
+        restarted = False
+        if st.st_size < self.offset:
+            # Usually the writer truncated the file and is mid-dump. If it
+            # stays shorter across two polls, a new, smaller run replaced it.
+            if self.shrunk != (st.st_mtime_ns, st.st_size):
+                self.shrunk = (st.st_mtime_ns, st.st_size)
+                return [], False
+            self.offset, self.fingerprint, restarted = 0, b"", True
+        self.shrunk = None
+
+        with open(self.path, "rb") as f:
+            if self.offset:
+                f.seek(self.offset - len(self.fingerprint))
+                if f.read(len(self.fingerprint)) != self.fingerprint:
+                    self.offset, self.fingerprint, restarted = 0, b"", True
+            f.seek(self.offset)
+            raw = f.read()
+        tail = raw.decode("utf-8", errors="replace")
+
+        entries = []
+        pos = parsed = 0
+        while True:
+            while pos < len(tail) and tail[pos] in " \t\r\n,[":
+                pos += 1
+            if pos >= len(tail) or tail[pos] == "]":
+                break
+            try:
+                entry, end = self.decoder.raw_decode(tail, pos)
+            except json.JSONDecodeError:
+                break  # entry still being written; pick it up next time
+            entries.append(entry)
+            pos = parsed = end
+
+        if entries:
+            # Stop right after the last entry: the bytes after it change
+            consumed = len(tail[:parsed].encode("utf-8"))
+            self.fingerprint = (self.fingerprint + raw[:consumed])[-self.FINGERPRINT:]
+            self.offset += consumed
+        # Only mark this version as seen once it parsed to the end
+        if pos >= len(tail) or tail[pos] == "]":
+            self.mtime = st.st_mtime_ns
+        return entries, restarted
+
+
+class LiveStats:
+    """Running crash / context-token counters for one config."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.reset()
+
+    def reset(self):
+        self.entries = 0
+        self.crashes = {"context_window": 0, "api_timeout": 0, "other": 0}
+        self.near_limit = 0
+        self.peak_tokens = 0
+        self.ctx_over_by = []
+
+    def add(self, profile: dict, near_threshold: int, crash: CrashRecord = None):
+        self.entries += 1
+        if crash:
+            self.crashes[crash.crash_type] += 1
+            if crash.tokens_used and crash.token_limit:
+                self.ctx_over_by.append(crash.over_by)
+        elif profile["peak_tokens"] >= near_threshold:
+            self.near_limit += 1
+        self.peak_tokens = max(self.peak_tokens, profile["peak_tokens"])
+
+    @property
+    def crash_rate(self):
+        return sum(self.crashes.values()) / self.entries * 100 if self.entries else 0.0
+
+    @property
+    def near_limit_rate(self):
+        return self.near_limit / self.entries * 100 if self.entries else 0.0
+
+    def line(self):
+        over = (f" over_by(max)={max(self.ctx_over_by):,}" if self.ctx_over_by else "")
+        return (f"{self.label:20s} n={self.entries:<4d} "
+                f"crash={sum(self.crashes.values())} ({self.crash_rate:.1f}%) "
+                f"[ctx={self.crashes['context_window']} timeout={self.crashes['api_timeout']} "
+                f"other={self.crashes['other']}] "
+                f"near-limit={self.near_limit} ({self.near_limit_rate:.1f}%) "
+                f"peak={self.peak_tokens:,}{over}")
+
+
+def fire_alert(stats: LiveStats, metric: str, value: float, threshold: float, alert_cmd: str):
+    message = (f"ALERT {stats.label}: {metric} {value:.1f}% >= {threshold:.1f}% "
+               f"after {stats.entries} entries")
+    print(f"\a[{time.strftime('%H:%M:%S')}] {message}", file=sys.stderr, flush=True)
+    if alert_cmd:
+        env = dict(os.environ, TAU_ALERT=message, TAU_ALERT_CONFIG=stats.label,
+                   TAU_ALERT_METRIC=metric, TAU_ALERT_VALUE=f"{value:.1f}")
+        import subprocess
+        subprocess.Popen(alert_cmd, shell=True, env=env)
+
+
+def make_waiter(traj_dir: Path, interval: float):
+    """Return wait() that blocks until something under traj_dir changes (or interval)."""
+    try:
+        from inotify_simple import INotify, flags
+    except ImportError:
+        return lambda: time.sleep(interval), "polling"
+
+    inotify = INotify()
+    mask = flags.CLOSE_WRITE | flags.MODIFY | flags.MOVED_TO | flags.CREATE
+    watched = set()
+
+    def add_watches():
+        for d in [traj_dir] + [p for p in traj_dir.rglob("*") if p.is_dir()]:
+            if d not in watched:
+                inotify.add_watch(str(d), mask)
+                watched.add(d)
+
+    def wait():
+        add_watches()
+        inotify.read(timeout=int(interval * 1000))
+        time.sleep(0.2)  # let a burst of writes settle
+
+    return wait, "inotify"
+
+
+def follow(traj_dir: Path, args):
+    """Tail every trajectory file under traj_dir and alert on bad configs."""
+    # Late import: profile_context imports from this module
+    from profile_context import init_worker, profile_entry
+    import profile_context
+
+    init_worker(args.tokenizer)
+    near_threshold = int(args.token_limit * (1 - args.near_limit_pct / 100))
+    wait, mode = make_waiter(traj_dir, args.poll_interval)
+    print(f"Following {traj_dir} ({mode}, every {args.poll_interval:g}s) — Ctrl-C to stop")
+    if profile_context._APPROXIMATE:
+        print(f"  WARNING: tokenizer '{args.tokenizer}' unavailable — near-limit uses approximate counts")
+
+    tails, stats, fired = {}, {}, set()
+    thresholds = {"crash rate": args.alert_crash_rate, "near-limit rate": args.alert_near_limit_rate}
+    try:
+        while True:
+            changed = set()
+            for filepath, config in discover_files(traj_dir, args.model_size):
+                tail = tails.setdefault(filepath, TrajectoryTail(filepath))
+                entries, restarted = tail.poll()
+                label = config["config_label"]
+                s = stats.setdefault(label, LiveStats(label))
+                if restarted:
+                    s.reset()
+                    fired = {k for k in fired if k[0] != label}
+                for entry in entries:
+                    info = entry.get("info", {})
+                    crash = CrashRecord(label, entry.get("task_id", "?"), entry.get("trial", "?"),
+                                        **classify_crash(info["error"])) if "error" in info else None
+                    s.add(profile_entry(entry, args.token_limit), near_threshold, crash)
+                if entries or restarted:
+                    changed.add(label)
+
+            for label in sorted(changed):
+                s = stats[label]
+                print(f"[{time.strftime('%H:%M:%S')}] {s.line()}", flush=True)
+                if s.entries < args.alert_min_entries:
+                    continue
+                for metric, value in (("crash rate", s.crash_rate),
+                                      ("near-limit rate", s.near_limit_rate)):
+                    threshold = thresholds[metric]
+                    if threshold is not None and value >= threshold and (label, metric) not in fired:
+                        fired.add((label, metric))
+                        fire_alert(s, metric, value, threshold, args.alert_cmd)
+            wait()
+    except KeyboardInterrupt:
+        print("\nFinal live stats:")
+        for label in sorted(stats):
+            print(f"  {stats[label].line()}")
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser(
         description="Analyze crashed runs in tau-bench trajectory files."
     )
@@ -476,7 +695,61 @@ def main():
         default=None,
         help="Save structured results to a JSON file.",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="Watch the trajectory directory and update crash stats live while runs are in progress.",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=5.0,
+        help="--follow: seconds between checks (max wait with inotify). Default: 5",
+    )
+    parser.add_argument(
+        "--alert-crash-rate",
+        type=float,
+        default=None,
+        help="--follow: alert when a config's crash rate reaches this %% (e.g., 20).",
+    )
+    parser.add_argument(
+        "--alert-near-limit-rate",
+        type=float,
+        default=None,
+        help="--follow: alert when a config's near-limit rate reaches this %% (e.g., 30).",
+    )
+    parser.add_argument(
+        "--alert-min-entries",
+        type=int,
+        default=10,
+        help="--follow: entries a config needs before alerts can fire. Default: 10",
+    )
+    parser.add_argument(
+        "--alert-cmd",
+        type=str,
+        default=None,
+        help="--follow: shell command run on alert ($TAU_ALERT, $TAU_ALERT_CONFIG, "
+             "$TAU_ALERT_METRIC, $TAU_ALERT_VALUE are set).",
+    )
+    parser.add_argument(
+        "--token-limit",
+        type=int,
+        default=32768,
+        help="--follow: context window of the agent model. Default: 32768",
+    )
+    parser.add_argument(
+        "--near-limit-pct",
+        type=float,
+        default=10.0,
+        help="--follow: a run is near-limit when its peak is within this %% of the limit. Default: 10",
+    )
+    parser.add_argument(
+        "--tokenizer",
+        type=str,
+        default="Qwen/Qwen3-14B",
+        help="--follow: HF tokenizer name or local path. Default: Qwen/Qwen3-14B",
+    )
+    args = parser.parse_args(argv)
 
     # Auto-detect trajectory directory
     if args.trajectory_dir:
@@ -498,6 +771,10 @@ def main():
     if args.model_size:
         print(f"Filter: {args.model_size.upper()} only")
 
+    if args.follow:
+        follow(traj_dir, args)
+        return
+
     # Discover and scan
     files = discover_files(traj_dir, args.model_size)
     print(f"Found {len(files)} trajectory file(s)")
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+bench_json.py — Benchmark traj_json.py against plain json.load.
+
+How it works:
+─────────────
+1. CORPORA: The bundled ReAct trajectory file (~1 MB) and a synthetic
+   corpus of --synthetic-mb MB (default 100). The corpus is built by
+   cycling the bundled entries with fresh task_ids/trials, with ~5% crashed
+   entries mixed in, and is written with json.dump(indent=2) in
+   --file-mb sized files, exactly like tau-bench writes results.
+
+2. FULL DECODE: json.load(open(path)) — what the scripts did before —
+   versus traj_json.load(path) (mmap + backend) for every installed
+   backend (json, orjson, simdjson).
+
+3. SCAN: The crash scan (info.error, reward, traj length per entry). The
+   old analyze_crashes.scan_file loop over a json.load()ed list versus the
+   current scan_file, which reads lazy entries and never decodes traj.
+
+4. SAMPLE: classify_errors.load_and_sample versus decoding everything
+   first. It filters lazily above LAZY_MIN_BYTES and decodes smaller files
+   whole, so the bundled file and the synthetic corpus exercise both paths.
+
+Each time is the best of --repeat runs. Peak Python heap is measured with
+tracemalloc in a separate run on one file. Results are printed as a
+markdown table with the speedup over the json.load baseline.
+
+Usage:
+    python bench_json.py                               # bundled file + 100 MB synthetic
+    python bench_json.py --synthetic-mb 20 --repeat 5
+    python bench_json.py --synthetic-dir /tmp/synth    # keep/reuse the synthetic corpus
+    python bench_json.py --output bench_json.md
+"""
+
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import traj_json
+from analyze_crashes import classify_crash, scan_file
+from classify_errors import load_and_sample
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+
+def find_bundled_file():
+    """The largest bundled ReAct trajectory file (falls back to any)."""
+    base = SCRIPT_DIR.parent.parent / "phase1" / "JSON_trajectories"
+    if not base.exists():
+        base = SCRIPT_DIR.parent.parent / "phase1" / "JSON_trajectories "
+    files = sorted(base.rglob("*.json"), key=lambda p: p.stat().st_size, reverse=True)
+    react = [p for p in files if "react" in p.name.lower()]
+    return (react or files or [None])[0]
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# SYNTHETIC CORPUS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def build_synthetic(template_path, out_dir, total_mb, file_mb):
+    """Write ~total_mb of indent=2 trajectory files cycling the template entries."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    existing = sorted(out_dir.glob("synthetic_*.json"))
+    if existing and sum(p.stat().st_size for p in existing) >= total_mb * 0.9 * 2**20:
+        return existing
+
+    with open(template_path) as f:
+        template = json.load(f)
+    entry_bytes = len(json.dumps(template, indent=2)) / len(template)
+    per_file = max(1, int(file_mb * 2**20 / entry_bytes))
+    n_files = max(1, round(total_mb / file_mb))
+
+    paths = []
+    task_id = 0
+    for i in range(n_files):
+        entries = []
+        for j in range(per_file):
+            src = template[(i * per_file + j) % len(template)]
+            if j % 20 == 19:
+                entries.append({
+                    "task_id": task_id, "reward": 0.0,
+                    "info": {"error": "litellm.ContextWindowExceededError: This model's maximum "
+                                      "context length is 40960 tokens. However, you requested "
+                                      "41234 tokens", "traceback": "Traceback ...\n"},
+                    "traj": [], "trial": j % 5,
+                })
+            else:
+                entries.append(dict(src, task_id=task_id, trial=j % 5))
+            task_id += j % 5 == 4
+        path = out_dir / f"synthetic_{i:03d}.json"
+        with open(path, "w") as f:
+            json.dump(entries, f, indent=2)
+        paths.append(path)
+    return paths
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# BASELINES (the pre-traj_json code paths)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def scan_stdlib(path):
+    with open(path, "r") as f:
+        data = json.load(f)
+    crashes, lengths = [], []
+    for entry in data:
+        info = entry.get("info", {})
+        if "error" in info:
+            crashes.append(classify_crash(info["error"]))
+        else:
+            lengths.append((len(entry.get("traj", [])), entry.get("reward", 0.0)))
+    return len(crashes), len(lengths)
+
+
+def sample_stdlib(path, sample_size=50):
+    with open(path) as f:
+        data = json.load(f)
+    failures = [e for e in data if e.get("reward", 1.0) == 0.0
+                and "task" in e.get("info", {}) and e.get("traj")]
+    return len(failures), len(data)
+
+
+def best_of(fn, paths, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for p in paths:
+            fn(p)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_mb(fn, path):
+    """Peak Python heap while fn(path) runs (mmap'd pages are not heap)."""
+    tracemalloc.start()
+    fn(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2**20
+
+
+def bench_corpus(name, paths, repeat):
+    size_mb = sum(p.stat().st_size for p in paths) / 2**20
+    backends = ["json"]
+    for candidate in ("orjson", "simdjson"):
+        try:
+            traj_json.set_backend(candidate)
+            backends.append(candidate)
+        except ImportError:
+            pass
+
+    config = {"config_label": "bench"}
+    stages = [
+        ("full decode", "json.load (before)", lambda p: json.load(open(p)),
+         "traj_json.load", traj_json.load),
+        ("crash scan", "json.load + loop (before)", scan_stdlib,
+         "scan_file lazy", lambda p: scan_file(p, config)),
+        ("failure sample", "json.load + filter (before)", sample_stdlib,
+         "load_and_sample", load_and_sample),
+    ]
+    rows = []
+    for stage, old_name, old_fn, new_name, new_fn in stages:
+        baseline = best_of(old_fn, paths, repeat)
+        rows.append((stage, old_name, baseline, baseline, peak_mb(old_fn, paths[0])))
+        for b in backends:
+            traj_json.set_backend(b)
+            rows.append((stage, f"{new_name} [{b}]", best_of(new_fn, paths, repeat),
+                         baseline, peak_mb(new_fn, paths[0])))
+    traj_json.set_backend()
+    return {"corpus": name, "files": len(paths), "size_mb": size_mb,
+            "peak_file_mb": paths[0].stat().st_size / 2**20, "rows": rows}
+
+
+def print_summary(results, output_file=None):
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    p("# traj_json Benchmark")
+    p()
+    for r in results:
+        p(f"## {r['corpus']} ({r['files']} file(s), {r['size_mb']:.1f} MB)")
+        p()
+        p(f"Peak heap is measured on one {r['peak_file_mb']:.1f} MB file.")
+        p()
+        p("| Stage | Method | Time (s) | MB/s | Speedup | Peak heap (MB) |")
+        p("|-------|--------|----------|------|---------|----------------|")
+        for stage, method, t, base, peak in r["rows"]:
+            p(f"| {stage} | {method} | {t:.3f} | {r['size_mb'] / t:,.0f} | {base / t:.1f}x "
+              f"| {peak:,.1f} |")
+        p()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark traj_json against json.load.")
+    parser.add_argument(
+        "--file", default=None,
+        help="Real trajectory file to benchmark (default: bundled ReAct file)",
+    )
+    parser.add_argument(
+        "--synthetic-mb", type=float, default=100,
+        help="Size of the synthetic corpus in MB; 0 to skip (default: 100)",
+    )
+    parser.add_argument(
+        "--file-mb", type=float, default=25,
+        help="Size of each synthetic file in MB (default: 25)",
+    )
+    parser.add_argument(
+        "--synthetic-dir", default=None,
+        help="Keep the synthetic corpus here and reuse it next time (default: temp dir)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3,
+        help="Runs per measurement; the best is reported (default: 3)",
+    )
+    parser.add_argument(
+        "--output", default=None,
+        help="Save the markdown table to a file instead of printing to stdout",
+    )
+    args = parser.parse_args()
+
+    real = Path(args.file) if args.file else find_bundled_file()
+    if real is None or not real.exists():
+        sys.exit("ERROR: no trajectory file found. Pass --file.")
+
+    results = []
+    print(f"Benchmarking {real.name}...", file=sys.stderr)
+    results.append(bench_corpus(real.name, [real], max(args.repeat, 5)))
+
+    if args.synthetic_mb > 0:
+        tmp = None
+        out_dir = Path(args.synthetic_dir) if args.synthetic_dir else Path(
+            tmp := tempfile.mkdtemp(prefix="bench_json_"))
+        try:
+            print(f"Building {args.synthetic_mb:.0f} MB synthetic corpus in {out_dir}...",
+                  file=sys.stderr)
+            paths = build_synthetic(real, out_dir, args.synthetic_mb, args.file_mb)
+            print("Benchmarking synthetic corpus...", file=sys.stderr)
+            results.append(bench_corpus("synthetic", paths, args.repeat))
+        finally:
+            if tmp:
+                shutil.rmtree(tmp, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            print_summary(results, output_file=f)
+        print(f"Saved markdown to {args.output}")
+    else:
+        print_summary(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+bench_memory.py — Memory benchmark: plain dicts vs the traj_model classes.
+
+How it works:
+─────────────
+1. CORPUS: A synthetic full-size corpus is laid out exactly like
+   phase1/JSON_trajectories: 4 model sizes x 3 strategies x 2 domains =
+   24 files, found with classify_errors.discover_files. ACT and ReAct files
+   cycle the bundled ACT / ReAct entries. FC files use the same entries,
+   rewritten into tool_calls + role=tool messages. Each file gets fresh
+   task_ids and trials, ~5% crashed entries, and is written with
+   json.dump(indent=2) like tau-bench does. Pass --trajectory-dir to measure
+   a real corpus instead.
+
+2. STAGES: Each stage builds the same data both ways and keeps it alive:
+   - corpus:          every entry of every file (json.load dicts vs Entry)
+   - failure samples: load_and_sample for every config (the pre-traj_model
+                      dict version vs the current one returning Entry)
+   - classifications: one record per sampled failure, as process_file
+                      builds them (dicts vs Classification)
+   - crashes:         analyze_crashes crash records (dicts vs CrashRecord)
+
+3. MEASURE: The Python heap still held after the stage (tracemalloc, after
+   gc) is the retained size. Pages of mmap'd trajectory files are page
+   cache, not heap: the OS can drop and re-read them. Build time is measured
+   in a separate untraced run.
+
+Usage:
+    python bench_memory.py                             # ~100 MB synthetic corpus
+    python bench_memory.py --file-mb 1                 # smaller corpus (24 x 1 MB)
+    python bench_memory.py --corpus-dir /tmp/corpus    # keep/reuse the synthetic corpus
+    python bench_memory.py --trajectory-dir ../../phase1/JSON_trajectories
+    python bench_memory.py --output bench_memory.md
+"""
+
+import argparse
+import gc
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import classify_errors as ce
+from analyze_crashes import classify_crash
+from traj_json import TrajectoryFile
+from traj_model import Classification, CrashRecord, iter_entries
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+SIZES = ["4b", "8b", "14b", "32b"]
+STRATEGIES = {"act": "act", "react": "react", "tool-calling": "tool-calling"}
+DOMAINS = ["airline", "retail"]
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# SYNTHETIC CORPUS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def find_templates():
+    """The bundled ACT and ReAct trajectory files: {"act": path, "react": path}."""
+    base = SCRIPT_DIR.parent.parent / "phase1" / "JSON_trajectories"
+    if not base.exists():
+        base = SCRIPT_DIR.parent.parent / "phase1" / "JSON_trajectories "
+    found = {}
+    for path in sorted(base.rglob("*.json")):
+        name = path.name.lower()
+        key = "react" if name.startswith("react") else "act" if name.startswith("act") else None
+        if key and key not in found:
+            found[key] = path
+    if not found:
+        sys.exit(f"ERROR: no bundled trajectory files under {base}")
+    found.setdefault("act", found.get("react"))
+    found.setdefault("react", found.get("act"))
+    return found
+
+
+def to_fc(entry):
+    """Rewrite an ACT/ReAct entry into the tool-calling (FC) message layout."""
+    traj, pending = [], None
+    for msg in entry.get("traj", []):
+        content = msg.get("content") or ""
+        if msg.get("role") == "assistant" and "Action:" in content:
+            try:
+                action = json.loads(content.split("Action:")[-1].strip())
+                name, args = action["name"], action.get("arguments", {})
+            except (json.JSONDecodeError, KeyError, TypeError):
+                name = None
+            if name and name != "respond":
+                pending = (f"call_{len(traj)}", name)
+                traj.append({"role": "assistant", "content": None, "tool_calls": [{
+                    "id": pending[0], "type": "function",
+                    "function": {"name": name, "arguments": json.dumps(args)},
+                }]})
+                continue
+        if pending and msg.get("role") == "user" and content.startswith("API output:"):
+            traj.append({"role": "tool", "tool_call_id": pending[0], "name": pending[1],
+                         "content": content[len("API output:"):].strip()})
+            pending = None
+            continue
+        pending = None
+        traj.append(msg)
+    return dict(entry, traj=traj)
+
+
+def build_corpus(out_dir, file_mb):
+    """Write the 24-file corpus under out_dir (reused if already there)."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if len(list(out_dir.glob("*/*.json"))) == len(SIZES) * len(STRATEGIES) * len(DOMAINS):
+        return out_dir
+
+    templates = {}
+    for key, path in find_templates().items():
+        with open(path) as f:
+            templates[key] = json.load(f)
+    templates["tool-calling"] = [to_fc(e) for e in templates["react"]]
+
+    for size in SIZES:
+        for strategy, prefix in STRATEGIES.items():
+            template = templates[strategy]
+            entry_bytes = len(json.dumps(template, indent=2)) / len(template)
+            per_file = max(1, int(file_mb * 2**20 / entry_bytes))
+            for domain in DOMAINS:
+                entries, task_id = [], 0
+                for j in range(per_file):
+                    if j % 20 == 19:
+                        entries.append({
+                            "task_id": task_id, "reward": 0.0,
+                            "info": {"error": "litellm.ContextWindowExceededError: This model's "
+                                              "maximum context length is 40960 tokens. However, "
+                                              "your request has 41234 input tokens",
+                                     "traceback": "Traceback ...\n"},
+                            "traj": [], "trial": j % 5,
+                        })
+                    else:
+                        entries.append(dict(template[j % len(template)], task_id=task_id,
+                                            trial=j % 5))
+                    task_id += j % 5 == 4
+                subdir = out_dir / f"{prefix}_{domain}_trials5_qwen_{size}"
+                subdir.mkdir(exist_ok=True)
+                name = f"{prefix}-Qwen3-{size.upper()}-0.0_range_0--1_user-Qwen3-32B-llm.json"
+                with open(subdir / name, "w") as f:
+                    json.dump(entries, f, indent=2)
+    return out_dir
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# STAGES (old: plain dicts, new: traj_model)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def sample_dicts(filepath, sample_size=50, seed=42):
+    """load_and_sample as it was before traj_model: sampled entries as dicts."""
+    with open(filepath) as f:
+        data = json.load(f)
+    failures = [e for e in data if e.get("reward", 1.0) == 0.0
+                and "task" in e.get("info", {}) and e.get("traj")]
+    seen = {}
+    for entry in failures:
+        tid = entry["task_id"]
+        if tid not in seen or entry.get("trial", 0) < seen[tid][0]:
+            seen[tid] = (entry.get("trial", 0), entry)
+    unique = [seen[tid][1] for tid in sorted(seen)]
+    random.seed(seed)
+    if len(unique) > sample_size:
+        unique = random.sample(unique, sample_size)
+    return unique
+
+
+def fake_label(i):
+    cats = sorted(ce.ERROR_TAXONOMY)
+    return {"primary_category": cats[i % len(cats)], "sub_category": "none",
+            "explanation": "The agent skipped a required confirmation step before acting."}
+
+
+def crash_dicts(filepath, label):
+    """analyze_crashes.scan_file's crash list as it was before traj_model."""
+    crashes = []
+    with TrajectoryFile(filepath) as data:
+        for entry in data:
+            if entry.has("info", "error"):
+                crash = classify_crash(entry.get_path("info", "error"))
+                crash.update(task_id=entry.get("task_id", "?"), trial=entry.get("trial", "?"),
+                             config_label=label)
+                crashes.append(crash)
+    return crashes
+
+
+def crash_records(filepath, label):
+    with TrajectoryFile(filepath) as data:
+        return [CrashRecord(label, entry.get("task_id", "?"), entry.get("trial", "?"),
+                            **classify_crash(entry.get_path("info", "error")))
+                for entry in data if entry.has("info", "error")]
+
+
+def stages(files, sample_size):
+    """[(stage, old_build, new_build)]; builds take the previous stage's kept data."""
+    def corpus_old(_):
+        out = []
+        for path, _ in files:
+            with open(path) as f:
+                out.extend(json.load(f))
+        return out
+
+    def corpus_new(_):
+        return [e for path, config in files for e in iter_entries(path, config)]
+
+    def sample_old(_):
+        return [(config, e) for path, config in files for e in sample_dicts(path, sample_size)]
+
+    def sample_new(_):
+        return [e for path, config in files
+                for e in ce.load_and_sample(path, sample_size, config=config)[0]]
+
+    def classify_old(failures):
+        records = []
+        for i, (_, failure) in enumerate(failures):
+            task = failure.get("info", {}).get("task")
+            records.append({
+                "index": i,
+                "task_id": failure["task_id"],
+                "trial": failure.get("trial", 0),
+                "instruction": task.get("instruction", ""),
+                "ground_truth_actions": task.get("actions", []),
+                "agent_actions": ce.extract_agent_actions(failure.get("traj", [])),
+                "classification": fake_label(i),
+            })
+        return records
+
+    def classify_new(failures):
+        return [Classification.from_entry(f, i, fake_label(i), ce.extract_agent_actions(f.messages))
+                for i, f in enumerate(failures)]
+
+    def crashes_old(_):
+        return [c for path, config in files for c in crash_dicts(path, config)]
+
+    def crashes_new(_):
+        return [c for path, config in files for c in crash_records(path, config)]
+
+    return [
+        ("corpus (all entries)", corpus_old, corpus_new, False),
+        ("failure samples", sample_old, sample_new, False),
+        ("classifications", classify_old, classify_new, True),
+        ("crash records", crashes_old, crashes_new, False),
+    ]
+
+
+def retained(build, arg):
+    """(retained heap bytes, result) of build(arg), with arg already allocated."""
+    gc.collect()
+    tracemalloc.start()
+    result = build(arg)
+    gc.collect()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return current, result
+
+
+def timed(build, arg):
+    start = time.perf_counter()
+    result = build(arg)
+    return time.perf_counter() - start, result
+
+
+def bench(files, sample_size):
+    rows = []
+    kept = {"old": None, "new": None}
+    for stage, old_build, new_build, needs_failures in stages(files, sample_size):
+        row = {"stage": stage}
+        for side, build in (("old", old_build), ("new", new_build)):
+            arg = kept[side] if needs_failures else None
+            seconds, _ = timed(build, arg)
+            size, result = retained(build, arg)
+            row[side] = {"mb": size / 2**20, "seconds": seconds, "items": len(result)}
+            if stage == "failure samples":
+                kept[side] = result
+            del result
+        rows.append(row)
+        print(f"  {stage:22s} {row['old']['mb']:8.1f} MB -> {row['new']['mb']:8.1f} MB",
+              file=sys.stderr)
+    return rows
+
+
+def print_summary(n_files, size_mb, rows, output_file=None):
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    p("# traj_model Memory Benchmark")
+    p()
+    p(f"{n_files} trajectory files, {size_mb:.1f} MB on disk. Retained = Python heap still "
+      "held after the stage (tracemalloc); mmap'd file pages are not heap.")
+    p()
+    p("| Stage | Items | Dicts (MB) | traj_model (MB) | Reduction | Dicts (s) | traj_model (s) |")
+    p("|-------|-------|------------|-----------------|-----------|-----------|----------------|")
+    for r in rows:
+        old, new = r["old"], r["new"]
+        ratio = f"{old['mb'] / new['mb']:.1f}x" if new["mb"] else "-"
+        p(f"| {r['stage']} | {new['items']:,} | {old['mb']:,.2f} | {new['mb']:,.2f} | {ratio} "
+          f"| {old['seconds']:.2f} | {new['seconds']:.2f} |")
+    p()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory benchmark: dicts vs traj_model.")
+    parser.add_argument(
+        "--trajectory-dir", default=None,
+        help="Measure this real corpus instead of a synthetic one",
+    )
+    parser.add_argument(
+        "--file-mb", type=float, default=4,
+        help="Size of each of the 24 synthetic files in MB (default: 4)",
+    )
+    parser.add_argument(
+        "--corpus-dir", default=None,
+        help="Keep the synthetic corpus here and reuse it next time (default: temp dir)",
+    )
+    parser.add_argument(
+        "--sample-size", type=int, default=50,
+        help="Unique failures sampled per config (default: 50)",
+    )
+    parser.add_argument(
+        "--output", default=None,
+        help="Save the markdown table to a file instead of printing to stdout",
+    )
+    args = parser.parse_args()
+
+    tmp = None
+    try:
+        if args.trajectory_dir:
+            base = Path(args.trajectory_dir)
+        else:
+            base = Path(args.corpus_dir) if args.corpus_dir else Path(
+                tmp := tempfile.mkdtemp(prefix="bench_memory_"))
+            print(f"Building synthetic corpus in {base}...", file=sys.stderr)
+            build_corpus(base, args.file_mb)
+
+        files = [f for size in SIZES for f in ce.discover_files(base, size)]
+        if not files:
+            sys.exit(f"ERROR: no trajectory files found in {base}")
+        size_mb = sum(path.stat().st_size for path, _ in files) / 2**20
+        print(f"Measuring {len(files)} files ({size_mb:.0f} MB)...", file=sys.stderr)
+        rows = bench(files, args.sample_size)
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            print_summary(len(files), size_mb, rows, output_file=f)
+        print(f"Saved markdown to {args.output}")
+    else:
+        print_summary(len(files), size_mb, rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+bench_startup.py — Startup-time regression check for analyze.py subcommands.
+
+How it works:
+─────────────
+1. CASES: Each subcommand is started the cheap way (`--help`), and the
+   reporting commands (summarize, examples) also do their real work against
+   a results directory, writing to a temp dir so nothing in results/ changes.
+
+2. TIMING: Every case runs --repeat times in a fresh interpreter; the median
+   wall time minus the median of a bare `python -c pass` is the command's
+   startup overhead. Subtracting the interpreter floor keeps the numbers
+   comparable across machines and Python installs.
+
+3. IMPORTS: One extra run per case with `python -X importtime` lists every
+   module it loaded. A case fails if it imports anything on its forbidden
+   list (provider SDKs, matplotlib, numpy, tokenizers, ...) — that catches
+   a stray top-level import even on a machine too fast to notice it.
+
+4. BUDGETS: A case also fails if its overhead exceeds its budget in ms
+   (scaled by --budget-scale), or, with --baseline, if it exceeds the saved
+   overhead by more than --tolerance x + --slack-ms. Exit status is 1 on
+   any failure, so this can run in CI next to the scripts.
+
+Usage:
+    python bench_startup.py                            # check against built-in budgets
+    python bench_startup.py --repeat 10 --output startup.md
+    python bench_startup.py --save-baseline startup_baseline.json
+    python bench_startup.py --baseline startup_baseline.json --tolerance 1.3
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+# Time what users get: imported modules load from cached bytecode (__pycache__/).
+ENV = {k: v for k, v in os.environ.items() if k != "PYTHONDONTWRITEBYTECODE"}
+
+# Never needed to start any command; only the code paths that use them import them.
+HEAVY_MODULES = {"anthropic", "openai", "matplotlib", "numpy", "transformers", "tokenizers"}
+
+# (name, argv after analyze.py, overhead budget in ms, extra forbidden modules)
+# {tmp} and {results} are filled in at run time. Budgets are ~3x the worst
+# overhead median seen over repeated --repeat 10 runs (loaded machine
+# included): they catch gross regressions without flaking. The forbidden
+# modules and --baseline are the precise checks.
+CASES = [
+    ("help", ["--help"], 10, {"argparse", "json", "pathlib"}),           # ~0-2 ms
+    ("scan --help", ["scan", "--help"], 120, set()),                     # ~30-40 ms
+    ("classify --help", ["classify", "--help"], 120, {"random", "heapq"}),
+    ("rerun --help", ["rerun", "--help"], 120, set()),
+    ("plan --help", ["plan", "--help"], 150, set()),                     # ~30-50 ms
+    ("summarize --help", ["summarize", "--help"], 80, {"json", "pathlib"}),  # ~15-28 ms
+    ("examples --help", ["examples", "--help"], 80, {"json", "pathlib"}),
+    ("plot --help", ["plot", "--help"], 80, {"json", "pathlib"}),
+    ("summarize", ["summarize", "--output-dir", "{results}", "--quiet",
+                   "--output", "{tmp}/combined_summary.json"], 200, {"random"}),  # ~40-70 ms
+    ("examples", ["examples", "--output-dir", "{results}",
+                  "--output", "{tmp}/representative_examples.json"], 200, {"random"}),
+]
+
+
+def run_case(argv, importtime=False):
+    """Run analyze.py once. Returns (seconds, stderr)."""
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd += [str(SCRIPT_DIR / "analyze.py")] + argv
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=SCRIPT_DIR, env=ENV, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"analyze.py {' '.join(argv)} exited {proc.returncode}:\n"
+                           f"{proc.stderr[-2000:]}")
+    return elapsed, proc.stderr
+
+
+def imported_modules(importtime_stderr):
+    """Top-level package names from `python -X importtime` output."""
+    mods = set()
+    for line in importtime_stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            name = line.rsplit("|", 1)[1].strip()
+            if name != "package":
+                mods.add(name.split(".")[0])
+    return mods
+
+
+def median_ms(cmd, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, env=ENV, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def bench(args):
+    floor_ms = median_ms([sys.executable, "-c", "pass"], args.repeat)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["overhead_ms"]
+
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as tmp:
+        for name, argv, budget, forbid in CASES:
+            argv = [a.format(tmp=tmp, results=args.results_dir) for a in argv]
+            run_case(argv)  # warm the page cache and write the bytecode cache
+            _, stderr = run_case(argv, importtime=True)
+            loaded = imported_modules(stderr)
+            times = [run_case(argv)[0] for _ in range(args.repeat)]
+            overhead = max(0.0, statistics.median(times) * 1000 - floor_ms)
+
+            problems = []
+            bad = sorted(loaded & (HEAVY_MODULES | forbid))
+            if bad:
+                problems.append(f"imports {', '.join(bad)}")
+            limit = budget * args.budget_scale
+            if overhead > limit:
+                problems.append(f"over budget ({limit:.0f} ms)")
+            if name in baseline:
+                allowed = baseline[name] * args.tolerance + args.slack_ms
+                if overhead > allowed:
+                    problems.append(f"regressed vs baseline {baseline[name]:.1f} ms")
+            rows.append({
+                "case": name,
+                "median_ms": round(statistics.median(times) * 1000, 1),
+                "overhead_ms": round(overhead, 1),
+                "budget_ms": round(limit),
+                "modules": len(loaded),
+                "status": "; ".join(problems) or "ok",
+            })
+            print(f"  {name:20s} {rows[-1]['overhead_ms']:7.1f} ms  {rows[-1]['status']}",
+                  file=sys.stderr)
+    return floor_ms, rows
+
+
+def print_summary(floor_ms, rows, output_file=None):
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    p("# analyze.py Startup Times")
+    p()
+    p(f"Interpreter floor (`python -c pass`): {floor_ms:.1f} ms — overhead is the time on top of it.")
+    p()
+    p("| Command | Median (ms) | Overhead (ms) | Budget (ms) | Modules | Status |")
+    p("|---------|-------------|---------------|-------------|---------|--------|")
+    for r in rows:
+        p(f"| `{r['case']}` | {r['median_ms']} | {r['overhead_ms']} | {r['budget_ms']} "
+          f"| {r['modules']} | {r['status']} |")
+    p()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check analyze.py subcommand startup times.")
+    parser.add_argument(
+        "--repeat", type=int, default=5,
+        help="Timed runs per command; the median is used (default: 5)",
+    )
+    parser.add_argument(
+        "--results-dir", default=str(SCRIPT_DIR / "results"),
+        help="Results directory for the summarize/examples cases (read only; default: results/)",
+    )
+    parser.add_argument(
+        "--budget-scale", type=float, default=1.0,
+        help="Multiply every built-in budget by this, e.g. 2 on a slow CI box (default: 1.0)",
+    )
+    parser.add_argument(
+        "--baseline", default=None,
+        help="Also fail when a command is slower than this saved baseline",
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=1.5,
+        help="Allowed slowdown factor vs --baseline (default: 1.5)",
+    )
+    parser.add_argument(
+        "--slack-ms", type=float, default=10.0,
+        help="Absolute ms added to the --baseline allowance to absorb noise (default: 10)",
+    )
+    parser.add_argument(
+        "--save-baseline", default=None,
+        help="Write the measured overheads to this JSON file",
+    )
+    parser.add_argument(
+        "--output", default=None,
+        help="Save the markdown table to a file instead of printing to stdout",
+    )
+    args = parser.parse_args()
+
+    print(f"Timing {len(CASES)} commands x {args.repeat} runs...", file=sys.stderr)
+    floor_ms, rows = bench(args)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            print_summary(floor_ms, rows, output_file=f)
+        print(f"Saved markdown to {args.output}")
+    else:
+        print_summary(floor_ms, rows)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"python": sys.version.split()[0], "floor_ms": round(floor_ms, 1),
+                       "overhead_ms": {r["case"]: r["overhead_ms"] for r in rows}}, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    failed = [r for r in rows if r["status"] != "ok"]
+    if failed:
+        print(f"FAIL: {len(failed)} command(s) regressed: "
+              f"{', '.join(r['case'] for r in failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,16 +17,18 @@ Usage:
     python classify_errors.py --help
 """
 
-import argparse
 import json
 import os
-import random
 import re
 import sys
 import time
 from collections import defaultdict
 from pathlib import Path
 
+from traj_json import TRAJ_SUFFIXES, TrajectoryFile, load
+from traj_model import (Classification, Entry, EntryList, as_actions, as_classification,
+                        as_entry, as_messages)
+
 # Set to True via --debug flag. Controls [DEBUG] print statements.
 DEBUG = False
 
@@ -82,6 +84,23 @@ DEFAULT_MODELS = {
     "openai": "gpt-4o",
 }
 
+# Cheap first-tier models for --cascade (escalate to DEFAULT_MODELS when unsure)
+CHEAP_MODELS = {
+    "anthropic": "claude-haiku-4-5-20251001",
+    "openai": "gpt-4o-mini",
+}
+
+# List prices in USD per 1M (input, output) tokens — only used for cost estimates
+MODEL_PRICES = {
+    "claude-sonnet-4-5-20250929": (3.00, 15.00),
+    "claude-haiku-4-5-20251001": (1.00, 5.00),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+# Per-tier call stats, filled by classify_one. tier -> {calls, seconds, est_cost_usd}
+TIER_STATS = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "est_cost_usd": 0.0})
+
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # FILE DISCOVERY
@@ -143,8 +162,8 @@ def discover_files(base_dir, model_size="14b"):
                         print(
                             f"[DEBUG] discover_files: Subdir to get json form  = {name}")
 
-                    # Each subdirectory should have exactly one JSON file inside
-                    jsons = sorted(subdir.glob("*.json"))
+                    # Each subdirectory should have exactly one JSON file (or .tjz archive) inside
+                    jsons = sorted(p for p in subdir.iterdir() if p.suffix in TRAJ_SUFFIXES)
                     if jsons:
                         files.append((jsons[0], config_name))
                         found = True
@@ -169,23 +188,68 @@ def discover_files(base_dir, model_size="14b"):
 # so we classify each unique failure pattern once, not 5 times.
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def load_and_sample(filepath, sample_size=50, seed=42):
-    """Load trajectory JSON, return sampled unique failure cases."""
+# Below this size one full decode is faster than the lazy filter, whose
+# per-entry span walks cost more than they save on small files
+# (bench_json.py: 0.4-0.6x of json.load + filter on the bundled 1 MB file).
+# Above it the lazy path runs at about json.load speed, and its samples
+# hold offsets into the mmap instead of decoded entry dicts.
+LAZY_MIN_BYTES = 2 * 2**20
+
+
+def load_and_sample(filepath, sample_size=50, seed=42, config=None):
+    """Load trajectory JSON, return sampled unique failure cases (as Entry objects).
+
+    The entries come as an EntryList that owns the mmap'd file: close it,
+    or use it in a with block, once their messages are no longer needed.
+    Files under LAZY_MIN_BYTES are decoded whole and hold nothing open.
+    """
     if DEBUG:
         print(
             f"[DEBUG] load_and_sample(filepath={Path(filepath).name}, sample_size={sample_size}, seed={seed})")
-    with open(filepath) as f:
-        data = json.load(f)
+    if Path(filepath).stat().st_size < LAZY_MIN_BYTES:
+        data = load(filepath)
+        sampled, unique, failures = _sample_failures(data, sample_size, seed)
+        entries = EntryList(Entry.from_dict(entry, config) for entry in sampled)
+        if DEBUG:
+            print(
+                f"[DEBUG] load_and_sample -> {len(data)} total entries, {len(failures)} failures, {len(unique)} unique task_ids")
+        return entries, len(data)
 
+    # Large files are lazy: the filter reads reward/info.task/traj length
+    # only, and just the sampled entries become Entry objects. Their message
+    # text stays in the mmap'd file until a prompt is built.
+    data = TrajectoryFile(filepath)
+    try:
+        sampled, unique, failures = _sample_failures(data, sample_size, seed)
+        entries = EntryList([Entry.from_lazy(entry, data, config) for entry in sampled], data)
+    except BaseException:
+        data.close()
+        raise
+    if DEBUG:
+        print(
+            f"[DEBUG] load_and_sample -> {len(data)} total entries, {len(failures)} failures, {len(unique)} unique task_ids")
+    return entries, len(data)
+
+
+def _sample_failures(data, sample_size, seed):
+    """(sample, unique failures, all failures) of decoded entries or a TrajectoryFile."""
     # Filter to failed tasks only (reward=0.0 means the agent got it wrong).
     # Also skip entries that crashed mid-run — these have info.error/traceback
     # instead of info.task, and an empty traj. Nothing to classify.
-    failures = [
-        entry for entry in data
-        if entry.get("reward", 1.0) == 0.0
-        and "task" in entry.get("info", {})
-        and entry.get("traj")
-    ]
+    if isinstance(data, list):
+        failures = [
+            entry for entry in data
+            if entry.get("reward", 1.0) == 0.0
+            and "task" in entry.get("info", {})
+            and entry.get("traj")
+        ]
+    else:
+        failures = [
+            entry for entry in data
+            if entry.get("reward", 1.0) == 0.0
+            and entry.has("info", "task")
+            and entry.length("traj")
+        ]
 
     # Deduplicate: keep one entry per task_id (lowest trial number).
     # Why? A task that fails all 5 trials is ONE failure pattern, not five.
@@ -193,18 +257,16 @@ def load_and_sample(filepath, sample_size=50, seed=42):
     seen = {}
     for entry in failures:
         tid = entry["task_id"]
-        if tid not in seen or entry.get("trial", 0) < seen[tid].get("trial", 0):
-            seen[tid] = entry
-    unique = sorted(seen.values(), key=lambda x: x["task_id"])
+        if tid not in seen or entry.get("trial", 0) < seen[tid][0]:
+            seen[tid] = (entry.get("trial", 0), entry)
+    unique = [seen[tid][1] for tid in sorted(seen)]
 
     # Deterministic sample (fixed seed = same sample on re-run = safe to resume)
+    import random
     random.seed(seed)
-    if DEBUG:
-        print(
-            f"[DEBUG] load_and_sample -> {len(data)} total entries, {len(failures)} failures, {len(unique)} unique task_ids")
-    if len(unique) <= sample_size:
-        return unique, len(data)
-    return random.sample(unique, sample_size), len(data)
+    if len(unique) > sample_size:
+        return random.sample(unique, sample_size), unique, failures
+    return unique, unique, failures
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -250,26 +312,24 @@ def extract_agent_actions(traj):
     if DEBUG:
         print(f"[DEBUG] extract_agent_actions(traj_len={len(traj)})")
     actions = []
-    for msg in traj:
-        if msg.get("role") != "assistant":
+    for msg in as_messages(traj):
+        if msg.role != "assistant":
             continue
 
         # FC format: structured tool_calls array
-        tool_calls = msg.get("tool_calls")
-        if tool_calls:
-            for tc in tool_calls:
-                fn = tc.get("function", {})
+        if msg.tool_calls:
+            for tc in msg.tool_calls:
                 try:
-                    args = json.loads(fn.get("arguments", "{}"))
+                    args = json.loads(tc.arguments)
                 except (json.JSONDecodeError, TypeError):
-                    args = fn.get("arguments", {})
-                name = fn.get("name", "unknown")
+                    args = tc.arguments
+                name = tc.name or "unknown"
                 if name not in ("respond", "unknown"):
                     actions.append({"name": name, "arguments": args})
             continue
 
         # ACT/ReAct format: Action: {...} in content
-        content = msg.get("content", "") or ""
+        content = msg.content or ""
         match = re.search(r'Action:\s*(\{.*\})', content, re.DOTALL)
         if match:
             try:
@@ -284,6 +344,83 @@ def extract_agent_actions(traj):
     return actions
 
 
+def iter_tool_results(traj):
+    """Yield (name, arguments, output) for every tool call the agent made.
+
+    Pairs each action with the environment's reply:
+      - ACT/ReAct: the next 'user' message starting with 'API output:'
+      - FC (tool-calling): the 'tool' message with the matching tool_call_id
+    'respond' actions are skipped. Output is None if the reply is missing
+    (e.g., the run was cut short right after the call).
+    """
+    pending_fc = {}
+    pending_act = None
+    for msg in as_messages(traj):
+        role = msg.role
+        content = msg.content or ""
+
+        if role == "assistant":
+            pending_act = None
+            if msg.tool_calls:
+                for tc in msg.tool_calls:
+                    try:
+                        args = json.loads(tc.arguments)
+                    except (json.JSONDecodeError, TypeError):
+                        args = tc.arguments
+                    name = tc.name or "unknown"
+                    if name not in ("respond", "unknown"):
+                        pending_fc[tc.id] = (name, args)
+                continue
+            match = re.search(r'Action:\s*(\{.*\})', content, re.DOTALL)
+            if match:
+                try:
+                    action = json.loads(match.group(1))
+                except json.JSONDecodeError:
+                    continue
+                if action.get("name") not in ("respond", None):
+                    pending_act = (action["name"], action.get("arguments", {}))
+
+        elif role == "tool":
+            call = pending_fc.pop(msg.tool_call_id, None)
+            if call:
+                yield call[0], call[1], content
+
+        elif role == "user" and pending_act and content.startswith("API output:"):
+            yield pending_act[0], pending_act[1], content[len("API output:"):].strip()
+            pending_act = None
+
+    # Calls that never got a reply (run ended or crashed mid-turn)
+    if pending_act:
+        yield pending_act[0], pending_act[1], None
+    for name, args in pending_fc.values():
+        yield name, args, None
+
+
+def extract_responses(traj):
+    """Collect the text of every 'respond' action the agent sent to the user.
+
+    Mirrors how tau-bench turns an assistant message into a respond action,
+    so info.task.outputs can be checked the same way:
+      - ACT/ReAct: Action: {"name": "respond", "arguments": {"content": ...}}
+      - Unparseable Action JSON: the raw text after 'Action:'
+      - FC: assistant messages without tool_calls (full content)
+    """
+    responses = []
+    for msg in as_messages(traj):
+        if msg.role != "assistant" or msg.tool_calls:
+            continue
+        action_str = (msg.content or "").split("Action:")[-1].strip()
+        try:
+            action = json.loads(action_str)
+        except json.JSONDecodeError:
+            responses.append(action_str)
+            continue
+        if isinstance(action, dict) and action.get("name") == "respond":
+            responses.append(
+                str(action.get("arguments", {}).get("content", "")))
+    return responses
+
+
 def format_conversation(traj_messages, max_api_output_len=500):
     """Format conversation turns for the classifier prompt.
 
@@ -295,27 +432,26 @@ def format_conversation(traj_messages, max_api_output_len=500):
         print(
             f"[DEBUG] format_conversation(num_messages={len(traj_messages)}, max_api_output_len={max_api_output_len})")
     lines = []
-    for msg in traj_messages:
-        role = msg.get("role", "unknown").upper()
-        content = msg.get("content", "") or ""
+    for msg in as_messages(traj_messages):
+        role = (msg.role or "unknown").upper()
+        content = msg.content or ""
 
         # Strip simulator reasoning from user messages (noise for classification)
-        if msg.get("role") == "user" and "<think>" in content:
+        if msg.role == "user" and "<think>" in content:
             content = re.sub(r'<think>.*?</think>\s*',
                              '', content, flags=re.DOTALL)
 
         # Truncate verbose API outputs (tool results can be huge JSON blobs)
-        if msg.get("role") == "user" and content.startswith("API output:"):
+        if msg.role == "user" and content.startswith("API output:"):
             if len(content) > max_api_output_len:
                 content = content[:max_api_output_len] + " ... [truncated]"
 
         # For FC format: append tool_calls info to content
-        if msg.get("role") == "assistant" and msg.get("tool_calls"):
+        if msg.role == "assistant" and msg.tool_calls:
             tc_lines = []
-            for tc in msg["tool_calls"]:
-                fn = tc.get("function", {})
+            for tc in msg.tool_calls:
                 tc_lines.append(
-                    f"  [Tool Call] {fn.get('name')}({fn.get('arguments', '{}')})")
+                    f"  [Tool Call] {tc.name}({tc.arguments})")
             content = ((content or "") + "\n" + "\n".join(tc_lines)).strip()
 
         if content.strip():
@@ -335,10 +471,8 @@ def format_ground_truth(actions):
             "or correctly identified it as out of scope."
         )
     lines = []
-    for i, action in enumerate(actions, 1):
-        name = action.get("name", "unknown")
-        kwargs = action.get("kwargs", action.get("arguments", {}))
-        lines.append(f"{i}. {name}({json.dumps(kwargs, indent=2)})")
+    for i, action in enumerate(as_actions(actions), 1):
+        lines.append(f"{i}. {action.name}({json.dumps(action.arguments, indent=2)})")
     return "\n".join(lines)
 
 
@@ -353,28 +487,31 @@ def format_ground_truth(actions):
 #   5. Our error taxonomy (so it picks a consistent category)
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def build_prompt(failure):
+def build_prompt(failure, ask_confidence=False):
     """Build the full classification prompt for one failure case.
 
     The key insight: we pass BOTH the ground truth and the actual conversation.
     Without ground truth, the classifier would have to guess what "correct"
     looks like and would hallucinate plausible-sounding errors.
+
+    ask_confidence=True adds a "confidence" field to the requested JSON
+    (used by the cheap tier in --cascade mode).
     """
+    entry = as_entry(failure)
     if DEBUG:
         print(
-            f"[DEBUG] build_prompt(task_id={failure.get('task_id')}, trial={failure.get('trial', 0)})")
-    traj = failure.get("traj", [])
-    task = failure.get("info", {}).get("task", {})
+            f"[DEBUG] build_prompt(task_id={entry.task_id}, trial={entry.trial})")
+    traj = entry.messages
 
     # Extract policy from system prompt (first traj entry)
     policy = "No policy available"
-    if traj and traj[0].get("role") == "system":
-        policy = extract_policy(traj[0].get("content", ""))
+    if traj and traj[0].role == "system":
+        policy = extract_policy(traj[0].content or "")
 
-    gt_text = format_ground_truth(task.get("actions", []))
+    gt_text = format_ground_truth(entry.actions)
 
     # Conversation = everything after system prompt
-    conv_messages = [m for m in traj if m.get("role") != "system"]
+    conv_messages = [m for m in traj if m.role != "system"]
     conv_text = format_conversation(conv_messages)
 
     # Build taxonomy reference for the classifier
@@ -389,7 +526,7 @@ The agent was supposed to help a simulated user with a customer service task but
 Your job: figure out WHY it failed by comparing what the agent did vs what it should have done.
 
 ## User's Goal
-{task.get("instruction", "No instruction available")}
+{entry.instruction if entry.instruction is not None else "No instruction available"}
 
 ## Expected Solution (Ground Truth)
 These are the correct actions the agent should have taken:
@@ -408,6 +545,11 @@ Classify this failure into EXACTLY ONE of these categories:
 Respond with ONLY valid JSON, nothing else:
 {{"primary_category": "<category_id>", "sub_category": "<brief specific sub-type>", "explanation": "<1-2 sentence explanation>"}}"""
 
+    if ask_confidence:
+        prompt = prompt[:-1] + (
+            ', "confidence": <0.0-1.0, how sure you are of primary_category>}'
+            "\nOnly use a confidence above 0.8 if no other category plausibly fits.")
+
     return prompt
 
 
@@ -445,16 +587,18 @@ def create_client(provider):
             f"ERROR: Unknown provider '{provider}'. Use 'anthropic' or 'openai'.")
 
 
-def call_llm(client, provider, model, prompt):
+def call_llm(client, provider, model, prompt, temperature=None):
     """Single LLM API call. Returns raw response text."""
     if DEBUG:
         print(
-            f"[DEBUG] call_llm(provider={provider}, model={model}, prompt_len={len(prompt)})")
+            f"[DEBUG] call_llm(provider={provider}, model={model}, prompt_len={len(prompt)}, temperature={temperature})")
+    extra = {} if temperature is None else {"temperature": temperature}
     if provider == "anthropic":
         response = client.messages.create(
             model=model,
             max_tokens=300,
             messages=[{"role": "user", "content": prompt}],
+            **extra,
         )
         return response.content[0].text
 
@@ -467,6 +611,7 @@ def call_llm(client, provider, model, prompt):
             ],
             max_tokens=300,
             response_format={"type": "json_object"},
+            **extra,
         )
         return response.choices[0].message.content
 
@@ -513,16 +658,18 @@ def parse_response(text):
     }
 
 
-def classify_one(client, provider, model, failure, delay=0.5):
-    """Classify a single failure case. Retries once on API error."""
-    if DEBUG:
-        print(
-            f"[DEBUG] classify_one(provider={provider}, model={model}, task_id={failure.get('task_id')}, delay={delay})")
-    prompt = build_prompt(failure)
-
+def _classify_prompt(client, provider, model, prompt, delay, tier, temperature=None):
+    """Send one prompt, parse the label, record per-tier stats. Retries once."""
     for attempt in range(2):
         try:
-            response_text = call_llm(client, provider, model, prompt)
+            start = time.perf_counter()
+            response_text = call_llm(client, provider, model, prompt, temperature)
+            stats = TIER_STATS[tier]
+            stats["calls"] += 1
+            stats["seconds"] += time.perf_counter() - start
+            # ~4 chars per token; good enough to compare tiers
+            price_in, price_out = MODEL_PRICES.get(model, (0.0, 0.0))
+            stats["est_cost_usd"] += (len(prompt) * price_in + len(response_text) * price_out) / 4e6
             result = parse_response(response_text)
 
             # Validate category is in our taxonomy
@@ -545,22 +692,201 @@ def classify_one(client, provider, model, failure, delay=0.5):
                 }
 
 
+def cheap_votes(client, provider, failure, cascade, delay):
+    """Ask the cheap model (cascade["samples"] times). Returns (votes, label, agreement, confidence)."""
+    prompt = build_prompt(failure, ask_confidence=True)
+    temperature = 0.7 if cascade["samples"] > 1 else None
+    votes = [
+        _classify_prompt(client, provider, cascade["cheap_model"], prompt, delay, "cheap", temperature)
+        for _ in range(cascade["samples"])
+    ]
+    counts = defaultdict(int)
+    for v in votes:
+        counts[v["primary_category"]] += 1
+    label = max(counts, key=counts.get)
+    agreement = counts[label] / len(votes)
+    confs = []
+    for v in votes:
+        if v["primary_category"] == label:
+            try:
+                confs.append(min(max(float(v.get("confidence", 0.0)), 0.0), 1.0))
+            except (TypeError, ValueError):
+                confs.append(0.0)
+    confidence = sum(confs) / len(confs) if confs else 0.0
+    return votes, label, agreement, confidence
+
+
+def classify_one(client, provider, model, failure, delay=0.5, cascade=None):
+    """Classify a single failure case. Retries once on API error.
+
+    cascade = {"cheap_model", "threshold", "samples"} enables cascade mode:
+    the cheap model answers first (with a confidence, optionally several
+    samples for self-consistency) and the case only goes to `model` when
+    the cheap answer is unsure, inconsistent, or not a taxonomy category.
+    """
+    if DEBUG:
+        print(
+            f"[DEBUG] classify_one(provider={provider}, model={model}, task_id={as_entry(failure).task_id}, delay={delay}, cascade={cascade})")
+    if not cascade:
+        return _classify_prompt(client, provider, model, build_prompt(failure), delay, "strong")
+
+    votes, label, agreement, confidence = cheap_votes(client, provider, failure, cascade, delay)
+    if label in ERROR_TAXONOMY and agreement == 1.0 and confidence >= cascade["threshold"]:
+        result = next(v for v in votes if v["primary_category"] == label)
+        result.update(tier="cheap", confidence=round(confidence, 3), agreement=agreement)
+        return result
+
+    result = _classify_prompt(client, provider, model, build_prompt(failure), delay, "strong")
+    result.update(tier="strong", cheap_label=label,
+                  confidence=round(confidence, 3), agreement=agreement)
+    return result
+
+
+def evaluate_cascade(client, provider, model, cascade, files, sample_size, n_holdout,
+                     seed, delay, thresholds=(0.5, 0.6, 0.7, 0.8, 0.9, 0.95)):
+    """Label a held-out set with BOTH tiers and sweep the escalation threshold.
+
+    The held-out set only contains unique failures, keyed by (config,
+    task_id), that are NOT in the classified sample. For each threshold,
+    the cascade's label is the cheap label if it would not have escalated,
+    else the strong label; we report how often that matches strong-only
+    labeling, the escalation rate, and the cost.
+    """
+    pool, opened = [], []
+    for filepath, config_name in files:
+        # Same call as process_file, so `classified` is exactly what was labeled
+        with load_and_sample(filepath, sample_size, config=config_name)[0] as classified:
+            taken = {(config_name, f.task_id) for f in classified}
+        everything, _ = load_and_sample(filepath, sys.maxsize, config=config_name)
+        opened.append(everything)
+        pool.extend(f for f in everything if (config_name, f.task_id) not in taken)
+    if len(pool) < n_holdout:
+        print(f"  WARNING: only {len(pool)} unique failures lie outside the classified "
+              f"sample (asked for {n_holdout}); add trajectories or lower --sample-size.")
+    if not pool:
+        print("  Skipping cascade evaluation: no held-out failures available.")
+        for entries in opened:
+            entries.close()
+        return {"cases": [], "sweep": [], "holdout_available": 0}
+    import random
+    rng = random.Random(seed + 1)
+    holdout = rng.sample(pool, min(n_holdout, len(pool)))
+
+    cases = []
+    try:
+        for i, failure in enumerate(holdout):
+            print(f"  [holdout {i+1}/{len(holdout)}] task_id={failure.task_id} ... ", end="", flush=True)
+            _, label, agreement, confidence = cheap_votes(client, provider, failure, cascade, delay)
+            strong = _classify_prompt(client, provider, model, build_prompt(failure), delay, "strong_eval")
+            cases.append({"task_id": failure.task_id, "cheap_label": label, "agreement": agreement,
+                          "confidence": confidence, "strong_label": strong["primary_category"]})
+            print(f"cheap={label} ({confidence:.2f}) strong={strong['primary_category']}")
+    finally:
+        for entries in opened:
+            entries.close()
+
+    sweep = []
+    cheap_cost = MODEL_PRICES.get(cascade["cheap_model"], (0, 0))
+    strong_cost = MODEL_PRICES.get(model, (0, 0))
+    for t in sorted(set(thresholds) | {cascade["threshold"]}):
+        escalated = [c["cheap_label"] not in ERROR_TAXONOMY or c["agreement"] < 1.0
+                     or c["confidence"] < t for c in cases]
+        agree = sum(
+            1 for c, esc in zip(cases, escalated)
+            if esc or c["cheap_label"] == c["strong_label"])
+        n = len(cases) or 1
+        sweep.append({
+            "threshold": t,
+            "escalation_rate": round(sum(escalated) / n, 3),
+            "agreement_with_strong": round(agree / n, 3),
+            # Relative input cost vs strong-only (cheap always runs, strong on escalation)
+            "relative_cost": round(
+                (cascade["samples"] * cheap_cost[0] + sum(escalated) / n * strong_cost[0])
+                / strong_cost[0], 3) if strong_cost[0] else None,
+        })
+    return {"cases": cases, "sweep": sweep, "holdout_available": len(pool)}
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# RESULT LOG (NDJSON)
+# Classifications are appended to results/{config}.ndjson, one JSON object
+# per line, as soon as they come back from the API. Each record carries its
+# position in the sample ("index"), so resuming only needs the LAST line —
+# no reload of everything written so far. Lines are flushed immediately
+# (survives a Python crash) and fsync'd every --fsync-every records
+# (survives a machine crash).
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _rfind_newline(f, before):
+    """Offset of the last newline strictly before `before`, or -1. Reads backwards."""
+    pos = before
+    while pos > 0:
+        step = min(65536, pos)
+        pos -= step
+        f.seek(pos)
+        i = f.read(step).rfind(b"\n")
+        if i >= 0:
+            return pos + i
+    return -1
+
+
+def read_last_record(log_path):
+    """Return the last complete record in an NDJSON log, or None.
+
+    Only reads the tail of the file. A torn final line (crash mid-write)
+    is truncated away so appends continue from a clean line boundary.
+    """
+    with open(log_path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        last_nl = _rfind_newline(f, size)
+        if last_nl + 1 < size:
+            f.truncate(last_nl + 1)
+        if last_nl < 0:
+            return None
+        prev_nl = _rfind_newline(f, last_nl)
+        f.seek(prev_nl + 1)
+        line = f.read(last_nl - prev_nl - 1)
+    return json.loads(line) if line.strip() else None
+
+
+def iter_log(log_path):
+    """Stream records from an NDJSON log, stopping at a torn final line."""
+    with open(log_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                return
+
+
+def iter_classifications(result, output_dir=None):
+    """Stream a config's classifications from its log (or inline, for old results)."""
+    if "classifications" in result:
+        yield from result["classifications"]
+    elif result.get("log"):
+        log_path = Path(result["log"])
+        if not log_path.is_absolute() and output_dir is not None:
+            log_path = Path(output_dir) / log_path
+        yield from iter_log(log_path)
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # PROCESSING & AGGREGATION
 # Runs classification on each file and aggregates results.
 # ═══════════════════════════════════════════════════════════════════════════════
 
 def compute_summary(classifications):
-    """Count errors per category with percentages."""
+    """Count errors per category with percentages. Accepts any iterable."""
     if DEBUG:
-        print(
-            f"[DEBUG] compute_summary(num_classifications={len(classifications)})")
+        print("[DEBUG] compute_summary()")
     counts = defaultdict(int)
+    total = 0
     for c in classifications:
-        cat = c["classification"]["primary_category"]
-        counts[cat] += 1
+        counts[as_classification(c).category] += 1
+        total += 1
 
-    total = len(classifications)
     return {
         cat: {
             "count": count,
@@ -571,17 +897,19 @@ def compute_summary(classifications):
 
 
 def process_file(filepath, config_name, client, provider, model,
-                 sample_size, output_dir, delay, force, dry_run):
+                 sample_size, output_dir, delay, force, dry_run, fsync_every=10,
+                 cascade=None):
     """Full pipeline for one trajectory file: load -> sample -> classify -> save.
 
-    Supports resuming: if a .partial.json exists from a crashed run, picks up
-    where it left off (same seed = same sample = safe to resume).
+    Supports resuming: if {config}.ndjson exists from a crashed run, picks up
+    after its last record (same seed = same sample = safe to resume).
     """
     if DEBUG:
         print(
             f"[DEBUG] process_file(config={config_name}, file={filepath.name}, provider={provider}, model={model}, sample_size={sample_size}, force={force}, dry_run={dry_run})")
     result_path = output_dir / f"{config_name}.json"
-    partial_path = output_dir / f"{config_name}.partial.json"
+    log_path = output_dir / f"{config_name}.ndjson"
+    legacy_partial_path = output_dir / f"{config_name}.partial.json"
 
     # Skip if already completed
     if result_path.exists() and not force:
@@ -595,14 +923,16 @@ def process_file(filepath, config_name, client, provider, model,
     print(f"File:   {filepath.name}")
 
     # Load and sample
-    failures, total_entries = load_and_sample(filepath, sample_size)
-    total_tasks = len(set(e["task_id"]
-                      for e in json.loads(open(filepath).read())))
+    failures, total_entries = load_and_sample(filepath, sample_size, config=config_name)
+    with TrajectoryFile(filepath) as data:
+        total_tasks = len({e["task_id"] for e in data})
+        total_failures_in_file = sum(1 for e in data if e.get("reward", 1) == 0.0)
 
     print(f"  {total_tasks} tasks total, {len(failures)} unique failures sampled")
 
     if not failures:
         print("  No failures found, skipping")
+        failures.close()
         return None
 
     # Dry run: print one prompt and exit
@@ -612,113 +942,134 @@ def process_file(filepath, config_name, client, provider, model,
         print("\n--- End of dry run ---")
         sys.exit(0)
 
-    # Check for partial results from a previous interrupted run
-    classifications = []
-    start_idx = 0
-    if partial_path.exists() and not force:
-        with open(partial_path) as f:
+    if force and log_path.exists():
+        log_path.unlink()
+
+    # Older runs saved progress as one .partial.json — convert it to the log once
+    if legacy_partial_path.exists() and not log_path.exists() and not force:
+        with open(legacy_partial_path) as f:
             partial = json.load(f)
-        classifications = partial.get("classifications", [])
-        start_idx = len(classifications)
-        print(f"  Resuming from classification {start_idx}/{len(failures)}")
+        with open(log_path, "w") as log:
+            for i, cls in enumerate(partial.get("classifications", [])):
+                log.write(json.dumps(dict(cls, index=i)) + "\n")
+        legacy_partial_path.unlink()
 
-    # Classify each failure
-    for i in range(start_idx, len(failures)):
-        failure = failures[i]
-        print(
-            f"  [{i+1}/{len(failures)}] task_id={failure['task_id']} ... ", end="", flush=True)
+    # Check for progress from a previous interrupted run (tail read only)
+    start_idx = 0
+    if log_path.exists():
+        last = read_last_record(log_path)
+        if last is not None:
+            start_idx = last["index"] + 1
+            print(f"  Resuming from classification {start_idx}/{len(failures)}")
+
+    # Classify each failure, appending to the log as we go (then unmap the file)
+    unsynced = 0
+    with failures, open(log_path, "a") as log:
+        for i in range(start_idx, len(failures)):
+            failure = failures[i]
+            print(
+                f"  [{i+1}/{len(failures)}] task_id={failure.task_id} ... ", end="", flush=True)
 
-        # Safety net: skip entries missing info.task (crashed runs)
-        task = failure.get("info", {}).get("task")
-        if not task:
-            print(f"-> SKIPPED (no info.task — crashed run)")
-            continue
+            # Safety net: skip entries missing info.task (crashed runs)
+            if not failure.has_task:
+                print(f"-> SKIPPED (no info.task — crashed run)")
+                continue
 
-        cls = classify_one(client, provider, model, failure, delay)
+            cls = classify_one(client, provider, model, failure, delay, cascade)
 
-        classifications.append({
-            "task_id": failure["task_id"],
-            "trial": failure.get("trial", 0),
-            "instruction": task.get("instruction", ""),
-            "ground_truth_actions": task.get("actions", []),
-            "agent_actions": extract_agent_actions(failure.get("traj", [])),
-            "classification": cls,
-        })
+            record = Classification.from_entry(
+                failure, i, cls, extract_agent_actions(failure.messages))
+            log.write(json.dumps(record.to_record()) + "\n")
+            log.flush()
+            unsynced += 1
+            if unsynced >= fsync_every:
+                os.fsync(log.fileno())
+                unsynced = 0
 
-        print(f"-> {cls['primary_category']}")
+            tier = f" [{cls['tier']}]" if "tier" in cls else ""
+            print(f"-> {cls['primary_category']}{tier}")
 
-        # Save progress after each call (crash-safe)
-        with open(partial_path, "w") as f:
-            json.dump({"classifications": classifications}, f)
+        log.flush()
+        os.fsync(log.fileno())
 
-    # Build final result
-    summary = compute_summary(classifications)
+    # Materialize the final summary by streaming the log
+    summary = compute_summary(iter_log(log_path))
     result = {
         "config": config_name,
         "file": str(filepath),
         "stats": {
             "total_tasks": total_tasks,
-            "total_failures_in_file": sum(
-                1 for e in json.loads(open(filepath).read()) if e.get("reward", 1) == 0.0
-            ),
+            "total_failures_in_file": total_failures_in_file,
             "unique_failures_sampled": len(failures),
         },
         "summary": summary,
-        "classifications": classifications,
+        "log": log_path.name,
     }
 
-    # Save final and clean up partial
-    with open(result_path, "w") as f:
+    # Write-then-rename so a crash never leaves a half-written result file
+    tmp_path = result_path.with_suffix(".json.tmp")
+    with open(tmp_path, "w") as f:
         json.dump(result, f, indent=2)
-    if partial_path.exists():
-        partial_path.unlink()
+    os.replace(tmp_path, result_path)
 
-    print(f"  Saved: {result_path}")
+    print(f"  Saved: {result_path} (classifications in {log_path.name})")
     return result
 
 
-def aggregate_all(all_results):
+def aggregate_all(all_results, output_dir=None):
     """Combine summaries across all configs into one structure for plotting."""
     if DEBUG:
         print(f"[DEBUG] aggregate_all(num_configs={len(all_results)})")
     combined = {}
     for config_name, result in all_results.items():
-        if result and "summary" in result:
+        if not result:
+            continue
+        if "summary" in result:
             combined[config_name] = result["summary"]
+        else:
+            combined[config_name] = compute_summary(
+                iter_classifications(result, output_dir))
     return combined
 
 
-def extract_examples(all_results, n_per_category=5):
+def extract_examples(all_results, n_per_category=5, output_dir=None):
     """Pull up to N representative failure examples per error category.
 
     These go into the Phase 2 submission as the required "5 representative
     failure trajectory JSONs per error category."
+
+    Streams classifications and keeps only the N best per category in a
+    bounded heap, so memory stays flat no matter how many results there are.
     """
+    import heapq
+
     if DEBUG:
         print(
             f"[DEBUG] extract_examples(num_configs={len(all_results)}, n_per_category={n_per_category})")
-    by_category = defaultdict(list)
+    # category -> max-heap of (-explanation_len, -seq, example); keeps the N shortest
+    heaps = defaultdict(list)
+    seq = 0
 
     for config_name, result in all_results.items():
         if not result:
             continue
-        for cls in result.get("classifications", []):
-            cat = cls["classification"]["primary_category"]
-            by_category[cat].append({
-                "config": config_name,
-                "task_id": cls["task_id"],
-                "instruction": cls["instruction"],
-                "ground_truth_actions": cls["ground_truth_actions"],
-                "agent_actions": cls["agent_actions"],
-                "classification": cls["classification"],
-            })
+        for record in iter_classifications(result, output_dir):
+            cls = as_classification(record, config_name)
+            key = (-len(cls.label.get("explanation", "")), -seq)
+            seq += 1
+            heap = heaps[cls.category]
+            if len(heap) == n_per_category and key <= heap[0][:2]:
+                continue
+            item = (key[0], key[1], cls)
+            if len(heap) < n_per_category:
+                heapq.heappush(heap, item)
+            else:
+                heapq.heapreplace(heap, item)
 
     # Pick the N with shortest explanations (usually the clearest examples)
     examples = {}
-    for cat, items in by_category.items():
-        items.sort(key=lambda x: len(
-            x["classification"].get("explanation", "")))
-        examples[cat] = items[:n_per_category]
+    for cat, heap in heaps.items():
+        examples[cat] = [item[2].to_example() for item in sorted(heap, key=lambda x: (-x[0], -x[1]))]
 
     if DEBUG:
         print(
@@ -726,6 +1077,61 @@ def extract_examples(all_results, n_per_category=5):
     return examples
 
 
+def load_results(output_dir, model_size=None):
+    """Load finished per-config results ({config}.json) from a results dir.
+
+    Lets summaries, examples and plots be rebuilt without re-classifying
+    (and without an API client). Combined/crash reports in the same dir are
+    skipped because their names don't look like "{size}_{strategy}_{domain}".
+    """
+    all_results = {}
+    for path in sorted(Path(output_dir).glob("*.json")):
+        if not re.fullmatch(r"\d+b_[A-Za-z]+_[a-z]+", path.stem):
+            continue
+        if model_size and not path.stem.startswith(f"{model_size.lower()}_"):
+            continue
+        with open(path) as f:
+            result = json.load(f)
+        if isinstance(result, dict) and "config" in result:
+            all_results[path.stem] = result
+    if DEBUG:
+        print(f"[DEBUG] load_results({output_dir}) -> {len(all_results)} configs")
+    return all_results
+
+
+def write_combined_summary(all_results, output_dir, path=None):
+    """Aggregate all configs and write combined_summary.json. Returns (combined, path)."""
+    # Structure: {"14b_ReAct_airline": {"policy_violation": {"count": 12, "percentage": 33.3}, ...}, ...}
+    combined = aggregate_all(all_results, output_dir)
+    path = Path(path) if path else Path(output_dir) / "combined_summary.json"
+    with open(path, "w") as f:
+        json.dump(combined, f, indent=2)
+    return combined, path
+
+
+def write_examples(all_results, output_dir, n_per_category=5, path=None):
+    """Extract representative examples and write them. Returns (examples, path)."""
+    examples = extract_examples(all_results, n_per_category, output_dir=output_dir)
+    path = Path(path) if path else Path(output_dir) / "examples" / "representative_examples.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(examples, f, indent=2)
+    return examples, path
+
+
+def print_summary_table(combined):
+    """Print the per-config category breakdown with ASCII bars."""
+    print(f"\n{'='*60}")
+    print("SUMMARY")
+    print(f"{'='*60}")
+    for config_name, summary in sorted(combined.items()):
+        print(f"\n{config_name}:")
+        for cat, info in summary.items():
+            bar = "#" * int(info["percentage"] / 2)
+            print(
+                f"  {cat:25s} {info['count']:3d} ({info['percentage']:5.1f}%) {bar}")
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # VISUALIZATION
 # Generates matplotlib plots for the Phase 2 report.
@@ -859,7 +1265,9 @@ def generate_plots(combined_summary, plot_dir):
 # CLI & MAIN
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def parse_args():
+def parse_args(argv=None):
+    import argparse
+
     parser = argparse.ArgumentParser(
         description="Classify tau-bench failures using LLM API calls",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -868,12 +1276,15 @@ Examples:
   python classify_errors.py --provider anthropic
   python classify_errors.py --provider openai --model gpt-4o
   python classify_errors.py --provider anthropic --model-size 32b --sample-size 60
-  python classify_errors.py --provider anthropic --dry-run
+  python classify_errors.py --dry-run
+
+Rebuilding summaries/examples/plots from existing results needs no provider:
+  python analyze.py summarize
         """,
     )
     parser.add_argument(
-        "--provider", required=True, choices=["anthropic", "openai"],
-        help="API provider (anthropic or openai)",
+        "--provider", choices=["anthropic", "openai"],
+        help="API provider (anthropic or openai; required unless --dry-run)",
     )
     parser.add_argument(
         "--model", default=None,
@@ -907,6 +1318,30 @@ Examples:
         "--dry-run", action="store_true",
         help="Print the prompt for the first failure case and exit (no API calls)",
     )
+    parser.add_argument(
+        "--cascade", action="store_true",
+        help="Classify with a cheap model first; escalate unsure cases to --model",
+    )
+    parser.add_argument(
+        "--cheap-model", default=None,
+        help="First-tier model for --cascade (default: claude-haiku-4-5-20251001 / gpt-4o-mini)",
+    )
+    parser.add_argument(
+        "--cascade-threshold", type=float, default=0.8,
+        help="Escalate when the cheap model's confidence is below this (default: 0.8)",
+    )
+    parser.add_argument(
+        "--cheap-samples", type=int, default=1,
+        help="Cheap-model samples per case; any disagreement escalates (default: 1)",
+    )
+    parser.add_argument(
+        "--cascade-eval", type=int, default=0,
+        help="Also label N held-out failures with both tiers and sweep the threshold",
+    )
+    parser.add_argument(
+        "--fsync-every", type=int, default=10,
+        help="fsync the results log every N classifications (default: 10)",
+    )
     parser.add_argument(
         "--seed", type=int, default=42,
         help="Random seed for sampling (default: 42)",
@@ -915,12 +1350,15 @@ Examples:
         "--debug", action="store_true",
         help="Enable [DEBUG] print statements for tracing",
     )
-    return parser.parse_args()
+    args = parser.parse_args(argv)
+    if not args.provider and not args.dry_run:
+        parser.error("--provider is required (except with --dry-run)")
+    return args
 
 
-def main():
+def main(argv=None):
     global DEBUG
-    args = parse_args()
+    args = parse_args(argv)
     DEBUG = args.debug
     if DEBUG:
         print(f"[DEBUG] main(provider={args.provider}, model={args.model}, model_size={args.model_size}, sample_size={args.sample_size}, force={args.force}, dry_run={args.dry_run}, seed={args.seed})")
@@ -936,7 +1374,14 @@ def main():
     output_dir = Path(args.output_dir) if args.output_dir else (
         script_dir / "results"
     )
-    model = args.model or DEFAULT_MODELS[args.provider]
+    model = args.model or DEFAULT_MODELS.get(args.provider)
+    cascade = None
+    if args.cascade or args.cascade_eval:
+        cascade = {
+            "cheap_model": args.cheap_model or CHEAP_MODELS.get(args.provider),
+            "threshold": args.cascade_threshold,
+            "samples": max(1, args.cheap_samples),
+        }
 
     print(f'Gwen3 Model to evaluate: {args.model_size}')
 
@@ -960,6 +1405,9 @@ def main():
     if not args.dry_run:
         client = create_client(args.provider)
         print(f"\nUsing {args.provider} / {model}")
+        if cascade:
+            print(f"Cascade: {cascade['cheap_model']} first "
+                  f"(threshold {cascade['threshold']}, {cascade['samples']} sample(s))")
     else:
         client = None
         print("\n[DRY RUN MODE]")
@@ -979,6 +1427,8 @@ def main():
             delay=args.delay,
             force=args.force,
             dry_run=args.dry_run,
+            fsync_every=args.fsync_every,
+            cascade=cascade if args.cascade else None,
         )
         if result:
             all_results[config_name] = result
@@ -988,18 +1438,11 @@ def main():
         return
 
     # Save combined summary — this is the main output you'll reference in the report.
-    # Structure: {"14b_ReAct_airline": {"policy_violation": {"count": 12, "percentage": 33.3}, ...}, ...}
-    combined = aggregate_all(all_results)
-    combined_path = output_dir / "combined_summary.json"
-    with open(combined_path, "w") as f:
-        json.dump(combined, f, indent=2)
+    combined, combined_path = write_combined_summary(all_results, output_dir)
     print(f"\nCombined summary: {combined_path}")
 
     # Extract representative examples (Phase 2 requirement: 5 per category)
-    examples = extract_examples(all_results)
-    examples_path = output_dir / "examples" / "representative_examples.json"
-    with open(examples_path, "w") as f:
-        json.dump(examples, f, indent=2)
+    examples, examples_path = write_examples(all_results, output_dir)
     n_cats_with_examples = sum(1 for v in examples.values() if v)
     print(
         f"Representative examples: {examples_path} ({n_cats_with_examples} categories)")
@@ -1008,16 +1451,33 @@ def main():
     print("\nGenerating plots...")
     generate_plots(combined, output_dir / "plots")
 
-    # Print summary table
-    print(f"\n{'='*60}")
-    print("SUMMARY")
-    print(f"{'='*60}")
-    for config_name, result in sorted(all_results.items()):
-        print(f"\n{config_name}:")
-        for cat, info in result["summary"].items():
-            bar = "#" * int(info["percentage"] / 2)
-            print(
-                f"  {cat:25s} {info['count']:3d} ({info['percentage']:5.1f}%) {bar}")
+    print_summary_table(combined)
+
+    # Cascade report: per-tier calls/latency/cost, and optional threshold sweep
+    if args.cascade or args.cascade_eval:
+        cascade_report = {"tiers": dict(TIER_STATS), "config": cascade}
+        if args.cascade_eval:
+            print(f"\nCascade evaluation on {args.cascade_eval} held-out failures...")
+            cascade_report["evaluation"] = evaluate_cascade(
+                client, args.provider, model, cascade, files, args.sample_size,
+                args.cascade_eval, args.seed, args.delay)
+            cascade_report["tiers"] = dict(TIER_STATS)
+
+        print(f"\n{'='*60}")
+        print("CASCADE")
+        print(f"{'='*60}")
+        for tier, st in cascade_report["tiers"].items():
+            avg = st["seconds"] / st["calls"] if st["calls"] else 0.0
+            print(f"  {tier:12s} {st['calls']:4d} calls  {avg:5.2f}s avg  ~${st['est_cost_usd']:.2f}")
+        for row in cascade_report.get("evaluation", {}).get("sweep", []):
+            # relative_cost is None when the strong model has no entry in MODEL_PRICES
+            cost = f"x{row['relative_cost']}" if row["relative_cost"] is not None else "n/a"
+            print(f"  threshold {row['threshold']:.2f}: escalate {row['escalation_rate']*100:5.1f}%  "
+                  f"agree {row['agreement_with_strong']*100:5.1f}%  cost {cost}")
+        cascade_path = output_dir / "cascade_stats.json"
+        with open(cascade_path, "w") as f:
+            json.dump(cascade_report, f, indent=2)
+        print(f"Cascade stats: {cascade_path}")
 
     print(f"\nDone! All outputs in: {output_dir}/")
 
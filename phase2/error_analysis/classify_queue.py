@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+classify_queue.py — Coordinator/worker mode for classify_errors.py.
+
+One classify_errors.py process is the ceiling for large corpora (all model
+sizes, all trials). This script splits the work: a coordinator enqueues the
+prompts built by `build_prompt` into a durable queue, and any number of
+worker processes — on this host or others — lease jobs, call the LLM and
+write results back.
+
+How it works:
+─────────────
+1. QUEUE: SQLite by default (one file, WAL mode, safe for many processes
+   on one host). --redis-url switches to a Redis-compatible server for
+   workers on several hosts (needs `pip install redis`). Both backends
+   expose the same enqueue/lease/complete/progress/results operations.
+
+2. ENQUEUE: Same discovery, sampling and prompt as classify_errors.py. Job
+   id = "{config}:{index}", so enqueueing twice is a no-op.
+
+3. LEASE: A worker atomically claims one pending job, or one whose lease
+   expired (the worker died), for --lease-seconds. Jobs that have been
+   leased --max-attempts times are closed with an api_error result.
+
+4. COMPLETE: The first result written for a job wins; later writes (a
+   slow worker whose lease expired and was re-run) are ignored, so result
+   writes are idempotent.
+
+5. COLLECT: Writes results/{config}.ndjson + {config}.json in exactly the
+   format process_file produces, plus combined_summary.json and the
+   representative examples, so plots and reports work unchanged.
+
+Workers with --stub answer with a deterministic fake label (hash of the
+prompt) after --stub-latency seconds — no API key, no network — so the
+whole pipeline can be exercised locally.
+
+Usage:
+    python classify_queue.py enqueue --model-size 14b
+    python classify_queue.py work --provider anthropic          # start N of these
+    python classify_queue.py work --stub --stub-latency 0.2      # local test worker
+    python classify_queue.py status                              # progress view
+    python classify_queue.py collect                             # write results/
+    python classify_queue.py work --provider openai --redis-url redis://host:6379/0
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import sys
+import time
+from hashlib import sha256
+from pathlib import Path
+
+import classify_errors as ce
+
+
+def stub_llm(prompt):
+    """Deterministic fake classifier for local testing."""
+    categories = list(ce.ERROR_TAXONOMY)
+    digest = int(sha256(prompt.encode()).hexdigest(), 16)
+    return {
+        "primary_category": categories[digest % len(categories)],
+        "sub_category": "stub",
+        "explanation": "Stub worker label (no LLM call).",
+    }
+
+
+def api_error_result(reason):
+    return {"primary_category": "api_error", "sub_category": "none", "explanation": reason}
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# QUEUE BACKENDS
+# job = {"id", "config", "index", "prompt", "meta"}; meta holds the fields
+# process_file stores next to the classification (task_id, trial, ...).
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class SQLiteQueue:
+    """Durable local job queue in a single SQLite file."""
+
+    def __init__(self, path, lease_seconds=120, max_attempts=3):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.db = sqlite3.connect(str(path), timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                config TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                prompt TEXT NOT NULL,
+                meta TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                lease_owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                completed_by TEXT,
+                updated_at REAL
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, lease_expires)")
+
+    def enqueue(self, jobs):
+        """Insert jobs; existing ids are left untouched. Returns number added."""
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        before = self.db.total_changes
+        self.db.executemany(
+            "INSERT OR IGNORE INTO jobs (id, config, idx, prompt, meta, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(j["id"], j["config"], j["index"], j["prompt"], json.dumps(j["meta"]), now)
+             for j in jobs])
+        self.db.execute("COMMIT")
+        return self.db.total_changes - before
+
+    def lease(self, owner):
+        """Claim one pending (or lease-expired) job. Returns a job dict or None."""
+        while True:
+            now = time.time()
+            self.db.execute("BEGIN IMMEDIATE")
+            row = self.db.execute(
+                "SELECT id, config, idx, prompt, meta, attempts FROM jobs "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY attempts, rowid LIMIT 1", (now,)).fetchone()
+            if row is None:
+                self.db.execute("COMMIT")
+                return None
+            job_id, config, idx, prompt, meta, attempts = row
+            if attempts >= self.max_attempts:
+                self.db.execute(
+                    "UPDATE jobs SET status = 'done', result = ?, completed_by = 'coordinator', "
+                    "updated_at = ? WHERE id = ?",
+                    (json.dumps(api_error_result(f"No result after {attempts} leases")), now, job_id))
+                self.db.execute("COMMIT")
+                continue
+            self.db.execute(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (owner, now + self.lease_seconds, now, job_id))
+            self.db.execute("COMMIT")
+            return {"id": job_id, "config": config, "index": idx, "prompt": prompt,
+                    "meta": json.loads(meta)}
+
+    def complete(self, job_id, owner, result):
+        """Store a result. Returns False if the job already had one."""
+        cur = self.db.execute(
+            "UPDATE jobs SET status = 'done', result = ?, completed_by = ?, updated_at = ? "
+            "WHERE id = ? AND status != 'done'",
+            (json.dumps(result), owner, time.time(), job_id))
+        return cur.rowcount == 1
+
+    def progress(self):
+        """{config: {"pending", "leased", "expired", "done"}} plus active workers."""
+        now = time.time()
+        configs = {}
+        for config, status, expires, n in self.db.execute(
+                "SELECT config, status, lease_expires < ?, COUNT(*) FROM jobs "
+                "GROUP BY config, status, lease_expires < ?", (now, now)):
+            key = "expired" if status == "leased" and expires else status
+            configs.setdefault(config, {"pending": 0, "leased": 0, "expired": 0, "done": 0})
+            configs[config][key] += n
+        workers = [r[0] for r in self.db.execute(
+            "SELECT DISTINCT lease_owner FROM jobs WHERE status = 'leased' AND lease_expires >= ?",
+            (now,))]
+        return configs, workers
+
+    def results(self, config):
+        """[(index, meta, result)] for finished jobs of one config, in sample order."""
+        rows = self.db.execute(
+            "SELECT idx, meta, result FROM jobs WHERE config = ? AND status = 'done' ORDER BY idx",
+            (config,))
+        return [(idx, json.loads(meta), json.loads(result)) for idx, meta, result in rows]
+
+
+class RedisQueue:
+    """Same interface over a Redis-compatible server (multi-host workers).
+
+    Keys (under --redis-prefix):
+      job:{id}   hash with config/index/prompt/meta/status/attempts/result
+      pending    list of job ids waiting for a worker
+      leases     sorted set of leased job ids scored by lease expiry
+      jobs       set of all job ids
+
+    A job id moves between `pending` and `leases` inside Lua scripts, so a
+    worker dying mid-lease can never drop it from both.
+    """
+
+    # Pop the next pending job and lease it in one step
+    CLAIM = """
+local job_id = redis.call('LPOP', KEYS[1])
+if job_id then
+    redis.call('ZADD', KEYS[2], ARGV[1], job_id)
+end
+return job_id
+"""
+    # Move an expired lease back to the front of the queue (exactly once)
+    REQUEUE = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 1 then
+    redis.call('LPUSH', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+    def __init__(self, url, prefix="tau-classify", lease_seconds=120, max_attempts=3):
+        try:
+            import redis
+        except ImportError:
+            sys.exit("ERROR: pip install redis")
+        self.r = redis.Redis.from_url(url, decode_responses=True)
+        self.p = prefix
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._claim = self.r.register_script(self.CLAIM)
+        self._requeue = self.r.register_script(self.REQUEUE)
+
+    def _k(self, *parts):
+        return ":".join((self.p,) + parts)
+
+    def enqueue(self, jobs):
+        added = 0
+        for j in jobs:
+            if self.r.sadd(self._k("jobs"), j["id"]):
+                self.r.hset(self._k("job", j["id"]), mapping={
+                    "config": j["config"], "index": j["index"], "prompt": j["prompt"],
+                    "meta": json.dumps(j["meta"]), "status": "pending", "attempts": 0,
+                })
+                self.r.rpush(self._k("pending"), j["id"])
+                added += 1
+        return added
+
+    def _requeue_expired(self):
+        for job_id in self.r.zrangebyscore(self._k("leases"), "-inf", time.time()):
+            # Done jobs that slip back in are skipped by lease()
+            self._requeue(keys=[self._k("leases"), self._k("pending")], args=[job_id])
+
+    def lease(self, owner):
+        self._requeue_expired()
+        while True:
+            job_id = self._claim(keys=[self._k("pending"), self._k("leases")],
+                                 args=[time.time() + self.lease_seconds])
+            if job_id is None:
+                return None
+            key = self._k("job", job_id)
+            job = self.r.hgetall(key)
+            if job.get("status") == "done":
+                self.r.zrem(self._k("leases"), job_id)
+                continue
+            if int(job.get("attempts", 0)) >= self.max_attempts:
+                self.complete(job_id, "coordinator",
+                              api_error_result(f"No result after {job['attempts']} leases"))
+                continue
+            self.r.hset(key, mapping={"status": "leased", "lease_owner": owner})
+            self.r.hincrby(key, "attempts", 1)
+            return {"id": job_id, "config": job["config"], "index": int(job["index"]),
+                    "prompt": job["prompt"], "meta": json.loads(job["meta"])}
+
+    def complete(self, job_id, owner, result):
+        key = self._k("job", job_id)
+        if not self.r.hsetnx(key, "result", json.dumps(result)):
+            return False
+        self.r.hset(key, mapping={"status": "done", "completed_by": owner})
+        self.r.zrem(self._k("leases"), job_id)
+        return True
+
+    def progress(self):
+        now = time.time()
+        configs, workers = {}, set()
+        for job_id in self.r.smembers(self._k("jobs")):
+            job = self.r.hmget(self._k("job", job_id), "config", "status", "lease_owner")
+            config, status, lease_owner = job
+            if status == "leased":
+                expiry = self.r.zscore(self._k("leases"), job_id)
+                if expiry is None or expiry < now:
+                    status = "expired"
+                else:
+                    workers.add(lease_owner)
+            configs.setdefault(config, {"pending": 0, "leased": 0, "expired": 0, "done": 0})
+            configs[config][status] += 1
+        return configs, sorted(workers)
+
+    def results(self, config):
+        out = []
+        for job_id in self.r.smembers(self._k("jobs")):
+            job = self.r.hgetall(self._k("job", job_id))
+            if job.get("config") == config and job.get("status") == "done":
+                out.append((int(job["index"]), json.loads(job["meta"]), json.loads(job["result"])))
+        return sorted(out, key=lambda x: x[0])
+
+
+def open_queue(args):
+    if args.redis_url:
+        return RedisQueue(args.redis_url, args.redis_prefix, args.lease_seconds, args.max_attempts)
+    return SQLiteQueue(args.queue, args.lease_seconds, args.max_attempts)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# COMMANDS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def cmd_enqueue(args, queue):
+    """Coordinator: build prompts for every sampled failure and enqueue them."""
+    total_added = 0
+    for model_size in args.model_size:
+        files = ce.discover_files(args.trajectory_dir, model_size)
+        for filepath, config_name in files:
+            failures, _ = ce.load_and_sample(filepath, args.sample_size, args.seed, config_name)
+            jobs = []
+            with failures:
+                for i, failure in enumerate(failures):
+                    if not failure.has_task:
+                        continue
+                    jobs.append({
+                        "id": f"{config_name}:{i}",
+                        "config": config_name,
+                        "index": i,
+                        "prompt": ce.build_prompt(failure),
+                        "meta": {
+                            "file": str(filepath),
+                            "task_id": failure.task_id,
+                            "trial": failure.trial,
+                            "instruction": failure.instruction or "",
+                            "ground_truth_actions": [a.to_action() for a in failure.actions],
+                            "agent_actions": ce.extract_agent_actions(failure.messages),
+                        },
+                    })
+            added = queue.enqueue(jobs)
+            total_added += added
+            print(f"  {config_name}: {len(jobs)} jobs ({added} new)")
+    print(f"Enqueued {total_added} new job(s)")
+
+
+def cmd_work(args, queue):
+    """Worker: lease -> classify -> complete, until the queue is drained."""
+    owner = args.worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    if args.stub:
+        client, model = None, "stub"
+    else:
+        client = ce.create_client(args.provider)
+        model = args.model or ce.DEFAULT_MODELS[args.provider]
+    print(f"Worker {owner} using {'stub' if args.stub else args.provider + ' / ' + model}")
+
+    done = 0
+    idle_since = None
+    while args.max_jobs is None or done < args.max_jobs:
+        job = queue.lease(owner)
+        if job is None:
+            configs, _ = queue.progress()
+            outstanding = sum(c["pending"] + c["leased"] + c["expired"] for c in configs.values())
+            if outstanding == 0:
+                break
+            # Other workers hold the rest; wait in case their leases expire
+            idle_since = idle_since or time.time()
+            if args.idle_exit is not None and time.time() - idle_since > args.idle_exit:
+                break
+            time.sleep(args.poll)
+            continue
+        idle_since = None
+
+        if args.stub:
+            time.sleep(args.stub_latency)
+            result = stub_llm(job["prompt"])
+        else:
+            result = ce._classify_prompt(client, args.provider, model, job["prompt"],
+                                         args.delay, "strong")
+        stored = queue.complete(job["id"], owner, result)
+        done += 1
+        print(f"  {job['id']} -> {result['primary_category']}"
+              + ("" if stored else " (duplicate, ignored)"))
+    print(f"Worker {owner} finished {done} job(s)")
+
+
+def cmd_status(args, queue):
+    """Progress view: per-config counts and live workers."""
+    while True:
+        configs, workers = queue.progress()
+        print(f"\n{'Config':24s} {'pending':>8s} {'leased':>8s} {'expired':>8s} {'done':>8s}  progress")
+        totals = {"pending": 0, "leased": 0, "expired": 0, "done": 0}
+        for config in sorted(configs):
+            c = configs[config]
+            n = sum(c.values())
+            bar = "#" * int(20 * c["done"] / n) if n else ""
+            print(f"{config:24s} {c['pending']:8d} {c['leased']:8d} {c['expired']:8d} "
+                  f"{c['done']:8d}  {bar:20s} {c['done']}/{n}")
+            for k in totals:
+                totals[k] += c[k]
+        n = sum(totals.values())
+        print(f"{'TOTAL':24s} {totals['pending']:8d} {totals['leased']:8d} "
+              f"{totals['expired']:8d} {totals['done']:8d}  {totals['done']}/{n}")
+        print(f"Active workers: {len(workers)}" + (f" ({', '.join(workers)})" if workers else ""))
+        if not args.watch or (n and totals["done"] == n):
+            return
+        time.sleep(args.watch)
+
+
+def cmd_collect(args, queue):
+    """Write results in the same layout classify_errors.py produces."""
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    (output_dir / "examples").mkdir(exist_ok=True)
+    configs, _ = queue.progress()
+
+    all_results = {}
+    for config in sorted(configs):
+        rows = queue.results(config)
+        if not rows:
+            continue
+        log_path = output_dir / f"{config}.ndjson"
+        with open(log_path, "w") as f:
+            for idx, meta, result in rows:
+                record = {"index": idx}
+                record.update({k: v for k, v in meta.items() if k != "file"})
+                record["classification"] = result
+                f.write(json.dumps(record) + "\n")
+        total = sum(configs[config].values())
+        result = {
+            "config": config,
+            "file": rows[0][1].get("file"),
+            "stats": {"unique_failures_sampled": total},
+            "summary": ce.compute_summary(ce.iter_log(log_path)),
+            "log": log_path.name,
+        }
+        with open(output_dir / f"{config}.json", "w") as f:
+            json.dump(result, f, indent=2)
+        all_results[config] = result
+        print(f"  {config}: {len(rows)}/{total} classified")
+
+    if not all_results:
+        print("No finished jobs to collect.")
+        return
+    combined = ce.aggregate_all(all_results, output_dir)
+    with open(output_dir / "combined_summary.json", "w") as f:
+        json.dump(combined, f, indent=2)
+    examples = ce.extract_examples(all_results, output_dir=output_dir)
+    with open(output_dir / "examples" / "representative_examples.json", "w") as f:
+        json.dump(examples, f, indent=2)
+    print(f"Saved results for {len(all_results)} config(s) to {output_dir}/")
+
+
+def main():
+    script_dir = Path(__file__).resolve().parent
+    parser = argparse.ArgumentParser(
+        description="Distributed error classification over a local job queue."
+    )
+    parser.add_argument(
+        "--queue", default=str(script_dir / "results" / "classify_queue.sqlite3"),
+        help="SQLite queue file (default: results/classify_queue.sqlite3)",
+    )
+    parser.add_argument(
+        "--redis-url", default=None,
+        help="Use a Redis-compatible server instead of SQLite (multi-host)",
+    )
+    parser.add_argument("--redis-prefix", default="tau-classify", help="Redis key prefix")
+    parser.add_argument(
+        "--lease-seconds", type=float, default=120,
+        help="How long a worker owns a job before it can be re-leased (default: 120)",
+    )
+    parser.add_argument(
+        "--max-attempts", type=int, default=3,
+        help="Leases per job before it is closed as api_error (default: 3)",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_enq = sub.add_parser("enqueue", help="Coordinator: enqueue classification prompts")
+    p_enq.add_argument("--model-size", nargs="+", default=["14b"],
+                       help="Qwen3 model size(s) to analyze (default: 14b)")
+    p_enq.add_argument("--sample-size", type=int, default=50,
+                       help="Max unique failures to sample per trajectory file (default: 50)")
+    p_enq.add_argument("--trajectory-dir", default=str(script_dir.parent.parent / "phase1" / "JSON_trajectories"),
+                       help="Path to JSON_trajectories directory (auto-detected if omitted)")
+    p_enq.add_argument("--seed", type=int, default=42, help="Random seed for sampling (default: 42)")
+
+    p_work = sub.add_parser("work", help="Worker: lease jobs and call the LLM")
+    p_work.add_argument("--provider", choices=["anthropic", "openai"], default=None,
+                        help="API provider (required unless --stub)")
+    p_work.add_argument("--model", default=None, help="Model name (default per provider)")
+    p_work.add_argument("--delay", type=float, default=0.5,
+                        help="Seconds between API calls for rate limiting (default: 0.5)")
+    p_work.add_argument("--stub", action="store_true", help="Fake LLM for local testing")
+    p_work.add_argument("--stub-latency", type=float, default=0.0,
+                        help="Seconds each stub call takes (default: 0)")
+    p_work.add_argument("--worker-id", default=None, help="Worker name (default: host:pid)")
+    p_work.add_argument("--max-jobs", type=int, default=None, help="Stop after N jobs")
+    p_work.add_argument("--poll", type=float, default=2.0,
+                        help="Seconds between polls while others hold leases (default: 2)")
+    p_work.add_argument("--idle-exit", type=float, default=None,
+                        help="Exit after idling this many seconds (default: wait for leases)")
+
+    p_stat = sub.add_parser("status", help="Show queue progress")
+    p_stat.add_argument("--watch", type=float, default=None,
+                        help="Refresh every N seconds until all jobs are done")
+
+    p_col = sub.add_parser("collect", help="Write finished results to the results directory")
+    p_col.add_argument("--output-dir", default=str(script_dir / "results"),
+                       help="Output directory for results (default: results/ next to this script)")
+
+    args = parser.parse_args()
+    if args.command == "work" and not args.stub and not args.provider:
+        parser.error("work needs --provider (or --stub)")
+    if not args.redis_url:
+        Path(args.queue).parent.mkdir(parents=True, exist_ok=True)
+
+    queue = open_queue(args)
+    {"enqueue": cmd_enqueue, "work": cmd_work,
+     "status": cmd_status, "collect": cmd_collect}[args.command](args, queue)
+
+
+if __name__ == "__main__":
+    main()
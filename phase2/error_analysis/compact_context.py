@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+compact_context.py — Context-compaction middleware for agent LLM calls.
+
+The crash analysis shows context_window crashes and 62-turn conversations
+that degrade long before they crash. ContextCompactor sits in front of the
+agent's LLM call and rewrites the message list so every request stays
+under a token budget, while keeping the parts the agent needs.
+
+How it works:
+─────────────
+1. PIN: The system message (policy + tool schemas) and the first user
+   message (the user's goal) are never touched.
+
+2. STRIP STALE THINK: <think>...</think> blocks are removed from every
+   message older than the last --keep-recent messages. The agent still
+   sees its latest reasoning; old reasoning is pure context cost.
+
+3. COLLAPSE OLD TOOL OUTPUTS: 'API output:' / FC 'tool' messages older
+   than --keep-recent are replaced with a one-line summary that keeps the
+   identifiers and statuses (order_id, reservation_id, status, ...) and
+   drops the rest of the JSON blob.
+
+4. BUDGET: If the request is still over --budget, the oldest unpinned
+   messages are dropped (replaced by a single "[N earlier messages
+   omitted]" note) until it fits.
+
+Token counts use the same tokenizer loader as profile_context.py and are
+cached per message, so the rolling count costs O(new messages) per call.
+
+Using it in an agent loop:
+    compactor = ContextCompactor(budget=24000)
+    completion = compactor.wrap(litellm.completion)
+    res = completion(model=..., messages=messages, ...)   # compacted copy sent
+
+Offline evaluation (no LLM calls):
+    python compact_context.py                        # all stored trajectories
+    python compact_context.py --model-size 14b --budget 20000 --keep-recent 6
+    python compact_context.py --json-output compaction_eval.json
+"""
+
+import argparse
+import json
+import re
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+from analyze_crashes import discover_files
+from profile_context import TEMPLATE_OVERHEAD, load_tokenizer
+from traj_json import load
+
+THINK_RE = re.compile(r"<think>.*?</think>\s*", re.DOTALL)
+
+# Fields worth keeping when an old tool output is collapsed
+SUMMARY_FIELDS = (
+    "user_id", "order_id", "reservation_id", "product_id", "item_id",
+    "status", "cabin", "flight_type", "name", "email", "total_baggages",
+    "insurance", "membership",
+)
+
+
+def is_tool_output(msg):
+    content = msg.get("content", "") or ""
+    return msg.get("role") == "tool" or (
+        msg.get("role") == "user" and content.startswith("API output:"))
+
+
+def summarize_tool_output(content):
+    """Collapse a tool-output message into a short, id-preserving summary."""
+    prefix = "API output: " if content.startswith("API output:") else ""
+    body = content[len("API output:"):].strip() if prefix else content.strip()
+    try:
+        parsed = json.loads(body)
+    except (json.JSONDecodeError, TypeError):
+        short = body if len(body) <= 80 else body[:80] + "..."
+        return f"{prefix}[compacted] {short}"
+
+    if isinstance(parsed, list):
+        return f"{prefix}[compacted] list of {len(parsed)} items"
+    if not isinstance(parsed, dict):
+        return f"{prefix}[compacted] {json.dumps(parsed)[:80]}"
+
+    kept = {k: parsed[k] for k in SUMMARY_FIELDS
+            if k in parsed and not isinstance(parsed[k], (dict, list))}
+    dropped = len(parsed) - len(kept)
+    return f"{prefix}[compacted] {json.dumps(kept)}" + (
+        f" (+{dropped} fields)" if dropped else "")
+
+
+class ContextCompactor:
+    """Keeps agent requests under a token budget.
+
+    budget       — max tokens per request (incl. chat-template overhead)
+    keep_recent  — trailing messages left verbatim (think + tool output)
+    tokenizer    — HF tokenizer name/path; falls back to an estimate
+    """
+
+    def __init__(self, budget=24000, keep_recent=4, tokenizer="Qwen/Qwen3-14B", encode=None):
+        self.budget = budget
+        self.keep_recent = keep_recent
+        if encode is None:
+            encode, self.approximate = load_tokenizer(tokenizer)
+        else:
+            self.approximate = False
+        self._encode = encode
+        self._cache = {}
+
+    def message_tokens(self, msg):
+        content = msg.get("content", "") or ""
+        if msg.get("tool_calls"):
+            content += json.dumps([tc.get("function", {}) for tc in msg["tool_calls"]])
+        n = self._cache.get(content)
+        if n is None:
+            n = self._cache[content] = self._encode(content) + TEMPLATE_OVERHEAD
+        return n
+
+    def count(self, messages):
+        return sum(self.message_tokens(m) for m in messages)
+
+    def compact(self, messages):
+        """Return a compacted copy of `messages` (the input is not modified)."""
+        n_pinned = 0
+        if messages and messages[0].get("role") == "system":
+            n_pinned = 1
+        if len(messages) > n_pinned and messages[n_pinned].get("role") == "user":
+            n_pinned += 1
+        pinned = list(messages[:n_pinned])
+        recent_start = max(n_pinned, len(messages) - self.keep_recent)
+
+        middle = []
+        for msg in messages[n_pinned:recent_start]:
+            content = msg.get("content", "") or ""
+            if "<think>" in content:
+                content = THINK_RE.sub("", content)
+            if is_tool_output(msg):
+                content = summarize_tool_output(content)
+            middle.append(dict(msg, content=content) if content != msg.get("content") else msg)
+        recent = list(messages[recent_start:])
+
+        # Still over budget: drop the oldest unpinned messages
+        total = self.count(pinned) + self.count(middle) + self.count(recent)
+        dropped = 0
+        note = None
+        while (total + (self.message_tokens(note) if note else 0) > self.budget
+               and (middle or len(recent) > 1)):
+            victim = middle.pop(0) if middle else recent.pop(0)
+            total -= self.message_tokens(victim)
+            dropped += 1
+            # Leave a note so the agent knows history was cut (it counts toward the budget)
+            note = {"role": "user",
+                    "content": f"[{dropped} earlier messages omitted to fit the context window]"}
+        if note:
+            pinned.append(note)
+
+        # FC tool messages must follow their tool_calls message; drop orphans
+        kept = middle + recent
+        call_ids = {tc.get("id") for m in kept for tc in (m.get("tool_calls") or [])}
+        kept = [m for m in kept if m.get("role") != "tool" or m.get("tool_call_id") in call_ids]
+        return pinned + kept
+
+    def wrap(self, completion_fn):
+        """Wrap an OpenAI/litellm-style completion(messages=..., **kw) function."""
+        def compacted_completion(*args, messages, **kwargs):
+            return completion_fn(*args, messages=self.compact(messages), **kwargs)
+        return compacted_completion
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# OFFLINE EVALUATION
+# Re-creates every agent request from a stored trajectory (all messages
+# before each assistant turn) and measures tokens with and without compaction.
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def evaluate_entry(compactor, traj):
+    """Per-request [(turn_index, original_tokens, compacted_tokens), ...]."""
+    requests = []
+    for i, msg in enumerate(traj):
+        if msg.get("role") != "assistant" or i == 0:
+            continue
+        context = traj[:i]
+        requests.append((i, compactor.count(context), compactor.count(compactor.compact(context))))
+    return requests
+
+
+def evaluate_file(compactor, filepath, config):
+    data = load(filepath)
+    entries = []
+    for entry in data:
+        traj = entry.get("traj", [])
+        if "error" in entry.get("info", {}) or not traj:
+            continue
+        requests = evaluate_entry(compactor, traj)
+        if requests:
+            entries.append({
+                "task_id": entry.get("task_id"),
+                "trial": entry.get("trial"),
+                "reward": entry.get("reward", 0.0),
+                "requests": requests,
+            })
+    return {"config": config, "entries": entries}
+
+
+def print_summary(all_results, compactor, output_file=None):
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    budget = compactor.budget
+    p("# Context Compaction — Offline Evaluation")
+    p()
+    p(f"Budget: **{budget:,} tokens** | Keep recent: **{compactor.keep_recent}** messages"
+      + (" | Counts are **approximate** (no tokenizer installed)" if compactor.approximate else ""))
+    p()
+    p("| Config | Requests | Orig Tokens | Compacted | Saved | Over Budget (before) | Over Budget (after) |")
+    p("|--------|----------|-------------|-----------|-------|----------------------|---------------------|")
+
+    by_turn = defaultdict(lambda: [0, 0, 0])  # turn -> [n, orig, compacted]
+    for r in all_results:
+        reqs = [q for e in r["entries"] for q in e["requests"]]
+        orig = sum(q[1] for q in reqs)
+        comp = sum(q[2] for q in reqs)
+        over_before = sum(1 for q in reqs if q[1] > budget)
+        over_after = sum(1 for q in reqs if q[2] > budget)
+        saved = f"{(orig - comp) / orig * 100:.1f}%" if orig else "N/A"
+        p(f"| {r['config']['config_label']} | {len(reqs)} | {orig:,} | {comp:,} | {saved} | "
+          f"{over_before} | {over_after} |")
+        for turn, o, c in reqs:
+            by_turn[turn][0] += 1
+            by_turn[turn][1] += o
+            by_turn[turn][2] += c
+    p()
+
+    p("## Per-Turn Savings (mean tokens per request)")
+    p()
+    p("| Turn | Requests | Original | Compacted | Saved |")
+    p("|------|----------|----------|-----------|-------|")
+    for turn in sorted(by_turn):
+        n, o, c = by_turn[turn]
+        p(f"| {turn} | {n} | {o / n:,.0f} | {c / n:,.0f} | {(o - c) / o * 100 if o else 0:.1f}% |")
+    p()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Evaluate context compaction on stored tau-bench trajectories."
+    )
+    parser.add_argument(
+        "--trajectory-dir", type=str, default=None,
+        help="Path to trajectory directory. Default: auto-detect from script location.",
+    )
+    parser.add_argument(
+        "--model-size", type=str, default=None, choices=["4b", "8b", "14b", "32b"],
+        help="Filter to a specific model size (e.g., 14b). Default: all sizes.",
+    )
+    parser.add_argument(
+        "--budget", type=int, default=24000,
+        help="Max tokens per agent request (default: 24000)",
+    )
+    parser.add_argument(
+        "--keep-recent", type=int, default=4,
+        help="Trailing messages left verbatim (default: 4)",
+    )
+    parser.add_argument(
+        "--tokenizer", type=str, default="Qwen/Qwen3-14B",
+        help="HF tokenizer name or local path (default: Qwen/Qwen3-14B)",
+    )
+    parser.add_argument(
+        "--output", type=str, default=None,
+        help="Save markdown output to a file instead of printing to stdout.",
+    )
+    parser.add_argument(
+        "--json-output", type=str, default=None,
+        help="Save per-request token counts to a JSON file.",
+    )
+    args = parser.parse_args()
+
+    if args.trajectory_dir:
+        traj_dir = Path(args.trajectory_dir)
+    else:
+        script_dir = Path(__file__).resolve().parent
+        traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories"
+        if not traj_dir.exists():
+            traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories "
+    if not traj_dir.exists():
+        print(f"ERROR: Trajectory directory not found: {traj_dir}")
+        sys.exit(1)
+
+    files = discover_files(traj_dir, args.model_size)
+    print(f"Found {len(files)} trajectory file(s)")
+    if not files:
+        sys.exit(1)
+
+    compactor = ContextCompactor(args.budget, args.keep_recent, args.tokenizer)
+    all_results = []
+    for filepath, config in files:
+        print(f"  Evaluating {config['config_label']}: {filepath.name}")
+        all_results.append(evaluate_file(compactor, filepath, config))
+    print()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            print_summary(all_results, compactor, output_file=f)
+        print(f"Saved markdown to {args.output}")
+    else:
+        print_summary(all_results, compactor)
+
+    if args.json_output:
+        output = [{
+            "config": r["config"]["config_label"],
+            "entries": [dict(e, requests=[
+                {"turn": t, "original_tokens": o, "compacted_tokens": c}
+                for t, o, c in e["requests"]]) for e in r["entries"]],
+        } for r in all_results]
+        with open(args.json_output, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"Saved JSON to {args.json_output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+crash_fingerprint.py — Group crashed runs by normalized stack signature.
+
+analyze_crashes.py puts every crash into one of three buckets by substring
+checks and keeps the first 120 characters of anything else. This script
+fingerprints each crash instead, so that identical failures across models,
+strategies and trials collapse into one group, and the biggest groups
+(the infra fixes worth doing first) come out on top.
+
+How it works:
+─────────────
+1. RULE TABLE: CRASH_RULES is an ordered list of (crash_type, regex). It is
+   compiled into ONE alternation of named groups, so classifying a message
+   is a single regex pass over it, however many rules there are. Among
+   the rules that match, the one listed first wins.
+   --rules rules.json adds or overrides rules ([[name, regex], ...]).
+
+2. TRACEBACK SIGNATURE: `info.traceback` is parsed into frames
+   (module, function). Line numbers, absolute paths / site-packages
+   prefixes and repeated frames are dropped, and the innermost
+   --max-frames are kept, together with the exception type.
+
+3. MESSAGE TEMPLATE: The error message is normalized: token counts, hex
+   addresses, UUIDs, request/completion ids, and quoted values become
+   placeholders. Entries without a traceback (e.g. the records in
+   crash_analysis_all.json) are grouped on the template alone.
+
+4. GROUPING: fingerprint = sha1(crash_type | exception | frames | template).
+   Groups are ranked by size and report counts per config, the top frames,
+   and one example message.
+
+Usage:
+    python crash_fingerprint.py                                # raw trajectories
+    python crash_fingerprint.py --model-size 14b --max-frames 5
+    python crash_fingerprint.py --crash-json results/crash_analysis_all.json
+    python crash_fingerprint.py --rules my_rules.json --json-output crash_groups.json
+"""
+
+import argparse
+import json
+import re
+import sys
+from collections import Counter, defaultdict
+from hashlib import sha1
+from pathlib import Path
+
+from analyze_crashes import discover_files
+from traj_json import load
+
+# Ordered by priority: when several rules match, the first one listed wins
+CRASH_RULES = [
+    ("context_window", r"ContextWindowExceeded|maximum context length is \d+ tokens|"
+                       r"[Cc]ontext window exceeded"),
+    ("api_timeout", r"APITimeoutError|Timeout|timed out"),
+    ("rate_limit", r"RateLimitError|\b429\b|Too Many Requests"),
+    ("connection_error", r"APIConnectionError|Connection (?:refused|reset|aborted)|RemoteDisconnected"),
+    ("server_error", r"InternalServerError|ServiceUnavailable|\b50[0-4]\b"),
+    ("bad_request", r"BadRequestError|\b400\b"),
+    ("json_decode", r"JSONDecodeError|Expecting value|Unterminated string"),
+    ("key_error", r"KeyError"),
+    ("validation_error", r"ValidationError|validation errors? for \w+"),
+    ("type_error", r"TypeError|is not iterable|is not subscriptable|unsupported operand"),
+    ("value_error", r"ValueError"),
+    ("index_error", r"IndexError"),
+    ("attribute_error", r"AttributeError"),
+    ("out_of_memory", r"CUDA out of memory|OutOfMemoryError|MemoryError"),
+]
+
+FRAME_RE = re.compile(r'File "([^"]+)", line \d+, in (\S+)')
+EXC_LINE_RE = re.compile(r"^([A-Za-z_][\w.]*(?:Error|Exception|Exceeded\w*|Interrupt|Exit))\b:?\s*(.*)$")
+
+# Applied in order; the earlier, more specific patterns protect their spans
+NORMALIZERS = [
+    (re.compile(r"0x[0-9a-fA-F]+"), "<ADDR>"),
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.I), "<UUID>"),
+    (re.compile(r"\b(?:chatcmpl|req|cmpl|run|msg)[-_][\w-]+"), "<ID>"),
+    (re.compile(r"'[^']{0,200}'|\"[^\"]{0,200}\""), "<STR>"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "<N>"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+class CrashMatcher:
+    """A rule table compiled into one combined regex."""
+
+    def __init__(self, rules):
+        self.names = []
+        parts = []
+        for i, (name, pattern) in enumerate(rules):
+            re.compile(pattern)  # fail early with the offending rule
+            self.names.append(name)
+            parts.append(f"(?P<r{i}>{pattern})")
+        self.regex = re.compile("|".join(parts))
+
+    def classify(self, text):
+        best = min((int(m.lastgroup[1:]) for m in self.regex.finditer(text)), default=None)
+        return "other" if best is None else self.names[best]
+
+
+def load_rules(path):
+    """Merge a user rule file ([[name, regex], ...]) into CRASH_RULES."""
+    rules = list(CRASH_RULES)
+    if path:
+        with open(path) as f:
+            extra = [tuple(r) for r in json.load(f)]
+        names = {name for name, _ in extra}
+        # User rules take precedence (listed first) and replace same-named defaults
+        rules = extra + [r for r in rules if r[0] not in names]
+    return rules
+
+
+def normalize_message(message):
+    text = message.strip()
+    for regex, repl in NORMALIZERS:
+        text = regex.sub(repl, text)
+    return text[:200]
+
+
+def module_name(path):
+    """'/x/lib/python3.11/site-packages/litellm/main.py' -> 'litellm/main.py'."""
+    path = path.replace("\\", "/")
+    for marker in ("site-packages/", "dist-packages/", "/lib/python"):
+        if marker in path:
+            path = path.split(marker)[-1]
+            if marker == "/lib/python":
+                path = path.split("/", 1)[-1]
+            break
+    parts = path.split("/")
+    return "/".join(parts[-2:])
+
+
+def stack_signature(traceback_text, max_frames):
+    """(exception_type, [module:function, ...]) for the innermost frames."""
+    frames = []
+    for path, func in FRAME_RE.findall(traceback_text or ""):
+        frame = f"{module_name(path)}:{func}"
+        if not frames or frames[-1] != frame:
+            frames.append(frame)
+    exc_type = None
+    for line in reversed((traceback_text or "").strip().splitlines()):
+        m = EXC_LINE_RE.match(line.strip())
+        if m:
+            exc_type = m.group(1).split(".")[-1]
+            break
+    return exc_type, frames[-max_frames:] if max_frames else frames
+
+
+def fingerprint(matcher, error, traceback_text, max_frames):
+    error = error or ""
+    crash_type = matcher.classify(error + "\n" + (traceback_text or "")[-2000:])
+    exc_type, frames = stack_signature(traceback_text, max_frames)
+    if exc_type is None:
+        m = EXC_LINE_RE.match(error.strip().split("\n")[0])
+        exc_type = m.group(1).split(".")[-1] if m else None
+    first_line = error.strip().split("\n")[0]
+    template = normalize_message(first_line)
+    key = "|".join([crash_type, exc_type or "", ";".join(frames), template])
+    return {
+        "fingerprint": sha1(key.encode()).hexdigest()[:12],
+        "crash_type": crash_type,
+        "exception": exc_type,
+        "frames": frames,
+        "template": template,
+    }
+
+
+def iter_raw_crashes(traj_dir, model_size):
+    for filepath, config in discover_files(traj_dir, model_size):
+        data = load(filepath)
+        for entry in data:
+            info = entry.get("info", {})
+            if "error" in info:
+                yield {
+                    "config": config["config_label"],
+                    "task_id": entry.get("task_id", "?"),
+                    "trial": entry.get("trial", "?"),
+                    "error": str(info["error"]),
+                    "traceback": info.get("traceback"),
+                }
+
+
+def iter_json_crashes(json_path):
+    """Crash records from analyze_crashes.py --json-output (no tracebacks)."""
+    with open(json_path) as f:
+        data = json.load(f)
+    for c in data.get("crashes", []):
+        yield {
+            "config": c["config"],
+            "task_id": c["task_id"],
+            "trial": c["trial"],
+            "error": c.get("error_short", ""),
+            "traceback": None,
+        }
+
+
+def group_crashes(crashes, matcher, max_frames):
+    groups = {}
+    for c in crashes:
+        fp = fingerprint(matcher, c["error"], c["traceback"], max_frames)
+        g = groups.get(fp["fingerprint"])
+        if g is None:
+            g = groups[fp["fingerprint"]] = dict(
+                fp, count=0, by_config=Counter(), example=c["error"].strip()[:300], members=[])
+        g["count"] += 1
+        g["by_config"][c["config"]] += 1
+        g["members"].append((c["config"], c["task_id"], c["trial"]))
+    return sorted(groups.values(), key=lambda g: (-g["count"], g["fingerprint"]))
+
+
+def print_summary(groups, top, output_file=None):
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    total = sum(g["count"] for g in groups)
+    p("# Crash Groups (by fingerprint)")
+    p()
+    p(f"**{total} crashes** in **{len(groups)} groups**.")
+    p()
+    by_type = defaultdict(int)
+    for g in groups:
+        by_type[g["crash_type"]] += g["count"]
+    p("| Crash Type | Count | % |")
+    p("|------------|-------|---|")
+    for t, n in sorted(by_type.items(), key=lambda x: -x[1]):
+        p(f"| {t} | {n} | {n / total * 100:.1f}% |")
+    p()
+
+    p(f"## Top {min(top, len(groups))} Groups")
+    p()
+    p("| # | Fingerprint | Type | Count | Cum % | Configs | Signature |")
+    p("|---|-------------|------|-------|-------|---------|-----------|")
+    cum = 0
+    for i, g in enumerate(groups[:top], 1):
+        cum += g["count"]
+        configs = ", ".join(f"{c} ({n})" for c, n in g["by_config"].most_common(4))
+        if len(g["by_config"]) > 4:
+            configs += f", +{len(g['by_config']) - 4} more"
+        sig = " → ".join(g["frames"][-3:]) if g["frames"] else g["template"]
+        # Templates often already name the exception ("KeyError: <STR>")
+        if g["exception"] and g["exception"] not in sig:
+            sig = f"{g['exception']}: {sig}"
+        p(f"| {i} | `{g['fingerprint']}` | {g['crash_type']} | {g['count']} | "
+          f"{cum / total * 100:.1f}% | {configs} | {sig.replace('|', '/')} |")
+    p()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fingerprint crashed runs and rank crash groups."
+    )
+    parser.add_argument(
+        "--trajectory-dir", type=str, default=None,
+        help="Path to trajectory directory. Default: auto-detect from script location.",
+    )
+    parser.add_argument(
+        "--model-size", type=str, default=None, choices=["4b", "8b", "14b", "32b"],
+        help="Filter to a specific model size (e.g., 14b). Default: all sizes.",
+    )
+    parser.add_argument(
+        "--crash-json", type=str, default=None,
+        help="Group the crashes in an analyze_crashes.py --json-output file instead.",
+    )
+    parser.add_argument(
+        "--rules", type=str, default=None,
+        help="JSON list of [name, regex] rules, checked before the built-in table.",
+    )
+    parser.add_argument(
+        "--max-frames", type=int, default=6,
+        help="Innermost stack frames kept in a signature (default: 6, 0 = all)",
+    )
+    parser.add_argument(
+        "--top", type=int, default=20,
+        help="Groups shown in the markdown table (default: 20)",
+    )
+    parser.add_argument(
+        "--output", type=str, default=None,
+        help="Save markdown output to a file instead of printing to stdout.",
+    )
+    parser.add_argument(
+        "--json-output", type=str, default=None,
+        help="Save all groups (with members) to a JSON file.",
+    )
+    args = parser.parse_args()
+
+    matcher = CrashMatcher(load_rules(args.rules))
+
+    if args.crash_json:
+        crashes = iter_json_crashes(args.crash_json)
+    else:
+        if args.trajectory_dir:
+            traj_dir = Path(args.trajectory_dir)
+        else:
+            script_dir = Path(__file__).resolve().parent
+            traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories"
+            if not traj_dir.exists():
+                traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories "
+        if not traj_dir.exists():
+            print(f"ERROR: Trajectory directory not found: {traj_dir}")
+            sys.exit(1)
+        crashes = iter_raw_crashes(traj_dir, args.model_size)
+
+    groups = group_crashes(crashes, matcher, args.max_frames)
+    if not groups:
+        print("No crashes found.")
+        return
+
+    if args.output:
+        with open(args.output, "w") as f:
+            print_summary(groups, args.top, output_file=f)
+        print(f"Saved markdown to {args.output}")
+    else:
+        print_summary(groups, args.top)
+
+    if args.json_output:
+        output = [dict(g, by_config=dict(g["by_config"]),
+                       members=[{"config": c, "task_id": t, "trial": r} for c, t, r in g["members"]])
+                  for g in groups]
+        with open(args.json_output, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"Saved JSON to {args.json_output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+diff_runs.py — Run-to-run differential report between two experiment corpora.
+
+Comparing two runs (baseline vs improved agent, 14B vs 32B) used to mean
+eyeballing two markdown reports. This script indexes both corpora and
+reports exactly what changed, entry by entry.
+
+How it works:
+─────────────
+1. INDEX: Every trajectory file is read lazily (traj_model.iter_entries:
+   mmap-backed, only assistant messages decoded). Each entry becomes one
+   compact record keyed by (task_id, trial): outcome (pass / fail / crash
+   type), a sha1 of its canonical action sequence (extract_agent_actions)
+   and the tool names in order. Files are indexed in a process pool
+   (--workers).
+
+2. PAIR: Configs are matched by (strategy, domain). When neither side is
+   filtered with --a-size / --b-size, the model size must match too, so two
+   full 4-size corpora pair up config by config. --a-size 14b --b-size 32b
+   compares two sizes within one corpus.
+
+3. DIFF: One pass over each pair of indexes computes:
+   - flips: pass→fail (regressions) and fail→pass (fixes);
+   - crash deltas: entries that started or stopped crashing, and crash
+     counts by type;
+   - changed action sequences, split into same and different outcome, with
+     the first tool call where the two runs diverge;
+   - entries present in only one run.
+
+4. CATEGORIES: With --a-results / --b-results (classify_errors.py output
+   dirs), failure categories are counted on both sides. The shift in each
+   category's share is reported in percentage points.
+
+Usage:
+    python diff_runs.py --a runs/baseline --b runs/improved
+    python diff_runs.py --a ../../phase1/JSON_trajectories --a-size 14b \\
+        --b ../../phase1/JSON_trajectories --b-size 32b --a-results results --b-results results
+    python diff_runs.py --a old/ --b new/ --output diff.md --json-output diff.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from analyze_crashes import classify_crash, discover_files
+from classify_errors import extract_agent_actions, iter_classifications
+from similar_failures import config_name
+from traj_model import iter_entries
+
+intern = sys.intern
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# INDEXING
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def action_signature(actions):
+    """(sha1 of the canonical action sequence, tool names in order)."""
+    canon = json.dumps([[a.get("name"), a.get("arguments")] for a in actions],
+                       sort_keys=True, separators=(",", ":"), default=str)
+    return (hashlib.sha1(canon.encode()).hexdigest()[:16],
+            tuple(intern(str(a.get("name"))) for a in actions))
+
+
+def index_file(job):
+    """(config, {(task_id, trial): (outcome, action hash, tool names)}, duplicates)."""
+    filepath, config = job
+    index, duplicates = {}, 0
+    for entry in iter_entries(filepath, config["config_label"]):
+        if entry.crashed:
+            outcome = "crash:" + classify_crash(entry.error)["crash_type"]
+            signature = ("", ())
+        else:
+            outcome = "pass" if entry.reward == 1.0 else "fail"
+            signature = action_signature(extract_agent_actions(entry.messages))
+        key = (entry.task_id, entry.trial)
+        duplicates += key in index
+        index[key] = (intern(outcome),) + signature
+    return config, index, duplicates
+
+
+def pair_key(config, by_size):
+    key = (config["strategy"], config["domain"])
+    return (config["model_size"],) + key if by_size else key
+
+
+def index_run(files, by_size, pool):
+    """{pair key: {"configs": [...], "index": {...}, "duplicates": n}} for one corpus."""
+    run = {}
+    jobs = [(filepath, config) for filepath, config in files]
+    results = pool.map(index_file, jobs) if pool else map(index_file, jobs)
+    for config, index, duplicates in results:
+        slot = run.setdefault(pair_key(config, by_size), {"configs": [], "index": {}, "duplicates": 0})
+        slot["configs"].append(config)
+        slot["duplicates"] += duplicates + len(slot["index"].keys() & index.keys())
+        slot["index"].update(index)
+    return run
+
+
+def load_categories(results_dir):
+    """{(config, task_id, trial): primary_category} from classify_errors.py results."""
+    labels = {}
+    if not results_dir:
+        return labels
+    results_dir = Path(results_dir)
+    for path in sorted(results_dir.glob("*_*_*.json")):
+        try:
+            with open(path) as f:
+                result = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            continue
+        if not isinstance(result, dict) or "config" not in result:
+            continue
+        for rec in iter_classifications(result, results_dir):
+            labels[(result["config"].lower(), rec.get("task_id"), rec.get("trial", 0))] = rec.get(
+                "classification", {}).get("primary_category")
+    return labels
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# DIFF
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def first_divergence(a_names, b_names):
+    """(step, A's tool, B's tool) at the first differing tool name; None if the names match."""
+    for i, (x, y) in enumerate(zip(a_names, b_names)):
+        if x != y:
+            return i, x, y
+    if len(a_names) != len(b_names):
+        i = min(len(a_names), len(b_names))
+        return i, a_names[i] if i < len(a_names) else None, b_names[i] if i < len(b_names) else None
+    return None
+
+
+def diff_pair(label, a, b, a_labels, b_labels):
+    ai, bi = a["index"], b["index"]
+    common = ai.keys() & bi.keys()
+    transitions = Counter()
+    flips, changed = [], []
+    for key in sorted(common, key=lambda k: (str(k[0]), str(k[1]))):
+        ao, ah, an = ai[key]
+        bo, bh, bn = bi[key]
+        a_status = "crash" if ao.startswith("crash") else ao
+        b_status = "crash" if bo.startswith("crash") else bo
+        transitions[(a_status, b_status)] += 1
+        record = {"config": label, "task_id": key[0], "trial": key[1], "a": ao, "b": bo}
+        if a_status != b_status:
+            flips.append(record)
+        if a_status != "crash" and b_status != "crash" and ah != bh:
+            div = first_divergence(an, bn)
+            changed.append(dict(record, same_outcome=ao == bo, a_actions=len(an), b_actions=len(bn),
+                                diverge_at=div[0] if div else None,
+                                a_tool=div[1] if div else None, b_tool=div[2] if div else None))
+
+    def crash_types(index):
+        return Counter(o.split(":", 1)[1] for o, _, _ in index.values() if o.startswith("crash"))
+
+    def categories(side, labels):
+        names = {config_name(c).lower() for c in side["configs"]}
+        return Counter(cat for (cfg, _, _), cat in labels.items() if cfg in names and cat)
+
+    def pass_rate(index):
+        judged = [o for o, _, _ in index.values()]
+        return sum(o == "pass" for o in judged) / len(judged) if judged else 0.0
+
+    return {
+        "config": label,
+        "a_configs": [c["config_label"] for c in a["configs"]],
+        "b_configs": [c["config_label"] for c in b["configs"]],
+        "a_entries": len(ai),
+        "b_entries": len(bi),
+        "common": len(common),
+        "only_a": len(ai.keys() - bi.keys()),
+        "only_b": len(bi.keys() - ai.keys()),
+        "a_pass_rate": round(pass_rate(ai), 4),
+        "b_pass_rate": round(pass_rate(bi), 4),
+        "pass_to_fail": transitions[("pass", "fail")],
+        "fail_to_pass": transitions[("fail", "pass")],
+        "to_crash": transitions[("pass", "crash")] + transitions[("fail", "crash")],
+        "from_crash": transitions[("crash", "pass")] + transitions[("crash", "fail")],
+        "actions_changed": len(changed),
+        "actions_changed_same_outcome": sum(1 for c in changed if c["same_outcome"]),
+        "a_crashes": dict(crash_types(ai)),
+        "b_crashes": dict(crash_types(bi)),
+        "a_categories": dict(categories(a, a_labels)),
+        "b_categories": dict(categories(b, b_labels)),
+        "duplicates": a["duplicates"] + b["duplicates"],
+        "flips": flips,
+        "changed_actions": changed,
+    }
+
+
+def diff_runs(run_a, run_b, a_labels, b_labels):
+    pairs = []
+    for key in sorted(run_a.keys() & run_b.keys()):
+        pairs.append(diff_pair("_".join(key), run_a[key], run_b[key], a_labels, b_labels))
+    unpaired = {"a": ["_".join(k) for k in sorted(run_a.keys() - run_b.keys())],
+                "b": ["_".join(k) for k in sorted(run_b.keys() - run_a.keys())]}
+    return pairs, unpaired
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# REPORTS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def category_shift(pairs):
+    a, b = Counter(), Counter()
+    for d in pairs:
+        a.update(d["a_categories"])
+        b.update(d["b_categories"])
+    na, nb = sum(a.values()), sum(b.values())
+    rows = []
+    for cat in sorted(a.keys() | b.keys(), key=lambda c: -(a[c] + b[c])):
+        pa = a[cat] / na * 100 if na else 0.0
+        pb = b[cat] / nb * 100 if nb else 0.0
+        rows.append({"category": cat, "a_count": a[cat], "b_count": b[cat],
+                     "a_pct": round(pa, 1), "b_pct": round(pb, 1), "shift_pp": round(pb - pa, 1)})
+    return rows, na, nb
+
+
+def print_summary(pairs, unpaired, names, max_list=20, output_file=None):
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    a_name, b_name = names
+    p(f"# Run Diff: {a_name} → {b_name}")
+    p()
+    p("| Config | Common | Pass^1 A | Pass^1 B | Δ | Pass→Fail | Fail→Pass | →Crash | Crash→ | Actions Changed (same outcome) | Only A | Only B |")
+    p("|--------|--------|----------|----------|---|-----------|-----------|--------|--------|--------------------------------|--------|--------|")
+    for d in pairs:
+        p(f"| {d['config']} | {d['common']} | {d['a_pass_rate']:.1%} | {d['b_pass_rate']:.1%} | "
+          f"{(d['b_pass_rate'] - d['a_pass_rate']) * 100:+.1f}pp | {d['pass_to_fail']} | {d['fail_to_pass']} | "
+          f"{d['to_crash']} | {d['from_crash']} | {d['actions_changed']} ({d['actions_changed_same_outcome']}) | "
+          f"{d['only_a']} | {d['only_b']} |")
+    if len(pairs) > 1:
+        tot = Counter()
+        for d in pairs:
+            tot.update({k: d[k] for k in ("common", "pass_to_fail", "fail_to_pass", "to_crash", "from_crash",
+                                          "actions_changed", "actions_changed_same_outcome",
+                                          "only_a", "only_b")})
+        p(f"| **Total** | {tot['common']} | | | | {tot['pass_to_fail']} | {tot['fail_to_pass']} | "
+          f"{tot['to_crash']} | {tot['from_crash']} | {tot['actions_changed']} "
+          f"({tot['actions_changed_same_outcome']}) | {tot['only_a']} | {tot['only_b']} |")
+    p()
+    if unpaired["a"] or unpaired["b"]:
+        p(f"Unpaired configs — only in {a_name}: {', '.join(unpaired['a']) or 'none'}; "
+          f"only in {b_name}: {', '.join(unpaired['b']) or 'none'}.")
+        p()
+    duplicates = sum(d["duplicates"] for d in pairs)
+    if duplicates:
+        p(f"**Warning:** {duplicates} duplicate (task_id, trial) entries; the last one read was kept.")
+        p()
+
+    flips = [f for d in pairs for f in d["flips"]]
+    if flips:
+        p("## Outcome Flips")
+        p()
+        p("| Config | Task | Trial | A | B |")
+        p("|--------|------|-------|---|---|")
+        order = {"pass": 0, "fail": 1}
+        flips.sort(key=lambda f: (order.get(f["a"], 2), f["config"], str(f["task_id"]), str(f["trial"])))
+        for f in flips[:max_list]:
+            p(f"| {f['config']} | {f['task_id']} | {f['trial']} | {f['a']} | {f['b']} |")
+        if len(flips) > max_list:
+            p(f"| ... | {len(flips) - max_list} more | | | |")
+        p()
+
+    crash_rows = []
+    for d in pairs:
+        for t in sorted(set(d["a_crashes"]) | set(d["b_crashes"])):
+            a, b = d["a_crashes"].get(t, 0), d["b_crashes"].get(t, 0)
+            crash_rows.append((d["config"], t, a, b))
+    if crash_rows:
+        p("## Crash Deltas")
+        p()
+        p("| Config | Crash Type | A | B | Δ |")
+        p("|--------|------------|---|---|---|")
+        for label, t, a, b in crash_rows:
+            p(f"| {label} | {t} | {a} | {b} | {b - a:+d} |")
+        p()
+
+    changed = [c for d in pairs for c in d["changed_actions"]]
+    if changed:
+        p("## Changed Action Sequences")
+        p()
+        p("Entries whose tool calls differ between the runs, and the first step where the tool names diverge "
+          "(— means only the arguments differ).")
+        p()
+        p("| Config | Task | Trial | A → B | Calls A / B | Diverge At | A Tool | B Tool |")
+        p("|--------|------|-------|-------|-------------|------------|--------|--------|")
+        changed.sort(key=lambda c: (c["same_outcome"], c["config"], str(c["task_id"]), str(c["trial"])))
+        for c in changed[:max_list]:
+            at = "—" if c["diverge_at"] is None else c["diverge_at"]
+            p(f"| {c['config']} | {c['task_id']} | {c['trial']} | {c['a']} → {c['b']} | "
+              f"{c['a_actions']} / {c['b_actions']} | {at} | {c['a_tool'] or '—'} | {c['b_tool'] or '—'} |")
+        if len(changed) > max_list:
+            p(f"| ... | {len(changed) - max_list} more | | | | | | |")
+        p()
+
+    rows, na, nb = category_shift(pairs)
+    if rows:
+        p("## Error Category Shifts")
+        p()
+        p(f"Classified failures: {na} in {a_name}, {nb} in {b_name}.")
+        p()
+        p("| Category | A | A % | B | B % | Shift |")
+        p("|----------|---|-----|---|-----|-------|")
+        for r in rows:
+            p(f"| {r['category']} | {r['a_count']} | {r['a_pct']}% | {r['b_count']} | {r['b_pct']}% | "
+              f"{r['shift_pp']:+.1f}pp |")
+        p()
+
+
+def save_json(pairs, unpaired, names, json_path):
+    """Machine-readable version of the markdown report: totals, per-config diffs and every changed entry."""
+    rows, na, nb = category_shift(pairs)
+    summary_keys = [k for k in (pairs[0] if pairs else {}) if k not in ("flips", "changed_actions")]
+    output = {
+        "runs": {"a": names[0], "b": names[1]},
+        "totals": {
+            "common_entries": sum(d["common"] for d in pairs),
+            "pass_to_fail": sum(d["pass_to_fail"] for d in pairs),
+            "fail_to_pass": sum(d["fail_to_pass"] for d in pairs),
+            "to_crash": sum(d["to_crash"] for d in pairs),
+            "from_crash": sum(d["from_crash"] for d in pairs),
+            "actions_changed": sum(d["actions_changed"] for d in pairs),
+            "only_a": sum(d["only_a"] for d in pairs),
+            "only_b": sum(d["only_b"] for d in pairs),
+        },
+        "per_config": [{k: d[k] for k in summary_keys} for d in pairs],
+        "unpaired": unpaired,
+        "flips": [f for d in pairs for f in d["flips"]],
+        "changed_actions": [c for d in pairs for c in d["changed_actions"]],
+        "category_shifts": {"a_classified": na, "b_classified": nb, "categories": rows},
+    }
+    with open(json_path, "w") as f:
+        json.dump(output, f, indent=2)
+
+
+def main():
+    script_dir = Path(__file__).resolve().parent
+    default_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories"
+    if not default_dir.exists():
+        default_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories "
+
+    parser = argparse.ArgumentParser(description="Differential report between two tau-bench runs.")
+    parser.add_argument("--a", type=str, default=str(default_dir),
+                        help="Trajectory directory of run A (default: the phase1 trajectories)")
+    parser.add_argument("--b", type=str, required=True, help="Trajectory directory of run B")
+    for side in ("a", "b"):
+        parser.add_argument(
+            f"--{side}-size", type=str, default=None, choices=["4b", "8b", "14b", "32b"],
+            help=f"Only this model size from run {side.upper()} (configs then pair by strategy + domain)",
+        )
+        parser.add_argument(
+            f"--{side}-results", type=str, default=None,
+            help=f"classify_errors.py results dir of run {side.upper()}, for category shifts",
+        )
+        parser.add_argument(f"--{side}-name", type=str, default=None, help=f"Label for run {side.upper()}")
+    parser.add_argument(
+        "--max-list", type=int, default=20,
+        help="Rows per listing in the markdown report (default: 20; the JSON has all)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1,
+        help="Processes for indexing files (default: all CPUs)",
+    )
+    parser.add_argument(
+        "--output", type=str, default=None,
+        help="Save markdown output to a file instead of printing to stdout.",
+    )
+    parser.add_argument(
+        "--json-output", type=str, default=None,
+        help="Save the full diff to a JSON file.",
+    )
+    args = parser.parse_args()
+
+    by_size = not (args.a_size or args.b_size)
+    files = {}
+    for side in ("a", "b"):
+        traj_dir = Path(getattr(args, side))
+        if not traj_dir.exists():
+            print(f"ERROR: Trajectory directory not found: {traj_dir}")
+            sys.exit(1)
+        files[side] = discover_files(traj_dir, getattr(args, f"{side}_size"))
+        print(f"Run {side.upper()}: {len(files[side])} trajectory file(s) in {traj_dir}")
+        if not files[side]:
+            sys.exit(1)
+    names = tuple(getattr(args, f"{s}_name") or
+                  Path(getattr(args, s)).resolve().name.strip() + (f" ({getattr(args, f'{s}_size')})"
+                                                                  if getattr(args, f"{s}_size") else "")
+                  for s in ("a", "b"))
+
+    start = time.perf_counter()
+    n_files = len(files["a"]) + len(files["b"])
+    workers = max(1, min(args.workers, n_files))
+    if workers == 1:
+        run_a, run_b = (index_run(files[s], by_size, None) for s in ("a", "b"))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            run_a, run_b = (index_run(files[s], by_size, pool) for s in ("a", "b"))
+    pairs, unpaired = diff_runs(run_a, run_b, load_categories(args.a_results), load_categories(args.b_results))
+    print(f"Indexed {n_files} files and diffed {len(pairs)} config pair(s) in "
+          f"{time.perf_counter() - start:.2f}s")
+    print()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            print_summary(pairs, unpaired, names, args.max_list, output_file=f)
+        print(f"Saved markdown to {args.output}")
+    else:
+        print_summary(pairs, unpaired, names, args.max_list)
+
+    if args.json_output:
+        save_json(pairs, unpaired, names, args.json_output)
+        print(f"Saved JSON to {args.json_output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+loop_detector.py — Loop and stall detector for early termination of agent conversations.
+
+The longest conversations in the crash report run to 62 turns and all of
+them fail. They use the most tokens and are the ones that overflow the
+context window. LoopDetector watches a conversation message by message and
+flags it once it has stopped making progress, so the agent loop can end it
+early.
+
+How it works:
+─────────────
+1. REPEAT: The same tool call (name + canonical JSON arguments) appearing
+   --max-repeats times within the last --window calls.
+
+2. OSCILLATION: The most recent calls form a cycle of period 2 or 3 (A B A
+   B ...) repeated --min-cycles times, e.g. get_order_details ->
+   modify_pending_order_items -> get_order_details -> ...
+
+3. STALL: An exchange is an agent reply plus the user's answer. It counts
+   as stalled if no tool was called during it and either side repeats one of
+   its recent messages (word-set Jaccard >= --similarity). --max-stalls
+   stalled exchanges in a row are flagged. A call to a tool not yet seen
+   with those arguments resets the count.
+
+4. IDLE: --max-idle consecutive exchanges without any tool call.
+
+The first flag sticks. <think> blocks are ignored, and 'API output:' / FC
+'tool' messages are tool replies, not user turns.
+
+Using it in an agent loop:
+    detector = LoopDetector()
+    completion = detector.wrap(litellm.completion)   # raises ConversationStalled when flagged
+    # or, explicitly:  flag = detector.check(messages); if flag: stop
+
+Offline evaluation (no LLM calls):
+    python loop_detector.py                          # all stored trajectories
+    python loop_detector.py --model-size 14b --max-repeats 2 --max-idle 8
+    python loop_detector.py --json-output loop_eval.json
+"""
+
+import argparse
+import json
+import re
+import sys
+from collections import Counter, defaultdict, deque
+from pathlib import Path
+
+from analyze_crashes import discover_files
+from classify_errors import extract_agent_actions
+from profile_context import TEMPLATE_OVERHEAD, load_tokenizer
+from traj_json import load
+
+THINK_RE = re.compile(r"<think>.*?</think>\s*", re.DOTALL)
+WORD_RE = re.compile(r"\w+")
+REASONS = ("repeat", "oscillation", "stall", "idle")
+
+
+class ConversationStalled(RuntimeError):
+    """Raised by LoopDetector.wrap() when the conversation has been flagged."""
+
+    def __init__(self, flag):
+        super().__init__(f"conversation stalled ({flag['reason']} at message {flag['index']}): "
+                         f"{flag['detail']}")
+        self.flag = flag
+
+
+def call_key(action):
+    return f"{action.get('name')}:{json.dumps(action.get('arguments'), sort_keys=True)}"
+
+
+def word_set(text):
+    return frozenset(WORD_RE.findall(THINK_RE.sub("", text or "").lower()))
+
+
+def similar(a, b, threshold):
+    if not a or not b:
+        return False
+    return len(a & b) / len(a | b) >= threshold
+
+
+class LoopDetector:
+    """Streaming detector: feed messages with observe() or check(); returns a flag dict or None.
+
+    max_repeats  — identical calls within `window` recent calls that count as a loop
+    min_cycles   — repetitions of a period-2/3 call cycle that count as oscillation
+    max_stalls   — consecutive no-progress exchanges
+    max_idle     — consecutive exchanges without any tool call
+    similarity   — Jaccard threshold for "repeats a recent message"
+    """
+
+    def __init__(self, max_repeats=3, window=8, min_cycles=2, max_stalls=3, max_idle=10,
+                 similarity=0.8, history=4):
+        self.max_repeats = max_repeats
+        self.window = window
+        self.min_cycles = min_cycles
+        self.max_stalls = max_stalls
+        self.max_idle = max_idle
+        self.similarity = similarity
+        self.history = history
+        self.reset()
+
+    def reset(self):
+        self.flag = None
+        self.seen = 0
+        self.first = None
+        self.calls = deque(maxlen=max(self.window, 3 * self.min_cycles))
+        self.all_calls = set()
+        self.agent_recent = deque(maxlen=self.history)
+        self.user_recent = deque(maxlen=self.history)
+        self.pending_agent = None     # word set of the agent's reply in the current exchange
+        self.exchange_calls = 0       # tool calls since the last user turn
+        self.progress = False         # a new distinct call since the last user turn
+        self.stalls = 0
+        self.idle = 0
+
+    def _raise(self, reason, detail):
+        self.flag = {"reason": reason, "index": self.seen - 1, "detail": detail}
+        return self.flag
+
+    def observe(self, msg):
+        """Feed the next message. Returns the flag (sticky) or None."""
+        self.seen += 1
+        if self.flag:
+            return self.flag
+        role = msg.get("role")
+        content = msg.get("content") or ""
+
+        if role == "assistant":
+            actions = extract_agent_actions([msg])
+            for action in actions:
+                key = call_key(action)
+                self.calls.append(key)
+                self.exchange_calls += 1
+                if key not in self.all_calls:
+                    self.all_calls.add(key)
+                    self.progress = True
+                recent = list(self.calls)[-self.window:]
+                if recent.count(key) >= self.max_repeats:
+                    return self._raise("repeat", f"{action.get('name')} called {recent.count(key)}x "
+                                                 f"in the last {len(recent)} calls")
+                cycle = self._cycle()
+                if cycle:
+                    return self._raise("oscillation", " -> ".join(cycle) + f" x{self.min_cycles}")
+            if not actions:
+                # The agent's text to the user (ACT/ReAct 'respond', FC plain content)
+                self.pending_agent = word_set(content)
+
+        elif role == "user" and not content.startswith("API output:"):
+            if self.seen <= 2:
+                self.user_recent.append(word_set(content))
+                return None
+            user = word_set(content)
+            if self.exchange_calls == 0:
+                self.idle += 1
+                repeated = (
+                    any(similar(self.pending_agent, a, self.similarity) for a in self.agent_recent)
+                    or any(similar(user, u, self.similarity) for u in self.user_recent))
+                self.stalls = self.stalls + 1 if repeated else 0
+            else:
+                self.idle = 0
+                if self.progress:
+                    self.stalls = 0
+            if self.pending_agent:
+                self.agent_recent.append(self.pending_agent)
+            self.user_recent.append(user)
+            self.pending_agent = None
+            self.exchange_calls = 0
+            self.progress = False
+            if self.stalls >= self.max_stalls:
+                return self._raise("stall", f"{self.stalls} exchanges in a row repeat earlier messages")
+            if self.idle >= self.max_idle:
+                return self._raise("idle", f"{self.idle} exchanges without a tool call")
+        return None
+
+    def _cycle(self):
+        calls = list(self.calls)
+        for period in (2, 3):
+            n = period * self.min_cycles
+            if len(calls) < n:
+                continue
+            tail = calls[-n:]
+            pattern = tail[:period]
+            if len(set(pattern)) > 1 and all(tail[i] == pattern[i % period] for i in range(n)):
+                return [key.split(":", 1)[0] for key in pattern]
+        return None
+
+    def check(self, messages):
+        """Feed the messages not seen yet. A list that doesn't extend the last one starts over."""
+        first = messages[0].get("content") if messages else None
+        if len(messages) < self.seen or first != self.first:
+            self.reset()
+            self.first = first
+        for msg in messages[self.seen:]:
+            self.observe(msg)
+        return self.flag
+
+    def wrap(self, completion_fn):
+        """Wrap an OpenAI/litellm-style completion(messages=..., **kw) function."""
+        def guarded_completion(*args, messages, **kwargs):
+            flag = self.check(messages)
+            if flag:
+                raise ConversationStalled(flag)
+            return completion_fn(*args, messages=messages, **kwargs)
+        return guarded_completion
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# OFFLINE EVALUATION
+# Streams every stored trajectory through the detector. Tokens saved = the
+# agent requests (context + reply) that would not have been sent after the cut.
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def request_tokens(traj, count):
+    """[(message index, tokens)] for every agent request: the context before it plus its reply."""
+    requests, context = [], 0
+    for i, msg in enumerate(traj):
+        content = msg.get("content") or ""
+        if msg.get("tool_calls"):
+            content += json.dumps([tc.get("function", {}) for tc in msg["tool_calls"]])
+        tokens = count(content) + TEMPLATE_OVERHEAD
+        if msg.get("role") == "assistant":
+            requests.append((i, context + tokens))
+        context += tokens
+    return requests
+
+
+def evaluate_file(detector_args, filepath, config, count):
+    data = load(filepath)
+    entries, crashed = [], 0
+    for entry in data:
+        traj = entry.get("traj", [])
+        if "error" in entry.get("info", {}) or not traj:
+            crashed += 1
+            continue
+        detector = LoopDetector(**detector_args)
+        for msg in traj:
+            if detector.observe(msg):
+                break
+        flag = detector.flag
+        requests = request_tokens(traj, count)
+        total = sum(t for _, t in requests)
+        saved = sum(t for i, t in requests if flag and i > flag["index"])
+        entries.append({
+            "task_id": entry.get("task_id"),
+            "trial": entry.get("trial"),
+            "reward": entry.get("reward", 0.0),
+            "turns": len(traj),
+            "tokens": total,
+            "flag": flag,
+            "tokens_saved": saved,
+        })
+    return {"config": config, "entries": entries, "crashed": crashed}
+
+
+def print_summary(all_results, detector_args, approximate, output_file=None):
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    p("# Loop and Stall Detector — Offline Evaluation")
+    p()
+    p("Settings: " + ", ".join(f"{k.replace('_', '-')}={v}" for k, v in detector_args.items())
+      + (" | Counts are **approximate** (no tokenizer installed)" if approximate else ""))
+    p()
+    p("A false positive is a successful run (reward 1.0) that would have been cut. "
+      "Crashed entries have no trajectory and are not evaluated.")
+    p()
+    p("| Config | Entries | Failures Cut | Successes Cut (FP) | FP Rate | Agent Tokens | Saved | Saved % | Crashed |")
+    p("|--------|---------|--------------|--------------------|---------|--------------|-------|---------|---------|")
+    tot = Counter()
+    reasons = Counter()
+    cut_turns = defaultdict(list)
+    for r in all_results:
+        es = r["entries"]
+        fails = [e for e in es if e["reward"] != 1.0]
+        succ = [e for e in es if e["reward"] == 1.0]
+        f_cut = sum(1 for e in fails if e["flag"])
+        s_cut = sum(1 for e in succ if e["flag"])
+        tokens = sum(e["tokens"] for e in es)
+        saved = sum(e["tokens_saved"] for e in es)
+        for e in es:
+            if e["flag"]:
+                reasons[(e["flag"]["reason"], e["reward"] == 1.0)] += 1
+                cut_turns[e["reward"] == 1.0].append(e["flag"]["index"])
+        p(f"| {r['config']['config_label']} | {len(es)} | {f_cut}/{len(fails)} | {s_cut}/{len(succ)} | "
+          f"{s_cut / len(succ) * 100 if succ else 0:.1f}% | {tokens:,} | {saved:,} | "
+          f"{saved / tokens * 100 if tokens else 0:.1f}% | {r['crashed']} |")
+        tot.update(entries=len(es), fails=len(fails), succ=len(succ), f_cut=f_cut, s_cut=s_cut,
+                   tokens=tokens, saved=saved, crashed=r["crashed"])
+    if len(all_results) > 1:
+        p(f"| **Total** | {tot['entries']} | {tot['f_cut']}/{tot['fails']} | {tot['s_cut']}/{tot['succ']} | "
+          f"{tot['s_cut'] / tot['succ'] * 100 if tot['succ'] else 0:.1f}% | {tot['tokens']:,} | "
+          f"{tot['saved']:,} | {tot['saved'] / tot['tokens'] * 100 if tot['tokens'] else 0:.1f}% | "
+          f"{tot['crashed']} |")
+    p()
+
+    p("## Flags by Reason")
+    p()
+    p("| Reason | Failures | Successes |")
+    p("|--------|----------|-----------|")
+    for reason in REASONS:
+        p(f"| {reason} | {reasons[(reason, False)]} | {reasons[(reason, True)]} |")
+    p()
+    for success, label in ((False, "failures"), (True, "successes")):
+        turns = sorted(cut_turns[success])
+        if turns:
+            p(f"Median cut point for {label}: message {turns[len(turns) // 2]} "
+              f"(earliest {turns[0]}, latest {turns[-1]}).")
+    p()
+
+    flagged = sorted((e for r in all_results for e in r["entries"] if e["flag"]),
+                     key=lambda e: -e["tokens_saved"])
+    if flagged:
+        p("## Largest Savings")
+        p()
+        p("| Config | Task | Trial | Reward | Turns | Cut At | Reason | Tokens Saved |")
+        p("|--------|------|-------|--------|-------|--------|--------|--------------|")
+        label_of = {id(e): r["config"]["config_label"] for r in all_results for e in r["entries"]}
+        for e in flagged[:10]:
+            p(f"| {label_of[id(e)]} | {e['task_id']} | {e['trial']} | {e['reward']} | {e['turns']} | "
+              f"{e['flag']['index']} | {e['flag']['reason']}: {e['flag']['detail']} | {e['tokens_saved']:,} |")
+        p()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Evaluate loop/stall detection on stored tau-bench trajectories."
+    )
+    parser.add_argument(
+        "--trajectory-dir", type=str, default=None,
+        help="Path to trajectory directory. Default: auto-detect from script location.",
+    )
+    parser.add_argument(
+        "--model-size", type=str, default=None, choices=["4b", "8b", "14b", "32b"],
+        help="Filter to a specific model size (e.g., 14b). Default: all sizes.",
+    )
+    parser.add_argument(
+        "--max-repeats", type=int, default=3,
+        help="Identical calls within --window recent calls that count as a loop (default: 3)",
+    )
+    parser.add_argument(
+        "--window", type=int, default=8,
+        help="Recent tool calls considered for --max-repeats (default: 8)",
+    )
+    parser.add_argument(
+        "--min-cycles", type=int, default=2,
+        help="Repetitions of a period-2/3 call cycle that count as oscillation (default: 2)",
+    )
+    parser.add_argument(
+        "--max-stalls", type=int, default=3,
+        help="Consecutive exchanges that repeat earlier messages without a tool call (default: 3)",
+    )
+    parser.add_argument(
+        "--max-idle", type=int, default=10,
+        help="Consecutive exchanges without any tool call (default: 10)",
+    )
+    parser.add_argument(
+        "--similarity", type=float, default=0.8,
+        help="Word-set Jaccard similarity that counts as a repeated message (default: 0.8)",
+    )
+    parser.add_argument(
+        "--tokenizer", type=str, default="Qwen/Qwen3-14B",
+        help="HF tokenizer name or local path (default: Qwen/Qwen3-14B)",
+    )
+    parser.add_argument(
+        "--output", type=str, default=None,
+        help="Save markdown output to a file instead of printing to stdout.",
+    )
+    parser.add_argument(
+        "--json-output", type=str, default=None,
+        help="Save per-entry results to a JSON file.",
+    )
+    args = parser.parse_args()
+
+    if args.trajectory_dir:
+        traj_dir = Path(args.trajectory_dir)
+    else:
+        script_dir = Path(__file__).resolve().parent
+        traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories"
+        if not traj_dir.exists():
+            traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories "
+    if not traj_dir.exists():
+        print(f"ERROR: Trajectory directory not found: {traj_dir}")
+        sys.exit(1)
+
+    files = discover_files(traj_dir, args.model_size)
+    print(f"Found {len(files)} trajectory file(s)")
+    if not files:
+        sys.exit(1)
+
+    detector_args = {
+        "max_repeats": args.max_repeats, "window": args.window, "min_cycles": args.min_cycles,
+        "max_stalls": args.max_stalls, "max_idle": args.max_idle, "similarity": args.similarity,
+    }
+    encode, approximate = load_tokenizer(args.tokenizer)
+    cache = {}
+
+    def count(text):
+        n = cache.get(text)
+        if n is None:
+            n = cache[text] = encode(text)
+        return n
+
+    all_results = []
+    for filepath, config in files:
+        print(f"  Evaluating {config['config_label']}: {filepath.name}")
+        all_results.append(evaluate_file(detector_args, filepath, config, count))
+    print()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            print_summary(all_results, detector_args, approximate, output_file=f)
+        print(f"Saved markdown to {args.output}")
+    else:
+        print_summary(all_results, detector_args, approximate)
+
+    if args.json_output:
+        output = {
+            "settings": detector_args,
+            "configs": [{"config": r["config"]["config_label"], "crashed": r["crashed"],
+                         "entries": r["entries"]} for r in all_results],
+        }
+        with open(args.json_output, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"Saved JSON to {args.json_output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+"""
+plan_trials.py — Adaptive trial planner for pass^k experiments.
+
+Every config runs all tasks x 5 trials, even tasks whose outcome is already
+clear (at temperature 0.0 the 5 rewards are often identical). This script
+reads the existing trajectory files, estimates how uncertain each task's
+outcome still is, and plans the next trials where they shrink the pass^k
+confidence interval the most per GPU-second.
+
+How it works:
+─────────────
+1. OUTCOMES: Every non-crashed entry is one trial of its task: success
+   when reward == 1 (tau-bench's tolerance), cost = its traj length (one
+   message ~ one LLM call). Crashed entries are not outcomes. Files are
+   grouped by config label as in analyze_crashes.py, so extra-trial result
+   files under --extra-dir count toward the same config.
+
+2. PER-TASK POSTERIOR: A task with s successes in n trials has the
+   posterior Beta(s + 1/2, n - s + 1/2) (Jeffreys prior) for its success
+   rate p. Its pass^k is p^k, with posterior mean E[p^k] and variance
+   Var[p^k] = E[p^2k] - E[p^k]^2. Both come from the exact Beta moments.
+   The config's pass^k is the mean over tasks, so its variance is the sum
+   of the task variances over T^2, and the CI half-width is
+   z * sqrt(sum Var) / T.
+
+3. VALUE OF A TRIAL: One more trial of a task succeeds with probability
+   E[p]. The expected variance after it is the mix of the two updated
+   posteriors. gain = current Var - expected Var, divided by the task's
+   mean trial cost. A task with 5/5 or 0/5 successes has a tight posterior
+   and a small gain. Tasks that flip between trials have a large one.
+
+4. PLAN (`plan`): Trials are handed out greedily by gain/cost, one at a
+   time, updating the chosen task by its expected outcome. This repeats
+   until the CI half-width reaches --target-ci or --budget trials are used.
+   The plan lists the trials per task and the tau-bench commands to run
+   them, batched like rerun_crashes.py does.
+
+5. SIMULATION (`simulate`): Replays the historical files. The fixed design
+   runs --fixed-trials of the recorded trials for every task. The adaptive
+   design starts from --initial trials per task and adds the next recorded
+   trial of the best task (revealing its real outcome). It may use every
+   recorded trial, and stops once its CI half-width is as tight as the
+   fixed design's. The fixed design must use fewer trials than were
+   recorded, otherwise adaptive has nothing left to draw and can only tie.
+   The report shows trials, LLM calls and GPU time (--seconds-per-call)
+   for both designs, and how far each estimate lands from the full-data
+   one. This is averaged over --repeats random trial orders.
+
+Usage:
+    python plan_trials.py plan --budget 200                     # best 200 new trials over all configs
+    python plan_trials.py plan --model-size 14b --k 2 --target-ci 0.03
+    python plan_trials.py plan --extra-dir extra_trials         # include trials run from a previous plan
+    python plan_trials.py simulate --k 1 --repeats 20
+    python plan_trials.py simulate --fixed-trials 4              # compare at the 4-trial CI
+    python plan_trials.py simulate --seconds-per-call 1.5 --json-output sim.json
+"""
+
+import argparse
+import heapq
+import json
+import random
+import sys
+from collections import defaultdict
+from math import comb, sqrt
+from pathlib import Path
+
+from analyze_crashes import discover_files
+from rerun_crashes import default_trajectory_dir, rerun_commands
+from traj_json import TrajectoryFile
+
+# 95% two-sided normal quantile
+Z = 1.959964
+
+
+def is_success(reward):
+    # Same tolerance tau-bench uses when computing pass^k
+    return 1 - 1e-6 <= reward <= 1 + 1e-6
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# LOADING
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def load_outcomes(dirs, model_size=None):
+    """config_label -> {"config", "file", "tasks": {task_id: [(success, cost), ...]}} (trial order)."""
+    configs = {}
+    for base in dirs:
+        for filepath, config in discover_files(Path(base), model_size):
+            label = config["config_label"]
+            # The first file found for a config is the original run (commands are built from it)
+            cfg = configs.setdefault(label, {"config": config, "file": filepath,
+                                             "tasks": defaultdict(list)})
+            with TrajectoryFile(filepath) as data:
+                rows = []
+                for entry in data:
+                    if entry.has("info", "error"):
+                        continue
+                    rows.append((entry.get("trial", 0), entry.get("task_id"),
+                                 is_success(entry.get("reward", 0.0)), entry.length("traj")))
+            for _, task_id, success, cost in sorted(rows, key=lambda r: r[0]):
+                cfg["tasks"][task_id].append((success, cost))
+    return configs
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# ESTIMATOR
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def beta_moment(a, b, m):
+    """E[p^m] for p ~ Beta(a, b)."""
+    out = 1.0
+    for i in range(m):
+        out *= (a + i) / (a + b + i)
+    return out
+
+
+def task_var(a, b, k):
+    """Posterior variance of p^k."""
+    return max(beta_moment(a, b, 2 * k) - beta_moment(a, b, k) ** 2, 0.0)
+
+
+def expected_gain(a, b, k):
+    """Expected drop in Var[p^k] from one more trial."""
+    p = a / (a + b)
+    after = p * task_var(a + 1, b, k) + (1 - p) * task_var(a, b + 1, k)
+    return task_var(a, b, k) - after
+
+
+class TaskState:
+    """Posterior pseudo-counts and cost of one task."""
+
+    __slots__ = ("key", "a", "b", "cost", "added")
+
+    def __init__(self, key, outcomes, default_cost):
+        self.key = key                      # (config_label, task_id)
+        s = sum(1 for ok, _ in outcomes if ok)
+        self.a = s + 0.5
+        self.b = len(outcomes) - s + 0.5
+        costs = [c for _, c in outcomes]
+        self.cost = (sum(costs) / len(costs) if costs else default_cost) or 1.0
+        self.added = 0
+
+    def observe(self, success):
+        """Add a trial outcome: True / False, or a float (expected outcome) when planning."""
+        self.a += float(success)
+        self.b += 1 - float(success)
+        self.added += 1
+
+
+def halfwidth(states, k):
+    return Z * sqrt(sum(task_var(s.a, s.b, k) for s in states)) / len(states) if states else 0.0
+
+
+def estimate(states, k):
+    return sum(beta_moment(s.a, s.b, k) for s in states) / len(states) if states else 0.0
+
+
+def tau_bench_passk(tasks, k):
+    """tau-bench's estimator: mean over tasks of C(successes, k) / C(trials, k)."""
+    vals = [comb(sum(ok for ok, _ in v), k) / comb(len(v), k) for v in tasks.values() if len(v) >= k]
+    return sum(vals) / len(vals) if vals else None
+
+
+def allocate(states, k, budget, target, reveal=None):
+    """Greedy allocation by expected gain per cost, one trial at a time.
+
+    reveal(state) returns the real outcome of the next trial, or None if the
+    task has no trials left (simulation). Without it the expected outcome is
+    used (planning). Stops at budget trials, or once the CI half-width of
+    each config group is <= target. Returns the number of trials allocated.
+    """
+    groups = defaultdict(list)
+    for s in states:
+        groups[s.key[0]].append(s)
+    total_var = {g: sum(task_var(s.a, s.b, k) for s in members) for g, members in groups.items()}
+
+    def done(g):
+        n = len(groups[g])
+        return target is not None and Z * sqrt(total_var[g]) / n <= target
+
+    heap = [(-expected_gain(s.a, s.b, k) / s.cost, i) for i, s in enumerate(states) if not done(s.key[0])]
+    heapq.heapify(heap)
+    used = 0
+    while heap and (budget is None or used < budget):
+        _, i = heapq.heappop(heap)
+        s = states[i]
+        g = s.key[0]
+        if done(g):
+            continue
+        if reveal is None:
+            outcome = s.a / (s.a + s.b)
+        else:
+            outcome = reveal(s)
+            if outcome is None:
+                continue  # no recorded trials left for this task
+        before = task_var(s.a, s.b, k)
+        s.observe(outcome)
+        total_var[g] += task_var(s.a, s.b, k) - before
+        used += 1
+        if not done(g):
+            heapq.heappush(heap, (-expected_gain(s.a, s.b, k) / s.cost, i))
+    return used
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# PLAN
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def make_states(tasks, label, initial=None):
+    """A TaskState per task from its recorded outcomes (the first `initial` only, if given)."""
+    all_costs = [c for v in tasks.values() for _, c in v]
+    default_cost = sum(all_costs) / len(all_costs) if all_costs else 1.0
+    return [TaskState((label, tid), outcomes[:initial] if initial else outcomes, default_cost)
+            for tid, outcomes in sorted(tasks.items())]
+
+
+def plan(configs, args):
+    """Allocate new trials across all configs. Returns one row per config."""
+    states, before = [], {}
+    for label, cfg in sorted(configs.items()):
+        cfg_states = make_states(cfg["tasks"], label)
+        before[label] = (estimate(cfg_states, args.k), halfwidth(cfg_states, args.k))
+        states.extend(cfg_states)
+    allocate(states, args.k, args.budget, args.target_ci)
+
+    rows = []
+    for label, cfg in sorted(configs.items()):
+        cfg_states = [s for s in states if s.key[0] == label]
+        picked = {s.key[1]: s.added for s in cfg_states if s.added}
+        rows.append({
+            "config_label": label,
+            "tasks": len(cfg_states),
+            "trials_so_far": sum(len(v) for v in cfg["tasks"].values()),
+            "estimate": round(before[label][0], 4),
+            "tau_bench_estimate": tau_bench_passk(cfg["tasks"], args.k),
+            "ci_halfwidth": round(before[label][1], 4),
+            "planned_ci_halfwidth": round(halfwidth(cfg_states, args.k), 4),
+            "new_trials": sum(picked.values()),
+            "est_llm_calls": round(sum(s.cost * s.added for s in cfg_states)),
+            "task_trials": [{"task_id": tid, "trials": n} for tid, n in picked.items()],
+            "commands": rerun_commands(cfg["file"], cfg["config"],
+                                       {tid: [None] * n for tid, n in picked.items()}, args),
+        })
+    return rows
+
+
+def print_plan(rows, args, output_file=None):
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    k = args.k
+    new = sum(r["new_trials"] for r in rows)
+    calls = sum(r["est_llm_calls"] for r in rows)
+    p(f"# Trial Plan (pass^{k})")
+    p()
+    p(f"**{new} new trials**, ~{calls:,} LLM calls "
+      f"(~{calls * args.seconds_per_call / 3600:.1f} GPU-hours at {args.seconds_per_call:g} s/call).")
+    p()
+    p(f"| Config | Tasks | Trials so far | pass^{k} | 95% CI ± | Planned CI ± | New trials | Tasks planned |")
+    p("|--------|-------|---------------|--------|----------|--------------|------------|---------------|")
+    for r in rows:
+        tasks = ", ".join(f"{t['task_id']}x{t['trials']}" for t in r["task_trials"][:12])
+        if len(r["task_trials"]) > 12:
+            tasks += f", ... (+{len(r['task_trials']) - 12})"
+        p(f"| {r['config_label']} | {r['tasks']} | {r['trials_so_far']} | {r['estimate']:.3f} "
+          f"| {r['ci_halfwidth']:.3f} | {r['planned_ci_halfwidth']:.3f} | {r['new_trials']} "
+          f"| {tasks or '-'} |")
+    p()
+    if new:
+        p("## Commands (run from the tau-bench checkout)")
+        p()
+        p("```bash")
+        for r in rows:
+            if r["commands"]:
+                p(f"# {r['config_label']}")
+                for cmd in r["commands"]:
+                    p(cmd["command"])
+        p("```")
+        p()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# SIMULATION
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def simulate_config(tasks, label, k, initial, fixed_trials, rng):
+    """One replay of one config. Returns the fixed vs adaptive numbers."""
+    order = {tid: rng.sample(v, len(v)) for tid, v in tasks.items()}
+
+    # The full-data estimate is the reference both designs are scored against
+    full = make_states(order, label)
+    fixed = make_states(order, label, fixed_trials)
+    target = halfwidth(fixed, k)
+
+    adaptive = make_states(order, label, initial)
+    pending = {tid: v[initial:] for tid, v in order.items()}
+    calls = sum(c for v in order.values() for _, c in v[:initial])
+    trials = sum(len(v[:initial]) for v in order.values())
+
+    def reveal(state):
+        nonlocal calls
+        left = pending[state.key[1]]
+        if not left:
+            return None
+        success, cost = left.pop(0)
+        calls += cost
+        return success
+
+    trials += allocate(adaptive, k, None, target + 1e-12, reveal)
+    return {
+        "trials_recorded": sum(len(v) for v in order.values()),
+        "trials_fixed": sum(len(v[:fixed_trials]) for v in order.values()),
+        "trials_adaptive": trials,
+        "calls_fixed": sum(c for v in order.values() for _, c in v[:fixed_trials]),
+        "calls_adaptive": calls,
+        "ci_fixed": target,
+        "ci_adaptive": halfwidth(adaptive, k),
+        "abs_error_fixed": abs(estimate(fixed, k) - estimate(full, k)),
+        "abs_error": abs(estimate(adaptive, k) - estimate(full, k)),
+    }
+
+
+def simulate(configs, args):
+    rows = []
+    for label, cfg in sorted(configs.items()):
+        runs = [simulate_config(cfg["tasks"], label, args.k, args.initial, args.fixed_trials,
+                                random.Random(args.seed + r))
+                for r in range(args.repeats)]
+        row = {"config_label": label, "tasks": len(cfg["tasks"])}
+        for key in runs[0]:
+            row[key] = sum(r[key] for r in runs) / len(runs)
+        row["max_abs_error"] = max(r["abs_error"] for r in runs)
+        rows.append(row)
+    return rows
+
+
+def print_simulation(rows, args, output_file=None):
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    k, spc = args.k, args.seconds_per_call
+    p(f"# Adaptive vs Fixed Trials — Simulation (pass^{k})")
+    p()
+    p(f"Replayed {args.repeats} random trial order(s) per config; adaptive starts from "
+      f"{args.initial} trial(s) per task and stops at the CI half-width of the fixed design "
+      f"({args.fixed_trials} trials per task). Errors are against the estimate from every "
+      f"recorded trial. GPU time assumes {spc:g} s per LLM call.")
+    p()
+    p("| Config | Tasks | Trials fixed | Trials adaptive | GPU-h fixed | GPU-h adaptive | Saved "
+      "| 95% CI ± fixed | 95% CI ± adaptive | Mean abs err fixed | Mean abs err adaptive "
+      "| Max abs err adaptive |")
+    p("|--------|-------|--------------|-----------------|-------------|----------------|-------"
+      "|----------------|-------------------|--------------------|-----------------------"
+      "|----------------------|")
+    for r in rows:
+        saved = 1 - r["calls_adaptive"] / r["calls_fixed"] if r["calls_fixed"] else 0.0
+        p(f"| {r['config_label']} | {r['tasks']} | {r['trials_fixed']:.0f} | {r['trials_adaptive']:.1f} "
+          f"| {r['calls_fixed'] * spc / 3600:.2f} | {r['calls_adaptive'] * spc / 3600:.2f} "
+          f"| {saved:.0%} | {r['ci_fixed']:.3f} | {r['ci_adaptive']:.3f} "
+          f"| {r['abs_error_fixed']:.4f} | {r['abs_error']:.4f} | {r['max_abs_error']:.4f} |")
+    fixed = sum(r["calls_fixed"] for r in rows)
+    adaptive = sum(r["calls_adaptive"] for r in rows)
+    p()
+    capped = [r["config_label"] for r in rows if r["trials_fixed"] >= r["trials_recorded"]]
+    if capped:
+        p(f"Note: {', '.join(capped)} recorded at most {args.fixed_trials} trial(s) per task, "
+          f"so the fixed design already uses all of them and adaptive cannot save anything there.")
+        p()
+    if fixed:
+        p(f"**Total:** {fixed * spc / 3600:.2f} -> {adaptive * spc / 3600:.2f} GPU-hours "
+          f"({1 - adaptive / fixed:.0%} saved) at the same CI half-width per config.")
+    p()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CLI
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan extra trials where they tighten pass^k the most.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    plan_p = sub.add_parser("plan", help="Prioritized run plan for new trials")
+    sim_p = sub.add_parser("simulate", help="Replay historical files: adaptive vs fixed trials")
+
+    for sp in (plan_p, sim_p):
+        sp.add_argument(
+            "--trajectory-dir", type=str, default=None,
+            help="Path to trajectory directory. Default: auto-detect from script location.",
+        )
+        sp.add_argument(
+            "--extra-dir", action="append", default=[],
+            help="Also read trials from this directory (e.g. results of an earlier plan; repeatable).",
+        )
+        sp.add_argument(
+            "--model-size", type=str, default=None, choices=["4b", "8b", "14b", "32b"],
+            help="Filter to a specific model size (e.g., 14b). Default: all sizes.",
+        )
+        sp.add_argument(
+            "--k", type=int, default=1,
+            help="Which pass^k to estimate. Default: 1",
+        )
+        sp.add_argument(
+            "--seconds-per-call", type=float, default=2.0,
+            help="GPU seconds per agent LLM call, for GPU-time estimates. Default: 2.0",
+        )
+        sp.add_argument(
+            "--output", type=str, default=None,
+            help="Save markdown output to a file instead of printing to stdout.",
+        )
+        sp.add_argument(
+            "--json-output", type=str, default=None,
+            help="Save structured results to a JSON file.",
+        )
+
+    plan_p.add_argument(
+        "--budget", type=int, default=None,
+        help="Max new trials over all configs. Default: no limit (needs --target-ci)",
+    )
+    plan_p.add_argument(
+        "--target-ci", type=float, default=None,
+        help="Stop planning a config once its 95%% CI half-width is at most this (e.g. 0.03).",
+    )
+    plan_p.add_argument(
+        "--model-prefix", type=str, default="Qwen/",
+        help="Prefix added to the model names parsed from file names. Default: Qwen/",
+    )
+    plan_p.add_argument(
+        "--model-provider", type=str, default="openai",
+        help="tau-bench --model-provider of the original runs. Default: openai",
+    )
+    plan_p.add_argument(
+        "--user-model-provider", type=str, default="openai",
+        help="tau-bench --user-model-provider of the original runs. Default: openai",
+    )
+    plan_p.add_argument(
+        "--log-dir", type=str, default="extra_trials",
+        help="tau-bench --log-dir root for the new trials (one subdirectory per config). "
+             "Default: extra_trials",
+    )
+
+    sim_p.add_argument(
+        "--initial", type=int, default=1,
+        help="Trials per task the adaptive design starts with. Default: 1",
+    )
+    sim_p.add_argument(
+        "--fixed-trials", type=int, default=3,
+        help="Trials per task of the fixed design to compare against; must be below the "
+             "recorded trials per task. Default: 3",
+    )
+    sim_p.add_argument(
+        "--repeats", type=int, default=20,
+        help="Random trial orders to average over. Default: 20",
+    )
+    sim_p.add_argument(
+        "--seed", type=int, default=0,
+        help="Random seed of the first trial order. Default: 0",
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "plan" and args.budget is None and args.target_ci is None:
+        parser.error("plan needs --budget and/or --target-ci")
+    if args.k < 1 or getattr(args, "initial", 1) < 1:
+        parser.error("--k and --initial must be at least 1")
+    if args.command == "simulate" and args.fixed_trials < args.initial:
+        parser.error("--fixed-trials must be at least --initial")
+
+    traj_dir = Path(args.trajectory_dir) if args.trajectory_dir else default_trajectory_dir()
+    if not traj_dir.exists():
+        print(f"ERROR: Trajectory directory not found: {traj_dir}")
+        sys.exit(1)
+    configs = load_outcomes([traj_dir] + args.extra_dir, args.model_size)
+    if not configs:
+        print("No trajectory files found. Check --trajectory-dir path.")
+        sys.exit(1)
+    print(f"Loaded {len(configs)} config(s) from {traj_dir}", file=sys.stderr)
+
+    if args.command == "plan":
+        rows, printer = plan(configs, args), print_plan
+    else:
+        rows, printer = simulate(configs, args), print_simulation
+
+    if args.output:
+        with open(args.output, "w") as f:
+            printer(rows, args, output_file=f)
+        print(f"Saved markdown to {args.output}")
+    else:
+        printer(rows, args)
+
+    if args.json_output:
+        with open(args.json_output, "w") as f:
+            json.dump({"k": args.k, "command": args.command, "configs": rows}, f, indent=2)
+        print(f"Saved JSON to {args.json_output}")
+
+
+if __name__ == "__main__":
+    main()
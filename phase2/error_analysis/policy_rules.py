@@ -0,0 +1,743 @@
+#!/usr/bin/env python3
+"""
+policy_rules.py — Compiled policy-rule engine for pre-execution action validation.
+
+Policy violations are the top error category (28.5% of classified
+failures). The proposed LLM "Policy Validator" would add a full LLM call to
+every action. This engine checks a proposed tool call against the
+airline/retail policy deterministically, in microseconds, using only what
+the conversation has already shown: tool outputs and user turns.
+
+How it works:
+─────────────
+1. RULES: Each policy rule is a small Python check registered with
+   @rule(domain, rule_id, tools, text). It gets the conversation state and
+   the call's arguments and returns a message when the call breaks the rule.
+
+2. COMPILE: PolicyEngine(domain) turns the rule list into a dispatch table
+   {tool name: (checks...)}. Validating a call is one dict lookup plus the
+   handful of checks for that tool; read-only tools have none.
+
+3. STATE: ConversationState is updated incrementally:
+   - observe_user(text) records the user's turns (<think> blocks removed);
+   - observe_result(name, args, output) records the parsed tool outputs:
+     authenticated user, user profiles and payment methods, orders and
+     their status, products and variants, reservations, searched flights.
+   Write outputs update the state too, so an order's status changes after
+   a modify/exchange, and once-only actions are caught.
+
+4. RULES COVERED:
+   - retail: authentication before writes, one user per conversation,
+     status checks (pending / delivered), items belong to the order,
+     same-product variants that are available, payment-method ownership,
+     refunds to the original method or a gift card, gift-card balance.
+   - airline: user and reservation looked up first, basic economy flight
+     changes, cancellation eligibility (24h / business / insurance /
+     airline-cancelled, nothing flown), no bag removal, payment-method
+     limits and ownership, passenger count, certificate eligibility and
+     amount, only available flights booked.
+   - both: explicit user confirmation ("yes") before every write. One
+     confirmation covers one write.
+
+5. OFFLINE MODE: Replays every stored trajectory. The calls come from
+   extract_agent_actions() and are validated before their output is
+   observed. The report shows the calls it would have blocked, per rule and
+   per config, split by failed / successful runs. It also shows how many
+   failures classify_errors.py labelled policy_violation it would have
+   caught, and the mean time per check.
+
+Using it in an agent loop:
+    engine = PolicyEngine("retail")
+    state = engine.new_state(system_prompt)
+    state.observe_user(user_message)
+    violations = engine.validate(state, name, arguments)   # [] = allowed
+    if not violations:
+        output = env.step(name, arguments)
+        state.observe_result(name, arguments, output)
+
+Offline mode (no LLM calls):
+    python policy_rules.py                           # all stored trajectories
+    python policy_rules.py --model-size 14b --rules  # + the rule list
+    python policy_rules.py --json-output policy_blocks.json
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from analyze_crashes import discover_files
+from classify_errors import extract_agent_actions
+from similar_failures import config_name, load_labels
+from traj_json import load
+
+THINK_RE = re.compile(r"<think>.*?</think>\s*", re.DOTALL)
+# A confirmation opens the user's turn ("Yes, please proceed.") ...
+AFFIRMATIVE_RE = re.compile(
+    r"^\W*(yes|yeah|yep|yup|i confirm|confirm(ed)?|go ahead|proceed|please (do|proceed|go ahead)"
+    r"|do it|that's right|that is right|that's correct|that is correct)\b",
+    re.IGNORECASE)
+# ... or is the whole reply ("Sure.", "Correct!")
+STANDALONE_AFFIRMATIVE_RE = re.compile(r"^\W*(sure|correct|ok(ay)?)\W*$", re.IGNORECASE)
+NEGATION_RE = re.compile(r"\b(no|not|don't|do not|wait|actually)\b", re.IGNORECASE)
+AIRLINE_CANCELLED_RE = re.compile(
+    r"airline (has )?cancel|flight (was|got|has been|is) cancel|cancelled by the airline", re.IGNORECASE)
+QUESTION_RE = re.compile(r"[^.!?\n]*\?")
+CURRENT_TIME_RE = re.compile(r"current time is (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})")
+DEFAULT_NOW = datetime(2024, 5, 15, 15, 0, 0)
+
+WRITE_TOOLS = {
+    "retail": {"cancel_pending_order", "modify_pending_order_address", "modify_pending_order_items",
+               "modify_pending_order_payment", "modify_user_address", "return_delivered_order_items",
+               "exchange_delivered_order_items"},
+    "airline": {"book_reservation", "cancel_reservation", "update_reservation_baggages",
+                "update_reservation_flights", "update_reservation_passengers", "send_certificate"},
+}
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CONVERSATION STATE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def is_confirmation(text):
+    """True if a user turn explicitly confirms the proposed action.
+
+    Questions are ignored, and any negation voids the turn.
+
+    >>> is_confirmation("Yes, please proceed with the cancellation.")
+    True
+    >>> is_confirmation("Sure.")
+    True
+    >>> is_confirmation("Could you confirm the new address first?")
+    False
+    >>> is_confirmation("No, that is not correct.")
+    False
+    >>> is_confirmation("I am not sure that is correct. No, do not proceed.")
+    False
+    >>> is_confirmation("I want to make sure I have the correct details first.")
+    False
+    """
+    text = QUESTION_RE.sub("", THINK_RE.sub("", text or "")).strip()
+    if NEGATION_RE.search(text):
+        return False
+    return bool(AFFIRMATIVE_RE.search(text) or STANDALONE_AFFIRMATIVE_RE.search(text))
+
+
+def parse_output(output):
+    """Tool output -> parsed JSON (or the raw string). None for errors."""
+    if output is None:
+        return None
+    text = output[len("API output:"):].strip() if output.startswith("API output:") else output.strip()
+    if text.startswith("Error") or text.startswith("Unknown action"):
+        return None
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        return text
+
+
+class ConversationState:
+    """What the agent has learned so far in one conversation."""
+
+    __slots__ = ("domain", "now", "user_id", "users", "orders", "products", "reservations",
+                 "flights", "confirmed", "user_turns")
+
+    def __init__(self, domain, now=DEFAULT_NOW):
+        self.domain = domain
+        self.now = now
+        self.user_id = None          # authenticated user
+        self.users = {}              # user_id -> profile
+        self.orders = {}             # order_id -> order
+        self.products = {}           # product_id -> product
+        self.reservations = {}       # reservation_id -> reservation
+        self.flights = {}            # (flight_number, date) -> searched flight
+        self.confirmed = False       # an explicit "yes" not yet used by a write
+        self.user_turns = []
+
+    def observe_user(self, text):
+        text = THINK_RE.sub("", text or "")
+        self.user_turns.append(text)
+        if is_confirmation(text):
+            self.confirmed = True
+
+    def mentions(self, pattern):
+        return any(pattern.search(t) for t in self.user_turns)
+
+    def observe_result(self, name, args, output):
+        data = parse_output(output)
+        if name in WRITE_TOOLS[self.domain]:
+            # The confirmation was used, whether or not the write succeeded
+            self.confirmed = False
+        if data is None:
+            return
+        if name in ("find_user_id_by_email", "find_user_id_by_name_zip") and isinstance(data, str):
+            self.user_id = self.user_id or data
+        elif name == "get_user_details" and isinstance(data, dict):
+            uid = args.get("user_id")
+            self.users[uid] = data
+            if self.domain == "airline":
+                self.user_id = self.user_id or uid
+        elif name == "get_product_details" and isinstance(data, dict):
+            self.products[data.get("product_id", args.get("product_id"))] = data
+        elif name == "search_direct_flight" and isinstance(data, list):
+            for f in data:
+                if isinstance(f, dict):
+                    self.flights[(f.get("flight_number"), args.get("date"))] = f
+        elif name == "search_onestop_flight" and isinstance(data, list):
+            for pair in data:
+                for f in pair if isinstance(pair, list) else ():
+                    if isinstance(f, dict):
+                        self.flights[(f.get("flight_number"), f.get("date"))] = f
+        if isinstance(data, dict):
+            if "order_id" in data and "status" in data:
+                self.orders[data["order_id"]] = data
+            if "reservation_id" in data and "flights" in data:
+                self.reservations[data["reservation_id"]] = data
+
+    # ── lookups used by the rules ────────────────────────────────────────────
+
+    def payment_methods(self, user_id=None):
+        user = self.users.get(user_id or self.user_id)
+        return user.get("payment_methods", {}) if user else None
+
+    def item_product(self, order, item_id):
+        for item in order.get("items", []):
+            if item.get("item_id") == item_id:
+                return item
+        return None
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# RULES
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class Rule:
+    __slots__ = ("id", "domain", "tools", "text", "check")
+
+    def __init__(self, id, domain, tools, text, check):
+        self.id = id
+        self.domain = domain
+        self.tools = tools
+        self.text = text
+        self.check = check
+
+
+RULES = []
+
+
+def rule(domain, rule_id, tools, text):
+    """Register check(state, args) -> message or None for `tools` of `domain`."""
+    def register(check):
+        RULES.append(Rule(rule_id, domain, tuple(tools), text, check))
+        return check
+    return register
+
+
+# ── both domains ─────────────────────────────────────────────────────────────
+
+def _register_confirm():
+    def confirm(state, args):
+        if not state.confirmed:
+            return "no explicit user confirmation since the last write"
+
+    for domain, tools in WRITE_TOOLS.items():
+        rule(domain, "confirm-before-write", tools,
+             "List the action details and obtain explicit user confirmation (yes) before a write.")(confirm)
+
+
+_register_confirm()
+
+
+# ── retail ───────────────────────────────────────────────────────────────────
+
+@rule("retail", "authenticate-first", WRITE_TOOLS["retail"],
+      "Authenticate the user via email or name + zip before acting on their account.")
+def _retail_auth(state, args):
+    if state.user_id is None:
+        return "user not authenticated (find_user_id_by_email / find_user_id_by_name_zip)"
+
+
+@rule("retail", "one-user", WRITE_TOOLS["retail"],
+      "Only help the authenticated user; deny requests about other users' orders or profiles.")
+def _retail_one_user(state, args):
+    if state.user_id is None:
+        return None
+    owner = args.get("user_id") or (state.orders.get(args.get("order_id")) or {}).get("user_id")
+    if owner and owner != state.user_id:
+        return f"acts on {owner}, but the authenticated user is {state.user_id}"
+
+
+@rule("retail", "order-pending", ("cancel_pending_order", "modify_pending_order_address",
+                                  "modify_pending_order_items", "modify_pending_order_payment"),
+      "Cancel / modify only 'pending' orders, and check the status first.")
+def _retail_pending(state, args):
+    order = state.orders.get(args.get("order_id"))
+    if order is None:
+        return f"status of {args.get('order_id')} not checked (get_order_details first)"
+    if order.get("status") != "pending":
+        return f"order {args.get('order_id')} is '{order.get('status')}', not 'pending'"
+
+
+@rule("retail", "order-delivered", ("return_delivered_order_items", "exchange_delivered_order_items"),
+      "Return / exchange only 'delivered' orders, and check the status first.")
+def _retail_delivered(state, args):
+    order = state.orders.get(args.get("order_id"))
+    if order is None:
+        return f"status of {args.get('order_id')} not checked (get_order_details first)"
+    if order.get("status") != "delivered":
+        return f"order {args.get('order_id')} is '{order.get('status')}', not 'delivered'"
+
+
+@rule("retail", "items-in-order", ("modify_pending_order_items", "return_delivered_order_items",
+                                   "exchange_delivered_order_items"),
+      "Items to modify / return / exchange must be in the order.")
+def _retail_items_in_order(state, args):
+    order = state.orders.get(args.get("order_id"))
+    if order is None:
+        return None
+    ids = {i.get("item_id") for i in order.get("items", [])}
+    missing = [i for i in args.get("item_ids") or [] if i not in ids]
+    if missing:
+        return f"items {missing} are not in order {args.get('order_id')}"
+
+
+@rule("retail", "same-product-variant", ("modify_pending_order_items", "exchange_delivered_order_items"),
+      "Each item can only change to an available variant of the same product with different options.")
+def _retail_same_product(state, args):
+    order = state.orders.get(args.get("order_id"))
+    old, new = args.get("item_ids") or [], args.get("new_item_ids") or []
+    if len(old) != len(new):
+        return f"{len(old)} items but {len(new)} new items"
+    if order is None:
+        return None
+    for old_id, new_id in zip(old, new):
+        item = state.item_product(order, old_id)
+        if item is None:
+            continue
+        if new_id == old_id:
+            return f"new item {new_id} is the same as the old one"
+        product = state.products.get(item.get("product_id"))
+        if product is None:
+            return f"product {item.get('product_id')} not looked up (get_product_details first)"
+        variant = product.get("variants", {}).get(new_id)
+        if variant is None:
+            return f"{new_id} is not a variant of {item.get('name', item.get('product_id'))}"
+        if not variant.get("available", True):
+            return f"variant {new_id} is not available"
+
+
+@rule("retail", "payment-method-owned", ("modify_pending_order_items", "modify_pending_order_payment",
+                                         "return_delivered_order_items", "exchange_delivered_order_items"),
+      "The payment method must be one of the user's own.")
+def _retail_payment_owned(state, args):
+    methods = state.payment_methods()
+    pid = args.get("payment_method_id")
+    if methods is not None and pid not in methods:
+        return f"{pid} is not one of the user's payment methods"
+
+
+@rule("retail", "refund-destination", ("return_delivered_order_items",),
+      "Refunds go to the original payment method or an existing gift card.")
+def _retail_refund_destination(state, args):
+    order = state.orders.get(args.get("order_id"))
+    pid = args.get("payment_method_id")
+    if order is None or not pid:
+        return None
+    original = {p.get("payment_method_id") for p in order.get("payment_history", [])
+                if p.get("transaction_type") == "payment"}
+    if pid in original or pid.startswith("gift_card"):
+        return None
+    return f"refund to {pid}, not the original payment method or a gift card"
+
+
+@rule("retail", "payment-change", ("modify_pending_order_payment",),
+      "The new payment method must differ from the original; a gift card must cover the total.")
+def _retail_payment_change(state, args):
+    order = state.orders.get(args.get("order_id"))
+    pid = args.get("payment_method_id")
+    if order is None:
+        return None
+    history = order.get("payment_history", [])
+    if history and history[0].get("payment_method_id") == pid:
+        return f"{pid} is already the order's payment method"
+    method = (state.payment_methods() or {}).get(pid) or {}
+    total = sum(i.get("price", 0) for i in order.get("items", []))
+    if method.get("source") == "gift_card" and method.get("balance", total) < total:
+        return f"gift card balance {method.get('balance')} < order total {total:.2f}"
+
+
+@rule("retail", "gift-card-balance", ("modify_pending_order_items", "exchange_delivered_order_items"),
+      "A gift card paying the price difference must have enough balance.")
+def _retail_gift_balance(state, args):
+    order = state.orders.get(args.get("order_id"))
+    method = (state.payment_methods() or {}).get(args.get("payment_method_id")) or {}
+    if order is None or method.get("source") != "gift_card":
+        return None
+    diff = 0.0
+    for old_id, new_id in zip(args.get("item_ids") or [], args.get("new_item_ids") or []):
+        item = state.item_product(order, old_id)
+        variant = (state.products.get((item or {}).get("product_id")) or {}).get("variants", {}).get(new_id)
+        if item is None or variant is None:
+            return None
+        diff += variant.get("price", 0) - item.get("price", 0)
+    if diff > method.get("balance", diff):
+        return f"gift card balance {method.get('balance')} < price difference {diff:.2f}"
+
+
+# ── airline ──────────────────────────────────────────────────────────────────
+
+@rule("airline", "user-first", WRITE_TOOLS["airline"],
+      "Obtain the user id (and look up the profile) before any write.")
+def _airline_user(state, args):
+    uid = args.get("user_id") or state.user_id
+    if uid is None or uid not in state.users:
+        return "user profile not looked up (get_user_details first)"
+
+
+@rule("airline", "reservation-first", ("cancel_reservation", "update_reservation_baggages",
+                                       "update_reservation_flights", "update_reservation_passengers"),
+      "Obtain the reservation id and check the reservation before changing it.")
+def _airline_reservation(state, args):
+    res = state.reservations.get(args.get("reservation_id"))
+    if res is None:
+        return f"reservation {args.get('reservation_id')} not checked (get_reservation_details first)"
+    if state.user_id and res.get("user_id") not in (None, state.user_id):
+        return f"reservation belongs to {res.get('user_id')}, not {state.user_id}"
+
+
+@rule("airline", "basic-economy-no-flight-change", ("update_reservation_flights",),
+      "Basic economy flights cannot be modified (cabin changes are allowed).")
+def _airline_basic_economy(state, args):
+    res = state.reservations.get(args.get("reservation_id"))
+    if res is None or res.get("cabin") != "basic_economy":
+        return None
+    current = {(f.get("flight_number"), f.get("date")) for f in res.get("flights", [])}
+    new = {(f.get("flight_number"), f.get("date")) for f in args.get("flights") or []}
+    if new != current:
+        return "changes the flights of a basic economy reservation"
+
+
+@rule("airline", "cancel-eligibility", ("cancel_reservation",),
+      "Cancel only within 24h of booking, if the airline cancelled, for business, or with insurance; "
+      "never a partly flown trip.")
+def _airline_cancel(state, args):
+    res = state.reservations.get(args.get("reservation_id"))
+    if res is None:
+        return None
+    flown = [f.get("date") for f in res.get("flights", []) if f.get("date", "9999") < state.now.date().isoformat()]
+    if flown:
+        return f"segments already flown ({', '.join(flown)}); transfer instead"
+    try:
+        created = datetime.fromisoformat(res.get("created_at", ""))
+    except ValueError:
+        created = None
+    if created is not None and state.now - created <= timedelta(hours=24):
+        return None
+    if res.get("cabin") == "business" or res.get("insurance") == "yes":
+        return None
+    if state.mentions(AIRLINE_CANCELLED_RE):
+        return None
+    return (f"{res.get('cabin')} reservation without insurance, booked more than 24h ago, "
+            f"and no airline cancellation")
+
+
+@rule("airline", "no-bag-removal", ("update_reservation_baggages",),
+      "Checked bags can be added but not removed.")
+def _airline_bags(state, args):
+    res = state.reservations.get(args.get("reservation_id"))
+    if res is None:
+        return None
+    if (args.get("total_baggages") or 0) < (res.get("total_baggages") or 0):
+        return f"total bags {args.get('total_baggages')} < current {res.get('total_baggages')}"
+
+
+@rule("airline", "passenger-count", ("book_reservation", "update_reservation_passengers"),
+      "At most five passengers; the number of passengers cannot change.")
+def _airline_passengers(state, args):
+    passengers = args.get("passengers") or []
+    if len(passengers) > 5:
+        return f"{len(passengers)} passengers (max 5)"
+    res = state.reservations.get(args.get("reservation_id"))
+    if res is not None and len(passengers) != len(res.get("passengers", [])):
+        return f"changes the passenger count {len(res.get('passengers', []))} -> {len(passengers)}"
+
+
+@rule("airline", "payment-methods", ("book_reservation", "update_reservation_flights",
+                                     "update_reservation_baggages"),
+      "Payment methods must be in the profile: at most 1 certificate, 1 credit card and 3 gift cards; "
+      "flight changes are paid by gift card or credit card.")
+def _airline_payment(state, args):
+    methods = state.payment_methods(args.get("user_id"))
+    if "payment_methods" in args:
+        ids = [p.get("payment_id") for p in args.get("payment_methods") or []]
+    else:
+        ids = [args.get("payment_id")] if args.get("payment_id") else []
+    if methods is not None:
+        unknown = [i for i in ids if i not in methods]
+        if unknown:
+            return f"{unknown} not in the user's profile"
+    kinds = Counter(((methods or {}).get(i) or {}).get("source") or i.rsplit("_", 1)[0] for i in ids)
+    for kind, limit in (("certificate", 1), ("credit_card", 1), ("gift_card", 3)):
+        if kinds[kind] > limit:
+            return f"{kinds[kind]} {kind} payments (max {limit})"
+    if "payment_id" in args and kinds["certificate"]:
+        return "flight changes must be paid by gift card or credit card"
+
+
+@rule("airline", "book-available-flights", ("book_reservation",),
+      "Only flights with status 'available' can be booked.")
+def _airline_available(state, args):
+    for f in args.get("flights") or []:
+        searched = state.flights.get((f.get("flight_number"), f.get("date")))
+        if searched is None:
+            return f"{f.get('flight_number')} on {f.get('date')} not found in any search"
+        if searched.get("status") not in (None, "available"):
+            return f"{f.get('flight_number')} on {f.get('date')} is '{searched.get('status')}'"
+
+
+@rule("airline", "certificate-eligibility", ("send_certificate",),
+      "Compensate only silver/gold members, insured or business reservations, after checking the "
+      "reservation: $100 (cancelled) or $50 (delayed) x passengers.")
+def _airline_certificate(state, args):
+    uid = args.get("user_id") or state.user_id
+    checked = [r for r in state.reservations.values() if r.get("user_id") in (None, uid)]
+    if not checked:
+        return "no reservation checked before compensating"
+    user = state.users.get(uid) or {}
+    eligible = user.get("membership") in ("silver", "gold") or any(
+        r.get("insurance") == "yes" or r.get("cabin") == "business" for r in checked)
+    if not eligible:
+        return "regular member without insurance in (basic) economy"
+    amounts = {per * len(r.get("passengers", [])) for r in checked for per in (50, 100)}
+    if args.get("amount") not in amounts:
+        return f"amount {args.get('amount')} is not $50/$100 x passengers ({sorted(amounts)})"
+
+
+class PolicyEngine:
+    """The rules of one domain compiled into a {tool: checks} dispatch table."""
+
+    def __init__(self, domain, rules=None):
+        self.domain = domain
+        self.rules = [r for r in (RULES if rules is None else rules) if r.domain == domain]
+        table = defaultdict(list)
+        for r in self.rules:
+            for tool in r.tools:
+                table[tool].append((r.id, r.check))
+        self.table = {tool: tuple(checks) for tool, checks in table.items()}
+
+    def new_state(self, system_prompt=None):
+        match = CURRENT_TIME_RE.search(system_prompt or "")
+        return ConversationState(self.domain, datetime.fromisoformat(match.group(1)) if match else DEFAULT_NOW)
+
+    def validate(self, state, name, args):
+        """[(rule_id, message)] for every rule the call breaks; [] if it may run."""
+        checks = self.table.get(name)
+        if not checks:
+            return []
+        args = args if isinstance(args, dict) else {}
+        violations = []
+        for rule_id, check in checks:
+            message = check(state, args)
+            if message:
+                violations.append((rule_id, message))
+        return violations
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# OFFLINE MODE
+# Replays each trajectory: user turns and tool outputs update the state, and
+# every agent call is validated before its output is observed.
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def replay(engine, traj):
+    """([(turn, tool, args, violations)], checks run, seconds spent validating)."""
+    state = engine.new_state(traj[0].get("content") if traj and traj[0].get("role") == "system" else None)
+    results, pending, checks, spent = [], [], 0, 0.0
+    for i, msg in enumerate(traj):
+        role = msg.get("role")
+        content = msg.get("content") or ""
+        if role == "assistant":
+            for action in extract_agent_actions([msg]):
+                name, args = action.get("name"), action.get("arguments")
+                start = time.perf_counter()
+                violations = engine.validate(state, name, args)
+                spent += time.perf_counter() - start
+                checks += 1
+                results.append((i, name, args, violations))
+                pending.append((name, args if isinstance(args, dict) else {}))
+        elif role == "tool" or (role == "user" and content.startswith("API output:")):
+            if pending:
+                name, args = pending.pop(0)
+                state.observe_result(name, args, content)
+        elif role == "user":
+            pending.clear()
+            state.observe_user(content)
+    return results, checks, spent
+
+
+def evaluate_file(filepath, config, labels):
+    engine = PolicyEngine(config["domain"])
+    data = load(filepath)
+    entries, checks, spent = [], 0, 0.0
+    for entry in data:
+        traj = entry.get("traj", [])
+        if "error" in entry.get("info", {}) or not traj or config["domain"] not in WRITE_TOOLS:
+            continue
+        results, n, s = replay(engine, traj)
+        checks += n
+        spent += s
+        entries.append({
+            "task_id": entry.get("task_id"),
+            "trial": entry.get("trial"),
+            "reward": entry.get("reward", 0.0),
+            "label": labels.get((config_name(config), entry.get("task_id"))),
+            "actions": len(results),
+            "writes": sum(1 for _, name, _, _ in results if name in WRITE_TOOLS[config["domain"]]),
+            "blocked": [{"turn": t, "tool": name, "arguments": args,
+                         "violations": [{"rule": r, "message": m} for r, m in v]}
+                        for t, name, args, v in results if v],
+        })
+    return {"config": config, "entries": entries, "checks": checks, "seconds": spent}
+
+
+def print_summary(all_results, output_file=None, show_rules=False):
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    p("# Policy Rule Engine — Offline Validation")
+    p()
+    p("Every agent tool call in the stored trajectories is checked before its output is observed. "
+      "A blocked call breaks at least one rule. Blocks in successful runs are rule breaks "
+      "that happened not to cost the reward (or false positives).")
+    p()
+    p("| Config | Entries | Calls | Writes | Blocked | Failures With a Block | Successes With a Block | Mean Check (us) |")
+    p("|--------|---------|-------|--------|---------|-----------------------|------------------------|-----------------|")
+    by_rule = defaultdict(Counter)
+    examples = {}
+    tot = Counter()
+    for r in all_results:
+        es = r["entries"]
+        fails = [e for e in es if e["reward"] != 1.0]
+        succ = [e for e in es if e["reward"] == 1.0]
+        blocked = sum(len(e["blocked"]) for e in es)
+        us = r["seconds"] / r["checks"] * 1e6 if r["checks"] else 0.0
+        p(f"| {r['config']['config_label']} | {len(es)} | {sum(e['actions'] for e in es)} | "
+          f"{sum(e['writes'] for e in es)} | {blocked} | {sum(1 for e in fails if e['blocked'])}/{len(fails)} | "
+          f"{sum(1 for e in succ if e['blocked'])}/{len(succ)} | {us:.1f} |")
+        tot.update(checks=r["checks"], seconds=r["seconds"])
+        for e in es:
+            for b in e["blocked"]:
+                for v in b["violations"]:
+                    by_rule[v["rule"]]["success" if e["reward"] == 1.0 else "failure"] += 1
+                    examples.setdefault(v["rule"], (r["config"]["config_label"], e, b, v))
+    p()
+    if tot["checks"]:
+        p(f"{tot['checks']:,} checks, {tot['seconds'] * 1e6 / tot['checks']:.1f} us per check on average.")
+        p()
+
+    p("## Blocks by Rule")
+    p()
+    p("| Rule | In Failures | In Successes | Example |")
+    p("|------|-------------|--------------|---------|")
+    for rule_id, counts in sorted(by_rule.items(), key=lambda kv: -sum(kv[1].values())):
+        label, e, b, v = examples[rule_id]
+        p(f"| {rule_id} | {counts['failure']} | {counts['success']} | {label} task {e['task_id']} "
+          f"turn {b['turn']}: {b['tool']} — {v['message']} |")
+    p()
+
+    labelled = [e for r in all_results for e in r["entries"] if e["label"] == "policy_violation"]
+    if labelled:
+        caught = sum(1 for e in labelled if e["blocked"])
+        p("## Failures Labelled policy_violation (classify_errors.py)")
+        p()
+        p(f"{caught} of {len(labelled)} would have had at least one call blocked.")
+        p()
+
+    if show_rules:
+        p("## Rules")
+        p()
+        p("| Domain | Rule | Tools | Policy |")
+        p("|--------|------|-------|--------|")
+        for r in RULES:
+            p(f"| {r.domain} | {r.id} | {', '.join(sorted(r.tools))} | {r.text} |")
+        p()
+
+
+def main():
+    script_dir = Path(__file__).resolve().parent
+    parser = argparse.ArgumentParser(
+        description="Validate stored tau-bench tool calls against the airline/retail policies."
+    )
+    parser.add_argument(
+        "--trajectory-dir", type=str, default=None,
+        help="Path to trajectory directory. Default: auto-detect from script location.",
+    )
+    parser.add_argument(
+        "--model-size", type=str, default=None, choices=["4b", "8b", "14b", "32b"],
+        help="Filter to a specific model size (e.g., 14b). Default: all sizes.",
+    )
+    parser.add_argument(
+        "--results-dir", type=str, default=str(script_dir / "results"),
+        help="classify_errors.py results, to cross-check policy_violation labels (default: results/)",
+    )
+    parser.add_argument(
+        "--rules", action="store_true",
+        help="Append the list of rules to the report.",
+    )
+    parser.add_argument(
+        "--output", type=str, default=None,
+        help="Save markdown output to a file instead of printing to stdout.",
+    )
+    parser.add_argument(
+        "--json-output", type=str, default=None,
+        help="Save every blocked call to a JSON file.",
+    )
+    args = parser.parse_args()
+
+    if args.trajectory_dir:
+        traj_dir = Path(args.trajectory_dir)
+    else:
+        traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories"
+        if not traj_dir.exists():
+            traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories "
+    if not traj_dir.exists():
+        print(f"ERROR: Trajectory directory not found: {traj_dir}")
+        sys.exit(1)
+
+    files = discover_files(traj_dir, args.model_size)
+    print(f"Found {len(files)} trajectory file(s)")
+    if not files:
+        sys.exit(1)
+
+    labels = load_labels(args.results_dir)
+    all_results = []
+    for filepath, config in files:
+        print(f"  Validating {config['config_label']}: {filepath.name}")
+        all_results.append(evaluate_file(filepath, config, labels))
+    print()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            print_summary(all_results, output_file=f, show_rules=args.rules)
+        print(f"Saved markdown to {args.output}")
+    else:
+        print_summary(all_results, show_rules=args.rules)
+
+    if args.json_output:
+        output = [{
+            "config": r["config"]["config_label"],
+            "entries": [e for e in r["entries"] if e["blocked"]],
+        } for r in all_results]
+        with open(args.json_output, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"Saved JSON to {args.json_output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,726 @@
+#!/usr/bin/env python3
+"""
+prefix_proxy.py — Prefix-aware request scheduler between tau-bench and vLLM.
+
+Every agent turn resends the same ~19 KB system prompt (tool schemas +
+policy, `traj[0]`) plus the conversation so far, and the Qwen3-32B user
+simulator does the same with its own prompt. vLLM's automatic prefix
+caching only helps while those prefixes are still in its KV cache. With
+many concurrent conversations of different configs arriving in arbitrary
+order, the cache keeps getting evicted. This proxy sits in front of vLLM
+and decides which waiting request goes next.
+
+How it works:
+─────────────
+1. PREFIX CHAIN: Each chat request is hashed message by message (model,
+   tools, then every message), giving one digest per prefix length. Two
+   requests share a cached prefix as far as their chains agree.
+
+2. CACHE MODEL: Per model, an LRU of chain digests sized in tokens
+   (~4 chars per token; --cache-tokens, ideally vLLM's "# GPU blocks" x
+   block size) mirrors what vLLM's prefix cache holds. A request's
+   estimated hit is the token length of its leading chain entries still in
+   the LRU.
+
+3. SCHEDULING: At most --max-inflight requests per model are forwarded at
+   once (MODEL=N overrides one model). When a slot frees up, the waiting
+   request with the largest estimated hit goes first. Conversations with
+   the same system prompt, and the next turn of a conversation just
+   served, are run back to back while their prefix is hot. A request
+   waiting longer than --max-wait-ms goes next regardless, so nothing
+   starves.
+
+4. STATS: GET /stats reports per model: requests, queue wait, prompt /
+   completion tokens, tokens/s, the estimated prefix hit rate, and the hit
+   rate vLLM reports in usage.prompt_tokens_details.cached_tokens (needs
+   vLLM's --enable-prompt-tokens-details).
+
+5. STUB (`stub`): An OpenAI-compatible server that simulates a
+   prefix-caching engine. It has an LRU prefix cache, --max-num-seqs
+   concurrent sequences, and latency = uncached prompt tokens x prefill
+   cost + completion tokens x decode cost. It reports cached_tokens like
+   vLLM does.
+
+6. BENCH (`bench`): Replays the trajectory files as concurrent agent and
+   user-simulator conversations against a fresh stub. It runs once
+   directly and once through the proxy, and compares wall time, tokens/s,
+   cache hit rate and latency.
+
+Usage:
+    python prefix_proxy.py serve --upstream http://localhost:8000 \\
+        --upstream Qwen/Qwen3-32B=http://localhost:8001 --max-inflight 32 --cache-tokens 200000
+    # then point tau-bench's OpenAI-compatible base URL at http://127.0.0.1:8100/v1
+    curl -s http://127.0.0.1:8100/stats
+    python prefix_proxy.py stub --port 8000                   # stand-in vLLM for testing
+    python prefix_proxy.py bench --concurrency 16 --cache-tokens 40000
+"""
+
+import argparse
+import hashlib
+import http.client
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+DEFAULT_PORT = 8100
+CHARS_PER_TOKEN = 4
+
+
+def approx_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def message_text(msg):
+    """The text of a chat message that ends up in the prompt (content + tool calls)."""
+    content = msg.get("content")
+    if isinstance(content, list):
+        content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    text = f"{msg.get('role', '')}\n{content or ''}"
+    if msg.get("tool_calls"):
+        text += json.dumps(msg["tool_calls"], sort_keys=True)
+    if msg.get("tool_call_id"):
+        text += msg["tool_call_id"]
+    return text
+
+
+def prefix_chain(body):
+    """[(digest, tokens)] per prefix length: model + tools first, then one per message."""
+    h = hashlib.blake2b(digest_size=16)
+    head = str(body.get("model", "")) + json.dumps(body.get("tools") or [], sort_keys=True)
+    h.update(head.encode())
+    chain = [(h.digest(), approx_tokens(json.dumps(body.get("tools") or [])))]
+    for msg in body.get("messages") or []:
+        text = message_text(msg)
+        h.update(b"\0" + text.encode())
+        chain.append((h.copy().digest(), approx_tokens(text)))
+    return chain
+
+
+class PrefixCache:
+    """LRU of prefix-chain digests, sized in tokens (a model of vLLM's prefix cache)."""
+
+    def __init__(self, capacity_tokens):
+        self.capacity = capacity_tokens
+        self.entries = OrderedDict()   # digest -> tokens
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def peek(self, chain):
+        """Tokens of the leading chain entries currently cached (no LRU update)."""
+        hit = 0
+        for digest, tokens in chain:
+            if digest not in self.entries:
+                break
+            hit += tokens
+        return hit
+
+    def access(self, chain):
+        """Look up a request's chain, then insert/touch all of it. Returns the hit tokens."""
+        with self.lock:
+            hit = self.peek(chain)
+            for digest, tokens in chain:
+                if digest in self.entries:
+                    self.entries.move_to_end(digest)
+                else:
+                    self.entries[digest] = tokens
+                    self.size += tokens
+            while self.size > self.capacity and self.entries:
+                _, tokens = self.entries.popitem(last=False)
+                self.size -= tokens
+            return hit
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# SCHEDULER
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class Waiter:
+    __slots__ = ("arrival", "chain", "event")
+
+    def __init__(self, chain):
+        self.arrival = time.monotonic()
+        self.chain = chain
+        self.event = threading.Event()
+
+
+class ModelScheduler:
+    """Caps in-flight requests for one model; dispatches the hottest-prefix waiter first."""
+
+    def __init__(self, max_inflight, max_wait, cache):
+        self.max_inflight = max_inflight
+        self.max_wait = max_wait
+        self.cache = cache
+        self.inflight = 0
+        self.waiting = []
+        self.lock = threading.Lock()
+
+    def acquire(self, chain):
+        """Block until this request may be forwarded. Returns the estimated hit tokens."""
+        with self.lock:
+            if self.inflight < self.max_inflight and not self.waiting:
+                self.inflight += 1
+                waiter = None
+            else:
+                waiter = Waiter(chain)
+                self.waiting.append(waiter)
+        if waiter is not None:
+            waiter.event.wait()
+        return self.cache.access(chain)
+
+    def release(self):
+        with self.lock:
+            self.inflight -= 1
+            while self.waiting and self.inflight < self.max_inflight:
+                waiter = self._pick()
+                self.waiting.remove(waiter)
+                self.inflight += 1
+                waiter.event.set()
+
+    def _pick(self):
+        oldest = self.waiting[0]
+        if time.monotonic() - oldest.arrival >= self.max_wait:
+            return oldest
+        # Largest cached prefix first; earliest arrival among equals
+        return max(self.waiting, key=lambda w: (self.cache.peek(w.chain), -w.arrival))
+
+
+class Stats:
+    """Per-model counters for /stats."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.models = defaultdict(lambda: {
+            "requests": 0, "errors": 0, "wait_s": 0.0, "max_wait_s": 0.0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+            "cached_tokens_reported": 0, "est_prompt_tokens": 0, "est_hit_tokens": 0,
+            "first_start": None, "last_end": None,
+        })
+
+    def record(self, model, wait, start, end, est_prompt, est_hit, usage, error=False):
+        with self.lock:
+            m = self.models[model]
+            m["requests"] += 1
+            m["errors"] += error
+            m["wait_s"] += wait
+            m["max_wait_s"] = max(m["max_wait_s"], wait)
+            m["est_prompt_tokens"] += est_prompt
+            m["est_hit_tokens"] += est_hit
+            m["first_start"] = start if m["first_start"] is None else min(m["first_start"], start)
+            m["last_end"] = end if m["last_end"] is None else max(m["last_end"], end)
+            if usage:
+                m["prompt_tokens"] += usage.get("prompt_tokens") or 0
+                m["completion_tokens"] += usage.get("completion_tokens") or 0
+                cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+                if cached is not None:
+                    m["cached_tokens"] += cached
+                    m["cached_tokens_reported"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            out = {}
+            for model, m in self.models.items():
+                span = (m["last_end"] - m["first_start"]) if m["requests"] else 0.0
+                total = m["prompt_tokens"] + m["completion_tokens"]
+                out[model] = {
+                    "requests": m["requests"],
+                    "errors": m["errors"],
+                    "mean_wait_ms": round(1000 * m["wait_s"] / m["requests"], 1) if m["requests"] else 0.0,
+                    "max_wait_ms": round(1000 * m["max_wait_s"], 1),
+                    "prompt_tokens": m["prompt_tokens"],
+                    "completion_tokens": m["completion_tokens"],
+                    "tokens_per_s": round(total / span, 1) if span else 0.0,
+                    "completion_tokens_per_s": round(m["completion_tokens"] / span, 1) if span else 0.0,
+                    "est_prefix_hit_rate": round(m["est_hit_tokens"] / m["est_prompt_tokens"], 4)
+                    if m["est_prompt_tokens"] else 0.0,
+                    "reported_prefix_hit_rate": round(m["cached_tokens"] / m["prompt_tokens"], 4)
+                    if m["cached_tokens_reported"] and m["prompt_tokens"] else None,
+                }
+            return out
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# PROXY
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class Proxy:
+    def __init__(self, upstreams, max_inflight, cache_tokens, max_wait_ms, verbose=False):
+        self.upstreams = upstreams          # model -> base URL; "" = default
+        self.max_inflight = max_inflight    # model -> cap; "" = default
+        self.cache_tokens = cache_tokens
+        self.max_wait = max_wait_ms / 1000
+        self.verbose = verbose
+        self.stats = Stats()
+        self.schedulers = {}
+        self.lock = threading.Lock()
+
+    def upstream(self, model):
+        return self.upstreams.get(model) or self.upstreams[""]
+
+    def scheduler(self, model):
+        with self.lock:
+            if model not in self.schedulers:
+                cap = self.max_inflight.get(model, self.max_inflight[""])
+                self.schedulers[model] = ModelScheduler(cap, self.max_wait, PrefixCache(self.cache_tokens))
+            return self.schedulers[model]
+
+    def forward(self, model, method, path, body, headers):
+        """Send the request upstream. Returns (status, headers, response object, connection)."""
+        url = urlparse(self.upstream(model))
+        conn_cls = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        conn = conn_cls(url.hostname, url.port or (443 if url.scheme == "https" else 80), timeout=600)
+        prefix = url.path.rstrip("/")
+        if prefix.endswith("/v1") and path.startswith("/v1/"):
+            prefix = prefix[:-3]
+        conn.request(method, prefix + path, body=body, headers=headers)
+        resp = conn.getresponse()
+        return resp, conn
+
+
+def make_proxy_handler(proxy):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                return self._send(200, proxy.stats.snapshot())
+            self._relay("GET", None, None)
+
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                body = json.loads(raw)
+            except ValueError:
+                body = None
+            self._relay("POST", raw, body if isinstance(body, dict) else None)
+
+        def _relay(self, method, raw, body):
+            model = (body or {}).get("model", "")
+            headers = {k: v for k, v in self.headers.items()
+                       if k.lower() in ("content-type", "authorization", "accept")}
+            scheduled = body is not None and "messages" in body
+            if scheduled:
+                chain = prefix_chain(body)
+                sched = proxy.scheduler(model)
+                arrived = time.monotonic()
+                est_hit = sched.acquire(chain)
+                start = time.monotonic()
+            conn = None
+            usage, error = None, False
+            try:
+                resp, conn = proxy.forward(model, method, self.path, raw, headers)
+                self.send_response(resp.status)
+                for k, v in resp.getheaders():
+                    if k.lower() not in ("transfer-encoding", "connection", "content-length"):
+                        self.send_header(k, v)
+                if body is not None and body.get("stream"):
+                    # Relay the event stream as it arrives
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    while chunk := resp.read1(65536):
+                        self.wfile.write(chunk)
+                        self.wfile.flush()
+                else:
+                    data = resp.read()
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                    if scheduled and resp.status == 200:
+                        try:
+                            usage = json.loads(data).get("usage")
+                        except ValueError:
+                            pass
+                error = resp.status != 200
+            except (OSError, http.client.HTTPException) as e:
+                error = True
+                self._send(502, {"error": f"upstream {proxy.upstream(model)}: {e}"})
+            finally:
+                if conn is not None:
+                    conn.close()
+                if scheduled:
+                    sched.release()
+                    proxy.stats.record(model, start - arrived, start, time.monotonic(),
+                                       sum(t for _, t in chain), est_hit, usage, error)
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, fmt, *args):
+            if proxy.verbose:
+                super().log_message(fmt, *args)
+
+    return Handler
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# STUB ENGINE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class StubEngine:
+    """Simulated prefix-caching engine: LRU cache, bounded batch, prefill/decode latency."""
+
+    def __init__(self, cache_tokens, max_num_seqs, prefill_ms_per_1k, decode_ms_per_token):
+        # One engine per model, as with one vLLM server per model
+        self.caches = defaultdict(lambda: PrefixCache(cache_tokens))
+        self.seats = defaultdict(lambda: threading.BoundedSemaphore(max_num_seqs))
+        self.lock = threading.Lock()
+        self.prefill_s = prefill_ms_per_1k / 1000 / 1000
+        self.decode_s = decode_ms_per_token / 1000
+
+    def complete(self, body):
+        chain = prefix_chain(body)
+        prompt = sum(t for _, t in chain)
+        completion = max(1, int(body.get("max_tokens") or body.get("max_completion_tokens") or 64))
+        model = body.get("model", "")
+        with self.lock:
+            seats, cache = self.seats[model], self.caches[model]
+        with seats:
+            cached = cache.access(chain)
+            time.sleep((prompt - cached) * self.prefill_s + completion * self.decode_s)
+        return {
+            "id": f"stub-{time.monotonic_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "length",
+                         "message": {"role": "assistant", "content": "x" * (completion * CHARS_PER_TOKEN)}}],
+            "usage": {"prompt_tokens": prompt, "completion_tokens": completion,
+                      "total_tokens": prompt + completion,
+                      "prompt_tokens_details": {"cached_tokens": cached}},
+        }
+
+
+def make_stub_handler(engine, verbose=False):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") == "/v1/models":
+                return self._send(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+            self._send(404, {"error": f"unknown endpoint {self.path}"})
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/v1/chat/completions":
+                return self._send(404, {"error": f"unknown endpoint {self.path}"})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            except ValueError as e:
+                return self._send(400, {"error": str(e)})
+            self._send(200, engine.complete(body))
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, fmt, *args):
+            if verbose:
+                super().log_message(fmt, *args)
+
+    return Handler
+
+
+def start_server(handler, host="127.0.0.1", port=0):
+    """Serve handler on a background thread. Returns the server (server.server_port is the port)."""
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# BENCH
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def build_workload(traj_dir, model_size, agent_model, user_model, limit):
+    """Conversations replayed from trajectory files: [[request body, ...], ...].
+
+    Each entry yields one conversation. An agent request is sent for every
+    assistant turn (the messages before it). A user-simulator request is sent
+    for every user turn after the first: a per-task simulator prompt with the
+    task instruction, plus the conversation so far with the roles swapped.
+    max_tokens is the recorded reply's length, so the stub decodes that much.
+    Conversations of different files are interleaved, as concurrent runs would be.
+    """
+    from analyze_crashes import discover_files
+    from traj_json import TrajectoryFile
+
+    per_file = []
+    for filepath, _ in discover_files(Path(traj_dir), model_size):
+        convs = []
+        with TrajectoryFile(filepath) as data:
+            for lazy in data:
+                if lazy.has("info", "error") or not lazy.length("traj"):
+                    continue
+                entry = lazy.to_dict()
+                instruction = (entry.get("info", {}).get("task") or {}).get("instruction", "")
+                convs.append(conversation_requests(entry["traj"], instruction, agent_model, user_model))
+        per_file.append(convs)
+
+    workload = []
+    while any(per_file) and (limit is None or len(workload) < limit):
+        for convs in per_file:
+            if convs and (limit is None or len(workload) < limit):
+                workload.append(convs.pop(0))
+    return workload
+
+
+def conversation_requests(traj, instruction, agent_model, user_model):
+    sim_system = {"role": "system", "content": (
+        "You are a user interacting with an agent.\n\nInstruction: " + instruction +
+        "\n\nRules:\n- Just generate one line at a time to simulate the user's message.\n"
+        "- Do not give away all the instruction at once.\n"
+        "- If the instruction goal is satisified, generate '###STOP###'.")}
+    swap = {"user": "assistant", "assistant": "user"}
+    requests = []
+    for i, msg in enumerate(traj):
+        reply = approx_tokens(msg.get("content") or "") or 16
+        if msg.get("role") == "assistant":
+            requests.append({"model": agent_model, "max_tokens": reply, "messages": [
+                {k: v for k, v in m.items() if k in ("role", "content", "tool_calls", "tool_call_id")}
+                for m in traj[:i]]})
+        elif msg.get("role") == "user" and i > 1:
+            history = [{"role": swap[m["role"]], "content": m.get("content") or ""}
+                       for m in traj[1:i] if m.get("role") in swap]
+            requests.append({"model": user_model, "max_tokens": reply,
+                             "messages": [sim_system] + history})
+    return requests
+
+
+def run_workload(base_url, workload, concurrency):
+    """Replay conversations with `concurrency` in flight. Returns timing + usage totals."""
+    url = urlparse(base_url)
+    queue = list(workload)
+    lock = threading.Lock()
+    latencies, totals = [], defaultdict(int)
+
+    def worker():
+        conn = None
+        while True:
+            with lock:
+                if not queue:
+                    return
+                conv = queue.pop(0)
+            for body in conv:
+                data = json.dumps(body).encode()
+                start = time.perf_counter()
+                conn = http.client.HTTPConnection(url.hostname, url.port, timeout=600)
+                conn.request("POST", "/v1/chat/completions", body=data,
+                             headers={"Content-Type": "application/json"})
+                resp = json.loads(conn.getresponse().read())
+                conn.close()
+                usage = resp.get("usage", {})
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+                    totals["requests"] += 1
+                    totals["prompt_tokens"] += usage.get("prompt_tokens", 0)
+                    totals["completion_tokens"] += usage.get("completion_tokens", 0)
+                    totals["cached_tokens"] += (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "wall_s": wall,
+        "requests": totals["requests"],
+        "tokens_per_s": (totals["prompt_tokens"] + totals["completion_tokens"]) / wall if wall else 0.0,
+        "hit_rate": totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0,
+        "p50_ms": 1000 * latencies[len(latencies) // 2] if latencies else 0.0,
+        "p95_ms": 1000 * latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+    }
+
+
+def bench(args):
+    workload = build_workload(args.trajectory_dir, args.model_size, args.agent_model,
+                              args.user_model, args.conversations)
+    if not workload:
+        sys.exit(f"ERROR: no conversations found in {args.trajectory_dir}")
+    n_requests = sum(len(c) for c in workload)
+    print(f"Replaying {len(workload)} conversations ({n_requests} requests), "
+          f"{args.concurrency} concurrent...", file=sys.stderr)
+
+    rows = []
+    for mode in ("direct", "proxy"):
+        engine = StubEngine(args.cache_tokens, args.max_num_seqs, args.prefill_ms_per_1k,
+                            args.decode_ms_per_token)
+        stub = start_server(make_stub_handler(engine))
+        base = f"http://127.0.0.1:{stub.server_port}"
+        proxy_server = None
+        if mode == "proxy":
+            proxy = Proxy({"": base}, {"": args.max_num_seqs}, args.cache_tokens, args.max_wait_ms)
+            proxy_server = start_server(make_proxy_handler(proxy))
+            base = f"http://127.0.0.1:{proxy_server.server_port}"
+        try:
+            row = run_workload(base, workload, args.concurrency)
+        finally:
+            for server in (proxy_server, stub):
+                if server is not None:
+                    server.shutdown()
+                    server.server_close()
+        row["mode"] = mode
+        rows.append(row)
+        print(f"  {mode:7s} {row['wall_s']:6.1f}s  hit rate {row['hit_rate']:.1%}", file=sys.stderr)
+    return rows
+
+
+def print_bench(rows, args, output_file=None):
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    p("# Prefix Proxy Benchmark (stub engine)")
+    p()
+    p(f"Stub: {args.cache_tokens:,}-token prefix cache, {args.max_num_seqs} sequences, "
+      f"{args.prefill_ms_per_1k:g} ms prefill per 1k uncached tokens, "
+      f"{args.decode_ms_per_token:g} ms per decoded token. Clients: {args.concurrency} "
+      f"concurrent conversations.")
+    p()
+    p("| Mode | Requests | Wall (s) | Tokens/s | Prefix hit rate | p50 latency (ms) | p95 latency (ms) |")
+    p("|------|----------|----------|----------|-----------------|------------------|------------------|")
+    for r in rows:
+        p(f"| {r['mode']} | {r['requests']} | {r['wall_s']:.1f} | {r['tokens_per_s']:,.0f} "
+          f"| {r['hit_rate']:.1%} | {r['p50_ms']:.0f} | {r['p95_ms']:.0f} |")
+    p()
+    if len(rows) == 2 and rows[1]["wall_s"]:
+        p(f"Proxy speedup: {rows[0]['wall_s'] / rows[1]['wall_s']:.2f}x wall time.")
+        p()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CLI
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def parse_model_map(values, default, convert=str):
+    """["URL", "MODEL=URL", ...] -> {"": default-or-URL, "MODEL": URL}."""
+    out = {"": default}
+    for value in values or []:
+        model, sep, rest = value.rpartition("=")
+        if sep and model and not model.startswith("http"):
+            out[model] = convert(rest)
+        else:
+            out[""] = convert(value)
+    return out
+
+
+def main(argv=None):
+    script_dir = Path(__file__).resolve().parent
+    parser = argparse.ArgumentParser(description="Prefix-aware request scheduler in front of vLLM.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_p = sub.add_parser("serve", help="Run the proxy")
+    serve_p.add_argument(
+        "--upstream", action="append", default=None,
+        help="Upstream base URL, or MODEL=URL for one model (repeatable). Default: http://127.0.0.1:8000",
+    )
+    serve_p.add_argument(
+        "--max-inflight", action="append", default=None,
+        help="Max in-flight requests per model, or MODEL=N (repeatable). Default: 16",
+    )
+    serve_p.add_argument("--host", type=str, default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    serve_p.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port (default: {DEFAULT_PORT})")
+    serve_p.add_argument("--verbose", action="store_true", help="Log every request")
+
+    stub_p = sub.add_parser("stub", help="Run a stub OpenAI-compatible engine with a prefix cache")
+    stub_p.add_argument("--host", type=str, default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    stub_p.add_argument("--port", type=int, default=8000, help="Port (default: 8000)")
+    stub_p.add_argument("--verbose", action="store_true", help="Log every request")
+
+    bench_p = sub.add_parser("bench", help="Replay trajectories against the stub, direct vs proxied")
+    bench_p.add_argument(
+        "--trajectory-dir", type=str, default=None,
+        help="Path to trajectory directory. Default: auto-detect from script location.",
+    )
+    bench_p.add_argument(
+        "--model-size", type=str, default=None, choices=["4b", "8b", "14b", "32b"],
+        help="Filter to a specific model size (e.g., 14b). Default: all sizes.",
+    )
+    bench_p.add_argument(
+        "--conversations", type=int, default=None,
+        help="Replay at most this many conversations. Default: all",
+    )
+    bench_p.add_argument(
+        "--concurrency", type=int, default=16,
+        help="Conversations in flight at once. Default: 16",
+    )
+    bench_p.add_argument("--agent-model", type=str, default="Qwen/Qwen3-14B", help="Default: Qwen/Qwen3-14B")
+    bench_p.add_argument("--user-model", type=str, default="Qwen/Qwen3-32B", help="Default: Qwen/Qwen3-32B")
+    bench_p.add_argument(
+        "--output", type=str, default=None,
+        help="Save markdown output to a file instead of printing to stdout.",
+    )
+
+    for sp in (serve_p, bench_p):
+        sp.add_argument(
+            "--max-wait-ms", type=float, default=2000,
+            help="A request waiting this long is dispatched next regardless of prefix. Default: 2000",
+        )
+    for sp in (serve_p, stub_p, bench_p):
+        sp.add_argument(
+            "--cache-tokens", type=int, default=40000,
+            help="Prefix cache size in tokens (vLLM: # GPU blocks x block size). Default: 40000",
+        )
+    for sp in (stub_p, bench_p):
+        sp.add_argument("--max-num-seqs", type=int, default=4,
+                        help="Stub: sequences processed at once per model (bench: also the proxy's cap). Default: 4")
+        sp.add_argument("--prefill-ms-per-1k", type=float, default=20.0,
+                        help="Stub: ms per 1k uncached prompt tokens. Default: 20")
+        sp.add_argument("--decode-ms-per-token", type=float, default=0.5,
+                        help="Stub: ms per completion token. Default: 0.5")
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        if not args.trajectory_dir:
+            args.trajectory_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories"
+            if not args.trajectory_dir.exists():
+                args.trajectory_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories "
+        rows = bench(args)
+        if args.output:
+            with open(args.output, "w") as f:
+                print_bench(rows, args, output_file=f)
+            print(f"Saved markdown to {args.output}")
+        else:
+            print_bench(rows, args)
+        return
+
+    if args.command == "stub":
+        engine = StubEngine(args.cache_tokens, args.max_num_seqs, args.prefill_ms_per_1k,
+                            args.decode_ms_per_token)
+        handler = make_stub_handler(engine, args.verbose)
+        name = "Stub engine"
+    else:
+        try:
+            caps = parse_model_map(args.max_inflight, 16, int)
+        except ValueError:
+            parser.error("--max-inflight takes N or MODEL=N")
+        proxy = Proxy(parse_model_map(args.upstream, "http://127.0.0.1:8000"), caps,
+                      args.cache_tokens, args.max_wait_ms, args.verbose)
+        handler = make_proxy_handler(proxy)
+        name = "Prefix proxy"
+
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    print(f"{name} on http://{args.host}:{args.port} — Ctrl-C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
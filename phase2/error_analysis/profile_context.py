@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+profile_context.py — Per-turn context-size profiler for tau-bench trajectories.
+
+analyze_crashes.py measures conversation length as `len(traj)` and only sees
+token counts after a crash (parsed from the ContextWindowExceeded message).
+This script tokenizes every conversation locally and rebuilds the context
+the agent model saw at every turn, so we can see how close each run came to
+the limit and what was filling it.
+
+How it works:
+─────────────
+1. TOKENIZER: Loads a Qwen-compatible tokenizer via `tokenizers` or
+   `transformers` (default: Qwen/Qwen3-14B). If neither is installed, falls
+   back to a regex word/punctuation estimate and labels the output as
+   approximate. System prompts are identical across entries, so token
+   counts are cached by content.
+
+2. GROWTH CURVE: For each entry, turn i's request = system prompt + every
+   message up to i, plus chat-template overhead per message
+   (<|im_start|>role ... <|im_end|>). The cumulative count per turn is the
+   growth curve; its last value is the peak context size.
+
+3. COMPOSITION: Each message is split into components:
+   - system       → traj[0] (policy + tool schemas)
+   - think        → <think>...</think> blocks (agent and user simulator)
+   - tool_output  → 'API output:' messages / FC 'tool' messages
+   - user / assistant → everything else
+   The component with the most tokens at the peak is the "dominant" one.
+
+4. FLAGGING: Runs whose peak is within --near-limit-pct of --token-limit
+   (default: 10% of 32,768) are flagged as near-limit. Crashed entries are
+   reported with the exact token counts from their error message.
+
+5. PARALLELISM: Files are profiled in a process pool (--workers); each
+   worker loads the tokenizer once.
+
+Usage:
+    python profile_context.py                              # all model sizes
+    python profile_context.py --model-size 14b --near-limit-pct 15
+    python profile_context.py --json-output context_profile.json --curves
+    python profile_context.py --tokenizer /models/Qwen3-14B --workers 8
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from analyze_crashes import classify_crash, discover_files
+from traj_json import load
+
+# Qwen chat template wraps each message as "<|im_start|>{role}\n{content}<|im_end|>\n"
+TEMPLATE_OVERHEAD = 5
+COMPONENTS = ["system", "think", "tool_output", "user", "assistant"]
+
+THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL)
+APPROX_RE = re.compile(r"\w+|[^\w\s]")
+
+# Per-process tokenizer state (set by init_worker)
+_ENCODE = None
+_APPROXIMATE = False
+_CACHE = {}
+
+
+def load_tokenizer(name):
+    """Return (encode_fn, is_approximate) for a Qwen-compatible tokenizer."""
+    try:
+        from tokenizers import Tokenizer
+        tok = Tokenizer.from_pretrained(name) if not Path(name).exists() else (
+            Tokenizer.from_file(str(Path(name) / "tokenizer.json")))
+        return (lambda text: len(tok.encode(text, add_special_tokens=False).ids)), False
+    except Exception:
+        pass
+    try:
+        from transformers import AutoTokenizer
+        tok = AutoTokenizer.from_pretrained(name)
+        return (lambda text: len(tok.encode(text, add_special_tokens=False))), False
+    except Exception:
+        pass
+    # Rough estimate: Qwen's BPE splits JSON/English at ~1 token per word or symbol
+    return (lambda text: len(APPROX_RE.findall(text))), True
+
+
+def init_worker(tokenizer_name):
+    global _ENCODE, _APPROXIMATE
+    _ENCODE, _APPROXIMATE = load_tokenizer(tokenizer_name)
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    if len(text) > 2000:
+        # Long texts (system prompts, big API outputs) repeat across entries
+        cached = _CACHE.get(text)
+        if cached is None:
+            cached = _CACHE[text] = _ENCODE(text)
+        return cached
+    return _ENCODE(text)
+
+
+def message_components(msg, is_first):
+    """Split one message into {component: tokens}."""
+    role = msg.get("role", "unknown")
+    content = msg.get("content", "") or ""
+    if msg.get("tool_calls"):
+        content += "".join(
+            json.dumps(tc.get("function", {})) for tc in msg["tool_calls"])
+
+    parts = dict.fromkeys(COMPONENTS, 0)
+    if role == "system" and is_first:
+        parts["system"] = count_tokens(content) + TEMPLATE_OVERHEAD
+        return parts
+
+    think_tokens = sum(count_tokens(block) for block in THINK_RE.findall(content))
+    rest = THINK_RE.sub("", content)
+    parts["think"] = think_tokens
+    if role == "tool" or (role == "user" and content.startswith("API output:")):
+        parts["tool_output"] = count_tokens(rest) + TEMPLATE_OVERHEAD
+    elif role == "assistant":
+        parts["assistant"] = count_tokens(rest) + TEMPLATE_OVERHEAD
+    else:
+        parts["user"] = count_tokens(rest) + TEMPLATE_OVERHEAD
+    return parts
+
+
+def profile_entry(entry, token_limit, keep_curve=False):
+    """Profile one trajectory entry. Returns per-entry stats dict."""
+    info = entry.get("info", {})
+    result = {
+        "task_id": entry.get("task_id", "?"),
+        "trial": entry.get("trial", "?"),
+        "reward": entry.get("reward", 0.0),
+    }
+    if "error" in info:
+        crash = classify_crash(info["error"])
+        result.update(crashed=True, crash_type=crash["crash_type"],
+                      turns=0, peak_tokens=crash["tokens_used"] or 0)
+        return result
+
+    totals = dict.fromkeys(COMPONENTS, 0)
+    curve = []
+    running = 0
+    for i, msg in enumerate(entry.get("traj", [])):
+        parts = message_components(msg, i == 0)
+        for comp, n in parts.items():
+            totals[comp] += n
+        running += sum(parts.values())
+        curve.append(running)
+
+    result.update(
+        crashed=False,
+        turns=len(curve),
+        peak_tokens=running,
+        peak_pct=round(running / token_limit * 100, 1),
+        composition=totals,
+        dominant=max((c for c in COMPONENTS if c != "system"),
+                     key=lambda c: totals[c]) if running else None,
+    )
+    if keep_curve:
+        result["curve"] = curve
+    return result
+
+
+def profile_file(args):
+    """Worker entry point: profile every entry in one file."""
+    filepath, config, token_limit, keep_curves = args
+    data = load(filepath)
+    entries = [profile_entry(e, token_limit, keep_curves) for e in data]
+    return {"config": config, "filepath": str(filepath), "entries": entries,
+            "approximate": _APPROXIMATE}
+
+
+def print_summary(all_results, token_limit, near_pct, output_file=None):
+    """Print markdown summary tables."""
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    threshold = token_limit * (1 - near_pct / 100)
+    approximate = any(r["approximate"] for r in all_results)
+
+    p("# Context Pressure Profile")
+    p()
+    p(f"Token limit: **{token_limit:,}** | Near-limit threshold: **{threshold:,.0f}** "
+      f"(within {near_pct:g}%)" + (" | Counts are **approximate** (no tokenizer installed)"
+                                   if approximate else ""))
+    p()
+
+    # ── Table 1: Per-config pressure ──
+    p("## Per-Config Context Pressure")
+    p()
+    p("| Config | Entries | Crashed | Mean Peak | Max Peak | Near-Limit | System % | Think % | Tool Output % |")
+    p("|--------|---------|---------|-----------|----------|------------|----------|---------|---------------|")
+    for r in all_results:
+        ok = [e for e in r["entries"] if not e["crashed"]]
+        crashed = len(r["entries"]) - len(ok)
+        near = sum(1 for e in r["entries"] if e["peak_tokens"] >= threshold)
+        mean_peak = sum(e["peak_tokens"] for e in ok) / len(ok) if ok else 0
+        max_peak = max((e["peak_tokens"] for e in ok), default=0)
+        totals = {c: sum(e["composition"][c] for e in ok) for c in COMPONENTS}
+        grand = sum(totals.values()) or 1
+        p(f"| {r['config']['config_label']} | {len(r['entries'])} | {crashed} | "
+          f"{mean_peak:,.0f} | {max_peak:,} | {near} | "
+          f"{totals['system'] / grand * 100:.1f}% | {totals['think'] / grand * 100:.1f}% | "
+          f"{totals['tool_output'] / grand * 100:.1f}% |")
+    p()
+
+    # ── Table 2: Near-limit runs ──
+    near_entries = [
+        dict(e, config_label=r["config"]["config_label"])
+        for r in all_results for e in r["entries"] if e["peak_tokens"] >= threshold
+    ]
+    near_entries.sort(key=lambda e: e["peak_tokens"], reverse=True)
+    if near_entries:
+        p("## Near-Limit Runs")
+        p()
+        p("| Config | Task ID | Trial | Turns | Peak Tokens | % of Limit | Dominant | Status |")
+        p("|--------|---------|-------|-------|-------------|------------|----------|--------|")
+        for e in near_entries:
+            status = "CRASH" if e["crashed"] else ("PASS" if e["reward"] == 1.0 else "FAIL")
+            pct = e["peak_tokens"] / token_limit * 100
+            p(f"| {e['config_label']} | {e['task_id']} | {e['trial']} | {e['turns']} | "
+              f"{e['peak_tokens']:,} | {pct:.1f}% | {e.get('dominant') or '-'} | {status} |")
+        p()
+
+    # ── Table 3: What dominates ──
+    p("## Dominant Non-System Component (per entry)")
+    p()
+    p("| Config | " + " | ".join(c for c in COMPONENTS if c != "system") + " |")
+    p("|--------|" + "|".join("-" * (len(c) + 2) for c in COMPONENTS if c != "system") + "|")
+    for r in all_results:
+        counts = {c: 0 for c in COMPONENTS if c != "system"}
+        for e in r["entries"]:
+            if e.get("dominant"):
+                counts[e["dominant"]] += 1
+        p(f"| {r['config']['config_label']} | " + " | ".join(str(v) for v in counts.values()) + " |")
+    p()
+
+
+def save_json(all_results, json_path, token_limit, near_pct):
+    threshold = token_limit * (1 - near_pct / 100)
+    output = {
+        "token_limit": token_limit,
+        "near_limit_threshold": round(threshold),
+        "approximate": any(r["approximate"] for r in all_results),
+        "per_file": [],
+    }
+    for r in all_results:
+        entries = r["entries"]
+        output["per_file"].append({
+            "config": r["config"]["config_label"],
+            "file": r["filepath"],
+            "near_limit": sum(1 for e in entries if e["peak_tokens"] >= threshold),
+            "entries": entries,
+        })
+    with open(json_path, "w") as f:
+        json.dump(output, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Profile per-turn context growth in tau-bench trajectory files."
+    )
+    parser.add_argument(
+        "--trajectory-dir", type=str, default=None,
+        help="Path to trajectory directory. Default: auto-detect from script location.",
+    )
+    parser.add_argument(
+        "--model-size", type=str, default=None, choices=["4b", "8b", "14b", "32b"],
+        help="Filter to a specific model size (e.g., 14b). Default: all sizes.",
+    )
+    parser.add_argument(
+        "--tokenizer", type=str, default="Qwen/Qwen3-14B",
+        help="HF tokenizer name or local path (default: Qwen/Qwen3-14B)",
+    )
+    parser.add_argument(
+        "--token-limit", type=int, default=32768,
+        help="Context window of the agent model (default: 32768)",
+    )
+    parser.add_argument(
+        "--near-limit-pct", type=float, default=10.0,
+        help="Flag runs whose peak is within this %% of the limit (default: 10)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1,
+        help="Parallel worker processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "--curves", action="store_true",
+        help="Include per-turn cumulative token curves in the JSON output",
+    )
+    parser.add_argument(
+        "--output", type=str, default=None,
+        help="Save markdown output to a file instead of printing to stdout.",
+    )
+    parser.add_argument(
+        "--json-output", type=str, default=None,
+        help="Save per-entry profiles to a JSON file.",
+    )
+    args = parser.parse_args()
+
+    if args.trajectory_dir:
+        traj_dir = Path(args.trajectory_dir)
+    else:
+        script_dir = Path(__file__).resolve().parent
+        traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories"
+        if not traj_dir.exists():
+            traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories "
+    if not traj_dir.exists():
+        print(f"ERROR: Trajectory directory not found: {traj_dir}")
+        sys.exit(1)
+
+    files = discover_files(traj_dir, args.model_size)
+    print(f"Found {len(files)} trajectory file(s)")
+    if not files:
+        sys.exit(1)
+
+    jobs = [(fp, config, args.token_limit, args.curves) for fp, config in files]
+    workers = max(1, min(args.workers, len(jobs)))
+    if workers == 1:
+        init_worker(args.tokenizer)
+        all_results = [profile_file(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(args.tokenizer,)) as pool:
+            all_results = list(pool.map(profile_file, jobs))
+    if any(r["approximate"] for r in all_results):
+        print(f"  WARNING: tokenizer '{args.tokenizer}' unavailable "
+              "(pip install tokenizers) — using approximate counts")
+    print()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            print_summary(all_results, args.token_limit, args.near_limit_pct, output_file=f)
+        print(f"Saved markdown to {args.output}")
+    else:
+        print_summary(all_results, args.token_limit, args.near_limit_pct)
+
+    if args.json_output:
+        save_json(all_results, args.json_output, args.token_limit, args.near_limit_pct)
+        print(f"Saved JSON to {args.json_output}")
+
+
+if __name__ == "__main__":
+    main()
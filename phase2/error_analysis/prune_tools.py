@@ -0,0 +1,517 @@
+#!/usr/bin/env python3
+"""
+prune_tools.py — Tool-schema pruning for agent prompts.
+
+Most of the ~19 KB system prompt is the "#Available tools" JSON list. It
+holds the full schema of every airline/retail tool and is sent on every
+turn, yet a task uses only a handful of them. ToolPruner keeps the schemas
+the agent is likely to need at the current stage of the conversation and
+drops the rest from the request.
+
+How it works:
+─────────────
+1. SPLIT: The system prompt is cut at the "#Available tools" marker (the
+   same one extract_policy() uses). The JSON list after it is parsed and
+   rebuilt with only the kept schemas; the text around it is untouched.
+   For FC agents the `tools=` request argument is pruned instead.
+
+2. TRANSITIONS: From stored trajectories, count which tool the agent called
+   next after each tool ("<start>" before the first call). At a turn, the
+   last tool called so far gives P(next tool).
+
+3. INTENT: A bag-of-words classifier over the user's messages (tool outputs
+   excluded). For every word, count the conversations containing it and
+   which tools they used. P(tool | conversation so far) is the average of
+   P(tool used | word) over the words seen so far.
+
+4. SELECT: --strategy picks transitions, intent or both (the mean of the
+   two). Tools are kept in order of probability until they cover
+   --coverage of it, with at least --min-tools. think /
+   transfer_to_human_agents, and every tool already called in this
+   conversation, are always kept.
+
+5. OFFLINE EVALUATION: Tasks are split into --folds folds. The model is
+   fitted on the other folds, and each stored agent request of the held-out
+   fold is rebuilt (the messages before every assistant turn). The report
+   shows the schema tokens sent with and without pruning. It also shows how
+   often the tool the agent actually called at that turn would have been
+   missing from the prompt. A coverage sweep shows the trade-off.
+
+Using it in an agent loop:
+    pruner = ToolPruner.load("tool_model.json", coverage=0.95)
+    completion = pruner.wrap(litellm.completion)
+    res = completion(model=..., messages=messages, tools=tools, ...)  # pruned copy sent
+
+Offline evaluation (no LLM calls):
+    python prune_tools.py                                  # all stored trajectories
+    python prune_tools.py --model-size 14b --strategy transitions --coverage 0.9
+    python prune_tools.py --save-model tool_model.json     # fit on everything, save for the agent
+"""
+
+import argparse
+import json
+import re
+import sys
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from analyze_crashes import discover_files
+from classify_errors import extract_agent_actions
+from profile_context import load_tokenizer
+from traj_json import load
+
+TOOLS_MARKERS = ("#Available tools", "# Available tools", "#Available Tools")
+
+# Cheap to keep and needed at unpredictable points
+ALWAYS_KEEP = ("think", "transfer_to_human_agents")
+
+START = "<start>"
+STRATEGIES = ("transitions", "intent", "both")
+WORD_RE = re.compile(r"[a-z]{3,}")
+SWEEP_COVERAGE = (0.8, 0.9, 0.95, 0.99, 1.0)
+
+
+def split_system_prompt(content):
+    """(head, tool schemas, tail). Schemas is None if the prompt has no tool list."""
+    for marker in TOOLS_MARKERS:
+        i = content.find(marker)
+        if i < 0:
+            continue
+        start = content.find("[", i)
+        try:
+            tools, end = json.JSONDecoder().raw_decode(content, start)
+        except (ValueError, TypeError):
+            return content, None, ""
+        return content[:start], tools, content[end:]
+    return content, None, ""
+
+
+def tool_name(schema):
+    return schema.get("function", schema).get("name")
+
+
+def is_user_text(msg):
+    """A message written by the user (not a system prompt or an 'API output:' reply)."""
+    content = msg.get("content") or ""
+    return msg.get("role") == "user" and not content.startswith("API output:")
+
+
+def words(text):
+    return set(WORD_RE.findall(text.lower()))
+
+
+def turn_calls(traj):
+    """[(turn index, [tool names called at that turn])] for every assistant turn."""
+    return [(i, [a.get("name") for a in extract_agent_actions([msg])])
+            for i, msg in enumerate(traj) if msg.get("role") == "assistant"]
+
+
+class ToolPruner:
+    """Keeps the tool schemas likely needed at the current conversation stage.
+
+    coverage     — keep tools until their probabilities sum to this much
+    min_tools    — never keep fewer than this many predicted tools
+    strategy     — "transitions", "intent" or "both"
+    """
+
+    def __init__(self, coverage=0.95, min_tools=3, strategy="both", always_keep=ALWAYS_KEEP):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"strategy must be one of {STRATEGIES}, got {strategy!r}")
+        self.coverage = coverage
+        self.min_tools = min_tools
+        self.strategy = strategy
+        self.always_keep = set(always_keep)
+        self.transitions = defaultdict(Counter)     # previous tool -> Counter(next tool)
+        self.word_tools = defaultdict(Counter)      # word -> Counter(tool used in conversation)
+        self.word_docs = Counter()                  # word -> conversations containing it
+
+    # ── fitting ──────────────────────────────────────────────────────────────
+
+    def fit(self, trajs):
+        for traj in trajs:
+            prev = START
+            used = set()
+            for _, names in turn_calls(traj):
+                for name in names:
+                    self.transitions[prev][name] += 1
+                    prev = name
+                    used.add(name)
+            vocab = set()
+            for msg in traj:
+                if is_user_text(msg):
+                    vocab |= words(msg.get("content") or "")
+            for w in vocab:
+                self.word_docs[w] += 1
+                self.word_tools[w].update(used)
+        return self
+
+    def to_json(self):
+        return {
+            "transitions": {k: dict(v) for k, v in self.transitions.items()},
+            "word_tools": {k: dict(v) for k, v in self.word_tools.items()},
+            "word_docs": dict(self.word_docs),
+        }
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        with open(path) as f:
+            data = json.load(f)
+        pruner = cls(**kwargs)
+        for k, v in data["transitions"].items():
+            pruner.transitions[k] = Counter(v)
+        for k, v in data["word_tools"].items():
+            pruner.word_tools[k] = Counter(v)
+        pruner.word_docs = Counter(data["word_docs"])
+        return pruner
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f)
+
+    # ── prediction ───────────────────────────────────────────────────────────
+
+    def stage(self, messages):
+        """(last tool called, tools called so far, user words so far) for a request."""
+        prev, called, vocab = START, set(), set()
+        for msg in messages:
+            if msg.get("role") == "assistant":
+                for action in extract_agent_actions([msg]):
+                    prev = action.get("name")
+                    called.add(prev)
+            elif is_user_text(msg):
+                vocab |= words(msg.get("content") or "")
+        return prev, called, vocab
+
+    def _transition_probs(self, names, prev):
+        counts = self.transitions.get(prev) or self.transitions.get(START) or Counter()
+        total = sum(counts[n] for n in names)
+        return {n: (counts[n] + 0.1) / (total + 0.1 * len(names)) for n in names}
+
+    def _intent_probs(self, names, vocab):
+        scores = dict.fromkeys(names, 0.0)
+        seen = 0
+        for w in vocab:
+            docs = self.word_docs.get(w)
+            if not docs:
+                continue
+            seen += 1
+            tools = self.word_tools[w]
+            for n in names:
+                scores[n] += tools[n] / docs
+        if not seen:
+            return {n: 1 / len(names) for n in names}
+        total = sum(scores.values()) + 0.1 * len(names)
+        return {n: (s + 0.1) / total for n, s in scores.items()}
+
+    def predict(self, names, messages):
+        """{tool name: probability it is needed next} over the tools in `names`."""
+        prev, _, vocab = self.stage(messages)
+        return self._probs(names, prev, vocab)
+
+    def _probs(self, names, prev, vocab):
+        if self.strategy == "transitions":
+            return self._transition_probs(names, prev)
+        if self.strategy == "intent":
+            return self._intent_probs(names, vocab)
+        trans = self._transition_probs(names, prev)
+        intent = self._intent_probs(names, vocab)
+        return {n: (trans[n] + intent[n]) / 2 for n in names}
+
+    def select(self, names, messages):
+        """The set of tool names to keep for a request with these messages."""
+        names = list(names)
+        if not names:
+            return set()
+        prev, called, vocab = self.stage(messages)
+        probs = self._probs(names, prev, vocab)
+        kept = (self.always_keep | called) & set(names)
+        cum, n_predicted = 0.0, 0
+        for name in sorted(names, key=lambda n: (-probs[n], n)):
+            if cum >= self.coverage and n_predicted >= self.min_tools:
+                break
+            kept.add(name)
+            cum += probs[name]
+            n_predicted += 1
+        return kept
+
+    # ── request rewriting ────────────────────────────────────────────────────
+
+    def prune_tools(self, tools, messages):
+        """FC: the `tools=` list with only the kept schemas (order preserved)."""
+        kept = self.select([tool_name(t) for t in tools], messages)
+        return [t for t in tools if tool_name(t) in kept]
+
+    def prune_messages(self, messages):
+        """ACT/ReAct: a copy of `messages` whose system prompt lists only the kept schemas."""
+        if not messages or messages[0].get("role") != "system":
+            return messages
+        head, tools, tail = split_system_prompt(messages[0].get("content") or "")
+        if tools is None:
+            return messages
+        pruned = self.prune_tools(tools, messages)
+        return [dict(messages[0], content=head + json.dumps(pruned) + tail)] + list(messages[1:])
+
+    def wrap(self, completion_fn):
+        """Wrap an OpenAI/litellm-style completion(messages=..., tools=..., **kw) function."""
+        def pruned_completion(*args, messages, tools=None, **kwargs):
+            if tools:
+                return completion_fn(*args, messages=messages,
+                                     tools=self.prune_tools(tools, messages), **kwargs)
+            return completion_fn(*args, messages=self.prune_messages(messages), **kwargs)
+        return pruned_completion
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# OFFLINE EVALUATION
+# Re-creates every agent request from a stored trajectory (all messages
+# before each assistant turn) with a model fitted on the other task folds.
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def load_corpus(files):
+    """Entries grouped by domain, plus the tool catalogue of each domain.
+
+    FC system prompts carry no tool list (tau-bench passes `tools=`), so FC
+    configs use the catalogue parsed from an ACT/ReAct prompt of the same domain.
+    """
+    corpus = defaultdict(list)   # domain -> [(config_label, task_id, trial, traj)]
+    catalogs = {}                # domain -> [schema, ...]
+    for filepath, config in files:
+        data = load(filepath)
+        for entry in data:
+            traj = entry.get("traj", [])
+            if "error" in entry.get("info", {}) or not traj:
+                continue
+            if config["domain"] not in catalogs and traj[0].get("role") == "system":
+                _, tools, _ = split_system_prompt(traj[0].get("content") or "")
+                if tools:
+                    catalogs[config["domain"]] = tools
+            corpus[config["domain"]].append(
+                (config["config_label"], entry.get("task_id"), entry.get("trial", 0), traj))
+    return corpus, catalogs
+
+
+def evaluate(corpus, catalogs, folds, pruners, count_tokens):
+    """Per-request records for every pruner.
+
+    {key: [(config, task, trial, turn, full_tokens, kept_tokens, n_kept, called, missed)]}
+    where `called` is True if the turn calls a known tool and `missed` lists
+    the called tools the pruner dropped.
+    """
+    results = defaultdict(list)
+    for domain, entries in corpus.items():
+        catalog = catalogs.get(domain)
+        if not catalog:
+            print(f"  WARNING: no tool list found for {domain}; skipping its entries")
+            continue
+        names = [tool_name(t) for t in catalog]
+        schema_tokens = {tool_name(t): count_tokens(json.dumps(t)) for t in catalog}
+        full = sum(schema_tokens.values())
+        for fold in range(folds):
+            train = [traj for _, task, _, traj in entries if (task or 0) % folds != fold]
+            test = [e for e in entries if (e[1] or 0) % folds == fold]
+            if not test:
+                continue
+            for key, make in pruners.items():
+                pruner = make().fit(train)
+                for label, task, trial, traj in test:
+                    for i, called in turn_calls(traj):
+                        # Calls to tools that don't exist can't be missing from the prompt
+                        called = [n for n in called if n in schema_tokens]
+                        kept = pruner.select(names, traj[:i])
+                        missed = [n for n in called if n not in kept]
+                        results[key].append((label, task, trial, i,
+                                             full, sum(schema_tokens[n] for n in kept),
+                                             len(kept), bool(called), missed))
+    return results
+
+
+def aggregate(records):
+    n = len(records)
+    full = sum(r[4] for r in records)
+    kept = sum(r[5] for r in records)
+    tool_turns = sum(1 for r in records if r[7])
+    missed = sum(1 for r in records if r[8])
+    entries = {(r[0], r[1], r[2]) for r in records}
+    entries_missed = {(r[0], r[1], r[2]) for r in records if r[8]}
+    return {
+        "requests": n,
+        "schema_tokens_full": full,
+        "schema_tokens_pruned": kept,
+        "saved_pct": round(100 * (full - kept) / full, 1) if full else 0.0,
+        "mean_tools_kept": round(sum(r[6] for r in records) / n, 1) if n else 0.0,
+        "tool_turns": tool_turns,
+        "missed_turns": missed,
+        "miss_rate_pct": round(100 * missed / tool_turns, 1) if tool_turns else 0.0,
+        "entries": len(entries),
+        "entries_with_miss": len(entries_missed),
+    }
+
+
+def print_summary(results, sweep, args, n_tools, approximate, output_file=None):
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    records = results[(args.strategy, args.coverage)]
+    p("# Tool-Schema Pruning — Offline Evaluation")
+    p()
+    p(f"Strategy: **{args.strategy}** | Coverage: **{args.coverage:g}** | Min tools: "
+      f"**{args.min_tools}** | {args.folds}-fold split by task_id"
+      + (" | Counts are **approximate** (no tokenizer installed)" if approximate else ""))
+    p()
+    p("A miss is an agent turn whose tool call would not have had its schema in the prompt.")
+    p()
+    p("| Config | Requests | Tools Kept (of) | Schema Tokens | Pruned | Saved | Tool Turns | Missed | Entries With a Miss |")
+    p("|--------|----------|-----------------|---------------|--------|-------|------------|--------|---------------------|")
+    by_config = defaultdict(list)
+    for r in records:
+        by_config[r[0]].append(r)
+    for label in sorted(by_config):
+        a = aggregate(by_config[label])
+        domain_tools = n_tools.get(label, "?")
+        p(f"| {label} | {a['requests']} | {a['mean_tools_kept']} ({domain_tools}) | "
+          f"{a['schema_tokens_full']:,} | {a['schema_tokens_pruned']:,} | {a['saved_pct']}% | "
+          f"{a['tool_turns']} | {a['missed_turns']} ({a['miss_rate_pct']}%) | "
+          f"{a['entries_with_miss']}/{a['entries']} |")
+    a = aggregate(records)
+    p(f"| **Total** | {a['requests']} | {a['mean_tools_kept']} | {a['schema_tokens_full']:,} | "
+      f"{a['schema_tokens_pruned']:,} | {a['saved_pct']}% | {a['tool_turns']} | "
+      f"{a['missed_turns']} ({a['miss_rate_pct']}%) | {a['entries_with_miss']}/{a['entries']} |")
+    p()
+
+    if sweep:
+        p("## Coverage Sweep (all configs)")
+        p()
+        p("| Strategy | Coverage | Tools Kept | Saved | Miss Rate | Entries With a Miss |")
+        p("|----------|----------|------------|-------|-----------|---------------------|")
+        for strategy, coverage in sweep:
+            a = aggregate(results[(strategy, coverage)])
+            p(f"| {strategy} | {coverage:g} | {a['mean_tools_kept']} | {a['saved_pct']}% | "
+              f"{a['miss_rate_pct']}% | {a['entries_with_miss']}/{a['entries']} |")
+        p()
+
+    misses = Counter(n for r in records for n in r[8])
+    if misses:
+        p("## Most Often Missing Tools")
+        p()
+        p("| Tool | Missed Turns |")
+        p("|------|--------------|")
+        for name, n in misses.most_common(10):
+            p(f"| {name} | {n} |")
+        p()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Evaluate tool-schema pruning on stored tau-bench trajectories."
+    )
+    parser.add_argument(
+        "--trajectory-dir", type=str, default=None,
+        help="Path to trajectory directory. Default: auto-detect from script location.",
+    )
+    parser.add_argument(
+        "--model-size", type=str, default=None, choices=["4b", "8b", "14b", "32b"],
+        help="Filter to a specific model size (e.g., 14b). Default: all sizes.",
+    )
+    parser.add_argument(
+        "--strategy", type=str, default="both", choices=STRATEGIES,
+        help="How to predict the needed tools (default: both)",
+    )
+    parser.add_argument(
+        "--coverage", type=float, default=0.95,
+        help="Keep tools until their probabilities sum to this (default: 0.95)",
+    )
+    parser.add_argument(
+        "--min-tools", type=int, default=3,
+        help="Minimum number of predicted tools kept per request (default: 3)",
+    )
+    parser.add_argument(
+        "--folds", type=int, default=5,
+        help="Train/test folds over task_id (default: 5)",
+    )
+    parser.add_argument(
+        "--no-sweep", action="store_true",
+        help="Skip the strategy x coverage sweep.",
+    )
+    parser.add_argument(
+        "--tokenizer", type=str, default="Qwen/Qwen3-14B",
+        help="HF tokenizer name or local path (default: Qwen/Qwen3-14B)",
+    )
+    parser.add_argument(
+        "--save-model", type=str, default=None,
+        help="Fit on all trajectories and save the model for ToolPruner.load().",
+    )
+    parser.add_argument(
+        "--output", type=str, default=None,
+        help="Save markdown output to a file instead of printing to stdout.",
+    )
+    parser.add_argument(
+        "--json-output", type=str, default=None,
+        help="Save per-request results to a JSON file.",
+    )
+    args = parser.parse_args()
+
+    if args.trajectory_dir:
+        traj_dir = Path(args.trajectory_dir)
+    else:
+        script_dir = Path(__file__).resolve().parent
+        traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories"
+        if not traj_dir.exists():
+            traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories "
+    if not traj_dir.exists():
+        print(f"ERROR: Trajectory directory not found: {traj_dir}")
+        sys.exit(1)
+
+    files = discover_files(traj_dir, args.model_size)
+    print(f"Found {len(files)} trajectory file(s)")
+    if not files:
+        sys.exit(1)
+
+    corpus, catalogs = load_corpus(files)
+    n_tools = {}
+    for filepath, config in files:
+        n_tools[config["config_label"]] = len(catalogs.get(config["domain"]) or [])
+
+    if args.save_model:
+        pruner = ToolPruner().fit(traj for entries in corpus.values() for *_, traj in entries)
+        pruner.save(args.save_model)
+        print(f"Saved tool model to {args.save_model}")
+
+    encode, approximate = load_tokenizer(args.tokenizer)
+    configs = [(args.strategy, args.coverage)]
+    sweep = [] if args.no_sweep else [(s, c) for s in STRATEGIES for c in SWEEP_COVERAGE]
+    pruners = {key: (lambda s=key[0], c=key[1]: ToolPruner(c, args.min_tools, s))
+               for key in dict.fromkeys(configs + sweep)}
+    print(f"Evaluating {len(pruners)} pruner setting(s) over {args.folds} folds...")
+    results = evaluate(corpus, catalogs, args.folds, pruners, encode)
+    print()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            print_summary(results, sweep, args, n_tools, approximate, output_file=f)
+        print(f"Saved markdown to {args.output}")
+    else:
+        print_summary(results, sweep, args, n_tools, approximate)
+
+    if args.json_output:
+        records = results[(args.strategy, args.coverage)]
+        output = {
+            "strategy": args.strategy,
+            "coverage": args.coverage,
+            "min_tools": args.min_tools,
+            "summary": aggregate(records),
+            "sweep": [dict(strategy=s, coverage=c, **aggregate(results[(s, c)])) for s, c in sweep],
+            "requests": [{
+                "config": r[0], "task_id": r[1], "trial": r[2], "turn": r[3],
+                "schema_tokens_full": r[4], "schema_tokens_pruned": r[5],
+                "tools_kept": r[6], "missed": r[8],
+            } for r in records],
+        }
+        with open(args.json_output, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"Saved JSON to {args.json_output}")
+
+
+if __name__ == "__main__":
+    main()
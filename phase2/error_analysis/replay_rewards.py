@@ -0,0 +1,813 @@
+#!/usr/bin/env python3
+"""
+replay_rewards.py — Re-score stored tau-bench trajectories offline.
+
+Replays the tool calls an agent actually made (from `extract_agent_actions`)
+and the ground-truth actions (from `info.task.actions`) against an in-memory
+copy of the airline/retail databases, hashes the resulting state the same
+way tau-bench computes `reward_info.info.gt_data_hash`, and re-derives the
+reward. No vLLM, no GPU — reward-function experiments run in seconds.
+
+How it works:
+─────────────
+1. DATABASE: Two modes.
+   - Real data (--data-dir): loads the tau-bench env JSONs
+     (airline: flights/reservations/users, retail: orders/products/users).
+     Hashes then match the stored gt_data_hash exactly (--verify-hash).
+   - Mock (default): builds a per-trajectory database from the records the
+     agent itself read (get_user_details, get_order_details,
+     get_reservation_details, search_*_flight, ...). Records nobody read
+     become "stub" records that just log the writes applied to them.
+
+2. REPLAY: Write tools are re-implemented with tau-bench's semantics
+   (validation first, then mutation; "Error: ..." means no state change).
+   Read-only tools never mutate state and are skipped. Records are copied
+   on first touch (copy-on-write), so the base database is shared across
+   every replay.
+
+3. HASHING: tau-bench's to_hashable + sha256. Because both the agent run
+   and the ground-truth run start from the same base, comparing the hash
+   of the touched records is equivalent to comparing full-database hashes,
+   and much cheaper. --verify-hash also materializes the full database and
+   checks it against the stored gt_data_hash (real-data mode only).
+
+4. REWARD: r_actions = agent state hash == ground-truth state hash, then
+   every info.task.outputs string must appear in a respond message
+   (lowercased, commas removed). Reward functions are registered in
+   REWARD_FUNCTIONS so experiments can add their own.
+
+5. OUTPUT: Agreement between stored and re-derived rewards per config, the
+   entries that flipped, and replay throughput.
+
+Usage:
+    python replay_rewards.py                                 # mock DB, all files
+    python replay_rewards.py --model-size 14b
+    python replay_rewards.py --data-dir ~/tau-bench/tau_bench/envs --verify-hash
+    python replay_rewards.py --json-output replay.json
+"""
+
+import argparse
+import copy
+import json
+import sys
+import time
+from hashlib import sha256
+from pathlib import Path
+
+from analyze_crashes import discover_files
+from classify_errors import (extract_agent_actions, extract_responses,
+                             iter_tool_results)
+from traj_json import load
+
+# Tables per domain (file names under tau_bench/envs/<domain>/data/)
+DOMAIN_TABLES = {
+    "airline": ["flights", "reservations", "users"],
+    "retail": ["orders", "products", "users"],
+}
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# HASHING
+# Same as tau_bench.envs.base: consistent_hash(to_hashable(data))
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def to_hashable(item):
+    """Convert nested dicts/lists/sets into nested tuples (tau-bench order)."""
+    if isinstance(item, dict):
+        return tuple((key, to_hashable(value)) for key, value in sorted(item.items()))
+    elif isinstance(item, list):
+        return tuple(to_hashable(element) for element in item)
+    elif isinstance(item, set):
+        return tuple(sorted(to_hashable(element) for element in item))
+    return item
+
+
+def consistent_hash(value):
+    return sha256(str(value).encode("utf-8")).hexdigest()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# IN-MEMORY DATABASE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class ToolError(Exception):
+    """Tool rejected the call. tau-bench returns 'Error: ...' and changes nothing."""
+
+
+class MissingRecord(Exception):
+    """Mock mode only: a record the agent never read is needed by a write."""
+
+
+class ReplayDB:
+    """Copy-on-write view over a shared base database.
+
+    base = {"orders": {...}, "users": {...}, ...}. Records are deep-copied
+    into `dirty` the first time a tool touches them, so replays never
+    mutate the base and never pay for copying untouched tables.
+    """
+
+    def __init__(self, base, mock=False):
+        self.base = base
+        self.mock = mock
+        self.dirty = {}
+
+    def has(self, table, key):
+        return (table, key) in self.dirty or key in self.base.get(table, {})
+
+    def get(self, table, key, missing_error=None):
+        k = (table, key)
+        if k in self.dirty:
+            return self.dirty[k]
+        record = self.base.get(table, {}).get(key)
+        if record is None:
+            if self.mock:
+                raise MissingRecord(table, key)
+            raise ToolError(missing_error or f"{table[:-1]} not found")
+        record = copy.deepcopy(record)
+        self.dirty[k] = record
+        return record
+
+    def put(self, table, key, record):
+        self.dirty[(table, key)] = record
+
+    def delta(self):
+        """Records that differ from the base, keyed 'table/key'."""
+        changed = {}
+        for (table, key), record in self.dirty.items():
+            if self.base.get(table, {}).get(key) != record:
+                changed[f"{table}/{key}"] = record
+        return changed
+
+    def materialize(self):
+        """Full database with all writes applied (for exact gt_data_hash)."""
+        data = {table: dict(rows) for table, rows in self.base.items()}
+        for (table, key), record in self.dirty.items():
+            data.setdefault(table, {})[key] = record
+        return data
+
+
+def load_domain_data(data_dir, domain):
+    """Load tau-bench env data: <data_dir>/<domain>/data/<table>.json."""
+    base = Path(data_dir)
+    for candidate in [base / domain / "data", base / domain, base]:
+        if (candidate / f"{DOMAIN_TABLES[domain][0]}.json").exists():
+            data = {}
+            for table in DOMAIN_TABLES[domain]:
+                with open(candidate / f"{table}.json") as f:
+                    data[table] = json.load(f)
+            return data
+    sys.exit(f"ERROR: No {domain} data under {data_dir}")
+
+
+def _parse_output(output):
+    try:
+        return json.loads(output)
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+
+def _seed_flight(flights, flight):
+    if not isinstance(flight, dict) or "flight_number" not in flight:
+        return
+    record = flights.setdefault(flight["flight_number"], {
+        "flight_number": flight["flight_number"],
+        "origin": flight.get("origin"),
+        "destination": flight.get("destination"),
+        "dates": {},
+    })
+    if flight.get("date"):
+        record["dates"].setdefault(flight["date"], {
+            "status": flight.get("status", "available"),
+            "available_seats": flight.get("available_seats", {}),
+            "prices": flight.get("prices", {}),
+        })
+
+
+def seed_from_trajectory(traj, domain):
+    """Build a mock database from the records the agent observed.
+
+    Only reads that happen before the first successful write are used, so
+    every seeded record reflects the pre-run state.
+    """
+    data = {table: {} for table in DOMAIN_TABLES[domain]}
+    write_tools = WRITE_TOOLS[domain]
+    for name, args, output in iter_tool_results(traj):
+        if name in write_tools:
+            if output and not output.startswith("Error"):
+                break
+            continue
+        parsed = _parse_output(output)
+        if parsed is None:
+            continue
+        if name == "get_user_details" and isinstance(parsed, dict):
+            data["users"].setdefault(args.get("user_id"), parsed)
+        elif name == "get_order_details" and isinstance(parsed, dict):
+            data["orders"].setdefault(args.get("order_id"), parsed)
+        elif name == "get_product_details" and isinstance(parsed, dict):
+            data["products"].setdefault(args.get("product_id"), parsed)
+        elif name == "get_reservation_details" and isinstance(parsed, dict):
+            data["reservations"].setdefault(args.get("reservation_id"), parsed)
+        elif name in ("search_direct_flight", "search_onestop_flight") and isinstance(parsed, list):
+            for item in parsed:
+                for flight in (item if isinstance(item, list) else [item]):
+                    flight = dict(flight, date=flight.get("date", args.get("date")))
+                    _seed_flight(data["flights"], flight)
+    return data
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# WRITE TOOLS — RETAIL
+# Ported from tau_bench/envs/retail/tools. Each tool validates everything
+# before mutating anything, so a ToolError leaves the state unchanged.
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _pending_order(db, order_id):
+    order = db.get("orders", order_id, "order not found")
+    if order["status"] != "pending":
+        raise ToolError("non-pending order cannot be modified")
+    return order
+
+
+def _user_payment(db, user_id, payment_method_id):
+    user = db.get("users", user_id, "user not found")
+    if payment_method_id not in user["payment_methods"]:
+        raise ToolError("payment method not found")
+    return user["payment_methods"][payment_method_id]
+
+
+def _swap_items(db, order, item_ids, new_item_ids):
+    """Validate an item swap and return (price_diff, [(item, variant)])."""
+    all_item_ids = [item["item_id"] for item in order["items"]]
+    for item_id in item_ids:
+        if item_ids.count(item_id) > all_item_ids.count(item_id):
+            raise ToolError(f"{item_id} not found")
+    if len(item_ids) != len(new_item_ids):
+        raise ToolError("the number of items to be exchanged should match")
+    diff_price = 0
+    swaps = []
+    for item_id, new_item_id in zip(item_ids, new_item_ids):
+        item = [i for i in order["items"] if i["item_id"] == item_id][0]
+        product = db.get("products", item["product_id"], "product not found")
+        variant = product["variants"].get(new_item_id)
+        if not variant or not variant.get("available"):
+            raise ToolError(f"new item {new_item_id} not found or available")
+        diff_price += variant["price"] - item["price"]
+        swaps.append((item, variant))
+    return round(diff_price, 2), swaps
+
+
+def cancel_pending_order(db, order_id, reason):
+    order = _pending_order(db, order_id)
+    if reason not in ("no longer needed", "ordered by mistake"):
+        raise ToolError("invalid reason")
+    refunds = []
+    for payment in order["payment_history"]:
+        refunds.append({
+            "transaction_type": "refund",
+            "amount": payment["amount"],
+            "payment_method_id": payment["payment_method_id"],
+        })
+    gift_cards = [p for p in order["payment_history"] if "gift_card" in p["payment_method_id"]]
+    methods = {p["payment_method_id"]: _user_payment(db, order["user_id"], p["payment_method_id"])
+               for p in gift_cards}
+    for payment in gift_cards:
+        method = methods[payment["payment_method_id"]]
+        method["balance"] = round(method["balance"] + payment["amount"], 2)
+    order["status"] = "cancelled"
+    order["cancel_reason"] = reason
+    order["payment_history"].extend(refunds)
+    return order
+
+
+def modify_pending_order_address(db, order_id, address1, address2, city, state, country, zip):
+    order = _pending_order(db, order_id)
+    order["address"] = {"address1": address1, "address2": address2, "city": city,
+                        "state": state, "country": country, "zip": zip}
+    return order
+
+
+def modify_user_address(db, user_id, address1, address2, city, state, country, zip):
+    user = db.get("users", user_id, "user not found")
+    user["address"] = {"address1": address1, "address2": address2, "city": city,
+                       "state": state, "country": country, "zip": zip}
+    return user
+
+
+def modify_pending_order_payment(db, order_id, payment_method_id):
+    order = _pending_order(db, order_id)
+    new_method = _user_payment(db, order["user_id"], payment_method_id)
+    history = order["payment_history"]
+    if len(history) > 1 or history[0]["transaction_type"] != "payment":
+        raise ToolError("there should be exactly one payment for a pending order")
+    old_id = history[0]["payment_method_id"]
+    if old_id == payment_method_id:
+        raise ToolError("the new payment method should be different from the current one")
+    amount = history[0]["amount"]
+    if new_method["source"] == "gift_card" and new_method["balance"] < amount:
+        raise ToolError("insufficient gift card balance to pay for the order")
+    old_method = _user_payment(db, order["user_id"], old_id) if "gift_card" in old_id else None
+    history.extend([
+        {"transaction_type": "payment", "amount": amount, "payment_method_id": payment_method_id},
+        {"transaction_type": "refund", "amount": amount, "payment_method_id": old_id},
+    ])
+    if new_method["source"] == "gift_card":
+        new_method["balance"] = round(new_method["balance"] - amount, 2)
+    if old_method is not None:
+        old_method["balance"] = round(old_method["balance"] + amount, 2)
+    return order
+
+
+def modify_pending_order_items(db, order_id, item_ids, new_item_ids, payment_method_id):
+    order = _pending_order(db, order_id)
+    diff_price, swaps = _swap_items(db, order, item_ids, new_item_ids)
+    method = _user_payment(db, order["user_id"], payment_method_id)
+    if method["source"] == "gift_card" and method["balance"] < diff_price:
+        raise ToolError("insufficient gift card balance to pay for the new item")
+    order["payment_history"].append({
+        "transaction_type": "payment" if diff_price > 0 else "refund",
+        "amount": abs(diff_price),
+        "payment_method_id": payment_method_id,
+    })
+    if method["source"] == "gift_card":
+        method["balance"] = round(method["balance"] - diff_price, 2)
+    for item, variant in swaps:
+        item["item_id"] = variant["item_id"]
+        item["price"] = variant["price"]
+        item["options"] = variant["options"]
+    order["status"] = "pending (item modified)"
+    return order
+
+
+def return_delivered_order_items(db, order_id, item_ids, payment_method_id):
+    order = db.get("orders", order_id, "order not found")
+    if order["status"] != "delivered":
+        raise ToolError("non-delivered order cannot be returned")
+    _user_payment(db, order["user_id"], payment_method_id)
+    if ("gift_card" not in payment_method_id
+            and payment_method_id != order["payment_history"][0]["payment_method_id"]):
+        raise ToolError("payment method should be either the original payment method or a gift card")
+    all_item_ids = [item["item_id"] for item in order["items"]]
+    for item_id in item_ids:
+        if item_ids.count(item_id) > all_item_ids.count(item_id):
+            raise ToolError("some item not found")
+    order["status"] = "return requested"
+    order["return_items"] = sorted(item_ids)
+    order["return_payment_method_id"] = payment_method_id
+    return order
+
+
+def exchange_delivered_order_items(db, order_id, item_ids, new_item_ids, payment_method_id):
+    order = db.get("orders", order_id, "order not found")
+    if order["status"] != "delivered":
+        raise ToolError("non-delivered order cannot be exchanged")
+    diff_price, _ = _swap_items(db, order, item_ids, new_item_ids)
+    method = _user_payment(db, order["user_id"], payment_method_id)
+    if method["source"] == "gift_card" and method["balance"] < diff_price:
+        raise ToolError("insufficient gift card balance to pay for the price difference")
+    order["status"] = "exchange requested"
+    order["exchange_items"] = sorted(item_ids)
+    order["exchange_new_items"] = sorted(new_item_ids)
+    order["exchange_payment_method_id"] = payment_method_id
+    order["exchange_price_difference"] = diff_price
+    return order
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# WRITE TOOLS — AIRLINE
+# Ported from tau_bench/envs/airline/tools.
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _flight_date(db, flight_number, date, cabin, n_passengers):
+    flight = db.get("flights", flight_number, f"flight {flight_number} not found")
+    date_data = flight["dates"].get(date)
+    if date_data is None:
+        raise ToolError(f"flight {flight_number} not found on date {date}")
+    if date_data["status"] != "available":
+        raise ToolError(f"flight {flight_number} not available on date {date}")
+    if date_data["available_seats"].get(cabin, 0) < n_passengers:
+        raise ToolError(f"not enough seats on flight {flight_number}")
+    return flight, date_data
+
+
+def _charge(db, user_id, payment_id, amount):
+    """Validate a payment method for `amount`; returns the method dict."""
+    method = _user_payment(db, user_id, payment_id)
+    if method["source"] == "certificate":
+        raise ToolError("certificate cannot be used to update reservation")
+    if method["source"] == "gift_card" and method["amount"] < amount:
+        raise ToolError("gift card balance is not enough")
+    return method
+
+
+def book_reservation(db, user_id, origin, destination, flight_type, cabin, flights,
+                     passengers, payment_methods, total_baggages, nonfree_baggages, insurance):
+    user = db.get("users", user_id, "user not found")
+    reservation_id = "HATHAT"
+    flights = copy.deepcopy(flights)
+    total_price = 0
+    seat_updates = []
+    for flight in flights:
+        flight_data, date_data = _flight_date(
+            db, flight["flight_number"], flight["date"], cabin, len(passengers))
+        flight["price"] = date_data["prices"][cabin]
+        flight["origin"] = flight_data["origin"]
+        flight["destination"] = flight_data["destination"]
+        total_price += flight["price"] * len(passengers)
+        seat_updates.append(date_data)
+    if insurance == "yes":
+        total_price += 30 * len(passengers)
+    total_price += 50 * nonfree_baggages
+
+    paid = 0
+    for payment in payment_methods:
+        method = _user_payment(db, user_id, payment["payment_id"])
+        if method["source"] in ("gift_card", "certificate") and method["amount"] < payment["amount"]:
+            raise ToolError(f"not enough balance in payment method {payment['payment_id']}")
+        paid += payment["amount"]
+    if paid != total_price:
+        raise ToolError(f"payment amount does not add up, total price is {total_price}, but paid {paid}")
+
+    for payment in payment_methods:
+        method = user["payment_methods"][payment["payment_id"]]
+        if method["source"] == "gift_card":
+            method["amount"] -= payment["amount"]
+        elif method["source"] == "certificate":
+            del user["payment_methods"][payment["payment_id"]]
+    for date_data in seat_updates:
+        date_data["available_seats"][cabin] -= len(passengers)
+
+    reservation = {
+        "reservation_id": reservation_id, "user_id": user_id, "origin": origin,
+        "destination": destination, "flight_type": flight_type, "cabin": cabin,
+        "flights": flights, "passengers": passengers, "payment_history": payment_methods,
+        "created_at": "2024-05-15T15:00:00", "total_baggages": total_baggages,
+        "nonfree_baggages": nonfree_baggages, "insurance": insurance,
+    }
+    db.put("reservations", reservation_id, reservation)
+    user.setdefault("reservations", []).append(reservation_id)
+    return reservation
+
+
+def cancel_reservation(db, reservation_id):
+    reservation = db.get("reservations", reservation_id, "reservation not found")
+    refunds = [{"payment_id": p["payment_id"], "amount": -p["amount"]}
+               for p in reservation["payment_history"]]
+    reservation["payment_history"].extend(refunds)
+    reservation["status"] = "cancelled"
+    return reservation
+
+
+def update_reservation_baggages(db, reservation_id, total_baggages, nonfree_baggages, payment_id):
+    reservation = db.get("reservations", reservation_id, "reservation not found")
+    total_price = 50 * max(0, nonfree_baggages - reservation["nonfree_baggages"])
+    method = _charge(db, reservation["user_id"], payment_id, total_price)
+    reservation["total_baggages"] = total_baggages
+    reservation["nonfree_baggages"] = nonfree_baggages
+    if method["source"] == "gift_card":
+        method["amount"] -= total_price
+    if total_price != 0:
+        reservation["payment_history"].append({"payment_id": payment_id, "amount": total_price})
+    return reservation
+
+
+def update_reservation_flights(db, reservation_id, cabin, flights, payment_id):
+    reservation = db.get("reservations", reservation_id, "reservation not found")
+    n_passengers = len(reservation["passengers"])
+    flights = copy.deepcopy(flights)
+    total_price = 0
+    for flight in flights:
+        existing = [f for f in reservation["flights"]
+                    if f["flight_number"] == flight["flight_number"]
+                    and f["date"] == flight["date"] and cabin == reservation["cabin"]]
+        if existing:
+            flight.update(price=existing[0]["price"], origin=existing[0]["origin"],
+                          destination=existing[0]["destination"])
+        else:
+            flight_data, date_data = _flight_date(
+                db, flight["flight_number"], flight["date"], cabin, n_passengers)
+            flight.update(price=date_data["prices"][cabin], origin=flight_data["origin"],
+                          destination=flight_data["destination"])
+        total_price += flight["price"] * n_passengers
+    total_price -= sum(f["price"] for f in reservation["flights"]) * n_passengers
+
+    method = _charge(db, reservation["user_id"], payment_id, total_price)
+    if total_price != 0:
+        reservation["payment_history"].append({"payment_id": payment_id, "amount": total_price})
+    if method["source"] == "gift_card":
+        method["amount"] -= total_price
+    reservation["flights"] = flights
+    reservation["cabin"] = cabin
+    return reservation
+
+
+def update_reservation_passengers(db, reservation_id, passengers):
+    reservation = db.get("reservations", reservation_id, "reservation not found")
+    if len(passengers) != len(reservation["passengers"]):
+        raise ToolError("number of passengers does not match")
+    reservation["passengers"] = passengers
+    return reservation
+
+
+def send_certificate(db, user_id, amount):
+    user = db.get("users", user_id, "user not found")
+    for cert_id in [3221322, 9564315, 1234567]:
+        payment_id = f"certificate_{cert_id}"
+        if payment_id not in user["payment_methods"]:
+            user["payment_methods"][payment_id] = {
+                "source": "certificate", "amount": amount, "id": payment_id,
+            }
+            return user
+    raise ToolError("too many certificates")
+
+
+# tool name -> (function, primary table, primary key argument)
+# The primary record is where mock mode logs writes it cannot resolve.
+WRITE_TOOLS = {
+    "retail": {
+        "cancel_pending_order": (cancel_pending_order, "orders", "order_id"),
+        "modify_pending_order_address": (modify_pending_order_address, "orders", "order_id"),
+        "modify_pending_order_items": (modify_pending_order_items, "orders", "order_id"),
+        "modify_pending_order_payment": (modify_pending_order_payment, "orders", "order_id"),
+        "modify_user_address": (modify_user_address, "users", "user_id"),
+        "return_delivered_order_items": (return_delivered_order_items, "orders", "order_id"),
+        "exchange_delivered_order_items": (exchange_delivered_order_items, "orders", "order_id"),
+    },
+    "airline": {
+        "book_reservation": (book_reservation, "reservations", None),
+        "cancel_reservation": (cancel_reservation, "reservations", "reservation_id"),
+        "update_reservation_baggages": (update_reservation_baggages, "reservations", "reservation_id"),
+        "update_reservation_flights": (update_reservation_flights, "reservations", "reservation_id"),
+        "update_reservation_passengers": (update_reservation_passengers, "reservations", "reservation_id"),
+        "send_certificate": (send_certificate, "users", "user_id"),
+    },
+}
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# REPLAY & REWARD
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def apply_action(db, domain, name, kwargs):
+    """Run one tool call. Returns 'ok', 'error', 'stub' or 'read'."""
+    spec = WRITE_TOOLS[domain].get(name)
+    if spec is None:
+        return "read"
+    func, table, key_arg = spec
+    kwargs = kwargs if isinstance(kwargs, dict) else {}
+    snapshot = dict(db.dirty)
+    try:
+        func(db, **copy.deepcopy(kwargs))
+        return "ok"
+    except (ToolError, TypeError, KeyError, IndexError, AttributeError):
+        db.dirty = snapshot
+        return "error"
+    except MissingRecord:
+        # Mock mode: the record was never observed. Log the write on a stub
+        # so identical calls on both sides still produce identical states.
+        db.dirty = snapshot
+        key = kwargs.get(key_arg) if key_arg else "HATHAT"
+        record = db.get(table, key) if db.has(table, key) else {"_stub": True}
+        db.put(table, key, record)
+        record.setdefault("_writes", []).append(
+            [name, json.dumps(kwargs, sort_keys=True)])
+        return "stub"
+
+
+def replay(base, domain, actions, mock=False):
+    """Replay a list of {"name", "arguments"|"kwargs"} actions. Returns (db, counts)."""
+    db = ReplayDB(base, mock=mock)
+    counts = {"ok": 0, "error": 0, "stub": 0, "read": 0}
+    for action in actions:
+        kwargs = action.get("kwargs", action.get("arguments", {}))
+        counts[apply_action(db, domain, action.get("name"), kwargs)] += 1
+    return db, counts
+
+
+def tau_bench_reward(agent_hash, gt_hash, outputs, responses):
+    """Default reward: state hashes must match, then all outputs must be said."""
+    r_actions = 1.0 if agent_hash == gt_hash else 0.0
+    info = {"r_actions": r_actions}
+    reward = r_actions
+    if outputs:
+        said = [r.lower().replace(",", "") for r in responses]
+        found = {o: any(o.lower() in r for r in said) for o in outputs}
+        info["r_outputs"] = 1.0 if all(found.values()) else 0.0
+        info["outputs"] = found
+        reward = min(reward, info["r_outputs"])
+    return reward, info
+
+
+def actions_only_reward(agent_hash, gt_hash, outputs, responses):
+    """Ablation: ignore required outputs, score on database state alone."""
+    return (1.0 if agent_hash == gt_hash else 0.0), {}
+
+
+REWARD_FUNCTIONS = {
+    "tau_bench": tau_bench_reward,
+    "actions_only": actions_only_reward,
+}
+
+
+def replay_entry(entry, domain, base=None, reward_fn=tau_bench_reward,
+                 verify_hash=False, gt_cache=None):
+    """Re-derive the reward for one trajectory entry.
+
+    base=None means mock mode (database seeded from the trajectory itself).
+    gt_cache memoizes ground-truth replays in real-data mode, where the
+    result only depends on the task's action list.
+    """
+    traj = entry.get("traj", [])
+    task = entry["info"]["task"]
+    mock = base is None
+    if mock:
+        base = seed_from_trajectory(traj, domain)
+
+    gt_actions = task.get("actions", [])
+    gt_key = json.dumps(gt_actions, sort_keys=True) if not mock else None
+    if gt_cache is not None and gt_key in gt_cache:
+        gt_delta_hash, gt_full_hash = gt_cache[gt_key]
+        gt_stubs = 0
+    else:
+        gt_db, gt_counts = replay(base, domain, gt_actions, mock=mock)
+        gt_stubs = gt_counts["stub"]
+        gt_delta_hash = consistent_hash(to_hashable(gt_db.delta()))
+        gt_full_hash = (consistent_hash(to_hashable(gt_db.materialize()))
+                        if verify_hash and not mock else None)
+        if gt_cache is not None and not mock:
+            gt_cache[gt_key] = (gt_delta_hash, gt_full_hash)
+
+    agent_db, counts = replay(base, domain, extract_agent_actions(traj), mock=mock)
+    agent_delta_hash = consistent_hash(to_hashable(agent_db.delta()))
+
+    reward, info = reward_fn(agent_delta_hash, gt_delta_hash, task.get("outputs", []),
+                             extract_responses(traj))
+    result = {
+        "task_id": entry.get("task_id"),
+        "trial": entry.get("trial"),
+        "stored_reward": entry.get("reward"),
+        "replayed_reward": reward,
+        "info": info,
+        "tool_calls": counts,
+        # Stub writes assume the call succeeded; the real tool may have
+        # rejected it, so these rewards are best-effort, not exact.
+        "approximate": bool(gt_stubs or counts["stub"]),
+    }
+    if gt_full_hash is not None:
+        stored = entry["info"].get("reward_info", {}).get("info", {}).get("gt_data_hash")
+        result["gt_data_hash"] = gt_full_hash
+        result["hash_verified"] = stored is None or stored == gt_full_hash
+    return result
+
+
+def replay_file(filepath, config, data=None, reward_fn=tau_bench_reward, verify_hash=False):
+    """Replay every scorable entry in one trajectory file."""
+    entries = load(filepath)
+    gt_cache = {}
+    results = []
+    for entry in entries:
+        if "task" not in entry.get("info", {}) or not entry.get("traj"):
+            continue  # crashed run — nothing to replay
+        result = replay_entry(entry, config["domain"], data, reward_fn, verify_hash, gt_cache)
+        result["config_label"] = config["config_label"]
+        results.append(result)
+    return results
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# OUTPUT
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def print_summary(per_config, elapsed, mock, output_file=None):
+    """Print markdown agreement tables."""
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    all_results = [r for results in per_config.values() for r in results]
+    n = len(all_results)
+    p("# Offline Reward Replay")
+    p()
+    p(f"Database: **{'mock (seeded from trajectories)' if mock else 'tau-bench env data'}** | "
+      f"Replayed **{n} entries** in {elapsed:.2f}s "
+      f"({n / elapsed if elapsed > 0 else 0:,.0f} entries/s)")
+    p()
+    p("| Config | Entries | Stored Pass | Replayed Pass | Agree | Flipped | Approximate |")
+    p("|--------|---------|-------------|---------------|-------|---------|-------------|")
+    for label, results in per_config.items():
+        stored = sum(1 for r in results if r["stored_reward"] == 1.0)
+        replayed = sum(1 for r in results if r["replayed_reward"] == 1.0)
+        agree = sum(1 for r in results if r["stored_reward"] == r["replayed_reward"])
+        approx = sum(1 for r in results if r["approximate"])
+        rate = f"{agree / len(results) * 100:.1f}%" if results else "N/A"
+        p(f"| {label} | {len(results)} | {stored} | {replayed} | {rate} | "
+          f"{len(results) - agree} | {approx} |")
+    p()
+
+    flipped = [r for r in all_results if r["stored_reward"] != r["replayed_reward"]]
+    if flipped:
+        p("## Flipped Entries")
+        p()
+        p("| Config | Task ID | Trial | Stored | Replayed | Approximate | Info |")
+        p("|--------|---------|-------|--------|----------|-------------|------|")
+        for r in flipped:
+            p(f"| {r['config_label']} | {r['task_id']} | {r['trial']} | "
+              f"{r['stored_reward']} | {r['replayed_reward']} | "
+              f"{'yes' if r['approximate'] else 'no'} | {json.dumps(r['info'])} |")
+        p()
+
+    verified = [r for r in all_results if "hash_verified" in r]
+    if verified:
+        ok = sum(1 for r in verified if r["hash_verified"])
+        p(f"**gt_data_hash verified:** {ok}/{len(verified)}")
+        p()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Re-score tau-bench trajectories offline by replaying tool calls."
+    )
+    parser.add_argument(
+        "--trajectory-dir", type=str, default=None,
+        help="Path to trajectory directory. Default: auto-detect from script location.",
+    )
+    parser.add_argument(
+        "--model-size", type=str, default=None, choices=["4b", "8b", "14b", "32b"],
+        help="Filter to a specific model size (e.g., 14b). Default: all sizes.",
+    )
+    parser.add_argument(
+        "--data-dir", type=str, default=None,
+        help="tau-bench envs directory with airline/ and retail/ data. Default: mock DB.",
+    )
+    parser.add_argument(
+        "--reward", default="tau_bench", choices=sorted(REWARD_FUNCTIONS),
+        help="Reward function to re-derive (default: tau_bench)",
+    )
+    parser.add_argument(
+        "--verify-hash", action="store_true",
+        help="Also recompute the full gt_data_hash and compare to the stored one (needs --data-dir)",
+    )
+    parser.add_argument(
+        "--output", type=str, default=None,
+        help="Save markdown output to a file instead of printing to stdout.",
+    )
+    parser.add_argument(
+        "--json-output", type=str, default=None,
+        help="Save per-entry replay results to a JSON file.",
+    )
+    args = parser.parse_args()
+
+    if args.trajectory_dir:
+        traj_dir = Path(args.trajectory_dir)
+    else:
+        script_dir = Path(__file__).resolve().parent
+        traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories"
+        if not traj_dir.exists():
+            traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories "
+    if not traj_dir.exists():
+        print(f"ERROR: Trajectory directory not found: {traj_dir}")
+        sys.exit(1)
+    if args.verify_hash and not args.data_dir:
+        sys.exit("ERROR: --verify-hash needs --data-dir (mock hashes never match)")
+
+    files = discover_files(traj_dir, args.model_size)
+    print(f"Found {len(files)} trajectory file(s)")
+    if not files:
+        sys.exit(1)
+
+    reward_fn = REWARD_FUNCTIONS[args.reward]
+    domain_data = {}
+    per_config = {}
+    start = time.perf_counter()
+    for filepath, config in files:
+        domain = config["domain"]
+        if domain not in DOMAIN_TABLES:
+            print(f"  Skipping {filepath.name} (unknown domain)")
+            continue
+        data = None
+        if args.data_dir:
+            if domain not in domain_data:
+                domain_data[domain] = load_domain_data(args.data_dir, domain)
+            data = domain_data[domain]
+        print(f"  Replaying {config['config_label']}: {filepath.name}")
+        per_config.setdefault(config["config_label"], []).extend(
+            replay_file(filepath, config, data, reward_fn, args.verify_hash))
+    elapsed = time.perf_counter() - start
+    print()
+
+    mock = args.data_dir is None
+    if args.output:
+        with open(args.output, "w") as f:
+            print_summary(per_config, elapsed, mock, output_file=f)
+        print(f"Saved markdown to {args.output}")
+    else:
+        print_summary(per_config, elapsed, mock)
+
+    if args.json_output:
+        with open(args.json_output, "w") as f:
+            json.dump(per_config, f, indent=2)
+        print(f"Saved JSON to {args.json_output}")
+
+
+if __name__ == "__main__":
+    main()
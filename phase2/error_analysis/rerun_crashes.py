@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+rerun_crashes.py — Re-run only the crashed entries of a config and splice
+the results back into the original trajectory file.
+
+analyze_crashes.py finds crashed entries (`info.error`, empty `traj`), but
+until now the only fix was to re-run the whole config through tau-bench
+(250+ agent runs). This script re-runs just the crashed (task_id, trial)
+pairs.
+
+How it works:
+─────────────
+1. MANIFEST (`manifest`): Scans the trajectory files with
+   analyze_crashes.scan_file. For every config with crashes it records:
+   - the file, its size and sha256;
+   - each crashed (task_id, trial) with crash_type, tokens_used, token_limit
+     and the error;
+   - the tau-bench commands that re-run exactly those tasks, each writing
+     to reruns/{original subdirectory}/.
+   tau-bench numbers a re-run's trials from 0, so tasks that crashed k times
+   are batched into one `--task-ids ... --num-trials k` command. The
+   commands add up to one agent run per crash.
+
+2. MERGE (`merge`): Takes the manifest and the result files of the
+   re-runs. Each re-run file is matched to its config by its path, like
+   analyze_crashes does. Each crashed slot takes the next successful re-run
+   entry of the same task_id, which is renumbered to the slot's trial.
+   Re-runs that crashed again are left out and reported. The slot keeps
+   its crash and can be re-run once more.
+
+3. ATOMIC WRITE: Before touching a trajectory file, merge checks that its
+   sha256 still matches the manifest. It then writes the spliced list with
+   json.dump(indent=2) to a temp file in the same directory, fsyncs it and
+   os.replace()s it over the original. Readers see either the old file or
+   the new one, never a partial write. The original is kept as
+   FILE.json.bak unless --no-backup.
+
+Usage:
+    python rerun_crashes.py manifest                           # all crashes -> rerun_manifest.json
+    python rerun_crashes.py manifest --model-size 14b --crash-type context_window
+    python rerun_crashes.py manifest --model-provider hosted_vllm --user-model-provider hosted_vllm
+    python rerun_crashes.py merge --manifest rerun_manifest.json reruns/
+    python rerun_crashes.py merge --manifest rerun_manifest.json --dry-run reruns/ RERUN.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shlex
+import shutil
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from analyze_crashes import discover_files, parse_config_from_path, scan_file
+import traj_archive
+from traj_json import TRAJ_SUFFIXES, TrajectoryFile, load, unique_runs
+
+# tau-bench --agent-strategy for each config strategy label
+AGENT_STRATEGIES = {"ACT": "act", "ReAct": "react", "FC": "tool-calling"}
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def default_trajectory_dir():
+    script_dir = Path(__file__).resolve().parent
+    candidate = script_dir.parent.parent / "phase1" / "JSON_trajectories"
+    if not candidate.exists():
+        # Try with trailing space (known issue)
+        candidate = script_dir.parent.parent / "phase1" / "JSON_trajectories "
+    return candidate
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# MANIFEST
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def parse_run_name(filepath):
+    """Model names and temperature from a tau-bench results file name.
+
+    tau-bench names results like
+    "{strategy}-{model}-{temperature}_range_{start}--{end}_user-{user_model}-{user_strategy}_{time}.json".
+    """
+    match = re.match(r"(?:[a-z]+_)?(act|react|tool-calling)-(.+)-([\d.]+)_range_-?\d+--?\d+"
+                     r"_user-(.+)-([a-z]+)_\d+$", Path(filepath).stem)
+    if not match:
+        return {}
+    return {"model": match.group(2), "temperature": match.group(3),
+            "user_model": match.group(4), "user_strategy": match.group(5)}
+
+
+def rerun_dir_name(filepath, config):
+    """The original subdirectory name (e.g. react_airline_trials5_qwen_14b), or one built from config."""
+    parent = Path(filepath).parent.name
+    if config["domain"] in parent.lower():
+        return parent
+    strategy = AGENT_STRATEGIES.get(config["strategy"], config["strategy"].lower())
+    return f"{strategy}_{config['domain']}_qwen_{config['model_size'].lower()}"
+
+
+def rerun_commands(filepath, config, task_trials, args):
+    """tau-bench commands that re-run each crashed (task_id, trial) exactly once.
+
+    task_trials maps task_id -> crashed trials. Tasks with the same number of
+    crashed trials share one command. Results go to a --log-dir subdirectory
+    named after the original one, since tau-bench's file names don't include
+    the domain.
+    """
+    run = parse_run_name(filepath)
+    by_count = defaultdict(list)
+    for task_id, trials in sorted(task_trials.items()):
+        by_count[len(trials)].append(task_id)
+
+    commands = []
+    for count, task_ids in sorted(by_count.items()):
+        cmd = [
+            "python", "run.py",
+            "--env", config["domain"],
+            "--agent-strategy", AGENT_STRATEGIES.get(config["strategy"], config["strategy"].lower()),
+            "--model", args.model_prefix + run.get("model", "MODEL"),
+            "--model-provider", args.model_provider,
+            "--user-model", args.model_prefix + run.get("user_model", "USER_MODEL"),
+            "--user-model-provider", args.user_model_provider,
+            "--user-strategy", run.get("user_strategy", "llm"),
+            "--temperature", run.get("temperature", "0.0"),
+            "--num-trials", str(count),
+            "--task-ids", *[str(t) for t in task_ids],
+            "--log-dir", f"{args.log_dir}/{rerun_dir_name(filepath, config)}",
+        ]
+        commands.append({"num_trials": count, "task_ids": task_ids, "agent_runs": count * len(task_ids),
+                         "command": shlex.join(cmd)})
+    return commands
+
+
+def build_manifest(files, args):
+    """Scan files and return the manifest dict (configs without matching crashes are left out)."""
+    configs = []
+    for filepath, config in files:
+        result = scan_file(filepath, config)
+        crashes = [c for c in result["crashes"]
+                   if not args.crash_type or c.crash_type in args.crash_type]
+        if not crashes:
+            continue
+        task_trials = defaultdict(list)
+        for c in crashes:
+            task_trials[c.task_id].append(c.trial)
+        tokens = [c.tokens_used for c in crashes if c.tokens_used is not None]
+        configs.append({
+            "config_label": config["config_label"],
+            "model_size": config["model_size"],
+            "strategy": config["strategy"],
+            "domain": config["domain"],
+            "file": str(filepath),
+            "size_bytes": filepath.stat().st_size,
+            "sha256": file_sha256(filepath),
+            "total_entries": result["total_entries"],
+            "max_tokens_used": max(tokens) if tokens else None,
+            "crashes": [{
+                "task_id": c.task_id,
+                "trial": c.trial,
+                "crash_type": c.crash_type,
+                "tokens_used": c.tokens_used,
+                "token_limit": c.token_limit,
+                "error_short": c.error_short,
+            } for c in sorted(crashes, key=lambda c: (c.task_id, c.trial))],
+            "commands": rerun_commands(filepath, config, task_trials, args),
+        })
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "trajectory_dir": str(args.trajectory_dir),
+        "crash_types": args.crash_type or "all",
+        "total_crashes": sum(len(c["crashes"]) for c in configs),
+        "total_entries": sum(c["total_entries"] for c in configs),
+        "configs": configs,
+    }
+
+
+def print_manifest(manifest, output_file=None):
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    p("# Re-run Manifest")
+    p()
+    p(f"**{manifest['total_crashes']} crashed entries** in {len(manifest['configs'])} config(s) "
+      f"— {manifest['total_crashes']} agent runs instead of {manifest['total_entries']}.")
+    p()
+    if not manifest["configs"]:
+        return
+    p("| Config | Crashes | Entries | Max Tokens Used | Task IDs |")
+    p("|--------|---------|---------|-----------------|----------|")
+    for c in manifest["configs"]:
+        task_ids = sorted({x["task_id"] for x in c["crashes"]})
+        p(f"| {c['config_label']} | {len(c['crashes'])} | {c['total_entries']} "
+          f"| {c['max_tokens_used'] or '-'} | {', '.join(map(str, task_ids))} |")
+    p()
+    p("## Commands (run from the tau-bench checkout)")
+    p()
+    p("```bash")
+    for c in manifest["configs"]:
+        p(f"# {c['config_label']}")
+        for cmd in c["commands"]:
+            p(cmd["command"])
+    p("```")
+    p()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# MERGE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def expand_paths(paths):
+    """Files as given; directories are searched for *.json / *.tjz (backups/temp files are skipped)."""
+    for path in map(Path, paths):
+        if path.is_dir():
+            yield from unique_runs(sorted(p for p in path.rglob("*") if p.suffix in TRAJ_SUFFIXES))
+        else:
+            yield path
+
+
+def load_reruns(paths):
+    """config_label -> task_id -> successful re-run entries (in trial order), plus still-crashed counts."""
+    reruns = defaultdict(lambda: defaultdict(list))
+    recrashed = defaultdict(int)
+    for path in expand_paths(paths):
+        label = parse_config_from_path(Path(path))["config_label"]
+        with TrajectoryFile(path) as data:
+            for entry in data:
+                if entry.has("info", "error") or not entry.length("traj"):
+                    recrashed[label] += 1
+                    continue
+                reruns[label][entry.get("task_id")].append(entry.to_dict())
+    for tasks in reruns.values():
+        for entries in tasks.values():
+            entries.sort(key=lambda e: e.get("trial", 0))
+    return reruns, recrashed
+
+
+def splice(entries, crashes, task_reruns):
+    """Replace crashed slots in entries (in place). Returns (merged, missing) slot lists."""
+    index = {(e.get("task_id"), e.get("trial")): i for i, e in enumerate(entries)}
+    merged, missing = [], []
+    for crash in crashes:
+        slot = (crash["task_id"], crash["trial"])
+        i = index.get(slot)
+        if i is None or "error" not in entries[i].get("info", {}):
+            continue  # no longer crashed (already merged)
+        candidates = task_reruns.get(crash["task_id"])
+        if not candidates:
+            missing.append(slot)
+            continue
+        entries[i] = dict(candidates.pop(0), trial=crash["trial"])
+        merged.append(slot)
+    return merged, missing
+
+
+def atomic_write_json(path, data, backup=True):
+    """Write data as indent=2 JSON (or a .tjz archive) to path via temp file + fsync + os.replace."""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    archive = path.suffix == traj_archive.SUFFIX
+    with open(tmp_path, "wb" if archive else "w") as f:
+        if archive:
+            traj_archive.write_entries(f, data, source=path.name)
+        else:
+            json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    if backup:
+        bak = path.with_name(path.name + ".bak")
+        if not bak.exists():
+            try:
+                os.link(path, bak)  # the old inode survives the replace: no copy needed
+            except OSError:
+                shutil.copy2(path, bak)
+    os.replace(tmp_path, path)
+    # Make the rename itself durable
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def merge(manifest, rerun_paths, dry_run=False, backup=True, force=False):
+    reruns, recrashed = load_reruns(rerun_paths)
+    report = []
+    for config in manifest["configs"]:
+        label = config["config_label"]
+        path = Path(config["file"])
+        row = {"config_label": label, "file": str(path), "crashes": len(config["crashes"]),
+               "merged": 0, "missing": [], "recrashed": recrashed.get(label, 0), "status": ""}
+        report.append(row)
+        if label not in reruns:
+            row["missing"] = [(c["task_id"], c["trial"]) for c in config["crashes"]]
+            row["status"] = "no re-run results"
+            continue
+        if not path.exists():
+            row["status"] = "trajectory file missing"
+            continue
+        if not force and file_sha256(path) != config["sha256"]:
+            row["status"] = "file changed since manifest (use --force)"
+            continue
+
+        entries = load(path)
+        merged, missing = splice(entries, config["crashes"], reruns[label])
+        row["merged"], row["missing"] = len(merged), missing
+        if not merged:
+            row["status"] = "nothing to merge"
+            continue
+        if dry_run:
+            row["status"] = "dry run"
+            continue
+        atomic_write_json(path, entries, backup)
+        row["status"] = "merged"
+    return report
+
+
+def print_merge_report(report, output_file=None):
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    p("# Re-run Merge")
+    p()
+    p("| Config | Crashes | Merged | Still Missing | Re-crashed | Status |")
+    p("|--------|---------|--------|---------------|------------|--------|")
+    for r in report:
+        missing = ", ".join(f"{t}/{tr}" for t, tr in r["missing"]) or "-"
+        p(f"| {r['config_label']} | {r['crashes']} | {r['merged']} | {missing} "
+          f"| {r['recrashed']} | {r['status']} |")
+    p()
+    p(f"Merged {sum(r['merged'] for r in report)} of {sum(r['crashes'] for r in report)} crashed entries.")
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CLI
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Re-run only crashed trajectory entries and merge the results back."
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    mp = sub.add_parser("manifest", help="List crashed (config, task_id, trial) + re-run commands")
+    mp.add_argument(
+        "--trajectory-dir", type=str, default=None,
+        help="Path to trajectory directory. Default: auto-detect from script location.",
+    )
+    mp.add_argument(
+        "--model-size", type=str, default=None, choices=["4b", "8b", "14b", "32b"],
+        help="Filter to a specific model size (e.g., 14b). Default: all sizes.",
+    )
+    mp.add_argument(
+        "--crash-type", action="append", default=None,
+        choices=["context_window", "api_timeout", "other"],
+        help="Only crashes of this type (repeatable). Default: all.",
+    )
+    mp.add_argument(
+        "--output", type=str, default="rerun_manifest.json",
+        help="Manifest path. Default: rerun_manifest.json",
+    )
+    mp.add_argument(
+        "--markdown", type=str, default=None,
+        help="Also save the markdown summary + commands to this file.",
+    )
+    mp.add_argument(
+        "--model-prefix", type=str, default="Qwen/",
+        help="Prefix added to the model names parsed from file names. Default: Qwen/",
+    )
+    mp.add_argument(
+        "--model-provider", type=str, default="openai",
+        help="tau-bench --model-provider of the original runs. Default: openai",
+    )
+    mp.add_argument(
+        "--user-model-provider", type=str, default="openai",
+        help="tau-bench --user-model-provider of the original runs. Default: openai",
+    )
+    mp.add_argument(
+        "--log-dir", type=str, default="reruns",
+        help="tau-bench --log-dir root for the re-runs (one subdirectory per config). Default: reruns",
+    )
+
+    gp = sub.add_parser("merge", help="Splice re-run results into the original trajectory files")
+    gp.add_argument(
+        "reruns", nargs="+",
+        help="tau-bench result files of the re-runs, or directories of them (e.g. reruns/)",
+    )
+    gp.add_argument(
+        "--manifest", type=str, default="rerun_manifest.json",
+        help="Manifest written by `manifest`. Default: rerun_manifest.json",
+    )
+    gp.add_argument(
+        "--dry-run", action="store_true",
+        help="Report what would be merged without writing anything.",
+    )
+    gp.add_argument(
+        "--no-backup", action="store_true",
+        help="Don't keep the original as FILE.json.bak.",
+    )
+    gp.add_argument(
+        "--force", action="store_true",
+        help="Merge even if a trajectory file changed since the manifest was made.",
+    )
+    gp.add_argument(
+        "--json-output", type=str, default=None,
+        help="Save the merge report to a JSON file.",
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "merge":
+        with open(args.manifest) as f:
+            manifest = json.load(f)
+        report = merge(manifest, args.reruns, args.dry_run, not args.no_backup, args.force)
+        print_merge_report(report)
+        if args.json_output:
+            with open(args.json_output, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Saved JSON to {args.json_output}")
+        if any(r["status"].startswith(("file changed", "trajectory file missing")) for r in report):
+            sys.exit(1)
+        return
+
+    args.trajectory_dir = Path(args.trajectory_dir) if args.trajectory_dir else default_trajectory_dir()
+    if not args.trajectory_dir.exists():
+        print(f"ERROR: Trajectory directory not found: {args.trajectory_dir}")
+        sys.exit(1)
+
+    files = discover_files(args.trajectory_dir, args.model_size)
+    print(f"Scanning {len(files)} trajectory file(s) in {args.trajectory_dir}")
+    manifest = build_manifest(files, args)
+    with open(args.output, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print()
+    print_manifest(manifest)
+    if args.markdown:
+        with open(args.markdown, "w") as f:
+            print_manifest(manifest, output_file=f)
+        print(f"Saved markdown to {args.markdown}")
+    print(f"Saved manifest to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
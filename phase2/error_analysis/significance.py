@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+significance.py — Vectorized significance tests between every pair of configs.
+
+compute_summary and the pass^k tables give point percentages. This script
+adds uncertainty to them: bootstrap confidence intervals and permutation
+p-values for every pair of configs, with a multiple-comparison correction
+over the whole family of tests. Every test runs as a handful of NumPy
+matrix operations over all pairs at once: 24 configs x 10k resamples take
+about a second.
+
+How it works:
+─────────────
+1. REWARDS (paired by task): Each config becomes a vector of per-task scores.
+   The score is tau-bench's C(successes, k) / C(trials, k), so the config's
+   mean is its pass^k. Crashed runs count as failures unless
+   --exclude-crashes is given. Task ids mean the same task only within a
+   domain, so every pair of configs in the same domain is compared, paired
+   by task.
+   - Bootstrap: one (resamples x tasks) matrix W of multinomial task counts.
+     It is shared by every config and every pair, so W @ D.T gives the
+     resampled mean difference of all pairs in one product. Tasks one of
+     the two configs lacks get weight 0.
+   - Permutation: swapping two configs' outcomes within a task flips the
+     sign of that task's difference. So a (resamples x tasks) matrix of
+     random signs E gives every pair's null distribution as E @ D.T.
+
+2. ERROR CATEGORIES (unpaired): The classified failures of each config
+   (classify_errors.py results) give one proportion per category.
+   - Bootstrap: all configs are resampled at once with a broadcast
+     multinomial draw.
+   - Permutation: shuffling two configs' pooled labels leaves the number of
+     category-c labels landing in config A hypergeometric. The permutation
+     null of every (pair, category) test is therefore computed exactly from
+     a log-factorial table, as one array expression, instead of sampled.
+
+3. CORRECTION: p-values are corrected within each family (all reward pairs;
+   all category tests) with Holm (default), Benjamini-Hochberg or
+   Bonferroni. A difference is flagged when its corrected p is below
+   --alpha.
+
+Usage:
+    python significance.py                              # auto-detect trajectories, results/
+    python significance.py --trajectory-dir runs/ --k 2 --resamples 20000
+    python significance.py --correction bh --alpha 0.1 --output significance.md --json-output significance.json
+"""
+
+import argparse
+import json
+import sys
+import time
+from collections import defaultdict
+from math import comb
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from analyze_crashes import discover_files
+from diff_runs import load_categories
+from plan_trials import is_success
+from traj_json import TrajectoryFile
+
+CORRECTIONS = ("holm", "bh", "bonferroni")
+# classify_errors config names come back lowercased from load_categories()
+STRATEGY_NAMES = {"act": "ACT", "react": "ReAct", "fc": "FC"}
+PAIR_CHUNK = 32   # category pairs per bootstrap slice (bounds memory at ~resamples x 32 x categories)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# LOADING
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def load_rewards(traj_dir, model_size=None, exclude_crashes=False):
+    """config_label -> {"config", "tasks": {task_id: [success, ...]}}; several files of one config are merged."""
+    configs = {}
+    for filepath, config in discover_files(Path(traj_dir), model_size):
+        cfg = configs.setdefault(config["config_label"], {"config": config, "tasks": defaultdict(list)})
+        with TrajectoryFile(filepath) as data:
+            for entry in data:
+                crashed = entry.has("info", "error")
+                if crashed and exclude_crashes:
+                    continue
+                cfg["tasks"][entry.get("task_id")].append(
+                    not crashed and is_success(entry.get("reward", 0.0)))
+    return configs
+
+
+def task_scores(tasks, k):
+    """{task_id: C(successes, k) / C(trials, k)} for tasks with at least k trials."""
+    return {t: comb(sum(v), k) / comb(len(v), k) for t, v in tasks.items() if len(v) >= k}
+
+
+def category_counts(labels):
+    """config name -> {category: count} from load_categories() output."""
+    counts = defaultdict(lambda: defaultdict(int))
+    for (config, _, _), category in labels.items():
+        if category:
+            size, strategy, domain = (config.split("_", 2) + ["", ""])[:3]
+            counts[f"{size}_{STRATEGY_NAMES.get(strategy, strategy)}_{domain}"][category] += 1
+    return counts
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# TESTS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def adjust(p, method):
+    """Multiple-comparison corrected p-values (holm / bh / bonferroni), in input order."""
+    p = np.asarray(p, dtype=float)
+    n = len(p)
+    if n == 0 or method == "bonferroni":
+        return np.minimum(p * n, 1.0)
+    order = np.argsort(p)
+    ranked = p[order]
+    if method == "holm":
+        adj = np.maximum.accumulate(ranked * (n - np.arange(n)))
+    elif method == "bh":
+        adj = np.minimum.accumulate((ranked * n / np.arange(1, n + 1))[::-1])[::-1]
+    else:
+        raise ValueError(f"unknown correction {method!r} (choose {', '.join(CORRECTIONS)})")
+    out = np.empty(n)
+    out[order] = np.minimum(adj, 1.0)
+    return out
+
+
+def reward_tests(labels, scores, resamples, rng):
+    """Bootstrap CIs per config and paired bootstrap / permutation tests for every pair, in one domain.
+
+    labels: config labels; scores: one {task_id: score} per config.
+    Returns (per-config rows, per-pair rows); pair rows carry a raw "p".
+    """
+    tasks = sorted({t for s in scores for t in s}, key=str)
+    col = {t: i for i, t in enumerate(tasks)}
+    S = np.full((len(labels), len(tasks)), np.nan)
+    for row, s in zip(S, scores):
+        row[[col[t] for t in s]] = list(s.values())
+    present = ~np.isnan(S)
+    S0 = np.nan_to_num(S)
+
+    # One task-resampling matrix serves every config and every pair
+    W = rng.multinomial(len(tasks), np.full(len(tasks), 1 / len(tasks)), size=resamples).astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        boot = (W @ S0.T) / (W @ present.T)
+    lo, hi = np.nanpercentile(boot, [2.5, 97.5], axis=0)
+    per_config = [{"config": label, "tasks": int(present[i].sum()), "score": float(np.nanmean(S[i])),
+                   "ci": [float(lo[i]), float(hi[i])]} for i, label in enumerate(labels)]
+
+    ii, jj = np.triu_indices(len(labels), 1)
+    if not len(ii):
+        return per_config, []
+    both = present[ii] & present[jj]
+    D = np.where(both, S0[ii] - S0[jj], 0.0)
+    n = both.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        obs = D.sum(axis=1) / n
+        boot = (W @ D.T) / (W @ both.T)
+        signs = rng.choice(np.array([-1.0, 1.0]), size=(resamples, len(tasks)))
+        null = (signs @ D.T) / n
+    lo, hi = np.nanpercentile(boot, [2.5, 97.5], axis=0)
+    p = (1 + (np.abs(null) >= np.abs(obs) - 1e-9).sum(axis=0)) / (resamples + 1)
+    pairs = []
+    for x, (i, j) in enumerate(zip(ii, jj)):
+        if n[x] == 0:
+            continue
+        pairs.append({"a": labels[i], "b": labels[j], "tasks": int(n[x]),
+                      "a_score": float(S0[i][both[x]].mean()), "b_score": float(S0[j][both[x]].mean()),
+                      "diff": float(obs[x]), "ci": [float(lo[x]), float(hi[x])], "p": float(p[x])})
+    return per_config, pairs
+
+
+def permutation_p(good, n_a, n_b, obs, log_fact):
+    """Exact two-sided permutation p-values of share differences, for arrays of tests at once.
+
+    Shuffling the pooled labels of A and B puts a hypergeometric number x of
+    the `good` category labels in A, so the permutation null of the share
+    difference x/n_a - (good-x)/n_b is known exactly: no resampling needed.
+    """
+    def log_comb(n, k):
+        return log_fact[n] - log_fact[k] - log_fact[n - k]
+
+    n_a, n_b = np.broadcast_to(n_a, good.shape), np.broadcast_to(n_b, good.shape)
+    x = np.arange(int(good.max()) + 1).reshape((-1,) + (1,) * good.ndim)       # (support, *tests)
+    valid = (x <= good) & (x <= n_a) & (good - x <= n_b)
+    xs = np.where(valid, x, 0)
+    log_pmf = (log_comb(good, np.minimum(xs, good)) + log_comb(n_a + n_b - good, np.where(valid, n_a - xs, 0))
+               - log_comb(n_a + n_b, n_a))
+    pmf = np.where(valid, np.exp(log_pmf), 0.0)
+    stat = xs / n_a - (good - xs) / n_b
+    return np.minimum(1.0, (pmf * (np.abs(stat) >= np.abs(obs) - 1e-9)).sum(axis=0))
+
+
+def category_tests(counts, resamples, rng, min_failures=5):
+    """Unpaired bootstrap CIs and hypergeometric permutation tests of category shares, every pair x category."""
+    labels = sorted(c for c in counts if sum(counts[c].values()) >= min_failures)
+    categories = sorted({cat for c in labels for cat in counts[c]})
+    if len(labels) < 2 or not categories:
+        return labels, []
+    K = np.array([[counts[c].get(cat, 0) for cat in categories] for c in labels], dtype=np.int64)
+    N = K.sum(axis=1)
+    share = K / N[:, None]
+    log_fact = np.concatenate([[0.0], np.cumsum(np.log(np.arange(1, 2 * N.max() + 1)))])
+
+    # Bootstrap: every config's category counts resampled in one broadcast multinomial draw
+    boot = rng.multinomial(N[:, None], share[:, None, :], size=(len(labels), resamples))
+    boot = (boot / N[:, None, None]).astype(np.float32)
+
+    ii, jj = np.triu_indices(len(labels), 1)
+    rows = []
+    for start in range(0, len(ii), PAIR_CHUNK):
+        i, j = ii[start:start + PAIR_CHUNK], jj[start:start + PAIR_CHUNK]
+        obs = share[i] - share[j]                                   # (pairs, categories)
+        lo, hi = np.percentile(boot[i] - boot[j], [2.5, 97.5], axis=1)
+        good = K[i] + K[j]
+        p = permutation_p(good, N[i][:, None], N[j][:, None], obs, log_fact)
+        for x in range(len(i)):
+            for c, cat in enumerate(categories):
+                if good[x, c] == 0:
+                    continue
+                a, b = i[x], j[x]
+                rows.append({"a": labels[a], "b": labels[b], "category": cat,
+                             "a_count": int(K[a, c]), "a_failures": int(N[a]),
+                             "b_count": int(K[b, c]), "b_failures": int(N[b]),
+                             "diff": float(obs[x, c]), "ci": [float(lo[x, c]), float(hi[x, c])],
+                             "p": float(p[x, c])})
+    return labels, rows
+
+
+def run_tests(configs, counts, k, resamples, correction, alpha, seed):
+    rng = np.random.default_rng(seed)
+    by_domain = defaultdict(list)
+    for label, cfg in sorted(configs.items()):
+        scores = task_scores(cfg["tasks"], k)
+        if scores:
+            by_domain[cfg["config"]["domain"]].append((label, scores))
+    per_config, reward_pairs = [], []
+    for domain, members in sorted(by_domain.items()):
+        rows, pairs = reward_tests([m[0] for m in members], [m[1] for m in members], resamples, rng)
+        per_config += [dict(r, domain=domain) for r in rows]
+        reward_pairs += [dict(r, domain=domain) for r in pairs]
+    cat_configs, cat_rows = category_tests(counts, resamples, rng)
+    for family in (reward_pairs, cat_rows):
+        for row, p_adj in zip(family, adjust([r["p"] for r in family], correction)):
+            row["p_adj"] = float(p_adj)
+            row["significant"] = bool(p_adj < alpha)
+    return per_config, reward_pairs, cat_configs, cat_rows
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# REPORTS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def fmt_p(p):
+    return f"{p:.4f}" if p >= 1e-4 else f"{p:.1e}"
+
+
+def print_summary(per_config, reward_pairs, cat_configs, cat_rows, settings, max_list=30, output_file=None):
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    k = settings["k"]
+    p("# Significance Tests")
+    p()
+    p(f"{settings['resamples']} resamples (seed {settings['seed']}), {settings['correction']} correction, "
+      f"alpha {settings['alpha']}. Computed in {settings['elapsed_s']:.2f}s.")
+    p()
+
+    if per_config:
+        p(f"## Pass^{k} per Config (95% bootstrap CI over tasks)")
+        p()
+        p(f"| Config | Tasks | Pass^{k} | 95% CI |")
+        p("|--------|-------|--------|--------|")
+        for r in sorted(per_config, key=lambda r: (r["domain"], -r["score"])):
+            p(f"| {r['config']} | {r['tasks']} | {r['score']:.1%} | {r['ci'][0]:.1%} – {r['ci'][1]:.1%} |")
+        p()
+
+    if reward_pairs:
+        sig = [r for r in reward_pairs if r["significant"]]
+        p(f"## Paired Pass^{k} Differences")
+        p()
+        p(f"{len(sig)} of {len(reward_pairs)} same-domain pairs differ significantly. "
+          "Δ = A − B over the tasks both ran, permutation p by sign-flipping per task.")
+        p()
+        p("| A | B | Tasks | A | B | Δ | 95% CI | p | p adj | |")
+        p("|---|---|-------|---|---|---|--------|---|-------|---|")
+        listed = sorted(reward_pairs, key=lambda r: (r["p"], -abs(r["diff"])))[:max_list]
+        for r in listed:
+            p(f"| {r['a']} | {r['b']} | {r['tasks']} | {r['a_score']:.1%} | {r['b_score']:.1%} | "
+              f"{r['diff'] * 100:+.1f}pp | {r['ci'][0] * 100:+.1f} – {r['ci'][1] * 100:+.1f} | "
+              f"{fmt_p(r['p'])} | {fmt_p(r['p_adj'])} | {'**yes**' if r['significant'] else ''} |")
+        if len(reward_pairs) > max_list:
+            p(f"| ... | {len(reward_pairs) - max_list} more (see --json-output) | | | | | | | | |")
+        p()
+    elif per_config:
+        p("No two configs share a domain, so there are no paired reward comparisons.")
+        p()
+
+    if cat_rows:
+        sig = [r for r in cat_rows if r["significant"]]
+        p("## Error-Category Share Differences")
+        p()
+        p(f"{len(cat_configs)} configs with classified failures; {len(sig)} of {len(cat_rows)} "
+          "(pair, category) tests significant. Share = category count / classified failures.")
+        p()
+        p("| A | B | Category | A | B | Δ | 95% CI | p | p adj | |")
+        p("|---|---|----------|---|---|---|--------|---|-------|---|")
+        listed = sorted(sig or cat_rows, key=lambda r: (r["p"], -abs(r["diff"])))[:max_list]
+        for r in listed:
+            p(f"| {r['a']} | {r['b']} | {r['category']} | "
+              f"{r['a_count'] / r['a_failures']:.0%} ({r['a_count']}/{r['a_failures']}) | "
+              f"{r['b_count'] / r['b_failures']:.0%} ({r['b_count']}/{r['b_failures']}) | "
+              f"{r['diff'] * 100:+.1f}pp | {r['ci'][0] * 100:+.1f} – {r['ci'][1] * 100:+.1f} | "
+              f"{fmt_p(r['p'])} | {fmt_p(r['p_adj'])} | {'**yes**' if r['significant'] else ''} |")
+        if len(sig or cat_rows) > max_list:
+            p(f"| ... | {len(sig or cat_rows) - max_list} more (see --json-output) | | | | | | | | |")
+        p()
+
+
+def save_json(per_config, reward_pairs, cat_configs, cat_rows, settings, json_path):
+    output = {
+        "settings": settings,
+        "totals": {
+            "reward_pairs": len(reward_pairs),
+            "reward_pairs_significant": sum(r["significant"] for r in reward_pairs),
+            "category_tests": len(cat_rows),
+            "category_tests_significant": sum(r["significant"] for r in cat_rows),
+        },
+        "per_config": per_config,
+        "reward_pairs": reward_pairs,
+        "category_configs": cat_configs,
+        "category_tests": cat_rows,
+    }
+    with open(json_path, "w") as f:
+        json.dump(output, f, indent=2)
+
+
+def main():
+    script_dir = Path(__file__).resolve().parent
+    default_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories"
+    if not default_dir.exists():
+        default_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories "
+
+    parser = argparse.ArgumentParser(description="Paired bootstrap / permutation tests between configs.")
+    parser.add_argument("--trajectory-dir", type=str, default=str(default_dir),
+                        help="Path to JSON_trajectories directory (auto-detected if omitted)")
+    parser.add_argument("--results-dir", type=str, default=str(script_dir / "results"),
+                        help="classify_errors.py results, for error-category tests (default: ./results)")
+    parser.add_argument("--model-size", type=str, default=None, choices=["4b", "8b", "14b", "32b"],
+                        help="Only test configs of this model size")
+    parser.add_argument("--k", type=int, default=1, help="Compare pass^k (default: 1)")
+    parser.add_argument("--resamples", type=int, default=10000,
+                        help="Bootstrap and permutation resamples (default: 10000)")
+    parser.add_argument("--correction", choices=CORRECTIONS, default="holm",
+                        help="Multiple-comparison correction (default: holm)")
+    parser.add_argument("--alpha", type=float, default=0.05, help="Significance level (default: 0.05)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--exclude-crashes", action="store_true",
+                        help="Drop crashed runs instead of counting them as failures")
+    parser.add_argument("--max-list", type=int, default=30, help="Rows per table (default: 30)")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Save markdown output to a file instead of printing to stdout.")
+    parser.add_argument("--json-output", type=str, default=None, help="Save every test to a JSON file.")
+    args = parser.parse_args()
+
+    if np is None:
+        print("ERROR: significance.py needs numpy: pip install numpy")
+        sys.exit(1)
+    traj_dir = Path(args.trajectory_dir)
+    configs = load_rewards(traj_dir, args.model_size, args.exclude_crashes) if traj_dir.exists() else {}
+    counts = category_counts(load_categories(args.results_dir if Path(args.results_dir).exists() else None))
+    if args.model_size:
+        counts = {c: v for c, v in counts.items() if c.split("_")[0] == args.model_size.lower()}
+    print(f"Loaded {len(configs)} config(s) from {traj_dir} and classified failures "
+          f"for {len(counts)} config(s) from {args.results_dir}")
+
+    start = time.perf_counter()
+    per_config, reward_pairs, cat_configs, cat_rows = run_tests(
+        configs, counts, args.k, args.resamples, args.correction, args.alpha, args.seed)
+    settings = {"k": args.k, "resamples": args.resamples, "correction": args.correction, "alpha": args.alpha,
+                "seed": args.seed, "exclude_crashes": args.exclude_crashes,
+                "elapsed_s": round(time.perf_counter() - start, 3)}
+    print()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            print_summary(per_config, reward_pairs, cat_configs, cat_rows, settings, args.max_list, output_file=f)
+        print(f"Saved markdown to {args.output}")
+    else:
+        print_summary(per_config, reward_pairs, cat_configs, cat_rows, settings, args.max_list)
+    if args.json_output:
+        save_json(per_config, reward_pairs, cat_configs, cat_rows, settings, args.json_output)
+        print(f"Saved JSON to {args.json_output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+similar_failures.py — Local similarity search over failed trajectories.
+
+Finding failures that look like a given one meant reading conversations by
+hand. This builds a TF-IDF index over every failed trajectory (the text
+`format_conversation` produces for the classifier, plus the agent's action
+signatures) and answers "what else failed like this?" in milliseconds,
+with NumPy only — no network, no GPU.
+
+How it works:
+─────────────
+1. FEATURES: Lowercased word unigrams + bigrams of the formatted
+   conversation (system prompt excluded — it is the same everywhere), plus
+   `act:<tool>` and `act:<tool>(<arg keys>)` tokens for each action.
+   Terms in fewer than --min-df entries are dropped. Weights are
+   sublinear TF x IDF, L2-normalized, stored as CSR arrays.
+
+2. EMBEDDING: Each term is sparsely projected onto --dims dimensions
+   (4 random dimensions with random signs per term, fixed seed), giving a
+   small dense vector per entry that preserves cosine similarity roughly.
+
+3. ANN: Spherical k-means over the embeddings gives ~sqrt(N) inverted
+   lists. A query scans the --nprobe closest lists, keeps the best
+   --rerank candidates by embedding score, then ranks those by exact
+   TF-IDF cosine. Below 2,000 entries the lists are skipped (brute force
+   is already sub-millisecond).
+
+4. STORAGE: Plain .npy files + meta.json in --index-dir, memory-mapped on
+   load, so a query touches only the rows it needs.
+
+5. LABELS: If classification results exist, each neighbor shows its
+   primary_category (keyed by config + task_id) — handy for checking a
+   label against its nearest neighbors.
+
+Usage:
+    python similar_failures.py build                         # all failed entries
+    python similar_failures.py similar 14b_ACT_airline 12 0   # top-10 neighbors
+    python similar_failures.py similar 14b_ACT_airline 12 0 --k 20 --same-config
+    python similar_failures.py bench --queries 200           # latency + recall vs exact
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from analyze_crashes import discover_files
+from classify_errors import extract_agent_actions, format_conversation, iter_classifications
+from traj_json import load
+
+WORD_RE = re.compile(r"[a-z0-9_#@.-]*[a-z0-9_]")
+PROJECTION_HASHES = 4
+BRUTE_FORCE_BELOW = 2000
+
+
+def config_name(config):
+    """analyze_crashes label -> classify_errors name ('14B_ACT_airline' -> '14b_ACT_airline')."""
+    return f"{config['model_size'].lower()}_{config['strategy']}_{config['domain']}"
+
+
+def entry_features(entry):
+    """Term counts for one trajectory entry."""
+    traj = entry.get("traj", [])
+    text = format_conversation([m for m in traj if m.get("role") != "system"])
+    words = WORD_RE.findall(text.lower())
+    counts = Counter(words)
+    counts.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    for action in extract_agent_actions(traj):
+        name = action.get("name")
+        args = action.get("arguments", {})
+        keys = ",".join(sorted(args)) if isinstance(args, dict) else ""
+        counts[f"act:{name}"] += 1
+        counts[f"act:{name}({keys})"] += 1
+    return counts
+
+
+def iter_entries(traj_dir, model_sizes, include_passes):
+    for size in model_sizes:
+        for filepath, config in discover_files(traj_dir, size):
+            data = load(filepath)
+            name = config_name(config)
+            for i, entry in enumerate(data):
+                if "error" in entry.get("info", {}) or not entry.get("traj"):
+                    continue
+                if entry.get("reward", 0.0) == 1.0 and not include_passes:
+                    continue
+                yield {
+                    "config": name, "task_id": entry.get("task_id"), "trial": entry.get("trial"),
+                    "reward": entry.get("reward", 0.0), "turns": len(entry["traj"]),
+                    "file": str(filepath), "entry_index": i,
+                }, entry_features(entry)
+
+
+def build_tfidf(doc_counts, min_df):
+    """CSR TF-IDF matrix (indptr, indices, data, idf) over terms with df >= min_df."""
+    df = Counter()
+    for counts in doc_counts:
+        df.update(counts.keys())
+    vocab = {t: i for i, t in enumerate(sorted(t for t, n in df.items() if n >= min_df))}
+    n_docs = len(doc_counts)
+    idf = np.zeros(len(vocab), dtype=np.float32)
+    for t, i in vocab.items():
+        idf[i] = np.log((1 + n_docs) / (1 + df[t])) + 1
+
+    indptr = [0]
+    indices, data = [], []
+    for counts in doc_counts:
+        cols = np.fromiter((vocab[t] for t in counts if t in vocab), dtype=np.int32)
+        tf = np.fromiter((c for t, c in counts.items() if t in vocab), dtype=np.float32)
+        order = np.argsort(cols)
+        cols, w = cols[order], (1 + np.log(tf[order])) * idf[cols[order]]
+        norm = np.linalg.norm(w)
+        indices.append(cols)
+        data.append(w / norm if norm else w)
+        indptr.append(indptr[-1] + len(cols))
+    return (np.asarray(indptr, dtype=np.int64),
+            np.concatenate(indices) if indices else np.zeros(0, np.int32),
+            np.concatenate(data) if data else np.zeros(0, np.float32), idf)
+
+
+def project(indptr, indices, data, n_terms, dims, seed=0):
+    """Sparse random projection of CSR rows onto `dims` dense dimensions."""
+    rng = np.random.default_rng(seed)
+    hash_dims = rng.integers(0, dims, size=(n_terms, PROJECTION_HASHES), dtype=np.int64)
+    hash_signs = rng.choice(np.array([-1.0, 1.0], dtype=np.float32), size=(n_terms, PROJECTION_HASHES))
+    n_docs = len(indptr) - 1
+    rows = np.repeat(np.arange(n_docs, dtype=np.int64), np.diff(indptr))
+    emb = np.zeros(n_docs * dims, dtype=np.float64)
+    for j in range(PROJECTION_HASHES):
+        emb += np.bincount(rows * dims + hash_dims[indices, j],
+                           weights=data * hash_signs[indices, j], minlength=n_docs * dims)
+    emb = emb.reshape(n_docs, dims).astype(np.float32)
+    norms = np.linalg.norm(emb, axis=1, keepdims=True)
+    return emb / np.where(norms == 0, 1, norms)
+
+
+def spherical_kmeans(emb, n_lists, iters=10, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = emb[rng.choice(len(emb), n_lists, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(emb @ centroids.T, axis=1)
+        for c in range(n_lists):
+            members = emb[assign == c]
+            if len(members):
+                v = members.sum(axis=0)
+                centroids[c] = v / (np.linalg.norm(v) or 1)
+    return centroids, np.argmax(emb @ centroids.T, axis=1)
+
+
+def cmd_build(args, traj_dir):
+    start = time.perf_counter()
+    meta, doc_counts = [], []
+    for m, counts in iter_entries(traj_dir, args.model_size, args.include_passes):
+        meta.append(m)
+        doc_counts.append(counts)
+    if not meta:
+        print("No entries to index.")
+        sys.exit(1)
+    print(f"  Featurized {len(meta)} entries ({time.perf_counter() - start:.1f}s)")
+
+    indptr, indices, data, idf = build_tfidf(doc_counts, args.min_df)
+    del doc_counts
+    emb = project(indptr, indices, data, len(idf), args.dims)
+
+    n_lists = int(np.sqrt(len(meta))) if len(meta) >= BRUTE_FORCE_BELOW else 0
+    if n_lists:
+        centroids, assign = spherical_kmeans(emb, n_lists)
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        list_offsets = np.searchsorted(assign[order], np.arange(n_lists + 1)).astype(np.int64)
+    else:
+        centroids = np.zeros((0, args.dims), np.float32)
+        order = np.arange(len(meta), dtype=np.int64)
+        list_offsets = np.array([0, len(meta)], dtype=np.int64)
+
+    out = Path(args.index_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    for name, arr in [("indptr", indptr), ("indices", indices), ("data", data), ("emb", emb),
+                      ("centroids", centroids), ("list_docs", order), ("list_offsets", list_offsets)]:
+        np.save(out / f"{name}.npy", arr)
+    with open(out / "meta.json", "w") as f:
+        json.dump({"entries": meta, "n_terms": len(idf), "dims": args.dims,
+                   "n_lists": n_lists, "min_df": args.min_df}, f)
+    print(f"Indexed {len(meta)} entries, {len(idf):,} terms, {len(data):,} nonzeros, "
+          f"{n_lists or 'no'} lists → {out}/ ({time.perf_counter() - start:.1f}s)")
+
+
+class SimilarityIndex:
+    """Memory-mapped index written by `build`."""
+
+    def __init__(self, index_dir):
+        d = Path(index_dir)
+        with open(d / "meta.json") as f:
+            info = json.load(f)
+        self.entries = info["entries"]
+        self.n_terms = info["n_terms"]
+        self.n_lists = info["n_lists"]
+        for name in ("indptr", "indices", "data", "emb", "centroids", "list_docs", "list_offsets"):
+            setattr(self, name, np.load(d / f"{name}.npy", mmap_mode="r"))
+        self.lookup = {(e["config"], e["task_id"], e["trial"]): i for i, e in enumerate(self.entries)}
+
+    def row(self, i):
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        return self.indices[lo:hi], self.data[lo:hi]
+
+    def exact_scores(self, q, candidates):
+        """TF-IDF cosine between doc q and each candidate."""
+        q_cols, q_vals = self.row(q)
+        dense = np.zeros(self.n_terms, dtype=np.float32)
+        dense[q_cols] = q_vals
+        starts = np.asarray(self.indptr[candidates])
+        lengths = np.asarray(self.indptr[candidates + 1]) - starts
+        # Positions of every candidate's nonzeros, concatenated
+        pos = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        products = dense[self.indices[pos]] * self.data[pos]
+        scores = np.zeros(len(candidates), dtype=np.float32)
+        nonempty = lengths > 0
+        scores[nonempty] = np.add.reduceat(products, (np.cumsum(lengths) - lengths)[nonempty])
+        return scores
+
+    def candidates(self, q, nprobe, rerank, exact=False):
+        if exact or not self.n_lists:
+            pool = np.arange(len(self.entries))
+        else:
+            lists = np.argsort(-(self.centroids @ self.emb[q]))[:nprobe]
+            pool = np.concatenate([self.list_docs[self.list_offsets[c]:self.list_offsets[c + 1]]
+                                   for c in lists])
+        if exact:
+            return pool
+        if len(pool) > rerank:
+            approx = self.emb[pool] @ self.emb[q]
+            pool = pool[np.argpartition(-approx, rerank)[:rerank]]
+        return pool
+
+    def search(self, q, k=10, nprobe=8, rerank=200, exact=False, keep=None):
+        pool = self.candidates(q, nprobe, rerank, exact)
+        pool = np.array([c for c in pool if c != q and (keep is None or keep(c))], dtype=np.int64)
+        if not len(pool):
+            return []
+        scores = self.exact_scores(q, pool)
+        top = np.argsort(-scores)[:k]
+        return [(int(pool[i]), float(scores[i])) for i in top]
+
+
+def load_labels(results_dir):
+    """{(config, task_id): primary_category} from classify_errors.py results."""
+    labels = {}
+    results_dir = Path(results_dir)
+    if not results_dir.exists():
+        return labels
+    for path in sorted(results_dir.glob("*_*_*.json")):
+        try:
+            with open(path) as f:
+                result = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            continue
+        if not isinstance(result, dict) or "config" not in result:
+            continue
+        for rec in iter_classifications(result, results_dir):
+            labels[(result["config"], rec.get("task_id"))] = rec.get(
+                "classification", {}).get("primary_category")
+    return labels
+
+
+def cmd_similar(args):
+    start = time.perf_counter()
+    index = SimilarityIndex(args.index_dir)
+    load_ms = (time.perf_counter() - start) * 1000
+    q = index.lookup.get((args.config, args.task_id, args.trial))
+    if q is None:
+        print(f"ERROR: ({args.config}, task {args.task_id}, trial {args.trial}) is not in the index "
+              f"(only failed, non-crashed entries are indexed unless built with --include-passes)")
+        sys.exit(1)
+
+    def same_config(c):
+        return index.entries[c]["config"] == args.config
+    keep = same_config if args.same_config else None
+    start = time.perf_counter()
+    hits = index.search(q, args.k, args.nprobe, args.rerank, args.exact, keep)
+    query_ms = (time.perf_counter() - start) * 1000
+
+    labels = load_labels(args.results_dir)
+    e = index.entries[q]
+    q_label = labels.get((e["config"], e["task_id"]))
+    print(f"Query: {e['config']} task {e['task_id']} trial {e['trial']} "
+          f"({e['turns']} turns{', label: ' + q_label if q_label else ''})")
+    print(f"{len(hits)} neighbors in {query_ms:.1f} ms (index load {load_ms:.1f} ms)")
+    print()
+    print("| # | Config | Task ID | Trial | Reward | Turns | Similarity | Label |")
+    print("|---|--------|---------|-------|--------|-------|------------|-------|")
+    for rank, (c, score) in enumerate(hits, 1):
+        n = index.entries[c]
+        label = labels.get((n["config"], n["task_id"]), "-")
+        print(f"| {rank} | {n['config']} | {n['task_id']} | {n['trial']} | {n['reward']} | "
+              f"{n['turns']} | {score:.3f} | {label} |")
+    if q_label:
+        labeled = [labels.get((index.entries[c]["config"], index.entries[c]["task_id"])) for c, _ in hits]
+        labeled = [lab for lab in labeled if lab]
+        if labeled:
+            same = sum(lab == q_label for lab in labeled)
+            print()
+            print(f"Label agreement: {same}/{len(labeled)} labeled neighbors are '{q_label}'")
+
+
+def cmd_bench(args):
+    index = SimilarityIndex(args.index_dir)
+    rng = np.random.default_rng(0)
+    queries = rng.choice(len(index.entries), min(args.queries, len(index.entries)), replace=False)
+    recall, times = [], []
+    for q in queries:
+        start = time.perf_counter()
+        approx = index.search(q, args.k, args.nprobe, args.rerank)
+        times.append((time.perf_counter() - start) * 1000)
+        exact = index.search(q, args.k, exact=True)
+        if exact:
+            # Ties at the k-th score make the exact top-k ambiguous; any
+            # neighbor scoring at least that high counts as a true neighbor
+            kth = exact[-1][1] - 1e-6
+            recall.append(min(1.0, sum(score >= kth for _, score in approx) / len(exact)))
+    times = np.array(times)
+    print(f"Entries: {len(index.entries)} | Lists: {index.n_lists} | nprobe: {args.nprobe} | "
+          f"rerank: {args.rerank}")
+    print(f"Query latency: mean {times.mean():.2f} ms, p95 {np.percentile(times, 95):.2f} ms")
+    print(f"Recall@{args.k} vs exact: {np.mean(recall) * 100:.1f}%")
+
+
+def main():
+    script_dir = Path(__file__).resolve().parent
+    parser = argparse.ArgumentParser(
+        description="Similarity search over failed tau-bench trajectories."
+    )
+    parser.add_argument(
+        "--index-dir", type=str, default=str(script_dir / "results" / "similarity_index"),
+        help="Index directory (default: results/similarity_index)",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_build = sub.add_parser("build", help="Build the index")
+    p_build.add_argument(
+        "--trajectory-dir", type=str, default=None,
+        help="Path to trajectory directory. Default: auto-detect from script location.",
+    )
+    p_build.add_argument(
+        "--model-size", nargs="+", default=[None],
+        help="Model size(s) to index (e.g., 14b 32b). Default: all sizes.",
+    )
+    p_build.add_argument("--include-passes", action="store_true",
+                         help="Index successful entries too (default: failures only)")
+    p_build.add_argument("--min-df", type=int, default=2,
+                         help="Drop terms found in fewer entries than this (default: 2)")
+    p_build.add_argument("--dims", type=int, default=256,
+                         help="Embedding dimensions for the ANN stage (default: 256)")
+
+    search_opts = argparse.ArgumentParser(add_help=False)
+    search_opts.add_argument("--k", type=int, default=10, help="Neighbors to return (default: 10)")
+    search_opts.add_argument("--nprobe", type=int, default=8,
+                             help="Inverted lists scanned per query (default: 8)")
+    search_opts.add_argument("--rerank", type=int, default=200,
+                             help="Candidates re-scored with exact TF-IDF cosine (default: 200)")
+
+    p_sim = sub.add_parser("similar", parents=[search_opts], help="Nearest neighbors of one entry")
+    p_sim.add_argument("config", help="Config name, e.g. 14b_ACT_airline")
+    p_sim.add_argument("task_id", type=int)
+    p_sim.add_argument("trial", type=int)
+    p_sim.add_argument("--same-config", action="store_true", help="Only neighbors from the same config")
+    p_sim.add_argument("--exact", action="store_true", help="Brute-force search (no ANN)")
+    p_sim.add_argument("--results-dir", type=str, default=str(script_dir / "results"),
+                       help="classify_errors.py results, for neighbor labels (default: results/)")
+
+    p_bench = sub.add_parser("bench", parents=[search_opts], help="Latency and recall vs exact search")
+    p_bench.add_argument("--queries", type=int, default=100, help="Random queries (default: 100)")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        if args.trajectory_dir:
+            traj_dir = Path(args.trajectory_dir)
+        else:
+            traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories"
+            if not traj_dir.exists():
+                traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories "
+        if not traj_dir.exists():
+            print(f"ERROR: Trajectory directory not found: {traj_dir}")
+            sys.exit(1)
+        cmd_build(args, traj_dir)
+        return
+
+    if not (Path(args.index_dir) / "meta.json").exists():
+        print(f"ERROR: Index not found: {args.index_dir} (run `build` first)")
+        sys.exit(1)
+    if args.command == "similar":
+        cmd_similar(args)
+    else:
+        cmd_bench(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+tool_cache.py — Memoizing tool-execution layer for read-only tau-bench tools.
+
+Agents call get_user_details / get_order_details / find_user_id_by_name_zip
+with identical arguments several times per conversation, and the 5 trials of
+a task repeat the same lookups against the same starting database.
+ToolResultCache serves those repeats from memory and invalidates on writes.
+
+How it works:
+─────────────
+1. KEY: (state_hash, tool, canonical JSON args). state_hash starts at a
+   per-domain root ("retail:initial") — every trial of every task starts
+   from the same database — and is chained with sha256 over each
+   successful write call. Two runs that made the same writes in the same
+   order share a state hash, so they share cache entries too.
+
+2. READ-ONLY TOOLS: Only tools in READ_ONLY_TOOLS are cached. 'think' and
+   'transfer_to_human_agents' neither hit the cache nor invalidate it.
+   Any other tool is treated as a write: if it succeeds (output does not
+   start with "Error"), the state hash advances and older entries stop
+   matching. A failed write changes nothing, exactly like tau-bench.
+
+3. ONLINE: `ToolResultCache.wrap(execute_fn)` returns a drop-in
+   execute(name, args) that consults the cache first.
+
+4. ANALYSIS: Re-runs every stored trajectory's tool calls through the cache
+   at two scopes — per conversation, and per task across its trials — and
+   reports hit rate, stale hits (cached output != actual output; should be
+   0), output tokens a hit would save if repeated outputs were deduplicated
+   in context, and tool latency saved (estimated with --tool-latency-ms,
+   since trajectories carry no timings).
+
+Usage:
+    python tool_cache.py                              # all model sizes
+    python tool_cache.py --model-size 14b --tool-latency-ms 120
+    python tool_cache.py --json-output tool_cache.json
+"""
+
+import argparse
+import json
+import sys
+from collections import defaultdict
+from hashlib import sha256
+from pathlib import Path
+
+from analyze_crashes import discover_files
+from classify_errors import iter_tool_results
+from profile_context import load_tokenizer
+from traj_json import load
+
+READ_ONLY_TOOLS = {
+    "retail": {
+        "find_user_id_by_email", "find_user_id_by_name_zip", "get_order_details",
+        "get_product_details", "get_user_details", "list_all_product_types", "calculate",
+    },
+    "airline": {
+        "get_user_details", "get_reservation_details", "search_direct_flight",
+        "search_onestop_flight", "list_all_airports", "calculate",
+    },
+}
+
+# Tools that neither read the database nor change it
+NEUTRAL_TOOLS = {"think", "transfer_to_human_agents"}
+
+
+def canonical_args(args):
+    return json.dumps(args, sort_keys=True, separators=(",", ":"))
+
+
+class ToolResultCache:
+    """Cache read-only tool results per (state hash, tool, args)."""
+
+    def __init__(self, domain):
+        self.domain = domain
+        self.read_only = READ_ONLY_TOOLS.get(domain, set())
+        self.entries = {}
+        self.reset()
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+
+    def reset(self):
+        """Back to the initial database state (new conversation/trial)."""
+        self.state_hash = f"{self.domain}:initial"
+
+    def lookup(self, name, args):
+        """Return the cached output or None. Non-cacheable tools always miss."""
+        if name not in self.read_only:
+            return None
+        return self.entries.get((self.state_hash, name, canonical_args(args)))
+
+    def record(self, name, args, output):
+        """Store a read result, or advance the state hash after a write."""
+        if name in NEUTRAL_TOOLS or output is None:
+            return
+        if name in self.read_only:
+            self.entries[(self.state_hash, name, canonical_args(args))] = output
+        elif not output.startswith("Error"):
+            self.stats["writes"] += 1
+            self.state_hash = sha256(
+                f"{self.state_hash}|{name}|{canonical_args(args)}".encode()).hexdigest()
+
+    def wrap(self, execute_fn):
+        """Wrap an execute(name, args) -> output function with the cache."""
+        def cached_execute(name, args):
+            cached = self.lookup(name, args)
+            if cached is not None:
+                self.stats["hits"] += 1
+                return cached
+            if name in self.read_only:
+                self.stats["misses"] += 1
+            output = execute_fn(name, args)
+            self.record(name, args, output)
+            return output
+        return cached_execute
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# ANALYSIS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def analyze_file(filepath, config, count_tokens):
+    """Replay one file's tool calls through conversation- and task-scoped caches."""
+    data = load(filepath)
+
+    domain = config["domain"]
+    task_caches = {}
+    stats = {
+        "read_calls": 0, "conv_hits": 0, "task_hits": 0, "stale_hits": 0,
+        "conv_tokens_saved": 0, "task_tokens_saved": 0,
+    }
+    by_tool = defaultdict(lambda: {"calls": 0, "conv_hits": 0, "task_hits": 0})
+
+    # Trials in order so the task-level cache fills the way a real run would
+    for entry in sorted(data, key=lambda e: (e.get("task_id", 0), e.get("trial", 0))):
+        traj = entry.get("traj", [])
+        if "error" in entry.get("info", {}) or not traj:
+            continue
+        conv = ToolResultCache(domain)
+        task = task_caches.setdefault(entry.get("task_id"), ToolResultCache(domain))
+        task.reset()
+
+        for name, args, output in iter_tool_results(traj):
+            if name in conv.read_only and output is not None:
+                stats["read_calls"] += 1
+                by_tool[name]["calls"] += 1
+                conv_hit = conv.lookup(name, args)
+                task_hit = task.lookup(name, args)
+                if conv_hit is not None:
+                    stats["conv_hits"] += 1
+                    by_tool[name]["conv_hits"] += 1
+                    stats["conv_tokens_saved"] += count_tokens(output)
+                if task_hit is not None:
+                    stats["task_hits"] += 1
+                    by_tool[name]["task_hits"] += 1
+                    stats["task_tokens_saved"] += count_tokens(output)
+                    if task_hit != output:
+                        stats["stale_hits"] += 1
+            conv.record(name, args, output)
+            task.record(name, args, output)
+
+    return {"config": config, "stats": stats, "by_tool": dict(by_tool)}
+
+
+def print_summary(all_results, latency_ms, output_file=None):
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    p("# Read-Only Tool Cache — Offline Analysis")
+    p()
+    p("Conversation scope = cache reset every trial. Task scope = cache shared "
+      "across the trials of a task (same starting database).")
+    p()
+    p("| Config | Read Calls | Conv Hits | Conv Hit % | Task Hits | Task Hit % | Stale | "
+      "Tokens Saved (task) | Latency Saved (task) |")
+    p("|--------|------------|-----------|------------|-----------|------------|-------|"
+      "---------------------|----------------------|")
+    for r in all_results:
+        s = r["stats"]
+        n = s["read_calls"]
+        conv_pct = f"{s['conv_hits'] / n * 100:.1f}%" if n else "N/A"
+        task_pct = f"{s['task_hits'] / n * 100:.1f}%" if n else "N/A"
+        p(f"| {r['config']['config_label']} | {n} | {s['conv_hits']} | {conv_pct} | "
+          f"{s['task_hits']} | {task_pct} | {s['stale_hits']} | {s['task_tokens_saved']:,} | "
+          f"{s['task_hits'] * latency_ms / 1000:.1f}s |")
+    p()
+
+    totals = defaultdict(lambda: {"calls": 0, "conv_hits": 0, "task_hits": 0})
+    for r in all_results:
+        for tool, t in r["by_tool"].items():
+            for k, v in t.items():
+                totals[tool][k] += v
+    if totals:
+        p("## Hits by Tool (all configs)")
+        p()
+        p("| Tool | Calls | Conv Hits | Task Hits | Task Hit % |")
+        p("|------|-------|-----------|-----------|------------|")
+        for tool, t in sorted(totals.items(), key=lambda x: -x[1]["task_hits"]):
+            pct = t["task_hits"] / t["calls"] * 100 if t["calls"] else 0
+            p(f"| {tool} | {t['calls']} | {t['conv_hits']} | {t['task_hits']} | {pct:.1f}% |")
+        p()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure how much a read-only tool cache would have saved."
+    )
+    parser.add_argument(
+        "--trajectory-dir", type=str, default=None,
+        help="Path to trajectory directory. Default: auto-detect from script location.",
+    )
+    parser.add_argument(
+        "--model-size", type=str, default=None, choices=["4b", "8b", "14b", "32b"],
+        help="Filter to a specific model size (e.g., 14b). Default: all sizes.",
+    )
+    parser.add_argument(
+        "--tool-latency-ms", type=float, default=50.0,
+        help="Assumed latency per tool call, for the savings estimate (default: 50)",
+    )
+    parser.add_argument(
+        "--tokenizer", type=str, default="Qwen/Qwen3-14B",
+        help="HF tokenizer name or local path (default: Qwen/Qwen3-14B)",
+    )
+    parser.add_argument(
+        "--output", type=str, default=None,
+        help="Save markdown output to a file instead of printing to stdout.",
+    )
+    parser.add_argument(
+        "--json-output", type=str, default=None,
+        help="Save per-config cache statistics to a JSON file.",
+    )
+    args = parser.parse_args()
+
+    if args.trajectory_dir:
+        traj_dir = Path(args.trajectory_dir)
+    else:
+        script_dir = Path(__file__).resolve().parent
+        traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories"
+        if not traj_dir.exists():
+            traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories "
+    if not traj_dir.exists():
+        print(f"ERROR: Trajectory directory not found: {traj_dir}")
+        sys.exit(1)
+
+    files = discover_files(traj_dir, args.model_size)
+    print(f"Found {len(files)} trajectory file(s)")
+    if not files:
+        sys.exit(1)
+
+    count_tokens, approximate = load_tokenizer(args.tokenizer)
+    if approximate:
+        print(f"  WARNING: tokenizer '{args.tokenizer}' unavailable — using approximate counts")
+
+    all_results = []
+    for filepath, config in files:
+        if config["domain"] not in READ_ONLY_TOOLS:
+            continue
+        print(f"  Analyzing {config['config_label']}: {filepath.name}")
+        all_results.append(analyze_file(filepath, config, count_tokens))
+    print()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            print_summary(all_results, args.tool_latency_ms, output_file=f)
+        print(f"Saved markdown to {args.output}")
+    else:
+        print_summary(all_results, args.tool_latency_ms)
+
+    if args.json_output:
+        output = {r["config"]["config_label"]: {"stats": r["stats"], "by_tool": r["by_tool"]}
+                  for r in all_results}
+        with open(args.json_output, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"Saved JSON to {args.json_output}")
+
+
+if __name__ == "__main__":
+    main()
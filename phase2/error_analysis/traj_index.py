@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+traj_index.py — On-disk inverted index + query CLI over trajectory content.
+
+Questions like "which failures called cancel_reservation on a basic economy
+reservation?" or "every run that mentions reservation ZFA04Y" used to need a
+one-off script that reloads every JSON file. `build` indexes all
+trajectories once into a SQLite file; `query` answers from the index in
+milliseconds and returns (config, task_id, trial, turn) hits.
+
+How it works:
+─────────────
+1. TERMS: For every message (turn = index in `traj`) we emit:
+     tool:<name>         a tool the agent called in this turn
+     arg:<key>           an argument key of that call
+     <key>=<value>       a scalar argument value (lowercased)
+     <word>              lowercased word tokens of the content, including
+                         tool outputs and FC tool-call arguments
+   and, once per entry (turn -1): task:<id>, trial:<n>, config:<label>,
+   reward:0|1, and `crashed` for entries with info.error.
+   The system prompt (policy + tool schemas, identical in every entry) is
+   not tokenized.
+
+2. STORAGE: postings(term, doc, turn) is a WITHOUT ROWID table keyed by
+   term, so every term lookup is one B-tree range scan.
+
+3. INCREMENTAL: The files table remembers each file's size and mtime.
+   `build` only (re)indexes new or changed files and drops files that are
+   gone, so re-running it while experiments write new trajectories is cheap.
+
+4. QUERY: All terms must match in the same entry (AND); `-term` excludes
+   entries; a trailing `*` is a prefix match (tool:cancel*). Each hit lists
+   the turns where each term occurs.
+
+Usage:
+    python traj_index.py build                                   # build / update
+    python traj_index.py query tool:cancel_reservation basic_economy reward:0
+    python traj_index.py query reservation_id=zfa04y
+    python traj_index.py query task:12 config:14b_act_retail -tool:transfer_to_human_agents
+    python traj_index.py query "tool:cancel*" --json
+    python traj_index.py stats
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from analyze_crashes import discover_files
+from classify_errors import extract_agent_actions
+from traj_json import load
+
+TOKEN_RE = re.compile(r"[a-z0-9_][a-z0-9_.@-]*[a-z0-9_]|[a-z0-9]")
+DOC_TURN = -1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    config TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL,
+    entry_index INTEGER NOT NULL,
+    task_id INTEGER,
+    trial INTEGER,
+    reward REAL,
+    turns INTEGER
+);
+CREATE INDEX IF NOT EXISTS docs_file ON docs(file_id);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc INTEGER NOT NULL,
+    turn INTEGER NOT NULL,
+    PRIMARY KEY (term, doc, turn)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings(doc);
+"""
+
+
+def open_index(path):
+    db = sqlite3.connect(str(path))
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+def tokenize(text):
+    return set(TOKEN_RE.findall(text.lower()))
+
+
+def scalar_terms(key, value):
+    if isinstance(value, (dict, list)):
+        return set()
+    return {f"{key}={str(value).lower()}"}
+
+
+def entry_terms(entry, config_label):
+    """Yield (term, turn) pairs for one trajectory entry."""
+    info = entry.get("info", {})
+    yield f"task:{entry.get('task_id')}", DOC_TURN
+    yield f"trial:{entry.get('trial')}", DOC_TURN
+    yield f"config:{config_label.lower()}", DOC_TURN
+    yield f"reward:{int(entry.get('reward', 0.0) == 1.0)}", DOC_TURN
+    if "error" in info:
+        yield "crashed", DOC_TURN
+        for tok in tokenize(str(info["error"])):
+            yield tok, DOC_TURN
+
+    for turn, msg in enumerate(entry.get("traj", [])):
+        if msg.get("role") == "system":
+            continue
+        terms = tokenize(msg.get("content", "") or "")
+        for action in extract_agent_actions([msg]) if msg.get("role") == "assistant" else []:
+            terms.add(f"tool:{action.get('name')}")
+            args = action.get("arguments", {})
+            if isinstance(args, dict):
+                for key, value in args.items():
+                    terms.add(f"arg:{key}")
+                    terms |= scalar_terms(key, value)
+                    if msg.get("tool_calls"):
+                        # FC arguments are not part of the message content
+                        terms |= tokenize(json.dumps(value))
+        for term in terms:
+            yield term, turn
+
+
+def index_file(db, filepath, config, st):
+    data = load(filepath)
+    cur = db.execute("INSERT INTO files (path, config, size, mtime_ns) VALUES (?, ?, ?, ?)",
+                     (str(filepath), config["config_label"], st.st_size, st.st_mtime_ns))
+    file_id = cur.lastrowid
+    n_postings = 0
+    for i, entry in enumerate(data):
+        cur = db.execute(
+            "INSERT INTO docs (file_id, entry_index, task_id, trial, reward, turns) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (file_id, i, entry.get("task_id"), entry.get("trial"),
+             entry.get("reward", 0.0), len(entry.get("traj", []))))
+        doc = cur.lastrowid
+        rows = {(term, doc, turn) for term, turn in entry_terms(entry, config["config_label"])}
+        db.executemany("INSERT INTO postings VALUES (?, ?, ?)", rows)
+        n_postings += len(rows)
+    return len(data), n_postings
+
+
+def drop_file(db, file_id):
+    db.execute("DELETE FROM postings WHERE doc IN (SELECT id FROM docs WHERE file_id = ?)", (file_id,))
+    db.execute("DELETE FROM docs WHERE file_id = ?", (file_id,))
+    db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+
+def cmd_build(args, db, traj_dir):
+    start = time.perf_counter()
+    known = {path: (fid, size, mtime) for fid, path, size, mtime in
+             db.execute("SELECT id, path, size, mtime_ns FROM files")}
+    seen = set()
+    added = updated = unchanged = 0
+    for filepath, config in discover_files(traj_dir, args.model_size):
+        key = str(filepath)
+        seen.add(key)
+        st = filepath.stat()
+        if key in known:
+            fid, size, mtime = known[key]
+            if (size, mtime) == (st.st_size, st.st_mtime_ns):
+                unchanged += 1
+                continue
+            drop_file(db, fid)
+            updated += 1
+        else:
+            added += 1
+        n_docs, n_postings = index_file(db, filepath, config, st)
+        db.commit()
+        print(f"  Indexed {config['config_label']}: {n_docs} entries, {n_postings:,} postings")
+
+    removed = 0
+    if not args.model_size:
+        for key, (fid, _, _) in known.items():
+            if key not in seen:
+                drop_file(db, fid)
+                removed += 1
+    db.commit()
+    print(f"Index up to date: {added} added, {updated} updated, {removed} removed, "
+          f"{unchanged} unchanged ({time.perf_counter() - start:.2f}s)")
+
+
+def term_docs(db, term):
+    """{doc: [turns]} for a term (trailing * = prefix match)."""
+    if term.endswith("*"):
+        prefix = term[:-1]
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1) if prefix else "￿"
+        rows = db.execute("SELECT doc, turn FROM postings WHERE term >= ? AND term < ?",
+                          (prefix, upper))
+    else:
+        rows = db.execute("SELECT doc, turn FROM postings WHERE term = ?", (term,))
+    docs = {}
+    for doc, turn in rows:
+        docs.setdefault(doc, set()).add(turn)
+    return docs
+
+
+def run_query(db, terms):
+    """Return [(doc, {term: sorted turns})] for docs matching every term."""
+    positive = [t.lower() for t in terms if not t.startswith("-")]
+    negative = [t[1:].lower() for t in terms if t.startswith("-")]
+    if not positive:
+        raise ValueError("query needs at least one term without '-'")
+    postings = {t: term_docs(db, t) for t in positive}
+    matched = None
+    for t in sorted(positive, key=lambda t: len(postings[t])):
+        matched = set(postings[t]) if matched is None else matched & postings[t].keys()
+        if not matched:
+            return []
+    for t in negative:
+        matched -= term_docs(db, t).keys()
+    return [(doc, {t: sorted(x for x in postings[t][doc] if x != DOC_TURN) for t in positive})
+            for doc in sorted(matched)]
+
+
+def cmd_query(args, db):
+    start = time.perf_counter()
+    try:
+        results = run_query(db, args.terms)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    hits = []
+    for doc, turns in results[:args.limit]:
+        config, path, entry_index, task_id, trial, reward = db.execute(
+            "SELECT f.config, f.path, d.entry_index, d.task_id, d.trial, d.reward "
+            "FROM docs d JOIN files f ON f.id = d.file_id WHERE d.id = ?", (doc,)).fetchone()
+        hits.append({
+            "config": config, "task_id": task_id, "trial": trial, "reward": reward,
+            "turns": turns, "file": path, "entry_index": entry_index,
+        })
+
+    if args.json:
+        print(json.dumps({"query": args.terms, "total": len(results),
+                          "elapsed_ms": round(elapsed_ms, 2), "hits": hits}, indent=2))
+        return
+    print(f"{len(results)} matching entries ({elapsed_ms:.1f} ms)"
+          + (f", showing {len(hits)}" if len(hits) < len(results) else ""))
+    if hits:
+        print()
+        print("| Config | Task ID | Trial | Reward | Turns |")
+        print("|--------|---------|-------|--------|-------|")
+        for h in hits:
+            turns = "; ".join(f"{t}: {','.join(map(str, v))}" for t, v in h["turns"].items() if v)
+            print(f"| {h['config']} | {h['task_id']} | {h['trial']} | {h['reward']} | {turns or '-'} |")
+
+
+def cmd_stats(args, db):
+    n_files, n_docs = db.execute("SELECT (SELECT COUNT(*) FROM files), (SELECT COUNT(*) FROM docs)").fetchone()
+    n_postings = db.execute("SELECT COUNT(*) FROM postings").fetchone()[0]
+    n_terms = db.execute("SELECT COUNT(DISTINCT term) FROM postings").fetchone()[0]
+    print(f"Files: {n_files} | Entries: {n_docs} | Terms: {n_terms:,} | Postings: {n_postings:,}")
+    print()
+    print("| Tool | Entries | Calls (turns) |")
+    print("|------|---------|---------------|")
+    for term, docs, turns in db.execute(
+            "SELECT term, COUNT(DISTINCT doc), COUNT(*) FROM postings "
+            "WHERE term >= 'tool:' AND term < 'tool;' GROUP BY term ORDER BY 2 DESC"):
+        print(f"| {term[5:]} | {docs} | {turns} |")
+
+
+def main():
+    script_dir = Path(__file__).resolve().parent
+    parser = argparse.ArgumentParser(
+        description="Build and query an inverted index over tau-bench trajectories."
+    )
+    parser.add_argument(
+        "--index", type=str, default=str(script_dir / "results" / "traj_index.sqlite3"),
+        help="Index file (default: results/traj_index.sqlite3)",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_build = sub.add_parser("build", help="Build or incrementally update the index")
+    p_build.add_argument(
+        "--trajectory-dir", type=str, default=None,
+        help="Path to trajectory directory. Default: auto-detect from script location.",
+    )
+    p_build.add_argument(
+        "--model-size", type=str, default=None, choices=["4b", "8b", "14b", "32b"],
+        help="Only index one model size (e.g., 14b). Default: all sizes.",
+    )
+
+    p_query = sub.add_parser("query", help="Find entries matching all terms")
+    p_query.add_argument("terms", nargs="+", help="Terms (tool:X, arg:K, K=V, task:N, reward:0, word, -term, prefix*)")
+    p_query.add_argument("--limit", type=int, default=50, help="Max hits to show (default: 50)")
+    p_query.add_argument("--json", action="store_true", help="Print hits as JSON")
+
+    sub.add_parser("stats", help="Index size and tool-call counts")
+    args, extra = parser.parse_known_args()
+    # argparse treats "-term" as an unknown option; it is a negated query term
+    if args.command == "query" and all(e.startswith("-") and not e.startswith("--") for e in extra):
+        args.terms += extra
+    elif extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+
+    if args.command != "build" and not Path(args.index).exists():
+        print(f"ERROR: Index not found: {args.index} (run `build` first)")
+        sys.exit(1)
+    Path(args.index).parent.mkdir(parents=True, exist_ok=True)
+    db = open_index(args.index)
+
+    if args.command == "build":
+        if args.trajectory_dir:
+            traj_dir = Path(args.trajectory_dir)
+        else:
+            traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories"
+            if not traj_dir.exists():
+                traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories "
+        if not traj_dir.exists():
+            print(f"ERROR: Trajectory directory not found: {traj_dir}")
+            sys.exit(1)
+        cmd_build(args, db, traj_dir)
+    elif args.command == "query":
+        cmd_query(args, db)
+    else:
+        cmd_stats(args, db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+traj_json.py — Fast, lazy decoding of tau-bench trajectory JSON files.
+
+Shared by analyze_crashes.py and classify_errors.py. Files are memory-mapped
+and handed to the fastest available decoder, and individual entry fields
+can be read without decoding the rest of the entry (in particular `traj`).
+
+How it works:
+─────────────
+1. BACKEND: orjson if installed, else simdjson, else the stdlib `json`
+   module. Force one with TAU_JSON_BACKEND=orjson|simdjson|json. orjson
+   decodes straight from the mmap'd bytes. The stdlib needs a bytes copy,
+   but it never sees an intermediate str.
+
+2. MMAP: TrajectoryFile mmaps the file read-only. Pages are faulted in only
+   where something is decoded or searched, and never copied into a Python
+   string.
+
+3. LAYOUT INDEX: tau-bench dumps results with json.dump(indent=2), and JSON
+   strings can't contain a raw newline. That pins the layout:
+   - every top-level entry starts at "\\n  {" and ends at "\\n  }";
+   - every key of an entry starts a line indented by 4 spaces;
+   - every key one level deeper is indented by 6 spaces, and so on.
+   So one bytes.find pass (C speed) over the entry-level keys indexes every
+   entry and key, and no JSON is parsed until a value is asked for.
+
+4. LAZY ENTRIES: LazyEntry.get("reward") decodes just that value.
+   get_path("info", "error") walks down the nested key spans. length("traj")
+   counts the list's items from indentation. has("info", "task") checks that
+   a key is present. None of them decode the traj list. to_dict() decodes
+   the whole entry once, for the entries that really need it.
+
+5. FALLBACK: A file that isn't in the indent=2 layout (compact dumps,
+   hand-edited files) is decoded in full with the backend. LazyEntry then
+   wraps the dicts, so callers don't care which path was taken.
+
+6. ARCHIVES: A compressed .tjz archive (traj_archive.py) is recognised by
+   its magic bytes. Its entries have the same interface and are
+   decompressed one frame at a time. find(task_id, trial) seeks straight to
+   one entry in an archive and scans a JSON file.
+
+Usage:
+    from traj_json import TrajectoryFile, load
+
+    data = load(path)                          # full decode, fast backend
+    with TrajectoryFile(path) as tf:
+        for e in tf:
+            if e.get_path("info", "error") is not None: ...
+            turns = e.length("traj")
+            full = e.to_dict()
+        one = tf.find(4, trial=0)             # None if absent
+
+    python traj_json.py FILE [FILE ...]        # backend + layout + entry counts
+"""
+
+import json
+import mmap
+import os
+import re
+import sys
+from pathlib import Path
+
+# Files that TrajectoryFile reads: trajectory JSON and traj_archive.py archives
+TRAJ_SUFFIXES = (".json", ".tjz")
+# First bytes of a .tjz archive. Checked here, so traj_archive (and zstd) is
+# only imported for archives, never for plain JSON corpora.
+ARCHIVE_MAGIC = b"TJZ1"
+
+_BACKEND = None
+_LOADS = None
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# BACKEND SELECTION
+# Resolved on first use so importing this module stays cheap.
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _stdlib_loads(buf):
+    return json.loads(bytes(buf) if isinstance(buf, memoryview) else buf)
+
+
+def _resolve(name):
+    if name == "orjson":
+        import orjson
+        return orjson.loads
+    if name == "simdjson":
+        import simdjson
+        return lambda buf: simdjson.loads(bytes(buf) if isinstance(buf, memoryview) else buf)
+    if name == "json":
+        return _stdlib_loads
+    raise ValueError(f"unknown JSON backend {name!r} (choose orjson, simdjson or json)")
+
+
+def set_backend(name="auto"):
+    """Select the decoder: "auto" (first installed of orjson, simdjson, json) or a name."""
+    global _BACKEND, _LOADS
+    if name == "auto":
+        for candidate in ("orjson", "simdjson"):
+            try:
+                _LOADS, _BACKEND = _resolve(candidate), candidate
+                return _BACKEND
+            except ImportError:
+                continue
+        name = "json"
+    _LOADS, _BACKEND = _resolve(name), name
+    return _BACKEND
+
+
+def backend():
+    """Name of the active decoder (resolving it if needed)."""
+    if _BACKEND is None:
+        set_backend(os.environ.get("TAU_JSON_BACKEND", "auto"))
+    return _BACKEND
+
+
+def loads(buf):
+    """Decode bytes / memoryview / str with the active backend."""
+    if _LOADS is None:
+        backend()
+    return _LOADS(buf)
+
+
+def load(path):
+    """Decode a whole JSON file (or .tjz archive) via mmap. Empty files decode to []."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:len(ARCHIVE_MAGIC)] == ARCHIVE_MAGIC:
+                import traj_archive
+                return [e.to_dict() for e in traj_archive.Archive(mm).entries]
+            with memoryview(mm) as view:
+                return loads(view)
+
+
+def unique_runs(paths):
+    """Drop .tjz archives whose source .json sits next to them: both hold the same run."""
+    paths = list(paths)
+    present = set(paths)
+    return [p for p in paths if not (p.suffix == ".tjz" and p.with_suffix(".json") in present)]
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# LAZY ENTRIES
+# ═══════════════════════════════════════════════════════════════════════════════
+
+_MISSING = object()
+# A line that starts a list item (not a closing bracket) at a given indent
+_ITEM_RE = {}
+
+
+def _item_re(indent):
+    if indent not in _ITEM_RE:
+        _ITEM_RE[indent] = re.compile(rb"\n" + b" " * indent + rb"[^ \]}]")
+    return _ITEM_RE[indent]
+
+
+class LazyEntry:
+    """One trajectory entry. Fields are decoded on access from the mmap'd file."""
+
+    __slots__ = ("_tf", "_start", "_end", "_spans", "_dict")
+
+    def __init__(self, tf, start, end, spans=None, data=None):
+        self._tf = tf            # owning TrajectoryFile (holds the mmap)
+        self._start = start      # byte offset of "{"
+        self._end = end          # byte offset just past "}"
+        self._spans = spans      # key -> (value_start, value_end) of the entry's keys
+        self._dict = data        # fully decoded entry (fallback path / to_dict cache)
+
+    def _span(self, path):
+        """Value span of a nested key path, or None if any key is missing."""
+        span = self._spans.get(path[0])
+        indent = 6
+        for key in path[1:]:
+            if span is None or self._tf._mm[span[0]:span[0] + 1] != b"{":
+                return None
+            span = self._tf.key_spans(span[0], span[1], indent).get(key)
+            indent += 2
+        return span
+
+    def span(self, *path):
+        """(start, end) byte span of the value at path, or None. For TrajectoryFile helpers."""
+        return self._span(path) if self._dict is None else None
+
+    def _decode(self, span):
+        return self._tf.decode(span)
+
+    def get_path(self, *path, default=None):
+        """Decode only the value at path (e.g. "info", "error"); default if missing."""
+        if self._dict is not None:
+            value = self._dict
+            for key in path:
+                if not isinstance(value, dict) or key not in value:
+                    return default
+                value = value[key]
+            return value
+        span = self._span(path)
+        return default if span is None else self._decode(span)
+
+    def get(self, key, default=None):
+        return self.get_path(key, default=default)
+
+    def __getitem__(self, key):
+        value = self.get_path(key, default=_MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def has(self, *path):
+        """True if the key path exists, without decoding its value."""
+        if self._dict is not None:
+            return self.get_path(*path, default=_MISSING) is not _MISSING
+        return self._span(path) is not None
+
+    __contains__ = has
+
+    def keys(self):
+        if self._dict is not None:
+            return list(self._dict)
+        return list(self._spans)
+
+    def length(self, *path):
+        """len() of a list/dict value, counted from the layout (no decode). 0 if missing."""
+        if self._dict is not None:
+            value = self.get_path(*path, default=None)
+            return len(value) if value is not None else 0
+        span = self._span(path)
+        if span is None:
+            return 0
+        if self._tf._mm[span[0] + 1:span[0] + 2] in (b"]", b"}"):
+            return 0  # "[]" / "{}"
+        with memoryview(self._tf._mm)[span[0]:span[1]] as view:
+            return sum(1 for _ in _item_re(2 * len(path) + 4).finditer(view))
+
+    def to_dict(self):
+        """Decode the whole entry (cached)."""
+        if self._dict is None:
+            self._dict = self._decode((self._start, self._end))
+        return self._dict
+
+
+class TrajectoryFile:
+    """A memory-mapped trajectory file: a sequence of LazyEntry.
+
+    Use as a context manager; entries must not be read after it closes
+    (values already decoded, including to_dict() results, stay valid).
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._f = open(self.path, "rb")
+        self._mm = None
+        self.lazy = False
+        self.archive = None      # traj_archive.Archive for .tjz files
+        if os.fstat(self._f.fileno()).st_size == 0:
+            self.entries = []
+            return
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(ARCHIVE_MAGIC)] == ARCHIVE_MAGIC:
+            import traj_archive
+            self.archive = traj_archive.Archive(self._mm)
+            self.entries = self.archive.entries
+            return
+        self.entries = self._index()
+
+    def _index(self):
+        """One pass over every entry-level key ("\n    \"") in the file.
+
+        A key right after "\n  {" starts a new entry; the value before it
+        (the previous entry's last one) ends at that entry's "\n  }".
+        """
+        mm = self._mm
+        if mm[:5] != b"[\n  {":
+            return self._fallback()
+        marker = b'\n    "'
+        entries = []
+        spans = None
+        pos = mm.find(marker)
+        while pos != -1:
+            if mm[pos - 4:pos] == b"\n  {":
+                spans = {}
+                entries.append(LazyEntry(self, pos - 1, None, spans))
+            colon = mm.find(b'": ', pos + 6)
+            nxt = mm.find(marker, colon)
+            if nxt == -1 or mm[nxt - 4:nxt] == b"\n  {":
+                close = mm.rfind(b"\n  }", colon, len(mm) if nxt == -1 else nxt)
+                if close == -1:
+                    return self._fallback()  # torn write: let the decoder report it
+                value_end = close
+                entries[-1]._end = close + 4
+            else:
+                value_end = nxt - 1 if mm[nxt - 1:nxt] == b"," else nxt
+            spans[mm[pos + 6:colon].decode()] = (colon + 3, value_end)
+            pos = nxt
+        self.lazy = True
+        return entries
+
+    def _fallback(self):
+        with memoryview(self._mm) as view:
+            data = loads(view)
+        return [LazyEntry(self, 0, 0, data=entry) for entry in data]
+
+    def key_spans(self, start, end, indent):
+        """Map each key of the object in buf[start:end] to its value span.
+
+        indent is the indentation of the object's keys (4 for entry keys).
+        """
+        buf = self._mm
+        marker = b"\n" + b" " * indent + b'"'
+        spans = {}
+        pos = buf.find(marker, start, end)
+        while pos != -1:
+            key_start = pos + len(marker)
+            colon = buf.find(b'": ', key_start, end)
+            nxt = buf.find(marker, colon, end)
+            value_end = nxt if nxt != -1 else buf.rfind(b"\n", colon, end)
+            if buf[value_end - 1:value_end] == b",":
+                value_end -= 1
+            spans[buf[key_start:colon].decode()] = (colon + 3, value_end)
+            pos = nxt
+        return spans
+
+    def item_spans(self, start, end, indent):
+        """Spans of the items of the list in buf[start:end]; items are indented by indent."""
+        buf = self._mm
+        if buf[start + 1:start + 2] == b"]":
+            return []
+        prefix = b"\n" + b" " * indent
+        items = []
+        pos = buf.find(prefix, start, end)
+        while pos != -1:
+            item_start = pos + len(prefix)
+            opener = buf[item_start:item_start + 1]
+            if opener in (b"{", b"["):
+                closer = prefix + (b"}" if opener == b"{" else b"]")
+                if buf[item_start + 1:item_start + 2] in (b"}", b"]"):
+                    item_end = item_start + 2  # "{}" / "[]"
+                else:
+                    item_end = buf.find(closer, item_start, end) + len(closer)
+            else:
+                item_end = buf.find(b"\n", item_start, end)
+                if buf[item_end - 1:item_end] == b",":
+                    item_end -= 1
+            items.append((item_start, item_end))
+            if buf[item_end:item_end + 1] != b",":
+                break
+            pos = item_end + 1
+        return items
+
+    def raw(self, start, end):
+        """The raw bytes buf[start:end] (for peeking at a value's first characters)."""
+        return self._mm[start:end]
+
+    def decode(self, span):
+        """Decode the JSON value at a (start, end) byte span."""
+        with memoryview(self._mm)[span[0]:span[1]] as view:
+            return loads(view)
+
+    def find(self, task_id, trial=0):
+        """The entry for (task_id, trial), or None. Archives seek via their index."""
+        if self.archive is not None:
+            return self.archive.find(task_id, trial)
+        for e in self.entries:
+            if e.get("task_id") == task_id and e.get("trial", 0) == trial:
+                return e
+        return None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __getitem__(self, i):
+        return self.entries[i]
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help"):
+        print("usage: python traj_json.py FILE [FILE ...]")
+        return
+    print(f"backend: {backend()}")
+    for path in sys.argv[1:]:
+        with TrajectoryFile(path) as tf:
+            crashed = sum(1 for e in tf if e.has("info", "error"))
+            turns = sum(e.length("traj") for e in tf)
+            mode = "archive" if tf.archive else "lazy" if tf.lazy else "full decode"
+            print(f"{path}: {len(tf)} entries, {crashed} crashed, {turns} turns, {mode}")
+
+
+if __name__ == "__main__":
+    main()
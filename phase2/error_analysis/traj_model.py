@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+traj_model.py — Compact in-memory model for trajectories, classifications
+and crashes.
+
+The scripts used to pass plain dicts around: whole entries with every
+message string, failure lists, per-classification copies of the ground
+truth and agent actions. These `__slots__` classes carry the same data
+with far less memory. analyze_crashes.py and classify_errors.py use them
+internally, and every public helper still accepts the old dicts.
+
+How it works:
+─────────────
+1. SLOTS: Entry, Message, ToolCall, Classification and CrashRecord are
+   `__slots__` classes: no per-instance __dict__, just the fields.
+
+2. INTERNING: Roles, tool names, argument keys, config labels and error
+   categories are sys.intern()ed. Thousands of entries then share a single
+   "assistant" / "get_user_details" / "14b_ACT_airline" string.
+
+3. CONTENT BY OFFSET: Entries built from a traj_json.TrajectoryFile keep
+   each message's content as a byte span into the mmap'd file. The text is
+   decoded only when .content is read (e.g. while building a prompt), so a
+   loaded corpus holds offsets instead of copies of every system prompt
+   and tool output.
+
+4. NO DUPLICATION: A Classification built from an Entry points at the
+   entry's ground-truth ToolCalls instead of copying them. to_record()
+   produces the exact dict that goes into the .ndjson log.
+
+5. COMPATIBILITY: as_entry / as_messages / as_actions / as_classification
+   accept either model objects or the old dicts. Callers such as
+   similar_failures.py and replay_rewards.py keep passing dicts and work
+   unchanged.
+
+Usage:
+    from traj_model import iter_entries, as_messages
+
+    for entry in iter_entries(path, "14b_ACT_airline"):
+        if entry.reward == 0.0 and entry.has_task:
+            system = entry.messages[0].content    # decoded on demand
+
+    python traj_model.py FILE [FILE ...]           # entries/messages/tool calls per file
+"""
+
+import json
+import sys
+
+from traj_json import TrajectoryFile
+
+intern = sys.intern
+
+
+def _intern_keys(args):
+    """Intern the keys of an arguments dict (values are left alone)."""
+    if isinstance(args, dict):
+        return {intern(k) if isinstance(k, str) else k: v for k, v in args.items()}
+    return args
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# TRAJECTORY MODEL
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class ToolCall:
+    """A tool call: an FC tool_call, or a ground-truth action (name + kwargs).
+
+    arguments is kept as stored: a JSON string for FC tool calls, a dict
+    for ground-truth actions.
+    """
+
+    __slots__ = ("id", "name", "arguments")
+
+    def __init__(self, name, arguments, id=None):
+        self.id = id
+        self.name = intern(name) if isinstance(name, str) else name
+        self.arguments = _intern_keys(arguments)
+
+    @classmethod
+    def from_tool_call(cls, tc):
+        """From an FC message's tool_calls item: {"id", "function": {"name", "arguments"}}."""
+        fn = tc.get("function", {})
+        return cls(fn.get("name"), fn.get("arguments", "{}"), tc.get("id"))
+
+    @classmethod
+    def from_action(cls, action):
+        """From info.task.actions / agent action dicts: {"name", "kwargs" | "arguments"}."""
+        return cls(action.get("name", "unknown"),
+                   action.get("kwargs", action.get("arguments", {})))
+
+    def to_action(self):
+        """Back to the ground-truth action dict stored in results."""
+        return {"name": self.name, "kwargs": self.arguments}
+
+    def __repr__(self):
+        return f"ToolCall({self.name!r})"
+
+
+class Message:
+    """One traj message. Content is a str, or a byte span into a TrajectoryFile."""
+
+    __slots__ = ("role", "tool_calls", "tool_call_id", "_content", "_end", "_src")
+
+    def __init__(self, role, content, tool_calls=None, tool_call_id=None, src=None, end=None):
+        self.role = intern(role) if isinstance(role, str) else role
+        self.tool_calls = tool_calls or None    # list[ToolCall] or None
+        self.tool_call_id = tool_call_id
+        self._content = content                 # str / None, or the span start when src is set
+        self._end = end                         # span end when src is set
+        self._src = src
+
+    @property
+    def content(self):
+        if self._src is None:
+            return self._content
+        return self._src.decode((self._content, self._end))
+
+    @classmethod
+    def from_dict(cls, msg):
+        tool_calls = msg.get("tool_calls")
+        return cls(msg.get("role"), msg.get("content"),
+                   [ToolCall.from_tool_call(tc) for tc in tool_calls] if tool_calls else None,
+                   msg.get("tool_call_id"))
+
+    def __repr__(self):
+        return f"Message({self.role!r})"
+
+
+class Entry:
+    """One trajectory entry (one task x trial) of one config."""
+
+    __slots__ = ("config", "task_id", "trial", "reward", "instruction", "actions",
+                 "messages", "error", "has_task", "_source")
+
+    def __init__(self, config, task_id, trial, reward, instruction=None, actions=(),
+                 messages=(), error=None, has_task=False, source=None):
+        self.config = intern(config) if isinstance(config, str) else config
+        self.task_id = task_id
+        self.trial = trial
+        self.reward = reward
+        self.instruction = instruction          # info.task.instruction (None if no task)
+        self.actions = list(actions)            # ground truth: list[ToolCall]
+        self.messages = list(messages)          # traj: list[Message]
+        self.error = error                      # info.error for crashed runs
+        self.has_task = has_task                # info.task present and non-empty
+        self._source = source                   # LazyEntry / dict, for to_dict()
+
+    @property
+    def crashed(self):
+        return self.error is not None
+
+    @classmethod
+    def from_dict(cls, entry, config=None):
+        info = entry.get("info", {})
+        task = info.get("task") or {}
+        return cls(config, entry.get("task_id"), entry.get("trial", 0), entry.get("reward", 0.0),
+                   task.get("instruction"),
+                   [ToolCall.from_action(a) for a in task.get("actions", [])],
+                   [Message.from_dict(m) for m in entry.get("traj", [])],
+                   info.get("error"), bool(info.get("task")), entry)
+
+    @classmethod
+    def from_lazy(cls, lazy, tf, config=None):
+        """Build from a traj_json.LazyEntry; message content stays in the mmap."""
+        if not tf.lazy:
+            return cls.from_dict(lazy.to_dict(), config)
+        task_span = lazy.span("info", "task")
+        has_task = task_span is not None and tf.raw(task_span[0], task_span[0] + 2) not in (b"{}", b"nu")
+        messages = []
+        traj = lazy.span("traj")
+        for start, end in tf.item_spans(traj[0], traj[1], 6) if traj else ():
+            keys = tf.key_spans(start, end, 8)
+            tool_calls = tf.decode(keys["tool_calls"]) if "tool_calls" in keys else None
+            role = tf.decode(keys["role"]) if "role" in keys else None
+            tool_calls = [ToolCall.from_tool_call(tc) for tc in tool_calls] if tool_calls else None
+            tool_call_id = tf.decode(keys["tool_call_id"]) if "tool_call_id" in keys else None
+            span = keys.get("content")
+            if span is not None and tf.raw(span[0], span[0] + 1) == b'"':
+                # String content stays in the file: keep its offsets only
+                messages.append(Message(role, span[0], tool_calls, tool_call_id, tf, span[1]))
+            else:
+                # null / missing / non-string content is tiny: decode it now
+                messages.append(Message(role, tf.decode(span) if span else None,
+                                        tool_calls, tool_call_id))
+        return cls(config, lazy.get("task_id"), lazy.get("trial", 0), lazy.get("reward", 0.0),
+                   lazy.get_path("info", "task", "instruction") if has_task else None,
+                   [ToolCall.from_action(a) for a in lazy.get_path("info", "task", "actions",
+                                                                   default=[])],
+                   messages, lazy.get_path("info", "error"), has_task, lazy)
+
+    def to_dict(self):
+        """The full original entry dict (decoded from the file for mmap-backed entries)."""
+        return self._source.to_dict() if hasattr(self._source, "to_dict") else self._source
+
+    def __repr__(self):
+        return f"Entry({self.config!r}, task_id={self.task_id}, trial={self.trial})"
+
+
+class EntryList(list):
+    """A list of Entry that owns the TrajectoryFile their message content lives in.
+
+    close() (or leaving a with block) unmaps the file; message content of
+    the entries must not be read afterwards.
+    """
+
+    def __init__(self, entries=(), source=None):
+        super().__init__(entries)
+        self.source = source                    # TrajectoryFile, or None if nothing to close
+
+    def close(self):
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_entries(path, config=None):
+    """Yield an Entry per trajectory entry in path.
+
+    The file is closed once the loop finishes (or the generator is closed),
+    so read message content inside the loop.
+    """
+    with TrajectoryFile(path) as tf:
+        for lazy in tf:
+            yield Entry.from_lazy(lazy, tf, config)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# RESULTS MODEL
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class Classification:
+    """One classified failure: a line of {config}.ndjson."""
+
+    __slots__ = ("config", "index", "task_id", "trial", "instruction",
+                 "ground_truth_actions", "agent_actions", "label")
+
+    def __init__(self, config, index, task_id, trial, instruction, ground_truth_actions,
+                 agent_actions, label):
+        self.config = intern(config) if isinstance(config, str) else config
+        self.index = index
+        self.task_id = task_id
+        self.trial = trial
+        self.instruction = instruction
+        self.ground_truth_actions = ground_truth_actions   # list[ToolCall] or list[dict]
+        self.agent_actions = agent_actions
+        self.label = label                                 # the classifier's JSON
+        cat = label.get("primary_category")
+        if isinstance(cat, str):
+            label["primary_category"] = intern(cat)
+
+    @property
+    def category(self):
+        return self.label["primary_category"]
+
+    @classmethod
+    def from_entry(cls, entry, index, label, agent_actions):
+        return cls(entry.config, index, entry.task_id, entry.trial, entry.instruction or "",
+                   entry.actions, agent_actions, label)
+
+    @classmethod
+    def from_record(cls, record, config=None):
+        return cls(config, record.get("index"), record["task_id"], record.get("trial", 0),
+                   record.get("instruction", ""), record.get("ground_truth_actions", []),
+                   record.get("agent_actions", []), record["classification"])
+
+    def _ground_truth(self):
+        return [a.to_action() if isinstance(a, ToolCall) else a for a in self.ground_truth_actions]
+
+    def to_record(self):
+        """The .ndjson log line (as a dict)."""
+        return {
+            "index": self.index,
+            "task_id": self.task_id,
+            "trial": self.trial,
+            "instruction": self.instruction,
+            "ground_truth_actions": self._ground_truth(),
+            "agent_actions": self.agent_actions,
+            "classification": self.label,
+        }
+
+    def to_example(self):
+        """The representative_examples.json form."""
+        return {
+            "config": self.config,
+            "task_id": self.task_id,
+            "instruction": self.instruction,
+            "ground_truth_actions": self._ground_truth(),
+            "agent_actions": self.agent_actions,
+            "classification": self.label,
+        }
+
+
+class CrashRecord:
+    """One crashed entry, as found by analyze_crashes.scan_file."""
+
+    __slots__ = ("config_label", "task_id", "trial", "crash_type",
+                 "tokens_used", "token_limit", "error_short")
+
+    def __init__(self, config_label, task_id, trial, crash_type, tokens_used=None,
+                 token_limit=None, error_short=""):
+        self.config_label = intern(config_label) if isinstance(config_label, str) else config_label
+        self.task_id = task_id
+        self.trial = trial
+        self.crash_type = intern(crash_type)
+        self.tokens_used = tokens_used
+        self.token_limit = token_limit
+        self.error_short = error_short
+
+    @property
+    def over_by(self):
+        if self.tokens_used is None or self.token_limit is None:
+            return None
+        return self.tokens_used - self.token_limit
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# ADAPTERS (model objects or the old dicts)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def as_entry(entry, config=None):
+    return entry if isinstance(entry, Entry) else Entry.from_dict(entry, config)
+
+
+def as_messages(traj):
+    for msg in traj:
+        yield msg if isinstance(msg, Message) else Message.from_dict(msg)
+
+
+def as_actions(actions):
+    for action in actions or ():
+        yield action if isinstance(action, ToolCall) else ToolCall.from_action(action)
+
+
+def as_classification(record, config=None):
+    return record if isinstance(record, Classification) else Classification.from_record(record, config)
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help"):
+        print("usage: python traj_model.py FILE [FILE ...]")
+        return
+    for path in sys.argv[1:]:
+        entries = list(iter_entries(path))
+        n_msgs = sum(len(e.messages) for e in entries)
+        n_calls = sum(len(m.tool_calls or ()) for e in entries for m in e.messages)
+        print(json.dumps({"file": path, "entries": len(entries), "crashed": sum(e.crashed for e in entries),
+                          "messages": n_msgs, "fc_tool_calls": n_calls}))
+
+
+if __name__ == "__main__":
+    main()
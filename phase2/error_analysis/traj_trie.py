@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+"""
+traj_trie.py — Prefix-sharing storage for multi-trial trajectories, and a first-divergence report.
+
+At temperature 0.0 the trials of a task often replay the same conversation
+for many turns before they drift apart, but the trajectory JSON stores every
+trial in full. This module stores each task's trials as a trie of messages,
+so a shared prefix is stored (and analysed) once. It also records the turn
+where each trial leaves the others, which shows where nondeterminism creeps
+in.
+
+How it works:
+─────────────
+1. HASH: Each message is hashed (blake2b, 128 bits) from its raw bytes in
+   the file, via traj_json spans, so nothing is decoded to compare
+   messages. Files in another layout hash a canonical json.dumps instead.
+   Only the first occurrence of each message is decoded.
+
+2. TRIE: Per task, trials are inserted into a trie keyed by (parent node,
+   message hash). Message bodies are deduplicated across the whole file,
+   so the system prompt is stored once however many tasks use it. An entry
+   keeps all its other fields, with `traj` replaced by its leaf node.
+
+3. DIVERGENCE: A task's first divergence turn is the number of messages all
+   of its trials share (turn = index into traj, 0 = the system prompt).
+   Each trial's own divergence turn is the last point where its path is
+   still shared with another trial. The first message after the split
+   says who introduced the difference:
+   - assistant: the agent model;
+   - user: the user simulator;
+   - tool: the environment ("API output:" messages count as tool);
+   - end: one trial stopped while another went on.
+
+4. SHARED-PREFIX ANALYSES: TrajectoryTrie.accumulate(fn) calls fn once per
+   trie node and returns each entry's running total at its leaf. Per-entry
+   context size, for example, then tokenises every shared prefix once. The
+   report shows how many message visits this saves.
+
+5. STORAGE: `build` writes one .tjt file per trajectory file:
+   {messages, nodes, entries, diverges_at}. `restore` rebuilds entries
+   equal to the originals. Any file TrajectoryFile reads (JSON or .tjz)
+   can be the input.
+
+Usage:
+    python traj_trie.py report                                  # auto-detect trajectories
+    python traj_trie.py report --trajectory-dir runs/ --model-size 14b --json-output divergence.json
+    python traj_trie.py build ../../phase1/JSON_trajectories --out tries/
+    python traj_trie.py restore tries/ --out restored/
+
+    from traj_trie import TrajectoryTrie
+    trie = TrajectoryTrie.from_file(path)
+    chars = trie.accumulate(lambda m: len(m.get("content") or ""))   # per entry, prefixes counted once
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from analyze_crashes import discover_files
+from traj_json import TrajectoryFile, loads, unique_runs
+
+SUFFIX = ".tjt"
+TURN_BUCKETS = [(0, 1), (2, 3), (4, 7), (8, 15), (16, 31), (32, None)]
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# TRIE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def message_hash(raw):
+    return hashlib.blake2b(raw, digest_size=16).digest()
+
+
+def message_source(msg):
+    """Who wrote a message: assistant, user (the simulator) or tool (the environment)."""
+    role = msg.get("role")
+    if role == "tool" or (role == "user" and str(msg.get("content") or "").startswith("API output:")):
+        return "tool"
+    return role or "unknown"
+
+
+class TrajectoryTrie:
+    """The trials of every task in one trajectory file, stored as per-task message tries."""
+
+    def __init__(self, source=""):
+        self.source = source
+        self.messages = []       # unique message dicts
+        self.nodes = []          # [parent node (-1 for a task root), message index (-1 for a root)]
+        self.entries = []        # original entry dicts with "traj" replaced by the leaf node
+        self.depth = []          # messages from the task root to each node
+        self.flat_messages = 0   # messages across all entries (what a flat scan visits)
+        self.flat_bytes = 0      # raw message bytes across all entries
+        self.unique_bytes = 0    # raw bytes of the unique messages
+        self._msg_index = {}     # message hash -> index into messages
+        self._child = {}         # (parent node, message hash) -> node
+        self._roots = {}         # task_id -> root node
+        self._diverges = None
+
+    def _node(self, parent, msg_idx, key):
+        node = self._child.get(key)
+        if node is None:
+            node = len(self.nodes)
+            self.nodes.append([parent, msg_idx])
+            self.depth.append(self.depth[parent] + 1 if parent >= 0 else 0)
+            self._child[key] = node
+        return node
+
+    def add(self, fields, messages):
+        """Insert one entry: fields without traj, messages as (raw bytes, decode()) pairs; None if no traj."""
+        task_id = fields.get("task_id")
+        node = self._roots.get(task_id)
+        if node is None:
+            node = self._roots[task_id] = self._node(-1, -1, ("root", task_id))
+        if messages is None:
+            self.entries.append(fields)
+            return
+        for raw, decode in messages:
+            h = message_hash(raw)
+            idx = self._msg_index.get(h)
+            if idx is None:
+                idx = self._msg_index[h] = len(self.messages)
+                self.messages.append(decode())
+                self.unique_bytes += len(raw)
+            self.flat_messages += 1
+            self.flat_bytes += len(raw)
+            node = self._node(node, idx, (node, h))
+        fields["traj"] = node
+        self.entries.append(fields)
+        self._diverges = None
+
+    @classmethod
+    def from_file(cls, path):
+        """Build from anything TrajectoryFile reads; message bytes are hashed straight from the mmap."""
+        trie = cls(Path(path).name)
+        with TrajectoryFile(path) as tf:
+            for e in tf:
+                if not tf.lazy:
+                    entry = dict(e.to_dict())
+                    traj = entry.get("traj")
+                    trie.add(entry, [(json.dumps(m, sort_keys=True).encode(), lambda m=m: m) for m in traj]
+                             if isinstance(traj, list) else None)
+                    continue
+                # Keep the original key order: traj goes back where it was
+                fields = {k: None if k == "traj" else e.get(k) for k in e.keys()}
+                span = e.span("traj")
+                if span is None or tf.raw(span[0], span[0] + 1) != b"[":
+                    if span is not None:
+                        fields["traj"] = tf.decode(span)
+                    trie.add(fields, None)
+                    continue
+                trie.add(fields, [(bytes(tf.raw(*s)), lambda s=s: tf.decode(s))
+                                  for s in tf.item_spans(span[0], span[1], 6)])
+        return trie
+
+    # ── Reading ──
+
+    def path(self, node):
+        """Message indices from the task root down to node."""
+        out = []
+        while node >= 0 and self.nodes[node][1] >= 0:
+            out.append(self.nodes[node][1])
+            node = self.nodes[node][0]
+        return out[::-1]
+
+    def leaf(self, i):
+        """Entry i's leaf node; None if it has no traj list."""
+        leaf = self.entries[i].get("traj")
+        return leaf if isinstance(leaf, int) else None
+
+    def traj(self, i):
+        """Entry i's message list, rebuilt from the trie."""
+        leaf = self.leaf(i)
+        return [] if leaf is None else [self.messages[m] for m in self.path(leaf)]
+
+    def entry(self, i):
+        """Entry i as it was in the original file."""
+        entry = dict(self.entries[i])
+        if self.leaf(i) is not None:
+            entry["traj"] = self.traj(i)
+        return entry
+
+    def accumulate(self, fn):
+        """Per entry: sum of fn(message) over its traj, with fn called once per trie node."""
+        totals = [0] * len(self.nodes)
+        for n, (parent, msg) in enumerate(self.nodes):   # parents always precede children
+            if msg >= 0:
+                totals[n] = totals[parent] + fn(self.messages[msg])
+        leaves = [self.leaf(i) for i in range(len(self.entries))]
+        return [totals[leaf] if leaf is not None else 0 for leaf in leaves]
+
+    # ── Divergence ──
+
+    def _passes(self):
+        """How many entries' paths run through each node."""
+        passes = [0] * len(self.nodes)
+        for i in range(len(self.entries)):
+            node = self.leaf(i)
+            while node is not None and node >= 0:
+                passes[node] += 1
+                node = self.nodes[node][0]
+        return passes
+
+    def diverges_at(self):
+        """Per entry: messages it shares with at least one other trial of its task."""
+        if self._diverges is None:
+            passes = self._passes()
+            out = []
+            for i in range(len(self.entries)):
+                node = self.leaf(i)
+                while node is not None and node >= 0 and passes[node] < 2:
+                    node = self.nodes[node][0]
+                out.append(self.depth[node] if node is not None and node >= 0 else 0)
+            self._diverges = out
+        return self._diverges
+
+    def tasks(self):
+        """Per task: its entries' indices (in file order)."""
+        by_task = defaultdict(list)
+        for i, e in enumerate(self.entries):
+            by_task[e.get("task_id")].append(i)
+        return by_task
+
+    def task_divergence(self, indices):
+        """First divergence of one task's trials: shared turns, who diverged, outcome split."""
+        leaves = [self.leaf(i) for i in indices]
+        paths = [self.path(leaf) if leaf is not None else [] for leaf in leaves]
+        shared = 0
+        while all(len(p) > shared for p in paths) and len({p[shared] for p in paths}) == 1:
+            shared += 1
+        identical = len(set(map(tuple, paths))) == 1
+        kinds = set() if identical else {
+            message_source(self.messages[p[shared]]) if len(p) > shared else "end" for p in paths}
+        diverged_by = (None if identical else kinds.pop() if len(kinds) == 1
+                       else "end" if "end" in kinds else "mixed")
+        rewards = [self.entries[i].get("reward") for i in indices]
+        return {
+            "trials": len(indices),
+            "shared_turns": shared,
+            "turns": [len(p) for p in paths],
+            "identical": identical,
+            "diverged_by": diverged_by,
+            "rewards": rewards,
+            "outcome_split": len({r == 1.0 for r in rewards}) > 1,
+        }
+
+    # ── Storage ──
+
+    def to_json(self):
+        return {"format": "traj-trie", "version": 1, "source": self.source,
+                "messages": self.messages, "nodes": self.nodes, "entries": self.entries,
+                "diverges_at": self.diverges_at()}
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = loads(f.read())
+        trie = cls(data.get("source", ""))
+        trie.messages, trie.nodes, trie.entries = data["messages"], data["nodes"], data["entries"]
+        for parent, _ in trie.nodes:
+            trie.depth.append(trie.depth[parent] + 1 if parent >= 0 else 0)
+        trie._diverges = data.get("diverges_at")
+        return trie
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.to_json(), f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# REPORT
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def analyse_file(filepath, config):
+    trie = TrajectoryTrie.from_file(filepath)
+    tasks = []
+    for task_id, indices in sorted(trie.tasks().items(), key=lambda kv: str(kv[0])):
+        if len(indices) < 2:
+            continue
+        tasks.append(dict(trie.task_divergence(indices), config=config["config_label"], task_id=task_id))
+    nodes = sum(1 for _, m in trie.nodes if m >= 0)
+    return {
+        "config": config["config_label"],
+        "entries": len(trie.entries),
+        "multi_trial_tasks": len(tasks),
+        "flat_messages": trie.flat_messages,
+        "trie_nodes": nodes,
+        "unique_messages": len(trie.messages),
+        "flat_bytes": trie.flat_bytes,
+        "unique_bytes": trie.unique_bytes,
+        "tasks": tasks,
+    }
+
+
+def bucket_label(lo, hi):
+    return f"{lo}+" if hi is None else f"{lo}-{hi}"
+
+
+def print_summary(results, max_list=20, output_file=None):
+    out = output_file or sys.stdout
+
+    def p(text=""):
+        print(text, file=out)
+
+    p("# Trial Divergence Report")
+    p()
+    p("Turn = message index in `traj` (0 = system prompt). A task's first divergence turn is the number of "
+      "messages all of its trials share.")
+    p()
+    p("| Config | Multi-trial Tasks | Identical | Median First Divergence | Diverged By | Outcome Splits | "
+      "Messages Flat → Trie | Message Bytes Flat → Stored |")
+    p("|--------|-------------------|-----------|-------------------------|-------------|----------------|"
+      "----------------------|-----------------------------|")
+    for r in results:
+        tasks = r["tasks"]
+        div = [t for t in tasks if not t["identical"]]
+        med = f"{statistics.median(t['shared_turns'] for t in div):.0f}" if div else "-"
+        by = Counter(t["diverged_by"] for t in div)
+        by_text = ", ".join(f"{k} {v}" for k, v in by.most_common()) or "-"
+        saved = 1 - r["trie_nodes"] / r["flat_messages"] if r["flat_messages"] else 0.0
+        p(f"| {r['config']} | {len(tasks)} | {len(tasks) - len(div)} | {med} | {by_text} | "
+          f"{sum(t['outcome_split'] for t in tasks)} | {r['flat_messages']} → {r['trie_nodes']} "
+          f"(-{saved:.0%}) | {r['flat_bytes'] / 1e6:.2f} MB → {r['unique_bytes'] / 1e6:.2f} MB |")
+    p()
+
+    all_tasks = [t for r in results for t in r["tasks"]]
+    div = [t for t in all_tasks if not t["identical"]]
+    if not all_tasks:
+        p("No task has more than one trial, so there is nothing to compare.")
+        p()
+        return
+    if div:
+        p("## Where Trials First Diverge")
+        p()
+        p("| Turns Shared | Tasks | Assistant | User | Tool | Other | Outcome Splits |")
+        p("|--------------|-------|-----------|------|------|-------|----------------|")
+        for lo, hi in TURN_BUCKETS:
+            rows = [t for t in div if t["shared_turns"] >= lo and (hi is None or t["shared_turns"] <= hi)]
+            if not rows:
+                continue
+            by = Counter(t["diverged_by"] for t in rows)
+            other = len(rows) - by["assistant"] - by["user"] - by["tool"]
+            p(f"| {bucket_label(lo, hi)} | {len(rows)} | {by['assistant']} | {by['user']} | {by['tool']} | "
+              f"{other} | {sum(t['outcome_split'] for t in rows)} |")
+        p()
+        mean_frac = statistics.mean(t["shared_turns"] / max(t["turns"]) for t in div if max(t["turns"]))
+        p(f"Diverging tasks share {mean_frac:.0%} of their longest trial on average before the first split.")
+        p()
+
+    splits = [t for t in div if t["outcome_split"]]
+    if splits:
+        p("## Outcome Splits")
+        p()
+        p("Tasks whose trials diverged and ended with different rewards, latest divergence first.")
+        p()
+        p("| Config | Task | First Divergence | Diverged By | Turns per Trial | Rewards |")
+        p("|--------|------|------------------|-------------|-----------------|---------|")
+        for t in sorted(splits, key=lambda t: -t["shared_turns"])[:max_list]:
+            rewards = ", ".join(f"{r:g}" if isinstance(r, (int, float)) else str(r) for r in t["rewards"])
+            p(f"| {t['config']} | {t['task_id']} | {t['shared_turns']} | {t['diverged_by']} | "
+              f"{', '.join(map(str, t['turns']))} | {rewards} |")
+        if len(splits) > max_list:
+            p(f"| ... | {len(splits) - max_list} more | | | | |")
+        p()
+
+
+def save_json(results, json_path):
+    all_tasks = [t for r in results for t in r["tasks"]]
+    div = [t for t in all_tasks if not t["identical"]]
+    output = {
+        "totals": {
+            "multi_trial_tasks": len(all_tasks),
+            "identical_tasks": len(all_tasks) - len(div),
+            "outcome_splits": sum(t["outcome_split"] for t in all_tasks),
+            "median_first_divergence": statistics.median(t["shared_turns"] for t in div) if div else None,
+            "diverged_by": dict(Counter(t["diverged_by"] for t in div)),
+            "flat_messages": sum(r["flat_messages"] for r in results),
+            "trie_nodes": sum(r["trie_nodes"] for r in results),
+            "flat_bytes": sum(r["flat_bytes"] for r in results),
+            "unique_bytes": sum(r["unique_bytes"] for r in results),
+        },
+        "per_file": [{k: v for k, v in r.items() if k != "tasks"} for r in results],
+        "tasks": all_tasks,
+    }
+    with open(json_path, "w") as f:
+        json.dump(output, f, indent=2)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CLI
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def expand(paths, suffixes):
+    """(file, path relative to its input root) for files and directories given on the command line."""
+    for path in map(Path, paths):
+        if path.is_dir():
+            found = sorted(f for f in path.rglob("*")
+                           if f.suffix in suffixes and "results" not in str(f) and "summary" not in str(f))
+            for f in unique_runs(found):
+                yield f, f.relative_to(path)
+        else:
+            yield path, Path(path.name)
+
+
+def cmd_report(args):
+    script_dir = Path(__file__).resolve().parent
+    if args.trajectory_dir:
+        traj_dir = Path(args.trajectory_dir)
+    else:
+        traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories"
+        if not traj_dir.exists():
+            traj_dir = script_dir.parent.parent / "phase1" / "JSON_trajectories "
+    if not traj_dir.exists():
+        print(f"ERROR: Trajectory directory not found: {traj_dir}")
+        sys.exit(1)
+    files = discover_files(traj_dir, args.model_size)
+    print(f"Found {len(files)} trajectory file(s) in {traj_dir}")
+    start = time.perf_counter()
+    results = [analyse_file(filepath, config) for filepath, config in files]
+    print(f"Built tries in {time.perf_counter() - start:.2f}s")
+    print()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            print_summary(results, args.max_list, output_file=f)
+        print(f"Saved markdown to {args.output}")
+    else:
+        print_summary(results, args.max_list)
+    if args.json_output:
+        save_json(results, args.json_output)
+        print(f"Saved JSON to {args.json_output}")
+
+
+def cmd_build(args):
+    out = Path(args.out)
+    flat = stored = 0
+    for src, rel in expand(args.paths, (".json", ".tjz")):
+        trie = TrajectoryTrie.from_file(src)
+        dst = out / rel.with_suffix(SUFFIX)
+        trie.save(dst)
+        size, packed = src.stat().st_size, dst.stat().st_size
+        if src.suffix != ".json":
+            with TrajectoryFile(src) as tf:
+                size = tf.archive.raw_size if tf.archive else size   # compare against the JSON it holds
+        flat += size
+        stored += packed
+        nodes = sum(1 for _, m in trie.nodes if m >= 0)
+        print(f"  {rel}: {len(trie.entries)} entries, {trie.flat_messages} messages -> {nodes} nodes, "
+              f"{size / 1e6:.2f} MB -> {packed / 1e6:.2f} MB")
+    print(f"Total: {flat / 1e6:.1f} MB -> {stored / 1e6:.1f} MB")
+
+
+def cmd_restore(args):
+    out = Path(args.out)
+    for src, rel in expand(args.paths, (SUFFIX,)):
+        trie = TrajectoryTrie.load(src)
+        dst = out / rel.with_suffix(".json")
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        with open(dst, "w") as f:
+            json.dump([trie.entry(i) for i in range(len(trie.entries))], f, indent=2)
+        print(f"  {rel} -> {dst}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefix-sharing trie storage and first-divergence report.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("report", help="Where the trials of each task first diverge")
+    p.add_argument("--trajectory-dir", type=str, default=None,
+                   help="Path to JSON_trajectories directory (auto-detected if omitted)")
+    p.add_argument("--model-size", type=str, default=None, choices=["4b", "8b", "14b", "32b"],
+                   help="Only analyse this model size")
+    p.add_argument("--max-list", type=int, default=20, help="Rows in the outcome-split listing (default: 20)")
+    p.add_argument("--output", type=str, default=None,
+                   help="Save markdown output to a file instead of printing to stdout.")
+    p.add_argument("--json-output", type=str, default=None, help="Save per-task divergence to a JSON file.")
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser("build", help="Store trajectory files as prefix-sharing .tjt tries")
+    p.add_argument("paths", nargs="+", help="Trajectory files (.json / .tjz) or directories")
+    p.add_argument("--out", required=True, help="Output directory (the input directory layout is mirrored)")
+    p.set_defaults(func=cmd_build)
+
+    p = sub.add_parser("restore", help="Rebuild trajectory JSON files from .tjt tries")
+    p.add_argument("paths", nargs="+", help=".tjt files or directories")
+    p.add_argument("--out", required=True, help="Output directory")
+    p.set_defaults(func=cmd_restore)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()